@@ -34,6 +34,7 @@ class ConfigManager:
                 'output_directory': str(Path.home() / 'Pictures' / 'ProcessedImages'),
                 'temp_directory': None,  # 使用系统临时目录
                 'log_level': 'INFO',
+                'history_flush_interval': 1.0,  # 执行记录合并写入的间隔（秒），0 表示每次保存都立即写入
             },
             'ui': {
                 'theme': 'default',
@@ -47,6 +48,65 @@ class ConfigManager:
                     '2:3': 960,
                     '3:2': 960
                 },
+                'streaming': True,  # 流式执行，中间步骤不落盘
+                'max_concurrent_tasks': 2,  # 同时运行的任务数上限
+                'resource_slots': {  # 各资源类别的并发槽位
+                    'network': 2,
+                    'cpu': 2,
+                    'heavy_model': 1,
+                },
+                'incremental': False,  # 增量运行，只处理输入目录中新增或变化的文件
+                'incremental_prune': False,  # 增量运行时删除来源已被删除的旧输出
+                'progress_interval': 0.25,  # 进度快照的最短发布间隔（秒）
+                'telemetry': True,  # 记录每个步骤的耗时、CPU、内存和读写字节数
+                'provenance': True,  # 记录每个图像在各步骤的去向（溯源日志），见 provenance.ProvenanceLog
+                'fusion': True,  # 流式执行时把连续的逐图处理/过滤步骤融合为一次遍历
+                'prefetch': 4,  # 读取本地图像时在后台线程预先解码的文件数，0 表示不预读
+                'download': {  # 网络来源的下载
+                    'concurrency': 4,  # 同时进行的下载数，仍受站点速率限制约束；1 表示逐个下载
+                    'ordered': True,  # 按列表顺序产出图像；False 时先下载完的先产出
+                    'page_prefetch': 1,  # 在后台提前请求的 API 分页数，下载不必等待翻页请求；0 表示到达时才请求
+                    'pushdown': True,  # 下载前用工作流开头过滤步骤的元数据条件（如原图尺寸）跳过必然被过滤的帖子
+                    'preview': {  # 流式执行时工作流开头的分类/人脸计数等过滤步骤先在预览图上运行，只为通过的图像下载原图
+                        'enabled': False,  # 预览图上的判断可能与原图略有出入，默认关闭
+                        'size': 512,  # 预览图短边至少需要的像素数，没有这么大的预览图时直接下载原图
+                    },
+                },
+                'rate_limit': {  # 网络来源的自适应限速：遇到 429/503 时降速并遵守 Retry-After，请求顺利时逐渐恢复
+                    'shared': True,  # 同一台机器上的多个进程共享有速率上限的来源的限速状态并平分速率，避免并行任务合起来超出站点限制
+                    'path': '',  # 共享状态的目录，为空时使用系统临时目录下的 waifuc_rate_limits
+                },
+                'http_cache': {  # 网络来源 API 分页请求的磁盘缓存，重复抓取相同标签时跳过已缓存的页面
+                    'enabled': True,
+                    'path': '',  # 为空时使用配置目录下的 http_cache
+                    'max_size_mb': 256,  # 超过后淘汰最久未使用的响应，0 表示不限制
+                },
+                'download_cache': {  # 网络来源下载的图像文件缓存，跨任务和来源共享，命中时校验 md5
+                    'enabled': True,
+                    'path': '',  # 为空时使用配置目录下的 download_cache
+                    'max_size_mb': 10240,  # 超过后淘汰最久未使用的文件，0 表示不限制
+                },
+                'batch': {  # 批量推理：支持批处理的模型动作（打标、分类、检测、CCIP）一次推理多张图像
+                    'size': 8,  # 每批图像数，1 表示逐图推理；步骤选项 batch_size 可覆盖
+                    'max_latency': 1.0,  # 未凑满一批时最多等待的秒数，超过后提前推理；步骤选项 max_latency 可覆盖
+                },
+                'parallel': {  # 步骤内并行：把无状态的逐图动作分发到工作池
+                    'enabled': False,
+                    'workers': 0,  # 0 表示使用 CPU 核心数
+                    'mode': 'thread',  # thread 或 process
+                    'ordered': True,  # 保持输出顺序
+                },
+                'step_cache': {  # 步骤结果缓存，重跑修改过的工作流时复用未变化的前缀
+                    'enabled': True,
+                    'max_size_mb': 10240,
+                    'streaming': False,  # 流式执行时也把每个步骤的输出写入缓存（每图每步多一次编码和写盘）；步骤选项 checkpoint 可只缓存指定步骤
+                },
+                'scratch': {  # 中间文件的临时空间
+                    'path': '',  # 为空时使用系统临时目录，可指向 tmpfs 或本地 NVMe
+                    'max_size_mb': 0,  # 所有任务合计的容量上限，0 表示不限制
+                    'spill_policy': 'stream',  # 接近上限时：stream 改为流式执行剩余步骤，fail 使任务失败
+                    'sample_interval': 2.0,  # 后台统计用量的间隔（秒）
+                },
             },
             'sources': {
                 'danbooru': {
@@ -5,10 +5,16 @@ import os
 import json
 import uuid
 import logging
+import sqlite3
+import atexit
+import threading
 from typing import Any, Dict, List, Optional, Tuple, Union
 from datetime import datetime
 
 from .config_manager import config_manager
+from .provenance import remove_provenance
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
 
 
 class ExecutionRecord:
@@ -47,6 +53,8 @@ class ExecutionRecord:
         self.failed_images = 0
         
         self.step_logs: List[Dict[str, Any]] = []
+        self.step_metrics: List[Dict[str, Any]] = []  # 每个步骤的性能数据，见 telemetry.StepMeter
+        self.scratch: Dict[str, Any] = {}  # 临时空间的位置、预算和用量峰值，见 scratch.ScratchSpace.report
         self._status_callbacks = []  # 新增：状态变更回调列表
     
     def add_step_log(self, step_id: str, step_name: str, status: str, 
@@ -88,6 +96,7 @@ class ExecutionRecord:
         self.processed_images = processed_images
         self.success_images = success_images
         self.failed_images = failed_images
+        self._notify_status()
     
     def fail(self, error_message: str) -> None:
         """
@@ -99,6 +108,7 @@ class ExecutionRecord:
         self.end_time = datetime.now().isoformat()
         self.status = "failed"
         self.error_message = error_message
+        self._notify_status()
     
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -122,7 +132,9 @@ class ExecutionRecord:
             'processed_images': self.processed_images,
             'success_images': self.success_images,
             'failed_images': self.failed_images,
-            'step_logs': self.step_logs
+            'step_logs': self.step_logs,
+            'step_metrics': self.step_metrics,
+            'scratch': self.scratch
         }
     
     @classmethod
@@ -156,6 +168,8 @@ class ExecutionRecord:
         record.failed_images = data.get('failed_images', 0)
         
         record.step_logs = data.get('step_logs', [])
+        record.step_metrics = data.get('step_metrics', [])
+        record.scratch = data.get('scratch', {})
         
         return record
     
@@ -169,6 +183,10 @@ class ExecutionRecord:
     def set_status(self, new_status):
         """设置状态并通知订阅者"""
         self.status = new_status
+        self._notify_status()
+
+    def _notify_status(self):
+        """通知所有状态订阅者"""
         for cb in self._status_callbacks:
             try:
                 cb(self.status)
@@ -180,33 +198,110 @@ class ExecutionRecord:
 class ExecutionHistoryManager:
     """
     执行历史管理器，负责执行记录的存储和加载
+
+    记录保存在单个 SQLite 文件中，摘要字段（状态、工作流、开始时间等）单独成列并建立索引，
+    完整记录以 JSON 保存在 data 列。记录按需加载：get_record 只读取一条，
+    query_records 按页读取。本进程中尚未结束的记录只保留一个对象，保证引擎和界面看到同一个对象。
+
+    未结束记录的保存是延迟合并的：save_record 只把记录标记为待写入，后台线程在 flush_interval
+    秒内把同一记录的多次保存合并为一次，并把所有待写入记录放在同一个事务中提交。
+    记录进入结束状态、调用 flush、查询或统计记录以及进程退出时立即写入。
     """
-    def __init__(self):
+    def __init__(self, db_path: str = None, history_dir: str = None, flush_interval: float = None):
         """
         初始化执行历史管理器
+
+        Args:
+            db_path: 数据库文件路径，默认为配置目录下的 history.db
+            history_dir: 旧版 JSON 记录目录，首次启动时自动导入，默认为配置目录下的 history
+            flush_interval: 合并写入的间隔（秒），默认使用配置项 general.history_flush_interval，0 表示每次保存都立即写入
         """
-        self.history_dir = os.path.join(config_manager.config_dir, 'history')
-        os.makedirs(self.history_dir, exist_ok=True)
-        
+        self.db_path = db_path or os.path.join(config_manager.config_dir, 'history.db')
+        self.history_dir = history_dir or os.path.join(config_manager.config_dir, 'history')
+        if flush_interval is None:
+            flush_interval = config_manager.get("general.history_flush_interval", 1.0)
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
         self._records: Dict[str, ExecutionRecord] = {}
-        self._load_records()
-    
-    def _load_records(self) -> None:
+        self._pending: Dict[str, ExecutionRecord] = {}
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        # 引擎在工作线程中保存记录，界面在主线程中查询，共用一个连接并由锁串行化
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._init_schema()
+        self._migrate_json_records()
+        atexit.register(self.close)
+
+    def _init_schema(self) -> None:
+        with self._lock, self._conn:
+            # WAL 模式下命令行任务和界面可以同时读写同一个数据库
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # WAL 模式下 NORMAL 不会损坏数据库，断电时最多丢失最后几次提交，省去每次提交的 fsync
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS records (
+                    id TEXT PRIMARY KEY,
+                    workflow_id TEXT,
+                    workflow_name TEXT,
+                    status TEXT,
+                    start_time TEXT,
+                    end_time TEXT,
+                    total_images INTEGER,
+                    data TEXT NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_status ON records (status)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_workflow ON records (workflow_id, start_time)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_start ON records (start_time)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _migrate_json_records(self) -> None:
         """
-        加载所有保存的执行记录
+        一次性导入旧版 history/*.json 记录。导入后原文件保留不动，数据库中已有的记录不会被覆盖
         """
+        with self._lock:
+            migrated = self._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if migrated or not os.path.isdir(self.history_dir):
+            return
+
+        rows = []
         for filename in os.listdir(self.history_dir):
             if filename.endswith('.json'):
                 try:
-                    record_path = os.path.join(self.history_dir, filename)
-                    with open(record_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    record = ExecutionRecord.from_dict(data)
-                    self._records[record.id] = record
+                    with open(os.path.join(self.history_dir, filename), 'r', encoding='utf-8') as f:
+                        rows.append(self._to_row(ExecutionRecord.from_dict(json.load(f))))
                 except Exception as e:
-                    logging.error(f"加载执行记录 {filename} 失败: {e}")
-    
+                    logging.error(f"导入执行记录 {filename} 失败: {e}")
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('json_migrated', ?)", (datetime.now().isoformat(),))
+        logging.info(f"已从 {self.history_dir} 导入 {len(rows)} 条执行记录")
+
+    @staticmethod
+    def _to_row(record: ExecutionRecord) -> Tuple:
+        start_time = record.start_time if record.start_time is None else str(record.start_time)
+        return (record.id, record.workflow_id, record.workflow_name, record.status, start_time,
+                record.end_time, record.total_images, json.dumps(record.to_dict(), ensure_ascii=False))
+
+    def _from_row(self, record_id: str, data: str) -> ExecutionRecord:
+        """把查询结果转换为记录对象，本进程中正在运行的记录直接返回其对象"""
+        record = self._records.get(record_id)
+        return record if record is not None else ExecutionRecord.from_dict(json.loads(data))
+
+    @staticmethod
+    def _where(status: Union[str, List[str], None], workflow_id: Optional[str]) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        if status:
+            statuses = [status] if isinstance(status, str) else list(status)
+            clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if workflow_id:
+            clauses.append("workflow_id = ?")
+            params.append(workflow_id)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
     def get_record(self, record_id: str) -> Optional[ExecutionRecord]:
         """
         获取执行记录
@@ -217,25 +312,59 @@ class ExecutionHistoryManager:
         Returns:
             执行记录对象或None
         """
-        print(f"[get_record] called for {record_id}")
-        print(f"[get_record] _records keys: {list(self._records.keys())}")
-        record = self._records.get(record_id)
-        print(f"[get_record] returned record: {record}")
-        return record
-    
+        with self._lock:
+            record = self._records.get(record_id)
+            if record is not None:
+                return record
+            row = self._conn.execute("SELECT id, data FROM records WHERE id = ?", (record_id,)).fetchone()
+            return self._from_row(*row) if row else None
+
+    def query_records(self, status: Union[str, List[str], None] = None, workflow_id: str = None,
+                      offset: int = 0, limit: Optional[int] = None) -> List[ExecutionRecord]:
+        """
+        按条件分页查询执行记录，最新的在前。查询前先写入待写入的记录，使筛选和分页基于最新状态
+
+        Args:
+            status: 只返回该状态（或状态列表）的记录
+            workflow_id: 只返回该工作流的记录
+            offset: 跳过的记录数
+            limit: 最多返回的记录数，None 表示不限
+
+        Returns:
+            执行记录列表
+        """
+        where, params = self._where(status, workflow_id)
+        sql = f"SELECT id, data FROM records{where} ORDER BY start_time DESC LIMIT ? OFFSET ?"
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(sql, [*params, -1 if limit is None else limit, offset]).fetchall()
+            return [self._from_row(*row) for row in rows]
+
+    def count_records(self, status: Union[str, List[str], None] = None, workflow_id: str = None) -> int:
+        """
+        统计符合条件的记录数（同样先写入待写入的记录）
+
+        Args:
+            status: 只统计该状态（或状态列表）的记录
+            workflow_id: 只统计该工作流的记录
+
+        Returns:
+            记录数
+        """
+        where, params = self._where(status, workflow_id)
+        self.flush()
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM records{where}", params).fetchone()[0]
+
     def get_all_records(self) -> List[ExecutionRecord]:
         """
-        获取所有执行记录
+        获取所有执行记录（记录较多时请使用 query_records 分页读取）
         
         Returns:
             执行记录列表
         """
         # 按开始时间排序，最新的在前
-        return sorted(
-            self._records.values(),
-            key=lambda r: r.start_time if r.start_time else "",
-            reverse=True
-        )
+        return self.query_records()
     
     def create_record(self, workflow_id: str = None, workflow_name: str = None,
                     source_type: str = None, source_params: Dict[str, Any] = None,
@@ -261,37 +390,87 @@ class ExecutionHistoryManager:
             output_directory=output_directory
         )
         
-        # 保存到内存
-        self._records[record.id] = record
-        
-        # 保存到文件
+        # 保存到数据库（同时登记到内存）
         self.save_record(record)
         
         return record
     
-    def save_record(self, record: ExecutionRecord) -> bool:
+    def save_record(self, record: ExecutionRecord, immediate: bool = False) -> bool:
         """
-        保存执行记录
+        保存执行记录。未结束的记录延迟合并写入，已结束的记录立即写入
         
         Args:
             record: 执行记录对象
+            immediate: 是否立即写入
             
         Returns:
-            是否成功保存
+            是否成功保存（延迟写入时总是返回 True，写入失败会记录日志并在下一轮重试）
         """
+        finished = record.status in FINISHED_STATUSES
+        with self._lock:
+            # 只在内存中保留尚未结束的记录，已结束的记录需要时再从数据库读取
+            if finished:
+                self._records.pop(record.id, None)
+            else:
+                self._records[record.id] = record
+            if not (finished or immediate or self.flush_interval <= 0):
+                self._pending[record.id] = record
+                self._start_writer()
+                self._wake.set()
+                return True
+            self._pending.pop(record.id, None)
+        return self._write([record])
+
+    def _write(self, records: List[ExecutionRecord]) -> bool:
+        """在一个事务中写入多条记录"""
         try:
-            # 保存到内存
-            self._records[record.id] = record
-            
-            # 保存到文件
-            record_path = os.path.join(self.history_dir, f"{record.id}.json")
-            with open(record_path, 'w', encoding='utf-8') as f:
-                json.dump(record.to_dict(), f, ensure_ascii=False, indent=2)
-            
+            rows = [self._to_row(record) for record in records]
+            with self._lock, self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
             return True
         except Exception as e:
-            logging.error(f"保存执行记录 {record.id} 失败: {e}")
+            logging.error(f"保存执行记录 {', '.join(record.id for record in records)} 失败: {e}")
             return False
+
+    def flush(self) -> bool:
+        """
+        立即写入所有待写入的记录
+
+        Returns:
+            是否全部写入成功
+        """
+        with self._lock:
+            records = list(self._pending.values())
+            self._pending.clear()
+        if not records or self._write(records):
+            return True
+        with self._lock:
+            # 写入失败（例如数据库被其他进程长时间锁定）时放回队列，下一轮重试；期间较新的保存优先
+            for record in records:
+                self._pending.setdefault(record.id, record)
+        return False
+
+    def _start_writer(self) -> None:
+        if self._writer is None and not self._stop.is_set():
+            self._writer = threading.Thread(target=self._run_writer, name='history-writer', daemon=True)
+            self._writer.start()
+
+    def _run_writer(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait()
+            # 等待一个间隔，把这段时间内的多次保存合并为一次写入
+            self._stop.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self) -> None:
+        """停止后台写入线程并写入所有待写入的记录"""
+        self._stop.set()
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        self.flush()
     
     def delete_record(self, record_id: str) -> bool:
         """
@@ -303,19 +482,13 @@ class ExecutionHistoryManager:
         Returns:
             是否成功删除
         """
-        if record_id not in self._records:
-            return False
-        
         try:
-            # 从内存中删除
-            del self._records[record_id]
-            
-            # 从文件中删除
-            record_path = os.path.join(self.history_dir, f"{record_id}.json")
-            if os.path.exists(record_path):
-                os.remove(record_path)
-            
-            return True
+            with self._lock, self._conn:
+                self._records.pop(record_id, None)
+                self._pending.pop(record_id, None)
+                deleted = self._conn.execute("DELETE FROM records WHERE id = ?", (record_id,)).rowcount
+            remove_provenance(record_id)
+            return deleted > 0
         except Exception as e:
             logging.error(f"删除执行记录 {record_id} 失败: {e}")
             return False
@@ -330,34 +503,26 @@ class ExecutionHistoryManager:
         Returns:
             清理的记录数量
         """
-        if days is None:
-            # 清理所有记录
-            count = len(self._records)
-            self._records.clear()
-            
-            for filename in os.listdir(self.history_dir):
-                if filename.endswith('.json'):
-                    os.remove(os.path.join(self.history_dir, filename))
-            
-            return count
-        else:
-            # 清理特定天数之前的记录
-            cutoff = datetime.now().timestamp() - days * 24 * 60 * 60
-            to_delete = []
-            
-            for record_id, record in self._records.items():
-                try:
-                    record_time = datetime.fromisoformat(record.start_time).timestamp()
-                    if record_time < cutoff:
-                        to_delete.append(record_id)
-                except (ValueError, TypeError):
-                    # 如果时间格式有问题，默认保留
-                    pass
-            
-            # 删除记录
+        with self._lock, self._conn:
+            if days is None:
+                # 清理所有记录
+                self._records.clear()
+                self._pending.clear()
+                to_delete = [row[0] for row in self._conn.execute("SELECT id FROM records")]
+                self._conn.execute("DELETE FROM records")
+                for record_id in to_delete:
+                    remove_provenance(record_id)
+                return len(to_delete)
+
+            # 清理特定天数之前的记录；ISO 格式的时间可以直接按字符串比较，没有开始时间的记录保留
+            cutoff = datetime.fromtimestamp(datetime.now().timestamp() - days * 24 * 60 * 60).isoformat()
+            to_delete = [row[0] for row in self._conn.execute(
+                "SELECT id FROM records WHERE start_time IS NOT NULL AND start_time < ?", (cutoff,))]
+            self._conn.executemany("DELETE FROM records WHERE id = ?", [(record_id,) for record_id in to_delete])
             for record_id in to_delete:
-                self.delete_record(record_id)
-            
+                self._records.pop(record_id, None)
+                self._pending.pop(record_id, None)
+                remove_provenance(record_id)
             return len(to_delete)
 
 
@@ -0,0 +1,237 @@
+"""
+增量运行清单模块 - 记录某个 (工作流, 输入目录, 输出目录) 组合已经处理过的文件，只把新增或变化的文件送入处理步骤
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from waifuc.source import LocalSource
+
+from .config_manager import config_manager
+from .workflow import Workflow
+
+# 写入每个图像项元数据的键，记录其来源文件相对输入目录的路径，用于把输出归属到来源
+SOURCE_FILE_META = 'incremental_source'
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.webp')
+
+
+def _file_sha256(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def workflow_signature(workflow: Workflow) -> str:
+    """工作流步骤链的签名，步骤或参数变化后所有文件都需要重新处理"""
+    payload = json.dumps([[step.action_name, step.params] for step in workflow.steps],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SelectedLocalSource(LocalSource):
+    """
+    只读取输入目录中指定文件的 LocalSource，并在元数据中标注每个图像项的来源文件
+    """
+    def __init__(self, directory: str, files: List[str], recursive: bool = True, prefetch: int = 0):
+        LocalSource.__init__(self, directory, recursive, prefetch=prefetch)
+        self.files = set(files)
+
+    def _iter_files(self):
+        for file, group_name in LocalSource._iter_files(self):
+            if os.path.relpath(file, self.directory).replace(os.sep, '/') in self.files:
+                yield file, group_name
+
+    def _load_file(self, file: str, group_name: str):
+        # 预读时文件的读取先于图像项的产出，因此在读取时就标注来源文件
+        item = LocalSource._load_file(self, file, group_name)
+        if item is not None:
+            item.meta[SOURCE_FILE_META] = os.path.relpath(file, self.directory).replace(os.sep, '/')
+        return item
+
+
+class IncrementalPlan:
+    """
+    一次增量运行的计划：需要处理的文件、未变化的文件以及已从输入目录删除的文件
+    """
+    def __init__(self, manifest: 'RunManifest', input_directory: str,
+                 scanned: Dict[str, Dict[str, Any]], pending: List[str],
+                 unchanged: List[str], deleted: List[str]):
+        self.manifest = manifest
+        self.input_directory = input_directory
+        self.scanned = scanned
+        self.pending = pending
+        self.unchanged = unchanged
+        self.deleted = deleted
+        self._outputs: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def fingerprint(self) -> str:
+        """待处理文件集合的指纹（供步骤缓存使用）"""
+        sha = hashlib.sha256()
+        for rel in sorted(self.pending):
+            sha.update(f"{rel}\0{self.scanned[rel]['sha256']}\n".encode('utf-8'))
+        return sha.hexdigest()
+
+    def create_source(self, prefetch: int = 0) -> SelectedLocalSource:
+        return SelectedLocalSource(self.input_directory, self.pending, prefetch=prefetch)
+
+    def track(self, items) -> Iterator:
+        """
+        透传最终图像流，记录每个输出文件名对应的来源文件
+        """
+        for item in items:
+            source_file = item.meta.get(SOURCE_FILE_META)
+            filename = item.meta.get('filename')
+            if source_file and filename:
+                with self._lock:
+                    self._outputs.setdefault(source_file, []).append(filename)
+            yield item
+
+    @property
+    def output_count(self) -> int:
+        with self._lock:
+            return sum(len(names) for names in self._outputs.values())
+
+    def commit(self, prune: bool = False) -> List[str]:
+        """
+        运行成功后更新清单
+
+        Args:
+            prune: 是否删除来源已被删除（或已重新处理、不再产出）的旧输出
+
+        Returns:
+            被删除的输出文件列表
+        """
+        return self.manifest.apply(self, prune)
+
+
+class RunManifest:
+    """
+    单个 (工作流, 输入目录, 输出目录) 组合的处理清单
+    """
+    def __init__(self, workflow: Workflow, input_directory: str, output_directory: str,
+                 manifests_dir: str = None):
+        self.workflow = workflow
+        self.input_directory = os.path.abspath(input_directory)
+        self.output_directory = os.path.abspath(output_directory)
+        self.manifests_dir = manifests_dir or os.path.join(config_manager.config_dir, 'manifests')
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+        key = '\n'.join([workflow.id, self.input_directory, self.output_directory])
+        self.path = os.path.join(self.manifests_dir, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json")
+        self.signature = workflow_signature(workflow)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logging.error(f"加载增量清单 {self.path} 失败: {e}")
+            return
+        if data.get('signature') != self.signature:
+            logging.info(f"工作流 {self.workflow.name} 的步骤已变化，增量清单失效，将重新处理所有文件")
+            return
+        self.files = data.get('files', {})
+
+    def save(self) -> None:
+        data = {
+            'workflow_id': self.workflow.id,
+            'workflow_name': self.workflow.name,
+            'input_directory': self.input_directory,
+            'output_directory': self.output_directory,
+            'signature': self.signature,
+            'updated_time': datetime.now().isoformat(),
+            'files': self.files,
+        }
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def plan(self) -> IncrementalPlan:
+        """
+        扫描输入目录并与清单比较。大小和修改时间都未变的文件直接视为未变化，
+        否则再比较内容哈希，避免仅被 touch 过的文件被重新处理。
+        """
+        scanned: Dict[str, Dict[str, Any]] = {}
+        pending, unchanged = [], []
+        for root, dirs, files in os.walk(self.input_directory):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.input_directory).replace(os.sep, '/')
+                stat = os.stat(path)
+                entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+                previous = self.files.get(rel)
+                if previous and previous['size'] == entry['size'] and previous['mtime'] == entry['mtime']:
+                    entry['sha256'] = previous['sha256']
+                else:
+                    entry['sha256'] = _file_sha256(path)
+                scanned[rel] = entry
+                if previous and previous['sha256'] == entry['sha256']:
+                    unchanged.append(rel)
+                else:
+                    pending.append(rel)
+
+        deleted = sorted(rel for rel in self.files if rel not in scanned)
+        return IncrementalPlan(self, self.input_directory, scanned, pending, unchanged, deleted)
+
+    def _remove_output(self, filename: str) -> bool:
+        removed = False
+        body = os.path.splitext(filename)[0]
+        directory, basename = os.path.split(os.path.join(self.output_directory, body))
+        for path in (os.path.join(self.output_directory, filename),
+                     os.path.join(self.output_directory, f'{body}.txt'),
+                     os.path.join(directory, f'.{basename}_meta.json')):
+            if os.path.isfile(path):
+                os.remove(path)
+                removed = True
+        return removed
+
+    def apply(self, plan: IncrementalPlan, prune: bool = False) -> List[str]:
+        with plan._lock:
+            produced = {rel: list(names) for rel, names in plan._outputs.items()}
+
+        removed = []
+        stale: List[str] = []
+        for rel in plan.deleted:
+            stale.extend(self.files.get(rel, {}).get('outputs', []))
+        for rel in plan.pending:
+            new_outputs = set(produced.get(rel, []))
+            stale.extend(name for name in self.files.get(rel, {}).get('outputs', []) if name not in new_outputs)
+
+        if prune:
+            # 其他来源本次仍然产出的同名文件不能删除
+            still_used = {name for names in produced.values() for name in names}
+            for rel in plan.unchanged:
+                still_used.update(self.files.get(rel, {}).get('outputs', []))
+            for name in stale:
+                if name not in still_used and self._remove_output(name):
+                    removed.append(name)
+
+        files = {}
+        for rel in plan.unchanged:
+            files[rel] = {**plan.scanned[rel], 'outputs': self.files.get(rel, {}).get('outputs', [])}
+        for rel in plan.pending:
+            files[rel] = {**plan.scanned[rel], 'outputs': sorted(set(produced.get(rel, [])))}
+        if not prune:
+            # 不清理时保留已删除来源的记录，之后开启清理仍可找到其输出
+            for rel in plan.deleted:
+                files[rel] = self.files[rel]
+        self.files = files
+        self.save()
+        return removed
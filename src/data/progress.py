@@ -0,0 +1,224 @@
+"""
+进度通道模块 - 在处理过程中按图像粒度统计进度，并以限频的方式发布给订阅者（界面、命令行等）
+"""
+import logging
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TaskCancelledError(Exception):
+    """
+    任务被用户取消。由处理链中的取消检查点抛出，引擎据此把任务标记为已取消
+    """
+    pass
+
+
+class ProgressSnapshot:
+    """
+    某一时刻的任务进度快照（只读，可以安全地跨线程传递）
+    """
+    def __init__(self, record_id: str, stage: str, message: str, fraction: Optional[float],
+                 total: Optional[int], done: int, items_per_second: Optional[float],
+                 eta_seconds: Optional[float], elapsed_seconds: float,
+                 steps: List[Dict[str, Any]], finished: bool):
+        self.record_id = record_id
+        self.stage = stage
+        self.message = message
+        self.fraction = fraction
+        self.total = total
+        self.done = done
+        self.items_per_second = items_per_second
+        self.eta_seconds = eta_seconds
+        self.elapsed_seconds = elapsed_seconds
+        self.steps = steps
+        self.finished = finished
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+    def __repr__(self) -> str:
+        return (f"ProgressSnapshot(stage={self.stage!r}, done={self.done}, total={self.total}, "
+                f"fraction={self.fraction}, items_per_second={self.items_per_second})")
+
+
+class ProgressChannel:
+    """
+    单个任务的进度通道
+
+    处理链在每个图像经过步骤边界时调用 item_in/item_out，并在同一位置调用 check_cancelled，
+    因此取消请求最多在一个图像的处理时间内生效。快照最多每 min_interval 秒发布一次，
+    阶段变化和任务结束时立即发布。
+    """
+    def __init__(self, record_id: str, cancel_event: Optional[threading.Event] = None,
+                 min_interval: float = 0.25):
+        self.record_id = record_id
+        self.cancel_event = cancel_event
+        self.min_interval = min_interval
+
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[[ProgressSnapshot], None]] = []
+        self._stage = ""
+        self._message = ""
+        self._fraction: Optional[float] = None
+        self._total: Optional[int] = None
+        self._done = 0
+        self._started_at = time.monotonic()
+        self._processing_started_at: Optional[float] = None
+        self._span = (0.0, 1.0)
+        self._last_publish = 0.0
+        self._finished = False
+        self._steps: List[Dict[str, Any]] = []
+        self._counter_sources: List[Callable[[], None]] = []
+        self._guards: List[Callable[[], None]] = []
+        self._latest: Optional[ProgressSnapshot] = None
+
+    def subscribe(self, callback: Callable[[ProgressSnapshot], None]) -> None:
+        """注册进度订阅者，回调在工作线程中被调用"""
+        self._subscribers.append(callback)
+
+    def add_guard(self, guard: Callable[[], None]) -> None:
+        """注册在每个检查点调用的回调，需要中止处理时由回调抛出异常（例如临时空间超出预算）"""
+        self._guards.append(guard)
+
+    def remove_guard(self, guard: Callable[[], None]) -> None:
+        if guard in self._guards:
+            self._guards.remove(guard)
+
+    def check_cancelled(self) -> None:
+        """若已请求取消则抛出 TaskCancelledError，随后调用各个检查回调"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise TaskCancelledError("任务已被用户取消")
+        for guard in self._guards:
+            guard()
+
+    def set_steps(self, steps: List[Any]) -> None:
+        """设置需要统计的步骤（WorkflowStep 列表）"""
+        with self._lock:
+            self._steps = [{'step_id': step.id, 'name': step.action_name, 'items_in': 0, 'items_out': 0}
+                           for step in steps]
+
+    def set_total(self, total: Optional[int]) -> None:
+        with self._lock:
+            self._total = total
+
+    def set_stage(self, stage: str, message: str = "", fraction: Optional[float] = None) -> None:
+        """切换阶段（例如“获取图像”“处理中”），立即发布"""
+        with self._lock:
+            self._stage = stage
+            self._message = message
+            if fraction is not None:
+                self._fraction = fraction
+        self.publish(force=True)
+
+    def begin_pass(self, total: Optional[int], base: float = 0.0, width: float = 1.0) -> None:
+        """
+        开始一轮对图像的遍历，吞吐量和 ETA 从此刻起计算
+
+        Args:
+            total: 本轮预计的图像数，未知时为 None
+            base: 本轮开始时的总体进度
+            width: 本轮在总体进度中所占的比例（分阶段执行时每个步骤各占一段）
+        """
+        with self._lock:
+            self._processing_started_at = time.monotonic()
+            self._done = 0
+            self._total = total
+            self._span = (base, width)
+
+    def item_done(self) -> None:
+        """来源（或分阶段执行时当前步骤的输入）产出了一个图像"""
+        with self._lock:
+            self._done += 1
+        self.publish()
+
+    def item_in(self, index: int) -> None:
+        with self._lock:
+            if 0 <= index < len(self._steps):
+                self._steps[index]['items_in'] += 1
+
+    def item_out(self, index: int) -> None:
+        with self._lock:
+            if 0 <= index < len(self._steps):
+                self._steps[index]['items_out'] += 1
+        self.publish()
+
+    def add_counter_source(self, callback: Callable[[], None]) -> None:
+        """
+        注册在发布前调用的回调，用于把融合阶段内部的计数同步到各步骤
+        """
+        self._counter_sources.append(callback)
+
+    def set_step_counts(self, index: int, items_in: int, items_out: int) -> None:
+        with self._lock:
+            if 0 <= index < len(self._steps):
+                self._steps[index]['items_in'] = items_in
+                self._steps[index]['items_out'] = items_out
+
+    def step_counts(self) -> List[Dict[str, Any]]:
+        for callback in self._counter_sources:
+            callback()
+        with self._lock:
+            return [dict(step) for step in self._steps]
+
+    def finish(self, stage: str, message: str = "", fraction: Optional[float] = None) -> None:
+        """任务结束（完成、失败或取消），立即发布最终快照"""
+        with self._lock:
+            self._finished = True
+            self._stage = stage
+            self._message = message
+            if fraction is not None:
+                self._fraction = fraction
+        self.publish(force=True)
+
+    def snapshot(self) -> ProgressSnapshot:
+        steps = self.step_counts()
+        now = time.monotonic()
+        with self._lock:
+            rate = None
+            eta = None
+            fraction = self._fraction
+            if self._processing_started_at is not None:
+                elapsed = now - self._processing_started_at
+                if elapsed > 0 and self._done > 0:
+                    rate = self._done / elapsed
+                if self._total:
+                    if not self._finished:
+                        base, width = self._span
+                        fraction = base + width * min(1.0, self._done / self._total)
+                    if rate:
+                        eta = max(0.0, (self._total - self._done) / rate)
+            return ProgressSnapshot(
+                record_id=self.record_id,
+                stage=self._stage,
+                message=self._message,
+                fraction=fraction,
+                total=self._total,
+                done=self._done,
+                items_per_second=rate,
+                eta_seconds=eta,
+                elapsed_seconds=now - self._started_at,
+                steps=steps,
+                finished=self._finished,
+            )
+
+    @property
+    def latest(self) -> Optional[ProgressSnapshot]:
+        """最近一次发布的快照"""
+        return self._latest
+
+    def publish(self, force: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_publish < self.min_interval:
+                return
+            self._last_publish = now
+        snapshot = self.snapshot()
+        self._latest = snapshot
+        for callback in list(self._subscribers):
+            try:
+                callback(snapshot)
+            except Exception:
+                logger.exception("progress callback failed")
@@ -0,0 +1,420 @@
+"""
+溯源日志模块 - 记录每次运行中每个图像在各步骤的去向（输入、输出、被过滤），并提供查询接口
+
+日志按运行保存为只追加的二进制文件（config_dir/provenance/<记录ID>.prov），事件为定长记录，
+文件名只写一次并以编号引用，10 万张图像的运行也只增加几 MB 和可以忽略的耗时。
+进程崩溃时文件尾部可能不完整，读取时忽略不完整的记录。
+
+事件以"阶段"为单位记录：普通步骤是一个阶段；流式执行时融合在一起的连续步骤（FusedAction）
+共用一个阶段，成员步骤过滤掉的图像另外记录 DROP 事件。输出图像按文件名归属到输入图像：
+文件名相同、或以输入文件名（去掉扩展名）开头的输出归属该输入，否则归属最近读取的输入。
+"""
+import os
+import json
+import time
+import logging
+import struct
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .config_manager import config_manager
+
+MAGIC = b'WPRV1\n'
+
+# 事件类型
+K_META = 0  # 运行信息（JSON）
+K_NAME = 1  # 文件名定义
+K_STAGE = 2  # 阶段定义（首步骤序号, 末步骤序号）
+K_IN = 3  # 图像进入阶段
+K_OUT = 4  # 阶段产出图像
+K_DROP = 5  # 融合阶段中的某个成员步骤过滤掉图像
+
+# 来源和最终导出使用的步骤序号
+SOURCE_STEP = -1
+EXPORT_STEP = -2
+
+_EVENT = struct.Struct('<BhIIf')  # 事件类型, 步骤序号, 文件名编号, 上游文件名编号, 相对开始的秒数
+_NAME = struct.Struct('<IH')
+_STAGE = struct.Struct('<hh')
+_LENGTH = struct.Struct('<I')
+_NO_PARENT = 0xFFFFFFFF
+
+# 归属输出时只在最近读取的这么多个输入中查找
+ATTRIBUTION_WINDOW = 256
+
+
+def provenance_path(record_id: str) -> str:
+    """执行记录对应的溯源日志路径"""
+    return os.path.join(config_manager.config_dir, 'provenance', f'{record_id}.prov')
+
+
+def remove_provenance(record_id: str) -> None:
+    """删除执行记录的溯源日志（删除执行记录时调用）"""
+    try:
+        os.remove(provenance_path(record_id))
+    except FileNotFoundError:
+        pass
+
+
+def _item_name(item) -> Optional[str]:
+    meta = getattr(item, 'meta', None) or {}
+    return meta.get('filename')
+
+
+def _stem(name: str) -> str:
+    # 比 os.path.splitext 快，文件名只含一个点时两者结果相同
+    stem, dot, _ = name.rpartition('.')
+    return stem if dot else name
+
+
+class ProvenanceWriter:
+    """
+    一次运行的溯源日志写入器
+    """
+    def __init__(self, path: str, record_id: str, steps: List[Any], enabled: bool = True):
+        """
+        Args:
+            path: 日志文件路径
+            record_id: 执行记录ID
+            steps: 工作流步骤（WorkflowStep 列表）
+            enabled: 是否记录（配置项 processing.provenance），关闭时所有包装原样返回输入
+        """
+        self.path = path
+        self.enabled = enabled
+        self._names: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._file = None
+        if not enabled:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._file = open(path, 'wb', buffering=1 << 16)
+        except OSError as e:
+            logging.warning(f"无法创建溯源日志 {path}: {e}")
+            self.enabled = False
+            return
+        self._file.write(MAGIC)
+        meta = json.dumps({
+            'record_id': record_id,
+            'steps': [{'id': step.id, 'name': step.action_name} for step in steps],
+        }, ensure_ascii=False).encode('utf-8')
+        self._file.write(bytes([K_META]) + _LENGTH.pack(len(meta)) + meta)
+
+    def _name_id(self, name: str) -> int:
+        # 调用方持有 self._lock
+        name_id = self._names.get(name)
+        if name_id is None:
+            name_id = self._names[name] = len(self._names)
+            data = name.encode('utf-8')[:0xFFFF]
+            self._file.write(bytes([K_NAME]) + _NAME.pack(name_id, len(data)) + data)
+        return name_id
+
+    def _event(self, kind: int, step: int, name: str, parent: Optional[str] = None) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            name_id = self._name_id(name)
+            parent_id = _NO_PARENT if parent is None else self._name_id(parent)
+            self._file.write(_EVENT.pack(kind, step, name_id, parent_id, time.perf_counter() - self._start))
+
+    def stage(self, first: int, last: Optional[int] = None) -> 'StageTracer':
+        """
+        登记一个阶段
+
+        Args:
+            first: 阶段的首步骤序号（来源为 SOURCE_STEP，最终导出为 EXPORT_STEP）
+            last: 阶段的末步骤序号，默认与 first 相同
+
+        Returns:
+            该阶段的跟踪器
+        """
+        last = first if last is None else last
+        if self.enabled:
+            with self._lock:
+                if self._file is not None:
+                    self._file.write(bytes([K_STAGE]) + _STAGE.pack(first, last))
+        return StageTracer(self, first, last)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class StageTracer:
+    """
+    单个阶段的跟踪器：inputs 包装阶段的输入，outputs 包装阶段的输出
+    """
+    def __init__(self, writer: ProvenanceWriter, first: int, last: int):
+        self.writer = writer
+        self.first = first
+        self.last = last
+        self._recent: 'OrderedDict[str, str]' = OrderedDict()  # 文件名 -> 去掉扩展名的文件名
+        self._stems: Dict[str, str] = {}
+        self._seq = 0
+
+    def _name(self, item) -> str:
+        name = _item_name(item)
+        if name is None:
+            self._seq += 1
+            name = f'<item {self.first}:{self._seq}>'
+        return name
+
+    def inputs(self, items: Iterable) -> Iterable:
+        return self._inputs(items) if self.writer.enabled else items
+
+    def _inputs(self, items: Iterable) -> Iterator:
+        for item in items:
+            name = self._name(item)
+            if name in self._recent:
+                self._recent.move_to_end(name)
+            else:
+                stem = self._recent[name] = _stem(name)
+                self._stems[stem] = name
+                if len(self._recent) > ATTRIBUTION_WINDOW:
+                    evicted, evicted_stem = self._recent.popitem(last=False)
+                    if self._stems.get(evicted_stem) == evicted:
+                        del self._stems[evicted_stem]
+            self.writer._event(K_IN, self.first, name)
+            yield item
+
+    def outputs(self, items: Iterable) -> Iterable:
+        return self._outputs(items) if self.writer.enabled else items
+
+    def _parent(self, name: str) -> Optional[str]:
+        if name in self._recent:
+            return name
+        # 最长的、是输出文件名前缀的输入文件名（例如 a.png -> a_person0.png）
+        stem = _stem(name)
+        for length in range(len(stem), 0, -1):
+            candidate = self._stems.get(stem[:length])
+            if candidate is not None:
+                return candidate
+        return next(reversed(self._recent), None)
+
+    def _outputs(self, items: Iterable) -> Iterator:
+        for item in items:
+            name = self._name(item)
+            self.writer._event(K_OUT, self.last, name, self._parent(name))
+            yield item
+
+    def drop(self, offset: int, item) -> None:
+        """融合阶段的第 offset 个成员过滤掉了图像（供 FusedAction 的 on_drop 使用，可在工作线程中调用）"""
+        if self.writer.enabled:
+            self.writer._event(K_DROP, self.first + offset, _item_name(item) or '<unnamed>')
+
+
+class _Stage:
+    def __init__(self, first: int, last: int):
+        self.first = first
+        self.last = last
+        self.inputs: Dict[str, float] = {}
+        self.children: Dict[str, List[Tuple[str, float]]] = {}
+        self.drops: Dict[str, Tuple[int, float]] = {}
+        self.outputs = 0
+
+
+class ProvenanceLog:
+    """
+    读取溯源日志并回答"X 为什么没有输出"、"步骤 N 过滤掉了什么"等问题
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.meta: Dict[str, Any] = {}
+        self.truncated = False
+        self._stages: Dict[Tuple[int, int], _Stage] = {}
+        self._read()
+
+    @classmethod
+    def load(cls, record_id: str) -> Optional['ProvenanceLog']:
+        """
+        读取执行记录的溯源日志
+
+        Returns:
+            溯源日志，未记录时为 None
+        """
+        path = provenance_path(record_id)
+        return cls(path) if os.path.exists(path) else None
+
+    def _read(self) -> None:
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"不是溯源日志文件: {self.path}")
+        names: List[str] = []
+        by_first: Dict[int, _Stage] = {}
+        by_last: Dict[int, _Stage] = {}
+        pos, end = len(MAGIC), len(data)
+        try:
+            while pos < end:
+                kind = data[pos]
+                pos += 1
+                if kind == K_META:
+                    (length,) = _LENGTH.unpack_from(data, pos)
+                    self.meta = json.loads(data[pos + 4:pos + 4 + length].decode('utf-8'))
+                    pos += 4 + length
+                elif kind == K_NAME:
+                    name_id, length = _NAME.unpack_from(data, pos)
+                    if pos + 6 + length > end:
+                        raise struct.error('truncated name')
+                    names.append(data[pos + 6:pos + 6 + length].decode('utf-8', 'replace'))
+                    pos += 6 + length
+                elif kind == K_STAGE:
+                    first, last = _STAGE.unpack_from(data, pos)
+                    pos += _STAGE.size
+                    # 超出临时空间预算改为流式执行时，同一步骤会再次登记，以后登记的为准
+                    stage = self._stages[(first, last)] = _Stage(first, last)
+                    by_last[last] = stage
+                    for step in range(first, last + 1):
+                        by_first[step] = stage
+                else:
+                    _, step, name_id, parent_id, t = _EVENT.unpack_from(data, pos - 1)
+                    pos += _EVENT.size - 1
+                    name = names[name_id]
+                    if kind == K_IN:
+                        by_first[step].inputs.setdefault(name, t)
+                    elif kind == K_OUT:
+                        stage = by_last[step]
+                        stage.outputs += 1
+                        parent = names[parent_id] if parent_id != _NO_PARENT else None
+                        stage.children.setdefault(parent, []).append((name, t))
+                    elif kind == K_DROP:
+                        by_first[step].drops[name] = (step, t)
+                    else:
+                        raise ValueError(f"未知的事件类型 {kind}")
+        except (struct.error, IndexError, KeyError):
+            self.truncated = True
+
+    @property
+    def steps(self) -> List[Dict[str, str]]:
+        return self.meta.get('steps', [])
+
+    def _ordered_stages(self) -> List[_Stage]:
+        def key(stage):
+            return {SOURCE_STEP: -1, EXPORT_STEP: 1 << 16}.get(stage.first, stage.first)
+        return sorted(self._stages.values(), key=key)
+
+    def _step_label(self, step: int) -> str:
+        if step == SOURCE_STEP:
+            return "来源"
+        if step == EXPORT_STEP:
+            return "最终导出"
+        name = self.steps[step]['name'] if 0 <= step < len(self.steps) else '?'
+        return f"步骤 {step + 1} ({name})"
+
+    def _outcome(self, stage: _Stage, name: str) -> Tuple[str, int, List[str], Optional[float]]:
+        """图像在阶段中的去向：(passed/dropped, 所在步骤, 输出文件名, 耗时)"""
+        children = stage.children.get(name, [])
+        started = stage.inputs.get(name)
+        if children:
+            seconds = children[0][1] - started if started is not None else None
+            return 'passed', stage.last, [child for child, _ in children], seconds
+        step, t = stage.drops.get(name, (stage.last, None))
+        seconds = t - started if t is not None and started is not None else None
+        return 'dropped', step, [], seconds
+
+    def step_summary(self) -> List[Dict[str, Any]]:
+        """
+        每个步骤的输入、输出和被过滤的图像数（只含本次实际执行的步骤，不含缓存复用的步骤）
+
+        Returns:
+            [{'step_index', 'step_name', 'items_in', 'items_out', 'items_dropped'}, ...]
+        """
+        summary = []
+        for stage in self._ordered_stages():
+            if stage.first in (SOURCE_STEP, EXPORT_STEP):
+                continue
+            remaining = len(stage.inputs)
+            for step in range(stage.first, stage.last + 1):
+                if step == stage.last:
+                    dropped = len(self.dropped(step))
+                    items_out = stage.outputs
+                else:
+                    dropped = sum(1 for s, _ in stage.drops.values() if s == step)
+                    items_out = remaining - dropped
+                summary.append({
+                    'step_index': step,
+                    'step_name': self.steps[step]['name'] if step < len(self.steps) else None,
+                    'items_in': remaining,
+                    'items_out': items_out,
+                    'items_dropped': dropped,
+                })
+                remaining = items_out
+        return summary
+
+    def dropped(self, step_index: int) -> List[str]:
+        """
+        步骤 step_index（从 0 开始）过滤掉、没有产出任何图像的输入文件名
+        """
+        for stage in self._stages.values():
+            if stage.first <= step_index <= stage.last and stage.first >= 0:
+                return [name for name in stage.inputs
+                        if name not in stage.children and stage.drops.get(name, (stage.last,))[0] == step_index]
+        return []
+
+    def trace(self, name: str) -> List[Dict[str, Any]]:
+        """
+        跟踪一个来源图像经过各阶段的去向
+
+        Args:
+            name: 来源图像的文件名（图像 meta 中的 filename）
+
+        Returns:
+            按阶段排列的 [{'step_index', 'input', 'outcome', 'outputs', 'seconds'}, ...]，
+            outcome 为 passed、dropped 或 not_reached（未进入该阶段，例如由缓存提供）
+        """
+        frontier = [name]
+        result = []
+        for stage in self._ordered_stages():
+            if stage.first == SOURCE_STEP:
+                continue
+            next_frontier = []
+            for current in frontier:
+                if current not in stage.inputs:
+                    result.append({'step_index': stage.first, 'input': current, 'outcome': 'not_reached',
+                                   'outputs': [], 'seconds': None})
+                    continue
+                if stage.first == EXPORT_STEP:
+                    result.append({'step_index': EXPORT_STEP, 'input': current, 'outcome': 'exported',
+                                   'outputs': [current], 'seconds': None})
+                    continue
+                outcome, step, outputs, seconds = self._outcome(stage, current)
+                result.append({'step_index': step, 'input': current, 'outcome': outcome,
+                               'outputs': outputs, 'seconds': seconds})
+                next_frontier.extend(outputs)
+            frontier = next_frontier
+            if not frontier:
+                break
+        return result
+
+    def source_names(self) -> List[str]:
+        """来源产出的所有文件名"""
+        stage = self._stages.get((SOURCE_STEP, SOURCE_STEP))
+        return [name for children in stage.children.values() for name, _ in children] if stage else []
+
+    def explain(self, name: str) -> str:
+        """
+        用一句话说明一个来源图像的结果（例如为什么没有输出）
+
+        Args:
+            name: 来源图像的文件名
+
+        Returns:
+            说明文字
+        """
+        if name not in self.source_names():
+            return f"{name} 不在本次运行的来源图像中（可能不存在、增量运行时未变化，或由缓存提供）"
+        entries = self.trace(name)
+        exported = [e['input'] for e in entries if e['outcome'] == 'exported']
+        if exported:
+            return f"{name} 已导出为 {', '.join(exported)}"
+        for entry in entries:
+            if entry['outcome'] == 'dropped':
+                via = f"（经过处理后的文件名为 {entry['input']}）" if entry['input'] != name else ""
+                return f"{name} 在{self._step_label(entry['step_index'])}被过滤掉{via}"
+            if entry['outcome'] == 'not_reached':
+                return f"{name} 没有到达{self._step_label(entry['step_index'])}"
+        return f"{name} 没有产生任何输出" + ("（日志不完整，运行可能被中断）" if self.truncated else "")
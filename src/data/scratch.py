@@ -0,0 +1,212 @@
+"""
+临时空间模块 - 管理任务的中间文件目录（位置、容量预算、用量统计和超限时的处理策略）
+"""
+import os
+import shutil
+import tempfile
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from .config_manager import config_manager
+
+# 超出预算时的处理策略
+SPILL_STREAM = 'stream'  # 改为流式执行剩余步骤，不再写中间目录
+SPILL_FAIL = 'fail'  # 任务失败
+SPILL_POLICIES = (SPILL_STREAM, SPILL_FAIL)
+
+# 用量达到预算的该比例时即视为“接近预算”，给两次采样之间的写入留出余量
+NEAR_BUDGET_RATIO = 0.9
+
+
+class ScratchBudgetExceeded(Exception):
+    """
+    临时空间用量接近或超过预算。由处理链中的检查点抛出，引擎据此切换为流式执行或使任务失败
+    """
+    def __init__(self, space: 'ScratchSpace'):
+        self.space = space
+        super().__init__(f"临时空间用量 {space.usage} 字节已接近预算 {space.budget} 字节 ({space.path})")
+
+
+def _directory_size(directory: str) -> int:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ScratchSpace:
+    """
+    单个任务的临时空间，位于 ScratchManager.root 下的独立目录，任务结束时整体删除
+    """
+    def __init__(self, manager: 'ScratchManager', record_id: str, path: str,
+                 budget: Optional[int], policy: str):
+        self.manager = manager
+        self.record_id = record_id
+        self.path = path
+        self.budget = budget
+        self.policy = policy
+        self.usage = 0
+        self.high_water = 0
+        self.spilled = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    def mkdtemp(self, prefix: str = '') -> str:
+        """在临时空间中创建目录"""
+        return tempfile.mkdtemp(prefix=prefix, dir=self.path)
+
+    def remove(self, path: str) -> None:
+        """提前删除不再需要的中间目录"""
+        if os.path.abspath(path).startswith(os.path.abspath(self.path) + os.sep):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def sample(self) -> int:
+        """重新统计用量并更新峰值"""
+        usage = _directory_size(self.path)
+        with self._lock:
+            self.usage = usage
+            self.high_water = max(self.high_water, usage)
+        return usage
+
+    @property
+    def available(self) -> Optional[int]:
+        """预算内剩余的字节数（同时受全局预算限制），不限制时为 None"""
+        limits = []
+        if self.budget:
+            limits.append(self.budget - self.usage)
+        if self.manager.budget:
+            limits.append(self.manager.budget - self.manager.total_usage())
+        return max(0, min(limits)) if limits else None
+
+    def near_budget(self) -> bool:
+        if self.budget and self.usage >= self.budget * NEAR_BUDGET_RATIO:
+            return True
+        if self.manager.budget and self.manager.total_usage() >= self.manager.budget * NEAR_BUDGET_RATIO:
+            return True
+        return False
+
+    def check(self) -> None:
+        """
+        检查点：用量接近预算时抛出 ScratchBudgetExceeded（由后台采样更新用量，本身不访问磁盘）
+        """
+        if self.near_budget():
+            raise ScratchBudgetExceeded(self)
+
+    def start_monitor(self, interval: float) -> None:
+        """启动后台采样，记录峰值（包括 DirectoryPipelineAction 等动作内部写入的文件）"""
+        def _run():
+            while not self._stop.wait(interval):
+                try:
+                    self.sample()
+                except Exception as e:
+                    logging.debug(f"临时空间采样失败: {e}")
+
+        self._monitor = threading.Thread(target=_run, name=f'scratch-{self.record_id[:8]}', daemon=True)
+        self._monitor.start()
+
+    def report(self) -> Dict[str, Any]:
+        """写入执行记录的用量报告"""
+        return {
+            'path': self.path,
+            'budget': self.budget,
+            'global_budget': self.manager.budget,
+            'policy': self.policy,
+            'high_water': self.high_water,
+            'spilled': self.spilled,
+        }
+
+    def close(self) -> None:
+        """停止采样并删除整个临时空间"""
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join()
+        self.sample()
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.manager._release(self)
+
+
+class ScratchManager:
+    """
+    临时空间管理器，所有任务的中间文件都放在 root 下，并共享全局容量预算
+    """
+    def __init__(self, root: str = None, budget: int = None, policy: str = None):
+        """
+        初始化临时空间管理器
+
+        Args:
+            root: 临时空间根目录（例如 tmpfs 或本地 NVMe），默认使用配置项 processing.scratch.path，
+                为空时使用系统临时目录
+            budget: 所有任务合计的容量上限（字节），默认使用配置项 processing.scratch.max_size_mb，0 表示不限制
+            policy: 超出预算时的策略（stream 或 fail），默认使用配置项 processing.scratch.spill_policy
+        """
+        self._root = root
+        self._budget = budget
+        self._policy = policy
+        self._spaces: Dict[str, ScratchSpace] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def root(self) -> str:
+        return self._root or config_manager.get("processing.scratch.path", "") or tempfile.gettempdir()
+
+    @property
+    def budget(self) -> Optional[int]:
+        if self._budget is not None:
+            return self._budget or None
+        return int(config_manager.get("processing.scratch.max_size_mb", 0)) * 1024 * 1024 or None
+
+    @property
+    def policy(self) -> str:
+        return self._policy or config_manager.get("processing.scratch.spill_policy", SPILL_STREAM)
+
+    def create_space(self, record_id: str, root: str = None, budget: int = None,
+                     policy: str = None) -> ScratchSpace:
+        """
+        为任务创建临时空间
+
+        Args:
+            record_id: 执行记录ID
+            root: 覆盖根目录
+            budget: 该任务自身的容量上限（字节），None 表示只受全局预算限制
+            policy: 覆盖超出预算时的策略
+
+        Returns:
+            临时空间
+        """
+        policy = policy or self.policy
+        if policy not in SPILL_POLICIES:
+            raise ValueError(f"未知的临时空间策略: {policy}")
+        base = root or self.root
+        os.makedirs(base, exist_ok=True)
+        path = tempfile.mkdtemp(prefix=f'waifuc_{record_id[:8]}_', dir=base)
+        space = ScratchSpace(self, record_id, path, budget or None, policy)
+        with self._lock:
+            self._spaces[record_id] = space
+        space.start_monitor(config_manager.get("processing.scratch.sample_interval", 2.0))
+        return space
+
+    def _release(self, space: ScratchSpace) -> None:
+        with self._lock:
+            self._spaces.pop(space.record_id, None)
+
+    def total_usage(self) -> int:
+        with self._lock:
+            return sum(space.usage for space in self._spaces.values())
+
+    def get_usage(self) -> Dict[str, Any]:
+        """各任务当前的临时空间用量"""
+        with self._lock:
+            spaces = list(self._spaces.values())
+        return {
+            'root': self.root,
+            'budget': self.budget,
+            'total': sum(space.usage for space in spaces),
+            'tasks': {space.record_id: {'usage': space.usage, 'high_water': space.high_water,
+                                        'budget': space.budget} for space in spaces},
+        }
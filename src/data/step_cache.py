@@ -0,0 +1,375 @@
+"""
+步骤结果缓存模块 - 以内容寻址的方式缓存工作流每个步骤的输出，重跑修改过的工作流时复用未变化的前缀
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from .config_manager import config_manager
+from .workflow import WorkflowStep
+
+# 缓存目录布局或键算法变化时递增，使旧条目自然失效
+CACHE_FORMAT_VERSION = 1
+
+# 不在索引中的条目目录在此时间内视为其他进程正在登记，不清理
+ORPHAN_GRACE_SECONDS = 3600
+
+# 未固定随机种子时每次输出都不同，这类步骤（及其后续步骤）不参与缓存
+NONDETERMINISTIC_ACTIONS = {
+    'RandomChoiceAction',
+    'RandomFilenameAction',
+}
+
+
+def fingerprint_directory(directory: str, content: bool = False) -> str:
+    """
+    计算输入目录的指纹（相对路径、大小和修改时间）
+
+    Args:
+        directory: 输入目录
+        content: 是否按文件内容计算（用于每次重新下载、修改时间不稳定的目录）
+
+    Returns:
+        十六进制指纹字符串
+    """
+    sha = hashlib.sha256()
+    directory = os.path.abspath(directory)
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            rel = os.path.relpath(path, directory).replace(os.sep, '/')
+            if content:
+                file_sha = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        file_sha.update(chunk)
+                sha.update(f'{rel}\0{file_sha.hexdigest()}\n'.encode('utf-8'))
+            else:
+                sha.update(f'{rel}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return sha.hexdigest()
+
+
+def is_step_cacheable(step: WorkflowStep) -> bool:
+    """判断步骤的输出是否可以被缓存复用"""
+    if step.action_name in NONDETERMINISTIC_ACTIONS:
+        return step.params.get('seed') is not None
+    return True
+
+
+def step_chain_keys(input_fingerprint: str, steps: List[WorkflowStep]) -> List[str]:
+    """
+    为步骤链计算逐级的缓存键，第 i 个键覆盖输入指纹和前 i+1 个步骤的 (action_name, params)
+
+    Args:
+        input_fingerprint: 输入数据集指纹
+        steps: 工作流步骤
+
+    Returns:
+        与可缓存前缀等长的键列表，遇到不可缓存的步骤即停止
+    """
+    keys = []
+    current = f'v{CACHE_FORMAT_VERSION}:{input_fingerprint}'
+    for step in steps:
+        if not is_step_cacheable(step):
+            break
+        data = step.to_dict()
+        payload = json.dumps([data['action_name'], data['params']], sort_keys=True, ensure_ascii=False, default=str)
+        current = hashlib.sha256(f'{current}\n{payload}'.encode('utf-8')).hexdigest()
+        keys.append(current)
+    return keys
+
+
+def _pid_alive(pid: int) -> bool:
+    """判断进程是否仍在运行，无法可靠判断时视为仍在运行"""
+    if pid == os.getpid():
+        return True
+    try:
+        import psutil
+        return psutil.pid_exists(pid)
+    except ImportError:
+        pass
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _directory_size(directory: str) -> int:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class StepCache:
+    """
+    步骤结果缓存，每个条目是一个保存了图像及元数据的目录，按最近使用时间进行容量淘汰
+    """
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        """
+        初始化步骤缓存
+
+        Args:
+            cache_dir: 缓存目录，默认为配置目录下的 step_cache
+            max_bytes: 缓存容量上限（字节），默认使用配置项 processing.step_cache.max_size_mb
+        """
+        self.cache_dir = cache_dir or os.path.join(config_manager.config_dir, 'step_cache')
+        self._max_bytes = max_bytes
+        self.entries_dir = os.path.join(self.cache_dir, 'entries')
+        self.staging_dir = os.path.join(self.cache_dir, 'staging')
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.staging_dir, exist_ok=True)
+        self._cleanup_staging()
+
+        self._lock = threading.RLock()
+        self._pins: Dict[str, int] = {}
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(config_manager.get('processing.step_cache.enabled', True))
+
+    @property
+    def max_bytes(self) -> int:
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return int(config_manager.get('processing.step_cache.max_size_mb', 10240)) * 1024 * 1024
+
+    def _cleanup_staging(self) -> None:
+        """清理异常退出的进程遗留的半成品，其他仍在运行的进程（例如并行的命令行任务）的临时目录保留"""
+        for name in os.listdir(self.staging_dir):
+            parts = name.rsplit('_', 2)
+            if len(parts) == 3 and parts[1].isdigit() and _pid_alive(int(parts[1])):
+                continue
+            shutil.rmtree(os.path.join(self.staging_dir, name), ignore_errors=True)
+
+    def _read_index_file(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _load_index(self) -> None:
+        """加载索引，并丢弃磁盘上已不存在的条目"""
+        try:
+            self._index = self._read_index_file()
+        except Exception as e:
+            logging.error(f"加载步骤缓存索引失败: {e}")
+            self._index = {}
+        self._index = {key: entry for key, entry in self._index.items()
+                       if os.path.isdir(self._entry_path(key))}
+        now = time.time()
+        for name in os.listdir(self.entries_dir):
+            path = os.path.join(self.entries_dir, name)
+            if name not in self._index and now - os.path.getmtime(path) > ORPHAN_GRACE_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _save_index(self) -> None:
+        # 合并其他进程登记的条目，多个进程（例如并行的命令行任务）共用同一缓存目录时不会互相覆盖
+        try:
+            for key, entry in self._read_index_file().items():
+                if key not in self._index and os.path.isdir(self._entry_path(key)):
+                    self._index[key] = entry
+        except Exception:
+            pass
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logging.error(f"保存步骤缓存索引失败: {e}")
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.entries_dir, key)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """
+        查找缓存条目，命中时刷新其最近使用时间
+
+        Returns:
+            条目目录，未命中时返回 None
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            path = self._entry_path(key)
+            if not os.path.isdir(path):
+                del self._index[key]
+                self._save_index()
+                return None
+            entry['last_access'] = time.time()
+            entry['hits'] = entry.get('hits', 0) + 1
+            self._save_index()
+            return path
+
+    def longest_prefix(self, keys: List[str]) -> int:
+        """
+        返回已缓存的最长前缀长度（0 表示完全未命中）
+        """
+        with self._lock:
+            for i in range(len(keys), 0, -1):
+                if keys[i - 1] in self._index and os.path.isdir(self._entry_path(keys[i - 1])):
+                    return i
+            return 0
+
+    def pin(self, key: str) -> None:
+        """在任务使用条目期间阻止其被淘汰"""
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: str) -> None:
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+
+    def create_staging(self, key: str, directory: str = None) -> str:
+        """
+        创建用于写入新条目的临时目录
+
+        Args:
+            key: 缓存键
+            directory: 临时目录所在的目录，默认为缓存的 staging 目录；传入任务的临时空间时，
+                写入量在登记前计入该任务的临时空间预算
+
+        Returns:
+            临时目录
+        """
+        path = os.path.join(directory or self.staging_dir, f'{key}_{os.getpid()}_{threading.get_ident()}')
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        return path
+
+    def discard_staging(self, staging_path: str) -> None:
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+    def commit(self, key: str, staging_path: str, action_name: str = None, chain: List[str] = None) -> str:
+        """
+        把写好的临时目录登记为缓存条目
+
+        Args:
+            key: 缓存键
+            staging_path: create_staging 返回的目录，登记后移入缓存目录
+            action_name: 产生该条目的步骤名称（用于展示）
+            chain: 该条目对应的完整步骤名称链（用于展示）
+
+        Returns:
+            条目目录
+        """
+        if os.stat(staging_path).st_dev != os.stat(self.staging_dir).st_dev:
+            # 临时空间与缓存不在同一文件系统，先复制到缓存的 staging 目录，登记时仍是原子替换
+            local_path = self.create_staging(key)
+            shutil.copytree(staging_path, local_path, dirs_exist_ok=True)
+            shutil.rmtree(staging_path, ignore_errors=True)
+            staging_path = local_path
+        size = _directory_size(staging_path)
+        with self._lock:
+            path = self._entry_path(key)
+            if key in self._index and os.path.isdir(path):
+                # 并发任务已经写入同一条目
+                shutil.rmtree(staging_path, ignore_errors=True)
+                return path
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(staging_path, path)
+            now = time.time()
+            self._index[key] = {
+                'action_name': action_name,
+                'chain': list(chain or []),
+                'size': size,
+                'created': now,
+                'last_access': now,
+                'hits': 0,
+            }
+            self._evict_locked()
+            self._save_index()
+            return path
+
+    def _evict_locked(self) -> None:
+        total = sum(entry.get('size', 0) for entry in self._index.values())
+        limit = self.max_bytes
+        if total <= limit:
+            return
+        for key, entry in sorted(self._index.items(), key=lambda kv: kv[1].get('last_access', 0)):
+            if total <= limit:
+                break
+            if key in self._pins:
+                continue
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            total -= entry.get('size', 0)
+            del self._index[key]
+            logging.info(f"步骤缓存条目 {key[:12]} 已被淘汰 ({entry.get('size', 0)} 字节)")
+
+    def evict(self) -> None:
+        """按最近使用时间淘汰条目，直到总大小不超过容量上限"""
+        with self._lock:
+            self._evict_locked()
+            self._save_index()
+
+    def list_entries(self) -> List[Dict[str, Any]]:
+        """
+        列出所有缓存条目，最近使用的在前
+        """
+        with self._lock:
+            entries = [{'key': key, **entry} for key, entry in self._index.items()]
+        return sorted(entries, key=lambda e: e.get('last_access', 0), reverse=True)
+
+    def total_size(self) -> int:
+        with self._lock:
+            return sum(entry.get('size', 0) for entry in self._index.values())
+
+    def remove(self, key: str) -> bool:
+        """删除单个缓存条目（正在使用的条目不会被删除）"""
+        with self._lock:
+            if key not in self._index or key in self._pins:
+                return False
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            del self._index[key]
+            self._save_index()
+            return True
+
+    def purge(self) -> int:
+        """
+        清空缓存中所有未被使用的条目
+
+        Returns:
+            释放的字节数
+        """
+        freed = 0
+        with self._lock:
+            for key in list(self._index):
+                if key in self._pins:
+                    continue
+                freed += self._index[key].get('size', 0)
+                shutil.rmtree(self._entry_path(key), ignore_errors=True)
+                del self._index[key]
+            self._save_index()
+        return freed
+
+
+# 全局步骤缓存实例
+step_cache = StepCache()
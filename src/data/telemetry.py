@@ -0,0 +1,270 @@
+"""
+性能遥测模块 - 统计工作流每个步骤的耗时、CPU 时间、图像数、内存峰值增长和读写字节数
+"""
+import os
+import sys
+import csv
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from .execution_history import ExecutionRecord
+
+# 导出 CSV 时的列顺序
+METRIC_FIELDS = [
+    'step_index', 'step_id', 'step_name', 'wall_time', 'cpu_time', 'cpu_scope',
+    'items_in', 'items_out', 'items_dropped', 'throughput',
+    'peak_rss_delta', 'bytes_read', 'bytes_written', 'cached', 'fused_with',
+]
+
+_PROC_IO_PATH = '/proc/self/io'
+_proc_io_available = os.path.exists(_PROC_IO_PATH)
+_psutil_process = psutil.Process() if psutil is not None else None
+
+
+def _peak_rss() -> Optional[int]:
+    """进程的内存峰值（字节），平台不支持时返回 None"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 以 KB 为单位，macOS 以字节为单位
+        return peak if sys.platform == 'darwin' else peak * 1024
+    if _psutil_process is not None:
+        info = _psutil_process.memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    return None
+
+
+def _io_bytes() -> Optional[Tuple[int, int]]:
+    """进程累计读写的字节数，平台不支持时返回 None"""
+    global _proc_io_available
+    if _proc_io_available:
+        try:
+            with open(_PROC_IO_PATH, 'r') as f:
+                values = dict(line.split(':', 1) for line in f)
+            return int(values['rchar']), int(values['wchar'])
+        except (OSError, KeyError, ValueError):
+            _proc_io_available = False
+    if _psutil_process is not None:
+        try:
+            counters = _psutil_process.io_counters()
+            return counters.read_bytes, counters.write_bytes
+        except (AttributeError, psutil.Error):
+            return None
+    return None
+
+
+RSS_AVAILABLE = _peak_rss() is not None
+IO_AVAILABLE = _io_bytes() is not None
+
+
+def sample_resources() -> Tuple[float, float, float, int, int, int]:
+    """
+    采样当前的资源计数器
+
+    Returns:
+        (墙钟时间, 线程 CPU 时间, 进程 CPU 时间, 内存峰值, 累计读字节, 累计写字节)，
+        不可用的计数器为 0
+    """
+    rss = _peak_rss() or 0
+    io = _io_bytes() or (0, 0)
+    return time.perf_counter(), time.thread_time(), time.process_time(), rss, io[0], io[1]
+
+
+class StepMeter:
+    """
+    单个步骤（或来源、最终导出）的性能计量器
+
+    流式执行时各步骤交错运行，计量器只累计本步骤自身占用的部分：measure 包装本步骤的输出，
+    累计每次取下一个图像的开销；exclude 包装本步骤的输入，扣除其中花在上游的开销。
+    内存峰值增长和读写字节数来自进程级计数器，并发运行多个任务时会互相计入。
+    """
+    def __init__(self, step_id: str, step_name: str, step_index: Optional[int] = None,
+                 cpu_scope: str = 'thread', enabled: bool = True):
+        """
+        初始化计量器
+
+        Args:
+            step_id: 步骤ID
+            step_name: 步骤名称
+            step_index: 步骤序号，来源和最终导出为 None
+            cpu_scope: thread 只统计驱动线程的 CPU 时间；process 统计整个进程（用于工作池并行的步骤）
+            enabled: 关闭时 measure/exclude 原样返回输入，不产生任何开销
+        """
+        self.step_id = step_id
+        self.step_name = step_name
+        self.step_index = step_index
+        self.cpu_scope = cpu_scope
+        self.enabled = enabled
+        self.items_in = 0
+        self.items_out = 0
+        self.cached = False
+        self.fused_with: Optional[List[str]] = None
+        self._totals = [0.0, 0.0, 0, 0, 0]  # 墙钟时间, CPU 时间, 内存峰值增长, 读字节, 写字节
+        self._lock = threading.Lock()
+
+    def _select(self, delta: Tuple) -> Tuple[float, float, int, int, int]:
+        cpu = 1 if self.cpu_scope == 'thread' else 2
+        return delta[0], delta[cpu], delta[3], delta[4], delta[5]
+
+    def _delta(self, before: Tuple, after: Tuple) -> Tuple[float, float, int, int, int]:
+        return self._select(tuple(b - a for a, b in zip(before, after)))
+
+    def add_samples(self, delta: Tuple) -> None:
+        """累加两次 sample_resources 采样之差（例如 FusedAction.usage 中的成员用量）"""
+        self.add(self._select(delta))
+
+    def add(self, delta: Iterable[float], sign: int = 1) -> None:
+        """累加一组 (墙钟时间, CPU 时间, 内存峰值增长, 读字节, 写字节) 差值"""
+        with self._lock:
+            for i, value in enumerate(delta):
+                self._totals[i] += sign * value
+
+    def measure(self, items: Iterable) -> Iterable:
+        """包装本步骤的输出，累计取每个图像的开销并统计输出数"""
+        return self._measure(items, 1) if self.enabled else items
+
+    def exclude(self, items: Iterable) -> Iterable:
+        """包装本步骤的输入，扣除花在上游的开销并统计输入数"""
+        return self._measure(items, -1) if self.enabled else items
+
+    def _measure(self, items: Iterable, sign: int) -> Iterator:
+        iterator = iter(items)
+        while True:
+            before = sample_resources()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(self._delta(before, sample_resources()), sign)
+                return
+            self.add(self._delta(before, sample_resources()), sign)
+            if sign > 0:
+                self.items_out += 1
+            else:
+                self.items_in += 1
+            yield item
+
+    @contextmanager
+    def block(self):
+        """计量一整段代码（分阶段执行时的整个步骤）"""
+        if not self.enabled:
+            yield self
+            return
+        before = sample_resources()
+        try:
+            yield self
+        finally:
+            self.add(self._delta(before, sample_resources()))
+
+    def set_counts(self, items_in: int, items_out: int) -> None:
+        self.items_in = items_in
+        self.items_out = items_out
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            wall, cpu, rss, read, written = self._totals
+        wall, cpu = max(0.0, wall), max(0.0, cpu)
+        return {
+            'step_index': self.step_index,
+            'step_id': self.step_id,
+            'step_name': self.step_name,
+            'wall_time': round(wall, 6),
+            'cpu_time': round(cpu, 6),
+            'cpu_scope': self.cpu_scope,
+            'items_in': self.items_in,
+            'items_out': self.items_out,
+            'items_dropped': max(0, self.items_in - self.items_out),
+            'throughput': round(self.items_in / wall, 3) if wall > 0 and self.items_in else None,
+            'peak_rss_delta': max(0, int(rss)) if RSS_AVAILABLE else None,
+            'bytes_read': max(0, int(read)) if IO_AVAILABLE else None,
+            'bytes_written': max(0, int(written)) if IO_AVAILABLE else None,
+            'cached': self.cached,
+            'fused_with': self.fused_with,
+        }
+
+
+class RunTelemetry:
+    """
+    一次任务执行的全部计量器：图像来源、每个工作流步骤以及最终导出
+    """
+    def __init__(self, steps: List[Any], enabled: bool = True):
+        """
+        Args:
+            steps: 工作流步骤（WorkflowStep 列表）
+            enabled: 是否采集（配置项 processing.telemetry）
+        """
+        self.enabled = enabled
+        self.source = StepMeter('source_preparation', 'Source', enabled=enabled)
+        self.steps = [StepMeter(step.id, step.action_name, i, enabled=enabled) for i, step in enumerate(steps)]
+        self.export = StepMeter('final_export', 'Export', enabled=enabled)
+
+    @property
+    def probe(self):
+        """供 FusedAction 使用的采样函数，关闭时为 None"""
+        return sample_resources if self.enabled else None
+
+    def to_list(self, step_counts: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        汇总所有计量器
+
+        Args:
+            step_counts: ProgressChannel.step_counts() 的结果，用于填写各步骤的输入输出图像数
+
+        Returns:
+            性能数据列表，未开启时为空
+        """
+        if not self.enabled:
+            return []
+        for meter, counts in zip(self.steps, step_counts or []):
+            if not meter.cached:
+                meter.set_counts(counts['items_in'], counts['items_out'])
+        return [meter.to_dict() for meter in [self.source, *self.steps, self.export]]
+
+
+def export_step_metrics(records: List[ExecutionRecord], path: str) -> int:
+    """
+    把执行记录的步骤性能数据导出为 CSV 或 JSON（按扩展名决定），便于比较多次运行
+
+    Args:
+        records: 执行记录列表
+        path: 输出文件路径（.csv 或 .json）
+
+    Returns:
+        导出的行数
+    """
+    rows = []
+    for record in records:
+        for metrics in record.step_metrics:
+            rows.append({
+                'record_id': record.id,
+                'workflow_id': record.workflow_id,
+                'workflow_name': record.workflow_name,
+                'start_time': record.start_time,
+                'status': record.status,
+                **metrics,
+            })
+
+    if path.lower().endswith('.json'):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    else:
+        fields = ['record_id', 'workflow_id', 'workflow_name', 'start_time', 'status', *METRIC_FIELDS]
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                if row.get('fused_with'):
+                    row = {**row, 'fused_with': '+'.join(row['fused_with'])}
+                writer.writerow(row)
+    return len(rows)
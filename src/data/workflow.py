@@ -15,7 +15,8 @@ class WorkflowStep:
     """
     工作流步骤类，代表处理流程中的一个步骤
     """
-    def __init__(self, action_name: str, params: Dict[str, Any] = None, id: str = None):
+    def __init__(self, action_name: str, params: Dict[str, Any] = None, id: str = None,
+                 options: Dict[str, Any] = None):
         """
         初始化工作流步骤
         
@@ -23,10 +24,12 @@ class WorkflowStep:
             action_name: 操作名称
             params: 操作参数
             id: 步骤ID，如果不提供则自动生成
+            options: 执行选项（不影响处理结果），例如 {'parallel': True, 'workers': 8, 'ordered': False}
         """
         self.action_name = action_name
         self.params = params or {}
         self.id = id or str(uuid.uuid4())
+        self.options = options or {}
     
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -38,7 +41,8 @@ class WorkflowStep:
         return {
             'id': self.id,
             'action_name': self.action_name,
-            'params': self.params
+            'params': self.params,
+            'options': self.options
         }
     
     @classmethod
@@ -55,7 +59,8 @@ class WorkflowStep:
         return cls(
             action_name=data['action_name'],
             params=data.get('params', {}),
-            id=data.get('id')
+            id=data.get('id'),
+            options=data.get('options', {})
         )
     
     def __repr__(self) -> str:
@@ -217,7 +222,7 @@ class Workflow:
         new_workflow = Workflow(new_name, self.description)
         
         for step in self.steps:
-            new_step = WorkflowStep(step.action_name, step.params.copy())
+            new_step = WorkflowStep(step.action_name, step.params.copy(), options=step.options.copy())
             new_workflow.add_step(new_step)
         
         return new_workflow
@@ -310,6 +315,42 @@ class WorkflowManager:
         """
         return self._workflows.get(workflow_id)
     
+    def load_workflow_file(self, path: str) -> Workflow:
+        """
+        从 JSON 文件加载工作流（不保存到工作流目录）
+        
+        Args:
+            path: 工作流 JSON 文件路径
+            
+        Returns:
+            工作流对象
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return Workflow.from_dict(data)
+    
+    def find_workflow(self, ref: str) -> Optional[Workflow]:
+        """
+        按文件路径、工作流ID或名称查找工作流
+        
+        Args:
+            ref: JSON 文件路径、工作流ID或工作流名称（名称必须唯一）
+            
+        Returns:
+            工作流对象或None
+            
+        Raises:
+            ValueError: 有多个工作流使用该名称时
+        """
+        if os.path.isfile(ref):
+            return self.load_workflow_file(ref)
+        if ref in self._workflows:
+            return self._workflows[ref]
+        matches = [workflow for workflow in self._workflows.values() if workflow.name == ref]
+        if len(matches) > 1:
+            raise ValueError(f"有 {len(matches)} 个工作流名为 {ref}，请使用工作流ID")
+        return matches[0] if matches else None
+    
     def get_all_workflows(self) -> List[Workflow]:
         """
         获取所有工作流
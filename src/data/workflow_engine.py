@@ -1,25 +1,31 @@
 import os
 import logging
-import tempfile
-import shutil
 import time
-import uuid
-from typing import Any, Dict, List, Optional, Tuple, Union, Callable
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union, Callable
 from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import threading
 import collections
+import itertools
 
 # Assuming these imports are correct relative to your project structure
+from .config_manager import config_manager
 from .workflow import Workflow, WorkflowStep
 from .execution_history import ExecutionRecord, history_manager
+from .step_cache import step_cache, fingerprint_directory, step_chain_keys
+from .manifest import RunManifest
+from .progress import ProgressChannel, ProgressSnapshot, TaskCancelledError
+from .telemetry import RunTelemetry
+from .provenance import ProvenanceWriter, provenance_path, SOURCE_STEP, EXPORT_STEP
+from .scratch import ScratchManager, ScratchSpace, ScratchBudgetExceeded, SPILL_STREAM
 from src.tools.actions.action_registry import registry as action_registry
 from src.tools.sources.source_registry import registry as source_registry
 from src.tools.actions.waifuc_actions import WaifucActionWrapper
 
-from waifuc.source import LocalSource
-from waifuc.action import TerminalAction
+from waifuc.source import BaseDataSource, LocalSource, WebDataSource, OriginalFetchAction
+from waifuc.action import BaseAction, TerminalAction, ProgressBarAction, ParallelAction, FusedAction
 from waifuc.export import SaveExporter, TextualInversionExporter
+from waifuc.utils import HTTPCache, set_http_cache, DownloadCache, set_download_cache, set_rate_limit_dir
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +43,248 @@ TAG_RELATED_ACTIONS = {
     'TagAppendAction',
 }
 
+# --- 资源类别：调度器根据各类别的空闲槽位决定哪些排队任务可以并发运行 ---
+RESOURCE_NETWORK = 'network'            # 网络来源的下载阶段（I/O 密集）
+RESOURCE_CPU = 'cpu'                    # CPU 推理与常规图像处理
+RESOURCE_HEAVY_MODEL = 'heavy_model'    # 占用大量内存的重型模型
+DEFAULT_RESOURCE_SLOTS = {
+    RESOURCE_NETWORK: 2,
+    RESOURCE_CPU: 2,
+    RESOURCE_HEAVY_MODEL: 1,
+}
+
+# Actions that load large models and should not run side by side too often.
+HEAVY_MODEL_ACTIONS = {
+    'ESRGANActionWrapper',
+    'DirectoryPipelineActionWrapper',
+    'SmartCropActionWrapper',
+    'BackgroundRemovalAction',
+    'PersonRemovalAction',
+    'CCIPAction',
+    'FilterSimilarAction',
+}
+
+# Per-item actions whose output depends on nothing but the item itself; these may be
+# fanned out to a worker pool when parallel execution is enabled globally.
+PARALLEL_SAFE_ACTIONS = {
+    'ModeConvertAction', 'AlignMaxSizeAction', 'AlignMinSizeAction', 'AlignMaxAreaAction',
+    'PaddingAlignAction', 'BackgroundRemovalAction', 'PersonRemovalAction', 'MirrorAction',
+    'SafetyAction', 'HeadCutOutAction', 'PersonSplitAction', 'ThreeStageSplitAction',
+    'MinSizeFilterAction', 'MinAreaFilterAction', 'NoMonochromeAction', 'OnlyMonochromeAction',
+    'ClassFilterAction', 'RatingFilterAction', 'FaceCountAction', 'HeadCountAction', 'PersonRatioAction',
+    'TaggingAction', 'TagFilterAction', 'TagOverlapDropAction', 'TagDropAction',
+    'BlacklistedTagDropAction', 'TagRemoveUnderlineAction',
+}
+
+# Filters that only drop items and leave the others untouched; web sources may check the metadata
+# predicates of a leading run of them before downloading (see WebDataSource.pushdown).
+PUSHDOWN_SAFE_ACTIONS = {
+    'MinSizeFilterAction', 'MinAreaFilterAction', 'NoMonochromeAction', 'OnlyMonochromeAction',
+    'ClassFilterAction', 'RatingFilterAction', 'FaceCountAction', 'HeadCountAction', 'PersonRatioAction',
+}
+
+# The ones among them with metadata predicates (FilterAction.check_post), the only ones built for the
+# pushdown; the others are only looked past.
+PUSHDOWN_ACTIONS = {'MinSizeFilterAction', 'MinAreaFilterAction'}
+
+# Filters whose verdict on a downscaled variant of an image stands for the original (no pixel size
+# thresholds); a leading run of them may screen the previews of a web source before the originals
+# are downloaded (see WebDataSource.preview_first).
+PREVIEW_SAFE_ACTIONS = {
+    'NoMonochromeAction', 'OnlyMonochromeAction', 'ClassFilterAction', 'RatingFilterAction',
+    'FaceCountAction', 'HeadCountAction', 'PersonRatioAction',
+}
+
+
+def declare_task_resources(workflow: Workflow, source_type: str) -> FrozenSet[str]:
+    """
+    根据来源类型和工作流步骤推断任务需要占用的资源类别
+
+    Args:
+        workflow: 工作流
+        source_type: 图像来源类型
+
+    Returns:
+        资源类别集合
+    """
+    resources = set()
+    if source_type != "LocalSource":
+        resources.add(RESOURCE_NETWORK)
+    if workflow.steps:
+        resources.add(RESOURCE_CPU)
+    if any(step.action_name in HEAVY_MODEL_ACTIONS for step in workflow.steps):
+        resources.add(RESOURCE_HEAVY_MODEL)
+    return frozenset(resources)
+
+
+class ResourceSlots:
+    """
+    按资源类别计数的槽位池，任务只有在其声明的所有类别都有空闲槽位时才会被放行
+    """
+    def __init__(self, capacities: Dict[str, int]):
+        self._lock = threading.Lock()
+        self.capacities = {name: max(1, int(count)) for name, count in capacities.items()}
+        self._in_use = {name: 0 for name in self.capacities}
+
+    def can_acquire(self, resources: Iterable[str]) -> bool:
+        with self._lock:
+            return all(self._in_use.get(name, 0) < self.capacities.get(name, 1) for name in resources)
+
+    def try_acquire(self, resources: Iterable[str]) -> bool:
+        resources = list(resources)
+        with self._lock:
+            if not all(self._in_use.get(name, 0) < self.capacities.get(name, 1) for name in resources):
+                return False
+            for name in resources:
+                self._in_use[name] = self._in_use.get(name, 0) + 1
+            return True
+
+    def release(self, resources: Iterable[str]) -> None:
+        with self._lock:
+            for name in resources:
+                if self._in_use.get(name, 0) > 0:
+                    self._in_use[name] -= 1
+
+    def snapshot(self) -> Dict[str, Tuple[int, int]]:
+        """返回 {类别: (已占用, 容量)}"""
+        with self._lock:
+            return {name: (self._in_use.get(name, 0), capacity) for name, capacity in self.capacities.items()}
+
+
+class StepExecutionError(Exception):
+    """
+    流式执行时某个步骤抛出的异常。
+
+    流式模式下所有步骤串成一条生成器链，异常会沿着链向下游传播；
+    在每个步骤的出口处包装一次，便于把失败归因到真正出错的步骤。
+    """
+    def __init__(self, step_index: Optional[int], step: Optional[WorkflowStep], error: Exception):
+        super().__init__(str(error))
+        self.step_index = step_index
+        self.step = step
+        self.error = error
+
+
+class _CountingIterator:
+    """统计已产出元素数量的迭代器包装"""
+    def __init__(self, iterable):
+        self._iter = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._iter)
+        self.count += 1
+        return item
+
+
+def _prefetch_count() -> int:
+    """读取本地图像时预先解码的文件数（配置项 processing.prefetch）"""
+    return max(0, int(config_manager.get("processing.prefetch", 0) or 0))
+
+
+def _local_source(directory: str) -> LocalSource:
+    """读取本地目录的 LocalSource，按配置在后台线程预先读取并解码后续文件"""
+    return LocalSource(directory, prefetch=_prefetch_count())
+
+
+_web_caches_lock = threading.Lock()
+_web_caches_settings: Dict[str, Optional[Tuple[str, int]]] = {}
+
+
+def _cache_settings(name: str, default_max_size_mb: int) -> Optional[Tuple[str, int]]:
+    """读取配置项 processing.<name> 中缓存的目录和容量上限（字节），未启用时返回 None"""
+    if not config_manager.get(f"processing.{name}.enabled", True):
+        return None
+    path = config_manager.get(f"processing.{name}.path", "") or os.path.join(config_manager.config_dir, name)
+    max_size = int(config_manager.get(f"processing.{name}.max_size_mb", default_max_size_mb) or 0) * 1024 * 1024
+    return path, max_size
+
+
+def _ensure_web_caches() -> None:
+    """
+    按配置项 processing.http_cache 和 processing.download_cache 安装（或关闭）网络来源的
+    API 响应缓存和图像下载缓存，配置未变化时复用已打开的缓存
+    """
+    caches = [
+        ('http_cache', 256, HTTPCache, set_http_cache),
+        ('download_cache', 10240, DownloadCache, set_download_cache),
+    ]
+    with _web_caches_lock:
+        for name, default_max_size_mb, cache_class, set_cache in caches:
+            settings = _cache_settings(name, default_max_size_mb)
+            if name in _web_caches_settings and settings == _web_caches_settings[name]:
+                continue
+            # 旧缓存可能仍被其他任务的请求使用，不主动关闭
+            set_cache(cache_class(settings[0], settings[1] or None) if settings else None)
+            _web_caches_settings[name] = settings
+
+
+def _ensure_rate_limit_dir() -> None:
+    """按配置项 processing.rate_limit 设置网络来源限速状态的共享目录，不共享时限速状态只在本进程内"""
+    if not config_manager.get("processing.rate_limit.shared", True):
+        set_rate_limit_dir(None)
+    elif config_manager.get("processing.rate_limit.path", ""):
+        set_rate_limit_dir(config_manager.get("processing.rate_limit.path", ""))
+    else:
+        set_rate_limit_dir()
+
+
+def _web_source(source: Any, pushdown_filters: Iterable[BaseAction] = (),
+                original_fetch: Optional[OriginalFetchAction] = None) -> List[WebDataSource]:
+    """
+    按配置项 processing.download 为来源中的每个网络来源（包括 ParallelDataSource 等组合来源的子来源）
+    开启并发下载和分页预取，并启用 API 响应和下载缓存及共享限速
+
+    Args:
+        source: waifuc 来源实例
+        pushdown_filters: 工作流开头的过滤动作，网络来源在下载前先用它们的元数据条件筛掉帖子
+        original_fetch: 提供时网络来源先下载预览图，由该动作换成原图，见 WorkflowEngine._preview_steps
+
+    Returns:
+        已配置的网络来源；组合来源迭代时才创建的子来源（例如 GcharAutoSource 的各站点来源）在创建时加入
+    """
+    pushdown_filters = tuple(pushdown_filters)
+    web_sources: List[WebDataSource] = []
+
+    def _configure(child: BaseDataSource) -> None:
+        if not isinstance(child, WebDataSource):
+            return
+        child.pushdown(*pushdown_filters)
+        _ensure_web_caches()
+        _ensure_rate_limit_dir()
+        concurrency = int(config_manager.get("processing.download.concurrency", 1) or 1)
+        ordered = bool(config_manager.get("processing.download.ordered", True))
+        child.concurrent_download(concurrency, ordered=ordered)
+        child.prefetch_pages(int(config_manager.get("processing.download.page_prefetch", 0) or 0))
+        if original_fetch is not None:
+            child.preview_first(int(config_manager.get("processing.download.preview.size", 512)))
+            original_fetch.add_source(child)
+        web_sources.append(child)
+
+    if isinstance(source, BaseDataSource):
+        source.for_each_source(_configure)
+    return web_sources
+
+
+def _count_image_files(directory: str) -> int:
+    """统计目录下（不递归）的图像文件数"""
+    return sum(1 for f in os.listdir(directory)
+               if os.path.isfile(os.path.join(directory, f)) and
+               f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')))
+
+
+def _directory_image_bytes(directory: str) -> int:
+    """统计目录下（不递归）图像文件的总字节数"""
+    if not os.path.isdir(directory):
+        return 0
+    return sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)
+               if os.path.isfile(os.path.join(directory, f)) and
+               f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')))
+
+
 class QueuedTask:
     def __init__(self,
                  execution_record: ExecutionRecord,
@@ -44,8 +292,14 @@ class QueuedTask:
                  source_type: str,
                  source_params: Dict[str, Any],
                  output_directory: str,
-                 progress_callback: Optional[Callable[[str, float, str], None]] = None,
-                 cancel_event: threading.Event = None):
+                 progress_callback: Optional[Callable[[ProgressSnapshot], None]] = None,
+                 cancel_event: threading.Event = None,
+                 streaming: bool = True,
+                 resources: Optional[FrozenSet[str]] = None,
+                 incremental: bool = False,
+                 prune_outputs: bool = False,
+                 scratch_dir: Optional[str] = None,
+                 scratch_budget: Optional[int] = None):
         self.execution_record = execution_record
         self.workflow = workflow
         self.source_type = source_type
@@ -53,23 +307,71 @@ class QueuedTask:
         self.output_directory = output_directory
         self.progress_callback = progress_callback
         self.cancel_event = cancel_event
+        self.streaming = streaming
+        self.incremental = incremental
+        self.prune_outputs = prune_outputs
+        self.scratch_dir = scratch_dir
+        self.scratch_budget = scratch_budget
+        self.resources = resources if resources is not None else declare_task_resources(workflow, source_type)
 
 class WorkflowEngine:
-    def __init__(self, max_workers: int = 1):
-        if max_workers != 1:
-            logger.warning(f"WorkflowEngine with queuing enforces max_workers=1. Provided value {max_workers} was overridden.")
-        self.max_workers = 1
+    def __init__(self, max_workers: Optional[int] = None, resource_slots: Optional[Dict[str, int]] = None,
+                 scratch: Optional[ScratchManager] = None):
+        """
+        初始化工作流引擎
+
+        Args:
+            max_workers: 最多同时运行的任务数，为 None 时使用配置项 processing.max_concurrent_tasks
+            resource_slots: 各资源类别的槽位数，为 None 时使用配置项 processing.resource_slots
+            scratch: 中间文件的临时空间管理器，为 None 时使用配置项 processing.scratch
+        """
+        if max_workers is None:
+            max_workers = config_manager.get("processing.max_concurrent_tasks", 2)
+        self.max_workers = max(1, int(max_workers))
+        self.slots = ResourceSlots({**DEFAULT_RESOURCE_SLOTS,
+                                    **(resource_slots or config_manager.get("processing.resource_slots", {}) or {})})
         self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
         self._running_tasks: Dict[str, Tuple[Any, ExecutionRecord, threading.Event]] = {}
         self._task_queue = collections.deque()
         self._queue_lock = threading.Lock()
-        self._current_processing_record_id: Optional[str] = None
+        self._processing_record_ids: List[str] = []
+        self._held_resources: Dict[str, Set[str]] = {}
+        self._progress_channels: Dict[str, ProgressChannel] = {}
+        self.scratch = scratch or ScratchManager()
         os.makedirs("logs", exist_ok=True)
 
     def execute_workflow(self, workflow: Workflow,
                        source_type: str, source_params: Dict[str, Any],
                        output_directory: str,
-                       progress_callback: Optional[Callable[[str, float, str], None]] = None) -> ExecutionRecord:
+                       progress_callback: Optional[Callable[[ProgressSnapshot], None]] = None,
+                       streaming: Optional[bool] = None,
+                       resources: Optional[Iterable[str]] = None,
+                       incremental: Optional[bool] = None,
+                       prune_outputs: Optional[bool] = None,
+                       scratch_dir: Optional[str] = None,
+                       scratch_budget_mb: Optional[int] = None) -> ExecutionRecord:
+        """
+        将工作流加入执行队列
+
+        Args:
+            progress_callback: 进度订阅者，在工作线程中以限频方式接收 ProgressSnapshot
+            streaming: 是否以流式模式执行（所有步骤串成一条生成器链，不写中间目录）。
+                为 None 时使用配置项 processing.streaming。
+            resources: 任务占用的资源类别，为 None 时根据来源和步骤自动推断
+            incremental: 是否增量运行（仅对 LocalSource 生效，只处理新增或变化的文件），
+                为 None 时使用配置项 processing.incremental。
+            prune_outputs: 增量运行时是否删除来源文件已被删除的旧输出，
+                为 None 时使用配置项 processing.incremental_prune。
+            scratch_dir: 该任务中间文件所在的目录，为 None 时使用引擎的临时空间根目录
+            scratch_budget_mb: 该任务中间文件的容量上限（MB），为 None 或 0 时只受全局预算限制；
+                接近上限时按 processing.scratch.spill_policy 改为流式执行剩余步骤或使任务失败
+        """
+        if streaming is None:
+            streaming = config_manager.get("processing.streaming", True)
+        if incremental is None:
+            incremental = config_manager.get("processing.incremental", False)
+        if prune_outputs is None:
+            prune_outputs = config_manager.get("processing.incremental_prune", False)
         record = history_manager.create_record(
             workflow_id=workflow.id,
             workflow_name=workflow.name,
@@ -88,7 +390,13 @@ class WorkflowEngine:
             source_params=source_params,
             output_directory=output_directory,
             progress_callback=progress_callback,
-            cancel_event=cancel_event
+            cancel_event=cancel_event,
+            streaming=streaming,
+            resources=frozenset(resources) if resources is not None else None,
+            incremental=incremental,
+            prune_outputs=prune_outputs,
+            scratch_dir=scratch_dir,
+            scratch_budget=scratch_budget_mb * 1024 * 1024 if scratch_budget_mb else None
         )
         with self._queue_lock:
             self._task_queue.append(queued_item)
@@ -97,34 +405,73 @@ class WorkflowEngine:
         return record
 
     def _try_process_next_task_from_queue(self):
+        """
+        按先进先出顺序扫描队列，放行所有资源槽位允许的任务。
+
+        排在前面但资源不足的任务会预留其资源类别：后面需要同一类别的任务不能越过它，
+        只有与其不冲突的任务才能先行启动，避免重型任务被持续饿死。
+        """
+        to_start: List[QueuedTask] = []
         with self._queue_lock:
-            if self._current_processing_record_id is not None:
-                logger.debug(f"Engine busy with Record ID: {self._current_processing_record_id}. Queue will wait.")
-                return
             if not self._task_queue:
                 logger.debug("Task queue is empty. Nothing to process.")
                 return
-            next_queued_item: QueuedTask = self._task_queue.popleft()
-            record_to_process = next_queued_item.execution_record
-            self._current_processing_record_id = record_to_process.id
-            record_to_process.status = "processing_setup"
-            history_manager.save_record(record_to_process)
-            logger.info(f"Dequeued Record ID: {record_to_process.id} for execution.")
-
-        cancel_event_for_task = next_queued_item.cancel_event
-        self._running_tasks[record_to_process.id] = (None, record_to_process, cancel_event_for_task)
-        future = self.executor.submit(
-            self._execute_workflow_internal,
-            workflow=next_queued_item.workflow,
-            source_type=next_queued_item.source_type,
-            source_params=next_queued_item.source_params,
-            output_directory=next_queued_item.output_directory,
-            record=record_to_process,
-            progress_callback=next_queued_item.progress_callback,
-            cancel_event=cancel_event_for_task
-        )
-        self._running_tasks[record_to_process.id] = (future, record_to_process, cancel_event_for_task)
-        future.add_done_callback(lambda f, rid=record_to_process.id: self._on_task_done(f, rid))
+            blocked_resources: Set[str] = set()
+            for queued_item in list(self._task_queue):
+                if len(self._processing_record_ids) + len(to_start) >= self.max_workers:
+                    logger.debug(f"Engine busy with {len(self._processing_record_ids)} task(s). Queue will wait.")
+                    break
+                resources = queued_item.resources
+                if resources & blocked_resources or not self.slots.try_acquire(resources):
+                    logger.debug(f"Record ID: {queued_item.execution_record.id} waits for resources {sorted(resources)}.")
+                    blocked_resources |= resources
+                    continue
+                self._task_queue.remove(queued_item)
+                to_start.append(queued_item)
+
+            for queued_item in to_start:
+                record_to_process = queued_item.execution_record
+                self._processing_record_ids.append(record_to_process.id)
+                self._held_resources[record_to_process.id] = set(queued_item.resources)
+                record_to_process.status = "processing_setup"
+                history_manager.save_record(record_to_process)
+                logger.info(f"Dequeued Record ID: {record_to_process.id} for execution "
+                            f"(resources: {sorted(queued_item.resources)}).")
+
+        for queued_item in to_start:
+            record_to_process = queued_item.execution_record
+            cancel_event_for_task = queued_item.cancel_event
+            self._running_tasks[record_to_process.id] = (None, record_to_process, cancel_event_for_task)
+            future = self.executor.submit(
+                self._execute_workflow_internal,
+                workflow=queued_item.workflow,
+                source_type=queued_item.source_type,
+                source_params=queued_item.source_params,
+                output_directory=queued_item.output_directory,
+                record=record_to_process,
+                progress_callback=queued_item.progress_callback,
+                cancel_event=cancel_event_for_task,
+                streaming=queued_item.streaming,
+                incremental=queued_item.incremental,
+                prune_outputs=queued_item.prune_outputs,
+                scratch_dir=queued_item.scratch_dir,
+                scratch_budget=queued_item.scratch_budget
+            )
+            self._running_tasks[record_to_process.id] = (future, record_to_process, cancel_event_for_task)
+            future.add_done_callback(lambda f, rid=record_to_process.id: self._on_task_done(f, rid))
+
+    def _release_task_resource(self, record_id: str, resource: str) -> None:
+        """
+        提前归还任务的某个资源类别（例如预下载结束后归还网络槽位），并尝试放行排队任务
+        """
+        with self._queue_lock:
+            held = self._held_resources.get(record_id)
+            if not held or resource not in held:
+                return
+            held.discard(resource)
+            self.slots.release([resource])
+        logger.debug(f"Record ID {record_id} released resource '{resource}'.")
+        self._try_process_next_task_from_queue()
 
     def _on_task_done(self, future_object, record_id: str):
         try:
@@ -141,23 +488,431 @@ class WorkflowEngine:
                 del self._running_tasks[record_id]
                 logger.debug(f"Removed Record ID {record_id} from _running_tasks via _on_task_done callback.")
             with self._queue_lock:
-                if self._current_processing_record_id == record_id:
-                    self._current_processing_record_id = None
-                    logger.debug(f"Engine now idle (was processing Record ID: {record_id}).")
+                if record_id in self._processing_record_ids:
+                    self._processing_record_ids.remove(record_id)
+                    logger.debug(f"Record ID {record_id} finished, {len(self._processing_record_ids)} task(s) still running.")
                 else:
-                    logger.warning(f"Mismatch on task completion: _current_processing_record_id was {self._current_processing_record_id}, completed task was {record_id}.")
-                    if self._current_processing_record_id is not None and not self._running_tasks.get(self._current_processing_record_id) :
-                         self._current_processing_record_id = None
+                    logger.warning(f"Mismatch on task completion: Record ID {record_id} was not registered as processing.")
+                self.slots.release(self._held_resources.pop(record_id, ()))
             logger.debug(f"Triggering next task processing after Record ID {record_id} completion.")
             self._try_process_next_task_from_queue()
 
+    def _create_step_action(self, step: WorkflowStep, output_directory: str, allow_parallel: bool = True,
+                            scratch_directory: Optional[str] = None):
+        """
+        根据工作流步骤创建底层 waifuc action 实例
+
+        Args:
+            step: 工作流步骤
+            output_directory: 最终输出目录（注入给 TerminalAction）
+            allow_parallel: 是否按步骤选项/全局配置包装为 ParallelAction
+            scratch_directory: 任务的临时空间，注入给自行创建临时目录的动作（例如 DirectoryPipelineAction）
+
+        Returns:
+            waifuc action 实例
+        """
+        action = action_registry.create_action(step.action_name, **step.params)
+        action_instance = action.action if isinstance(action, WaifucActionWrapper) and hasattr(action, 'action') else action
+        if scratch_directory and hasattr(action_instance, 'scratch_directory'):
+            action_instance.scratch_directory = scratch_directory
+        if isinstance(action_instance, TerminalAction):
+            action_instance.output_directory = output_directory
+            return action_instance
+
+        batch_options = self._get_batch_options(step, action_instance)
+        if batch_options is not None:
+            action_instance.batched(**batch_options)
+        if allow_parallel:
+            action_instance = self._wrap_parallel(action_instance, self._get_parallel_options(step))
+        return action_instance
+
+    @staticmethod
+    def _wrap_parallel(action_instance, parallel_options: Optional[Dict[str, Any]]):
+        if parallel_options is not None and not isinstance(action_instance, (ProgressBarAction, TerminalAction)):
+            return ParallelAction(action_instance, **parallel_options)
+        return action_instance
+
+    @staticmethod
+    def _get_batch_options(step: WorkflowStep, action_instance) -> Optional[Dict[str, Any]]:
+        """
+        合并全局配置与步骤选项，决定支持批处理的动作每批处理多少张图像
+
+        步骤选项 batch_size/max_latency 优先；并行执行的步骤由工作池逐图调用，批处理不生效。
+
+        Returns:
+            BaseAction.batched 的参数，不批处理时返回 None
+        """
+        if not isinstance(action_instance, BaseAction) or not action_instance.batchable:
+            return None
+        global_options = config_manager.get("processing.batch", {}) or {}
+        batch_size = int(step.options.get('batch_size', global_options.get('size', 1)) or 1)
+        if batch_size <= 1:
+            return None
+        return {
+            'batch_size': batch_size,
+            'max_latency': step.options.get('max_latency', global_options.get('max_latency')),
+        }
+
+    def _pushdown_filters(self, workflow: Workflow, output_directory: str) -> List[BaseAction]:
+        """
+        创建工作流开头连续的纯过滤步骤中带元数据条件的动作实例（PUSHDOWN_ACTIONS），交给网络来源在下载前按帖子元数据预先筛选
+
+        过滤步骤本身照常执行，来源只跳过它们必然丢弃的帖子；
+        关闭 processing.download.pushdown 或步骤选项 pushdown=False 时不下推。
+
+        Returns:
+            过滤动作实例列表
+        """
+        if not config_manager.get("processing.download.pushdown", True):
+            return []
+        filters = []
+        for step in workflow.steps:
+            if step.action_name not in PUSHDOWN_SAFE_ACTIONS:
+                break
+            if step.action_name in PUSHDOWN_ACTIONS and step.options.get('pushdown', True):
+                filters.append(self._create_step_action(step, output_directory, allow_parallel=False))
+        return filters
+
+    @staticmethod
+    def _preview_steps(workflow: Workflow) -> int:
+        """
+        开启 processing.download.preview 时，工作流开头有多少个步骤可以先在网络来源的预览图上运行
+
+        这些过滤步骤在较小的预览图（例如 booru 的 sample）上筛选，只有通过的图像才会下载原图；
+        步骤选项 preview=False 的步骤及其后的步骤总是在原图上运行。
+
+        Returns:
+            步骤数，0 表示不使用预览图
+        """
+        if not config_manager.get("processing.download.preview.enabled", False):
+            return 0
+        count = 0
+        for step in workflow.steps:
+            if step.action_name not in PREVIEW_SAFE_ACTIONS or not step.options.get('preview', True):
+                break
+            count += 1
+        return count
+
+    @staticmethod
+    def _report_pushdown(web_sources: List[WebDataSource], source_type: str, record: ExecutionRecord,
+                         task_logger: logging.Logger) -> None:
+        """
+        记录各网络来源在下载前按元数据跳过的帖子数（合计）
+        """
+        web_sources = [web_source for web_source in web_sources if web_source.post_filters]
+        if web_sources:
+            posts_skipped = sum(web_source.posts_skipped for web_source in web_sources)
+            message = f"元数据预筛选跳过 {posts_skipped} 个帖子，未下载"
+            task_logger.info(message)
+            record.add_step_log("source_preparation", source_type, "skipped", message,
+                                {"posts_skipped": posts_skipped})
+
+    @staticmethod
+    def _get_parallel_options(step: WorkflowStep) -> Optional[Dict[str, Any]]:
+        """
+        合并全局配置与步骤选项，决定该步骤是否以工作池并行执行
+
+        步骤选项 parallel=True/False 优先；未指定时仅当全局开启且动作在 PARALLEL_SAFE_ACTIONS 中才并行。
+
+        Returns:
+            ParallelAction 的参数，不并行时返回 None
+        """
+        global_options = config_manager.get("processing.parallel", {}) or {}
+        enabled = step.options.get('parallel')
+        if enabled is None:
+            enabled = bool(global_options.get('enabled', False)) and step.action_name in PARALLEL_SAFE_ACTIONS
+        if not enabled:
+            return None
+        return {
+            'workers': step.options.get('workers', global_options.get('workers')) or None,
+            'mode': step.options.get('mode', global_options.get('mode', 'thread')),
+            'ordered': step.options.get('ordered', global_options.get('ordered', True)),
+        }
+
+    @staticmethod
+    def _iter_stage(items, step_index: Optional[int], step: Optional[WorkflowStep]):
+        """
+        包装流式链中的一个阶段，把该阶段内部抛出的异常转换为 StepExecutionError。
+        上游已经包装过的异常原样透传，保证归因到最早出错的阶段。
+        """
+        try:
+            yield from items
+        except (StepExecutionError, TaskCancelledError):
+            raise
+        except Exception as err:
+            raise StepExecutionError(step_index, step, err) from err
+
+    @staticmethod
+    def _track_items(items, channel: ProgressChannel, in_index: Optional[int] = None,
+                     out_index: Optional[int] = None, count_done: bool = False):
+        """
+        在图像流经过的边界处统计进度，并在每个图像之间检查取消请求
+
+        Args:
+            in_index: 把经过的图像计为该步骤的输入
+            out_index: 把经过的图像计为该步骤的输出
+            count_done: 把经过的图像计入本轮已完成数（用于吞吐量和 ETA）
+        """
+        for item in items:
+            channel.check_cancelled()
+            if count_done:
+                channel.item_done()
+            if in_index is not None:
+                channel.item_in(in_index)
+            if out_index is not None:
+                channel.item_out(out_index)
+            yield item
+        channel.check_cancelled()
+
+    @staticmethod
+    def _iter_fused_stage(items, fused: FusedAction, members: List[Tuple[int, WorkflowStep]]):
+        """
+        与 _iter_stage 相同，但把融合阶段内的异常归因到实际出错的成员步骤
+        """
+        try:
+            yield from items
+        except (StepExecutionError, TaskCancelledError):
+            raise
+        except Exception as err:
+            step_index, step = members[fused.failed_index or 0]
+            raise StepExecutionError(step_index, step, err) from err
+
+    @staticmethod
+    def _is_checkpoint(step: WorkflowStep) -> bool:
+        """
+        流式执行时是否把该步骤的输出写入步骤缓存
+
+        步骤选项 checkpoint=True/False 优先；未指定时取配置项 processing.step_cache.streaming（默认关闭），
+        避免流式执行为每个步骤额外编码、写盘一次。
+        """
+        checkpoint = step.options.get('checkpoint')
+        if checkpoint is None:
+            checkpoint = config_manager.get("processing.step_cache.streaming", False)
+        return bool(checkpoint)
+
+    def _tee_to_cache(self, items, key: str, steps: List[WorkflowStep], pinned_keys: List[str],
+                      scratch_directory: Optional[str] = None):
+        """
+        在流式链中把某一步骤的输出同时写入步骤缓存。
+
+        只有上游被完整消费时才登记条目；下游提前结束（例如 FirstNSelectAction）
+        或出错时丢弃半成品，避免缓存不完整的结果。条目先写在任务的临时空间
+        scratch_directory 中，计入其预算。
+        """
+        staging_path = step_cache.create_staging(key, scratch_directory)
+        exporter = SaveExporter(staging_path, no_meta=False)
+        exporter.reset()
+        exhausted = False
+        try:
+            for item in items:
+                exporter.export_item(item)
+                yield item
+            exhausted = True
+        finally:
+            if exhausted:
+                step_cache.pin(key)
+                pinned_keys.append(key)
+                step_cache.commit(key, staging_path, steps[-1].action_name, [s.action_name for s in steps])
+            else:
+                step_cache.discard_staging(staging_path)
+
+    def _build_streaming_pipeline(self, workflow: Workflow, source, output_directory: str,
+                                  record: ExecutionRecord, task_logger: logging.Logger,
+                                  start_index: int = 0, cache_keys: Optional[List[str]] = None,
+                                  pinned_keys: Optional[List[str]] = None,
+                                  fused_groups: Optional[List[Tuple[FusedAction, List[WorkflowStep]]]] = None,
+                                  channel: Optional[ProgressChannel] = None,
+                                  telemetry: Optional[RunTelemetry] = None,
+                                  scratch_directory: Optional[str] = None,
+                                  provenance: Optional[ProvenanceWriter] = None,
+                                  trace_source: bool = True,
+                                  original_fetch: Optional[Tuple[int, BaseAction]] = None):
+        """
+        把所有步骤串成一条从来源到最终导出器的生成器链，中间结果不落盘。
+
+        只有显式需要落盘的步骤（TerminalAction，例如 DirectoryPipelineAction）才会写磁盘，
+        它们自行处理输出并且不再向下游产出图像，因此链条在第一个 TerminalAction 处结束。
+
+        开启 processing.fusion 时，连续的 ProcessAction/FilterAction 步骤会被融合为一个
+        FusedAction，逐图依次调用各步骤，省去每一步单独的生成器和迭代开销。
+
+        Args:
+            start_index: 从第几个步骤开始串联（之前的步骤已由缓存提供）
+            cache_keys: 各步骤的缓存键，提供时会把检查点步骤（见 _is_checkpoint）的输出同时写入步骤缓存
+            pinned_keys: 收集本次任务登记的缓存条目，任务结束后统一解除固定
+            fused_groups: 收集融合后的 (FusedAction, 成员步骤) 列表，用于事后报告各步骤的图像数
+            channel: 进度通道，提供时在每个阶段边界统计图像数并检查取消请求
+            telemetry: 性能计量器，提供时在每个阶段边界计量该阶段自身的开销
+            scratch_directory: 任务的临时空间，见 _create_step_action
+            provenance: 溯源日志，提供时在每个阶段边界记录图像的去向
+            trace_source: 是否把 source 的输出记录为来源图像（从分阶段执行的中间结果继续时为 False）
+            original_fetch: (步骤序号, 动作)，在该步骤之前插入把预览图换成原图的动作，见 _preview_steps
+
+        Returns:
+            最终图像项的迭代器
+        """
+        cache_keys = cache_keys or []
+        telemetry = telemetry or RunTelemetry(workflow.steps, enabled=False)
+        provenance = provenance or ProvenanceWriter('', record.id, workflow.steps, enabled=False)
+        fusion = config_manager.get("processing.fusion", True)
+        total_steps = len(workflow.steps)
+
+        # Group consecutive fusable steps; every other step forms a stage of its own.
+        stages: List[List[Tuple[int, WorkflowStep, Any]]] = []
+        last_fusable = False
+        for i, step in enumerate(workflow.steps):
+            if i < start_index:
+                continue
+            action_instance = self._create_step_action(step, output_directory, allow_parallel=False,
+                                                       scratch_directory=scratch_directory)
+            task_logger.info(f"Chaining step {i+1}/{total_steps}: {step.action_name} (streaming)")
+            record.add_step_log(step.id, step.action_name, "started", f"Starting step {i+1}/{total_steps} (streaming)")
+
+            # A batched step keeps its own stage, FusedAction calls its members one item at a time.
+            fusable = fusion and step.options.get('fuse', True) and FusedAction.is_fusable(action_instance) \
+                and action_instance.batch_size <= 1
+            if fusable and last_fusable and not (original_fetch is not None and i == original_fetch[0]):
+                stages[-1].append((i, step, action_instance))
+            else:
+                stages.append([(i, step, action_instance)])
+            # A checkpoint ends its stage, so its own output is what gets cached.
+            last_fusable = fusable and not (i < len(cache_keys) and self._is_checkpoint(step))
+
+            if isinstance(action_instance, TerminalAction):
+                task_logger.info(f"Step {i+1} is a TerminalAction, output directory injected: {output_directory}")
+                for skipped in workflow.steps[i + 1:]:
+                    task_logger.warning(f"Step {skipped.action_name} follows a TerminalAction and will receive no images.")
+                    record.add_step_log(skipped.id, skipped.action_name, "skipped", "Follows a TerminalAction")
+                break
+
+        stream = telemetry.source.measure(self._iter_stage(source, None, None))
+        if trace_source:
+            stream = provenance.stage(SOURCE_STEP).outputs(stream)
+        if channel is not None:
+            stream = self._track_items(stream, channel, count_done=True)
+        for stage in stages:
+            if original_fetch is not None and stage[0][0] == original_fetch[0]:
+                stream = self._iter_original_fetch(stream, original_fetch[1])
+                original_fetch = None
+            last_index, last_step, last_action = stage[-1]
+            if channel is not None and len(stage) == 1:
+                stream = self._track_items(stream, channel, in_index=last_index)
+            meter = telemetry.steps[last_index]
+            tracer = provenance.stage(stage[0][0], last_index)
+            stream = tracer.inputs(stream)
+            if len(stage) > 1:
+                fused = FusedAction(*(action for _, _, action in stage), probe=telemetry.probe,
+                                    on_drop=tracer.drop if provenance.enabled else None)
+                # A fused stage runs in parallel only if every member would have (thread pools only,
+                # so the per-member counters stay in this process).
+                member_options = [self._get_parallel_options(step) for _, step, _ in stage]
+                stage_action = fused
+                if all(options is not None and options.get('mode') == 'thread' for options in member_options):
+                    stage_action = self._wrap_parallel(fused, member_options[0])
+                task_logger.info(f"Fusing steps {stage[0][0]+1}-{last_index+1}: "
+                                 f"{' -> '.join(step.action_name for _, step, _ in stage)}")
+                stream = self._iter_fused_stage(stage_action.iter_from(stream), fused,
+                                                [(i, step) for i, step, _ in stage])
+                if fused_groups is not None:
+                    fused_groups.append((fused, [step for _, step, _ in stage]))
+                if channel is not None:
+                    member_indices = [i for i, _, _ in stage]
+                    channel.add_counter_source(
+                        lambda fused=fused, indices=member_indices: [
+                            channel.set_step_counts(index, items_in, items_out)
+                            for index, (items_in, items_out) in zip(indices, fused.counts)])
+                    stream = self._track_items(stream, channel)
+            else:
+                stage_action = self._wrap_parallel(last_action, self._get_parallel_options(last_step))
+                if isinstance(stage_action, ParallelAction):
+                    # The work happens on pool workers, so only the process-wide CPU clock sees it.
+                    meter.cpu_scope = 'process'
+                stream = meter.measure(self._iter_stage(stage_action.iter_from(meter.exclude(stream)),
+                                                        last_index, last_step))
+                if channel is not None:
+                    stream = self._track_items(stream, channel, out_index=last_index)
+            stream = tracer.outputs(stream)
+
+            if last_index < len(cache_keys) and not isinstance(last_action, TerminalAction) \
+                    and self._is_checkpoint(last_step):
+                # Writing the cache entry is part of what this step costs in this run.
+                stream = meter.measure(self._iter_stage(
+                    self._tee_to_cache(meter.exclude(stream), cache_keys[last_index],
+                                       workflow.steps[:last_index + 1], pinned_keys, scratch_directory),
+                    last_index, last_step))
+
+        if original_fetch is not None:
+            # every step screened the previews
+            stream = self._iter_original_fetch(stream, original_fetch[1])
+        return stream
+
+    def _iter_original_fetch(self, items, fetch_action: BaseAction):
+        """
+        把预览图换成原图；按 processing.download 的并发数以线程池下载，失败按来源失败报告
+        """
+        concurrency = int(config_manager.get("processing.download.concurrency", 1) or 1)
+        if concurrency > 1:
+            fetch_action = self._wrap_parallel(fetch_action, {
+                'workers': concurrency, 'mode': 'thread',
+                'ordered': bool(config_manager.get("processing.download.ordered", True)),
+            })
+        return self._iter_stage(fetch_action.iter_from(items), None, None)
+
+    def _export_final(self, final_items, is_tagging_workflow: bool, output_directory: str,
+                      task_logger: logging.Logger) -> None:
+        """
+        根据工作流意图选择导出器，把最终图像流导出到输出目录
+
+        Args:
+            final_items: 最终图像项的迭代器（只会被遍历一次）
+            is_tagging_workflow: 工作流是否包含打标相关的动作
+            output_directory: 最终输出目录
+            task_logger: 任务日志
+        """
+        final_items = iter(final_items)
+        # Peek at the first item to see if it has a non-empty tags dictionary.
+        first_item = next(final_items, None)
+        if first_item is not None:
+            final_items = itertools.chain([first_item], final_items)
+
+        if is_tagging_workflow:
+            # The workflow was *intended* for tagging. Now, VERIFY if tags actually exist.
+            if first_item is not None and first_item.meta.get('tags'):
+                # If tags were found, use the exporter that creates .txt files.
+                task_logger.info("Verified that tags exist. Exporting final result with TextualInversionExporter.")
+                final_exporter = TextualInversionExporter(output_directory)
+            else:
+                # If no tags were found despite the intent, just save the images.
+                task_logger.info("Workflow was intended for tagging, but no actual tags were found. Exporting images only.")
+                final_exporter = SaveExporter(output_directory, no_meta=True)
+        else:
+            # If it was never a tagging workflow, just save the images.
+            task_logger.info("Non-tagging workflow. Exporting final result with SaveExporter (no_meta=True).")
+            final_exporter = SaveExporter(output_directory, no_meta=True)
+
+        # Perform the final, decisive export.
+        final_exporter.reset()
+        final_exporter.export_from(final_items)
+
     def _execute_workflow_internal(self, workflow: Workflow,
                                   source_type: str, source_params: Dict[str, Any],
                                   output_directory: str, record: ExecutionRecord,
-                                  progress_callback: Optional[Callable[[str, float, str], None]] = None,
-                                  cancel_event: Optional[threading.Event] = None) -> None:
-        class CancelledError(Exception):
-            pass
+                                  progress_callback: Optional[Callable[[ProgressSnapshot], None]] = None,
+                                  cancel_event: Optional[threading.Event] = None,
+                                  streaming: bool = True,
+                                  incremental: bool = False,
+                                  prune_outputs: bool = False,
+                                  scratch_dir: Optional[str] = None,
+                                  scratch_budget: Optional[int] = None) -> None:
+        channel = ProgressChannel(record.id, cancel_event,
+                                  min_interval=config_manager.get("processing.progress_interval", 0.25))
+        if progress_callback:
+            channel.subscribe(progress_callback)
+        channel.set_steps(workflow.steps)
+        self._progress_channels[record.id] = channel
+        telemetry = RunTelemetry(workflow.steps, enabled=config_manager.get("processing.telemetry", True))
+        provenance = ProvenanceWriter(provenance_path(record.id), record.id, workflow.steps,
+                                      enabled=config_manager.get("processing.provenance", True))
 
         task_logger = logging.getLogger(f"workflow.{record.id}")
         file_handler = None
@@ -170,63 +925,112 @@ class WorkflowEngine:
         else:
             file_handler = task_logger.handlers[0] if task_logger.handlers else None
 
-        temp_dir = None
+        scratch: Optional[ScratchSpace] = None
+        pinned_cache_keys: List[str] = []
         try:
             if record.status != "processing" :
                 record.set_status("running")
-                import time
-                time.sleep(2)  # 假装任务在跑2秒，便于UI捕捉
                 if record.start_time is None:
                      record.start_time = time.time()
                 history_manager.save_record(record)
 
             os.makedirs(output_directory, exist_ok=True)
-            temp_dir = tempfile.mkdtemp()
-            temp_input_dir = os.path.join(temp_dir, 'input')
-            os.makedirs(temp_input_dir, exist_ok=True)
+            scratch = self.scratch.create_space(record.id, scratch_dir, scratch_budget)
+            temp_input_dir = scratch.mkdtemp(prefix='input_')
 
-            task_logger.info(f"Task {record.id} started. Workflow: {workflow.name}, Source: {source_type}, Output: {output_directory}")
-            if progress_callback:
-                progress_callback("获取图像", 0.0, "准备图像来源...")
-            if cancel_event and cancel_event.is_set():
-                raise CancelledError("任务在获取图像前被取消")
+            task_logger.info(f"Task {record.id} started. Workflow: {workflow.name}, Source: {source_type}, Output: {output_directory}, Mode: {'streaming' if streaming else 'staged'}")
+            channel.set_stage("获取图像", "准备图像来源...", 0.0)
+            channel.check_cancelled()
+
+            if not streaming and scratch.policy == SPILL_STREAM and scratch.available is not None:
+                # 分阶段执行至少同时保留一个步骤的输入和输出，放不下时直接改为流式执行
+                if source_type != "LocalSource":
+                    estimate = None  # 下载量事先未知
+                else:
+                    estimate = 2 * _directory_image_bytes(source_params.get("directory", ""))
+                if estimate is None or estimate > scratch.available:
+                    task_logger.warning(f"Scratch budget ({scratch.available} bytes available) is too small for staged "
+                                        f"execution, switching to streaming.")
+                    scratch.spilled = True
+                    streaming = True
+            if not streaming and scratch.available is not None:
+                # 每个检查点都核对用量，接近预算时抛出 ScratchBudgetExceeded
+                channel.add_guard(scratch.check)
 
             input_dir_for_processing = ""
+            streaming_source = None
+            original_fetch = None
+            web_sources: List[WebDataSource] = []
+            incremental_plan = None
             try:
                 source = source_registry.create_source(source_type, **source_params)
                 record.add_step_log("source_preparation", source_type, "started", "创建图像来源")
                 task_logger.info("从来源获取图像...")
-                if progress_callback: progress_callback("获取图像", 0.1, "正在获取图像...")
+                channel.set_stage("获取图像", "正在获取图像...", 0.0)
                 if source_type == "LocalSource":
                     input_dir_for_processing = source_params.get("directory", "")
                     if not os.path.exists(input_dir_for_processing):
                         raise FileNotFoundError(f"输入目录不存在: {input_dir_for_processing}")
-                    total_files = sum(1 for f in os.listdir(input_dir_for_processing)
-                                    if os.path.isfile(os.path.join(input_dir_for_processing, f)) and
-                                    f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')))
+                    total_files = _count_image_files(input_dir_for_processing)
                     record.total_images = total_files
                     task_logger.info(f"发现 {total_files} 个图像文件于 {input_dir_for_processing}")
+                    if incremental:
+                        incremental_plan = RunManifest(workflow, input_dir_for_processing, output_directory).plan()
+                        record.total_images = len(incremental_plan.pending)
+                        task_logger.info(f"增量运行：{len(incremental_plan.pending)} 个新增或变化的文件，"
+                                         f"跳过 {len(incremental_plan.unchanged)} 个未变化的文件，"
+                                         f"{len(incremental_plan.deleted)} 个来源文件已删除")
+                    if streaming:
+                        streaming_source = _CountingIterator(
+                            incremental_plan.create_source(prefetch=_prefetch_count()) if incremental_plan
+                            else _local_source(input_dir_for_processing))
+                    record.add_step_log("source_preparation", source_type, "completed", f"成功获取 {record.total_images} 个图像文件")
+                elif streaming:
+                    if incremental:
+                        task_logger.warning("增量运行仅支持 LocalSource，本次将处理全部图像")
+                    # 流式模式下不预先下载到临时目录，图像在处理链中按需下载
+                    task_logger.info("流式模式：图像将在处理过程中按需下载")
+                    preview_steps = self._preview_steps(workflow)
+                    fetch_action = OriginalFetchAction() if preview_steps else None
+                    web_sources = _web_source(source.source, self._pushdown_filters(workflow, output_directory),
+                                              fetch_action)
+                    if preview_steps:
+                        original_fetch = (preview_steps, fetch_action)
+                        task_logger.info(f"前 {preview_steps} 个过滤步骤先在预览图上运行，通过后再下载原图")
+                    streaming_source = _CountingIterator(source.source)
+                    record.add_step_log("source_preparation", source_type, "completed", "图像来源已就绪（流式下载）")
                 else:
+                    if incremental:
+                        task_logger.warning("增量运行仅支持 LocalSource，本次将处理全部图像")
                     task_logger.info("开始下载图像...")
-                    if progress_callback: progress_callback("获取图像", 0.2, "下载图像...")
-                    source.source.export(SaveExporter(temp_input_dir, no_meta=False))
-                    total_files = sum(1 for f in os.listdir(temp_input_dir)
-                                    if os.path.isfile(os.path.join(temp_input_dir, f)) and
-                                    f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')))
+                    channel.set_stage("获取图像", "下载图像...")
+                    channel.begin_pass(None)
+                    with telemetry.source.block():
+                        download_exporter = SaveExporter(temp_input_dir, no_meta=False)
+                        download_exporter.reset()
+                        web_sources = _web_source(source.source, self._pushdown_filters(workflow, output_directory))
+                        download_exporter.export_from(self._track_items(source.source, channel, count_done=True))
+                    total_files = _count_image_files(temp_input_dir)
+                    telemetry.source.set_counts(0, total_files)
                     record.total_images = total_files
                     task_logger.info(f"已下载 {total_files} 个图像文件到 {temp_input_dir}")
+                    self._report_pushdown(web_sources, source_type, record, task_logger)
                     input_dir_for_processing = temp_input_dir
-                record.add_step_log("source_preparation", source_type, "completed", f"成功获取 {record.total_images} 个图像文件")
+                    # 下载阶段结束，网络槽位可以交给其他任务
+                    self._release_task_resource(record.id, RESOURCE_NETWORK)
+                    record.add_step_log("source_preparation", source_type, "completed", f"成功获取 {record.total_images} 个图像文件")
+            except TaskCancelledError:
+                raise
             except Exception as e:
                 error_msg = f"获取图像失败: {str(e)}"
                 task_logger.error(error_msg, exc_info=True)
                 record.add_step_log("source_preparation", source_type, "failed", error_msg)
                 record.fail(error_msg)
                 history_manager.save_record(record)
-                if progress_callback: progress_callback("错误", 0.0, error_msg)
+                channel.finish("错误", error_msg)
                 return
             
-            if cancel_event and cancel_event.is_set(): raise CancelledError("任务在处理步骤前被取消")
+            channel.check_cancelled()
             current_dir_for_steps = input_dir_for_processing
             
             # --- INTELLIGENT WORKFLOW LOGIC ---
@@ -237,90 +1041,235 @@ class WorkflowEngine:
             else:
                 task_logger.info("No tagging actions in workflow. Final export will only save images.")
 
-            for i, step in enumerate(workflow.steps):
-                step_progress_base = 0.3 + (i / len(workflow.steps)) * 0.6
-                
-                step_output_dir = os.path.join(temp_dir, f"step_{i+1}_{uuid.uuid4().hex[:8]}")
-                os.makedirs(step_output_dir, exist_ok=True)
+            # --- STEP RESULT CACHE ---
+            # Reuse the longest prefix of steps whose (input fingerprint, action chain) is already cached.
+            cache_keys: List[str] = []
+            reused_steps = 0
+            if step_cache.enabled and input_dir_for_processing and workflow.steps:
+                if incremental_plan:
+                    fingerprint = incremental_plan.fingerprint
+                else:
+                    fingerprint = fingerprint_directory(input_dir_for_processing,
+                                                        content=input_dir_for_processing == temp_input_dir)
+                cache_keys = step_chain_keys(fingerprint, workflow.steps)
+                reused_steps = step_cache.longest_prefix(cache_keys)
+                if reused_steps:
+                    reused_key = cache_keys[reused_steps - 1]
+                    step_cache.pin(reused_key)
+                    pinned_cache_keys.append(reused_key)
+                    reused_dir = step_cache.lookup(reused_key)
+                    if reused_dir is None:
+                        reused_steps = 0
+                    else:
+                        current_dir_for_steps = reused_dir
+                        task_logger.info(f"Reusing cached result of the first {reused_steps} step(s) from {reused_dir}")
+                        for i, step in enumerate(workflow.steps[:reused_steps]):
+                            telemetry.steps[i].cached = True
+                            record.add_step_log(step.id, step.action_name, "completed",
+                                                f"Step {i+1}/{len(workflow.steps)} reused from step cache.",
+                                                {"cache_key": cache_keys[i]})
+                        if streaming:
+                            streaming_source = _CountingIterator(_local_source(reused_dir))
+
+            spill_from: Optional[int] = None
+            if not streaming:
+                # --- STAGED EXECUTION ---
+                # Every step is materialized into its own temporary directory.
+                caching_steps = True
+                for i, step in enumerate(workflow.steps):
+                    if i < reused_steps:
+                        continue
+                    task_logger.info(f"Executing step {i+1}/{len(workflow.steps)}: {step.action_name} (In: {current_dir_for_steps})")
+                    record.add_step_log(step.id, step.action_name, "started", f"Starting step {i+1}/{len(workflow.steps)}")
+                    channel.set_stage("Processing images", f"Executing step {i+1}/{len(workflow.steps)}: {step.action_name}")
+                    step_cache_key = None
+                    step_output_dir = None
+                    try:
+                        # Inside the try: the scratch guard may stop the run at a step boundary too.
+                        channel.check_cancelled()
+                        action_instance = self._create_step_action(step, output_directory, scratch_directory=scratch.path)
+                        if isinstance(action_instance, TerminalAction):
+                            task_logger.info(f"Step {i+1} is a TerminalAction, output directory injected: {output_directory}")
+                            # TerminalAction writes straight to the output directory, nothing after it is cacheable.
+                            caching_steps = False
+
+                        if caching_steps and i < len(cache_keys):
+                            step_cache_key = cache_keys[i]
+                            # Staged inside the task's scratch space so the budget sees it until the entry is committed.
+                            step_output_dir = step_cache.create_staging(step_cache_key, scratch.path)
+                        else:
+                            step_output_dir = scratch.mkdtemp(prefix=f"step_{i+1}_")
+
+                        if incremental_plan and current_dir_for_steps == input_dir_for_processing:
+                            source_for_step = incremental_plan.create_source()
+                            step_total = len(incremental_plan.pending)
+                        else:
+                            source_for_step = _local_source(current_dir_for_steps)
+                            step_total = _count_image_files(current_dir_for_steps)
+                        channel.begin_pass(step_total, base=i / len(workflow.steps), width=1 / len(workflow.steps))
+                        if i == reused_steps:
+                            source_for_step = provenance.stage(SOURCE_STEP).outputs(source_for_step)
+                        tracer = provenance.stage(i)
+                        processed_output = tracer.outputs(self._track_items(
+                            action_instance.iter_from(tracer.inputs(
+                                self._track_items(source_for_step, channel, in_index=i, count_done=True))),
+                            channel, out_index=i))
+
+                        # For ALL steps, use SaveExporter to preserve the metadata chain.
+                        # The final conversion to .txt or simple image save is handled AFTER the loop.
+                        meter = telemetry.steps[i]
+                        if isinstance(action_instance, ParallelAction):
+                            meter.cpu_scope = 'process'
+                        with meter.block():
+                            step_exporter = SaveExporter(step_output_dir, no_meta=False)
+                            step_exporter.reset()
+                            step_exporter.export_from(processed_output)
+                        if step_cache_key:
+                            # Sampled before the entry leaves the scratch space, so the high-water mark includes it.
+                            scratch.sample()
+                            step_cache.pin(step_cache_key)
+                            pinned_cache_keys.append(step_cache_key)
+                            step_output_dir = step_cache.commit(step_cache_key, step_output_dir, step.action_name,
+                                                                [s.action_name for s in workflow.steps[:i + 1]])
+                        # The output of this step is the input for the next; the previous intermediate
+                        # directory is no longer needed (cache entries and the user's input live elsewhere).
+                        previous_dir, current_dir_for_steps = current_dir_for_steps, step_output_dir
+                        scratch.remove(previous_dir)
+                        scratch.sample()
 
-                task_logger.info(f"Executing step {i+1}/{len(workflow.steps)}: {step.action_name} (In: {current_dir_for_steps}, Out: {step_output_dir})")
-                record.add_step_log(step.id, step.action_name, "started", f"Starting step {i+1}/{len(workflow.steps)}")
-                if progress_callback: progress_callback("Processing images", step_progress_base, f"Executing step {i+1}/{len(workflow.steps)}: {step.action_name}")
-                if cancel_event and cancel_event.is_set(): raise CancelledError(f"Task cancelled before executing step {step.action_name}")
+                        step_counts = channel.step_counts()[i]
+                        record.add_step_log(step.id, step.action_name, "completed", f"Step {i+1}/{len(workflow.steps)} completed successfully.",
+                                            {"items_in": step_counts["items_in"], "items_out": step_counts["items_out"]})
+
+                    except ScratchBudgetExceeded as e_scratch:
+                        if step_output_dir and step_output_dir != current_dir_for_steps:
+                            if step_cache_key:
+                                step_cache.discard_staging(step_output_dir)
+                            else:
+                                scratch.remove(step_output_dir)
+                        if scratch.policy != SPILL_STREAM:
+                            raise
+                        # Keep what is already materialized and stream the remaining steps.
+                        task_logger.warning(f"{e_scratch}; streaming steps {i+1}-{len(workflow.steps)} instead.")
+                        record.add_step_log(step.id, step.action_name, "spilled",
+                                            f"Scratch budget reached, switching to streaming from step {i+1}")
+                        scratch.spilled = True
+                        spill_from = i
+                        break
+                    except TaskCancelledError:
+                        if step_cache_key and step_output_dir and step_output_dir != current_dir_for_steps:
+                            step_cache.discard_staging(step_output_dir)
+                        raise
+                    except Exception as e_step:
+                        if step_cache_key and step_output_dir and step_output_dir != current_dir_for_steps:
+                            step_cache.discard_staging(step_output_dir)
+                        error_msg_step = f"Step {i+1} ({step.action_name}) failed: {str(e_step)}"
+                        task_logger.error(error_msg_step, exc_info=True)
+                        record.add_step_log(step.id, step.action_name, "failed", error_msg_step)
+                        record.fail(f"Workflow aborted due to failure in step {step.action_name}: {error_msg_step}")
+                        history_manager.save_record(record)
+                        channel.finish("Error", f"Step {step.action_name} failed, workflow aborted.")
+                        return
+
+                channel.remove_guard(scratch.check)
+                channel.check_cancelled()
+
+            if not streaming and spill_from is None:
+                # --- FINAL EXPORT LOGIC (REVISED) ---
+                # After all steps are complete, `current_dir_for_steps` holds the result.
+                # Now, decide how to export it to the final `output_directory`.
+                task_logger.info(f"Finalizing export from last step's directory: {current_dir_for_steps}")
+                if incremental_plan:
+                    if current_dir_for_steps == input_dir_for_processing:
+                        final_items = incremental_plan.track(incremental_plan.create_source())
+                    else:
+                        final_items = incremental_plan.track(_local_source(current_dir_for_steps))
+                else:
+                    final_items = _local_source(current_dir_for_steps)
+                final_items = provenance.stage(EXPORT_STEP).inputs(final_items)
+                # Reading the last step's output is part of the export here, so it is not excluded.
+                with telemetry.export.block():
+                    self._export_final(final_items, is_tagging_workflow, output_directory, task_logger)
+            if streaming or spill_from is not None:
+                # --- STREAMING EXECUTION ---
+                # All steps are chained as one generator pipeline and driven by the final exporter.
+                # A staged run that reached its scratch budget continues here from the last materialized step.
+                start_index = reused_steps if spill_from is None else spill_from
+                channel.set_stage("Processing images", f"Streaming {len(workflow.steps) - start_index} steps")
+                if spill_from is not None:
+                    if incremental_plan and current_dir_for_steps == input_dir_for_processing:
+                        streaming_source = _CountingIterator(incremental_plan.create_source())
+                        channel.begin_pass(len(incremental_plan.pending))
+                    else:
+                        streaming_source = _CountingIterator(_local_source(current_dir_for_steps))
+                        channel.begin_pass(_count_image_files(current_dir_for_steps))
+                elif reused_steps:
+                    channel.begin_pass(_count_image_files(current_dir_for_steps))
+                else:
+                    channel.begin_pass(record.total_images if source_type == "LocalSource" else None)
                 try:
-                    action = action_registry.create_action(step.action_name, **step.params)
-                    action_instance = action.action if isinstance(action, WaifucActionWrapper) and hasattr(action, 'action') else action
-                    
-                    if isinstance(action_instance, TerminalAction):
-                        action_instance.output_directory = output_directory
-                        task_logger.info(f"Step {i+1} is a TerminalAction, output directory injected: {output_directory}")
-                    
-                    source_for_step = LocalSource(current_dir_for_steps)
-                    processed_output = source_for_step.attach(action_instance)
-                    
-                    # Check for cancellation before export
-                    if cancel_event and cancel_event.is_set(): raise CancelledError(f"Task cancelled before exporting step {step.action_name}")
-                    
-                    # For ALL steps, use SaveExporter to preserve the metadata chain.
-                    # The final conversion to .txt or simple image save is handled AFTER the loop.
-                    processed_output.export(SaveExporter(step_output_dir, no_meta=False))
-                    current_dir_for_steps = step_output_dir # The output of this step is the input for the next.
-                    
-                    record.add_step_log(step.id, step.action_name, "completed", f"Step {i+1}/{len(workflow.steps)} completed successfully.")
-                    if progress_callback: progress_callback("Processing images", step_progress_base + 0.6/len(workflow.steps), f"Step {i+1}/{len(workflow.steps)} complete")
-
-                except Exception as e_step:
-                    error_msg_step = f"Step {i+1} ({step.action_name}) failed: {str(e_step)}"
-                    task_logger.error(error_msg_step, exc_info=True)
-                    record.add_step_log(step.id, step.action_name, "failed", error_msg_step)
-                    record.fail(f"Workflow aborted due to failure in step {step.action_name}: {error_msg_step}")
+                    fused_groups: List[Tuple[FusedAction, List[WorkflowStep]]] = []
+                    final_items = self._build_streaming_pipeline(
+                        workflow, streaming_source, output_directory, record, task_logger,
+                        start_index=start_index, cache_keys=cache_keys, pinned_keys=pinned_cache_keys,
+                        fused_groups=fused_groups, channel=channel, telemetry=telemetry,
+                        scratch_directory=scratch.path, provenance=provenance,
+                        trace_source=spill_from is None or spill_from == reused_steps,
+                        original_fetch=original_fetch if spill_from is None else None)
+                    if incremental_plan:
+                        final_items = incremental_plan.track(final_items)
+                    final_items = provenance.stage(EXPORT_STEP).inputs(final_items)
+                    with telemetry.export.block():
+                        self._export_final(telemetry.export.exclude(final_items), is_tagging_workflow,
+                                           output_directory, task_logger)
+                except StepExecutionError as e_step:
+                    if e_step.step is None:
+                        error_msg_step = f"Source ({source_type}) failed: {str(e_step.error)}"
+                        task_logger.error(error_msg_step, exc_info=e_step.error)
+                        record.add_step_log("source_preparation", source_type, "failed", error_msg_step)
+                        record.fail(error_msg_step)
+                    else:
+                        error_msg_step = f"Step {e_step.step_index+1} ({e_step.step.action_name}) failed: {str(e_step.error)}"
+                        task_logger.error(error_msg_step, exc_info=e_step.error)
+                        record.add_step_log(e_step.step.id, e_step.step.action_name, "failed", error_msg_step)
+                        record.fail(f"Workflow aborted due to failure in step {e_step.step.action_name}: {error_msg_step}")
                     history_manager.save_record(record)
-                    if progress_callback: progress_callback("Error", step_progress_base, f"Step {step.action_name} failed, workflow aborted.")
+                    channel.finish("Error", error_msg_step)
                     return
-            
-            if cancel_event and cancel_event.is_set(): raise CancelledError("Task cancelled before finalizing output.")
 
-            # --- FINAL EXPORT LOGIC (REVISED) ---
-            # After all steps are complete, `current_dir_for_steps` holds the result.
-            # Now, decide how to export it to the final `output_directory`.
-            task_logger.info(f"Finalizing export from last step's directory: {current_dir_for_steps}")
-            final_source = LocalSource(current_dir_for_steps)
-            final_exporter = None
-
-            if is_tagging_workflow:
-                # The workflow was *intended* for tagging. Now, VERIFY if tags actually exist.
-                has_actual_tags = False
-                try:
-                    # Peek at the first item to see if it has a non-empty tags dictionary.
-                    first_item = next(iter(final_source))
-                    if first_item.meta.get('tags'):
-                        has_actual_tags = True
-                except StopIteration:
-                    # The source is empty, so no items and no tags.
-                    has_actual_tags = False
-                
-                if has_actual_tags:
-                    # If tags were found, use the exporter that creates .txt files.
-                    task_logger.info("Verified that tags exist. Exporting final result with TextualInversionExporter.")
-                    final_exporter = TextualInversionExporter(output_directory)
-                else:
-                    # If no tags were found despite the intent, just save the images.
-                    task_logger.info("Workflow was intended for tagging, but no actual tags were found. Exporting images only.")
-                    final_exporter = SaveExporter(output_directory, no_meta=True)
-            else:
-                # If it was never a tagging workflow, just save the images.
-                task_logger.info("Non-tagging workflow. Exporting final result with SaveExporter (no_meta=True).")
-                final_exporter = SaveExporter(output_directory, no_meta=True)
-            
-            # Perform the final, decisive export.
-            final_source.export(final_exporter)
+                if source_type != "LocalSource" and streaming and not reused_steps:
+                    record.total_images = streaming_source.count
+                    self._report_pushdown(web_sources, source_type, record, task_logger)
+                fused_with: Dict[str, List[str]] = {}
+                for fused, members in fused_groups:
+                    for member, usage in zip(members, fused.usage):
+                        fused_with[member.id] = [m.action_name for m in members]
+                        meter = telemetry.steps[workflow.steps.index(member)]
+                        meter.fused_with = fused_with[member.id]
+                        if usage is not None:
+                            meter.add_samples(usage)
+                step_counts = channel.step_counts()
+                for i, step in enumerate(workflow.steps[start_index:], start=start_index):
+                    details = {"items_in": step_counts[i]["items_in"], "items_out": step_counts[i]["items_out"]}
+                    if step.id in fused_with:
+                        details["fused_with"] = fused_with[step.id]
+                    record.add_step_log(step.id, step.action_name, "completed", f"Step {i+1}/{len(workflow.steps)} completed successfully.",
+                                        details)
             
             # Count the final files in the output directory
-            final_output_files_count = 0
-            if os.path.exists(output_directory):
-                final_output_files_count = len([f for f in os.listdir(output_directory) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff'))])
+            final_output_files_count = _count_image_files(output_directory) if os.path.exists(output_directory) else 0
             
             task_logger.info(f"Saved {final_output_files_count} files to the final output directory: {output_directory}")
+
+            if incremental_plan:
+                removed_outputs = incremental_plan.commit(prune=prune_outputs)
+                if removed_outputs:
+                    task_logger.info(f"Removed {len(removed_outputs)} outputs whose source files no longer exist.")
+                # Outputs of earlier runs stay in place; report only what this run produced.
+                final_output_files_count = incremental_plan.output_count
+            telemetry.export.set_counts(telemetry.export.items_in if streaming or spill_from is not None
+                                        else final_output_files_count,
+                                        final_output_files_count)
             
             record.complete(
                 total_images=record.total_images if record.total_images is not None else 0,
@@ -331,16 +1280,21 @@ class WorkflowEngine:
             history_manager.save_record(record)
             completion_log_message = getattr(record, 'message', record.status)
             task_logger.info(f"Workflow execution complete. Record ID: {record.id}. Status: {record.status}, Details: {completion_log_message}")
-            if progress_callback: progress_callback("Complete", 1.0, f"Processing complete. Total images: {record.total_images}, Successful: {final_output_files_count}")
+            channel.finish("Complete", f"Processing complete. Total images: {record.total_images}, Successful: {final_output_files_count}", 1.0)
 
-        except CancelledError as e:
+        except ScratchBudgetExceeded as e:
+            error_msg = f"Scratch budget exceeded: {e}"
+            task_logger.error(f"Record ID {record.id}: {error_msg}")
+            record.fail(error_msg)
+            history_manager.save_record(record)
+            channel.finish("Error", error_msg)
+
+        except TaskCancelledError as e:
             error_msg = str(e)
             task_logger.info(f"Record ID {record.id}: {error_msg} (Caught in _execute_workflow_internal)")
             record.fail(error_msg)
             history_manager.save_record(record)
-            if progress_callback:
-                progress_val = 0.0
-                progress_callback("Cancelled", progress_val, error_msg)
+            channel.finish("Cancelled", error_msg)
         
         except Exception as e:
             error_msg = f"An unexpected error occurred during workflow execution: {str(e)}"
@@ -348,18 +1302,35 @@ class WorkflowEngine:
             if record.status not in TERMINAL_STATUSES:
                 record.fail(error_msg)
                 history_manager.save_record(record)
-            if progress_callback:
-                progress_callback("Error", 0.0, error_msg)
+            channel.finish("Error", error_msg)
         finally:
-            if temp_dir and os.path.exists(temp_dir):
+            self._progress_channels.pop(record.id, None)
+            provenance.close()
+            if telemetry.enabled:
                 try:
-                    shutil.rmtree(temp_dir)
-                    task_logger.info(f"Temporary directory {temp_dir} removed for Record ID {record.id}.")
-                except Exception as e_rm_temp: task_logger.error(f"Failed to remove temporary directory {temp_dir} for Record ID {record.id}: {e_rm_temp}")
+                    record.step_metrics = telemetry.to_list(channel.step_counts())
+                    history_manager.save_record(record)
+                except Exception as e_metrics:
+                    task_logger.error(f"Failed to store step metrics for Record ID {record.id}: {e_metrics}")
+            for key in pinned_cache_keys:
+                step_cache.unpin(key)
+            if scratch is not None:
+                try:
+                    scratch.close()
+                    record.scratch = scratch.report()
+                    history_manager.save_record(record)
+                    task_logger.info(f"Scratch space {scratch.path} removed for Record ID {record.id} "
+                                     f"(high-water mark: {scratch.high_water} bytes).")
+                except Exception as e_rm_temp: task_logger.error(f"Failed to remove scratch space {scratch.path} for Record ID {record.id}: {e_rm_temp}")
             if file_handler and task_logger:
                 task_logger.removeHandler(file_handler)
                 file_handler.close()
 
+    def get_progress(self, record_id: str) -> Optional[ProgressSnapshot]:
+        """返回正在运行任务最近一次发布的进度快照"""
+        channel = self._progress_channels.get(record_id)
+        return channel.latest if channel else None
+
     def get_running_tasks(self) -> Dict[str, ExecutionRecord]:
         running_records = {}
         for task_id, (_future, record, _cancel_event) in list(self._running_tasks.items()):
@@ -379,53 +1350,69 @@ class WorkflowEngine:
             ]
 
     def get_current_processing_task_info(self) -> Optional[Dict[str, Any]]:
-        with self._queue_lock: record_id = self._current_processing_record_id
-        if record_id and record_id in self._running_tasks:
+        """返回最早开始的正在处理任务的信息（兼容单任务接口）"""
+        infos = self.get_processing_tasks_info()
+        return infos[0] if infos else None
+
+    def get_processing_tasks_info(self) -> List[Dict[str, Any]]:
+        """返回所有正在处理的任务及其占用的资源"""
+        with self._queue_lock:
+            record_ids = list(self._processing_record_ids)
+            held = {rid: sorted(self._held_resources.get(rid, ())) for rid in record_ids}
+        infos = []
+        for record_id in record_ids:
+            if record_id not in self._running_tasks:
+                continue
             _future, record, _ = self._running_tasks[record_id]
-            return {
+            infos.append({
                 "record_id": record.id, "workflow_name": record.workflow_name, "status": record.status,
                 "start_time": record.start_time.isoformat() if hasattr(record.start_time, 'isoformat') else str(record.start_time),
-            }
-        return None
+                "resources": held.get(record_id, []),
+            })
+        return infos
+
+    def get_resource_usage(self) -> Dict[str, Tuple[int, int]]:
+        """返回各资源类别的 (已占用, 容量)"""
+        return self.slots.snapshot()
 
     def cancel_task(self, execution_record_id: str) -> bool:
-        print(f"[cancel_task] called for {execution_record_id}")
-        print(f"[cancel_task] _running_tasks keys: {list(self._running_tasks.keys())}")
-        print(f"[cancel_task] _current_processing_record_id: {self._current_processing_record_id}")
+        logger.debug(f"cancel_task: called for {execution_record_id}")
+        logger.debug(f"cancel_task: _running_tasks keys: {list(self._running_tasks.keys())}")
+        logger.debug(f"cancel_task: processing record ids {self._processing_record_ids}")
         
         if execution_record_id in self._running_tasks:
-            print(f"[cancel_task] found running task {execution_record_id}")
+            logger.debug(f"cancel_task: found running task {execution_record_id}")
             _future, record, cancel_event_to_set = self._running_tasks[execution_record_id]
-            print(f"[cancel_task] task status: {record.status}")
+            logger.debug(f"cancel_task: task status: {record.status}")
             if record.status not in TERMINAL_STATUSES:
-                print(f"[cancel_task] signaling cancel_event for {execution_record_id}")
+                logger.debug(f"cancel_task: signaling cancel_event for {execution_record_id}")
                 cancel_event_to_set.set()
                 return True
             else:
-                print(f"[cancel_task] task {execution_record_id} already finished (status: {record.status})")
+                logger.debug(f"cancel_task: task {execution_record_id} already finished (status: {record.status})")
                 return False
         
         # 如果任务在队列里，还没开始
         with self._queue_lock:
-            print(f"[cancel_task] checking queue, queue length: {len(self._task_queue)}")
+            logger.debug(f"cancel_task: checking queue, queue length: {len(self._task_queue)}")
             task_to_remove_from_queue: Optional[QueuedTask] = None
             for i, queued_item_in_q in enumerate(self._task_queue):
-                print(f"[cancel_task] queue item {i}: {queued_item_in_q.execution_record.id}")
+                logger.debug(f"cancel_task: queue item {i}: {queued_item_in_q.execution_record.id}")
                 if queued_item_in_q.execution_record.id == execution_record_id:
                     task_to_remove_from_queue = queued_item_in_q
                     break
             if task_to_remove_from_queue:
-                print(f"[cancel_task] found queued task {execution_record_id}, removing from queue")
+                logger.debug(f"cancel_task: found queued task {execution_record_id}, removing from queue")
                 self._task_queue.remove(task_to_remove_from_queue)
                 record_to_cancel = task_to_remove_from_queue.execution_record
                 record_to_cancel.fail("Task has been cancelled from the queue")
                 history_manager.save_record(record_to_cancel)
-                if self._current_processing_record_id == execution_record_id:
-                    self._current_processing_record_id = None
-                    self._try_process_next_task_from_queue()
-                return True
+        if task_to_remove_from_queue:
+            # 被移除的任务可能曾阻挡后面的任务，重新调度一次
+            self._try_process_next_task_from_queue()
+            return True
         
-        print(f"[cancel_task] Record ID {execution_record_id} not found for cancellation (neither processing nor queued).")
+        logger.debug(f"cancel_task: Record ID {execution_record_id} not found for cancellation (neither processing nor queued).")
         return False
 
     def shutdown(self) -> None:
@@ -447,6 +1434,7 @@ class WorkflowEngine:
         logger.info("Shutting down ThreadPoolExecutor, waiting for tasks to complete or cancel...")
         self.executor.shutdown(wait=True)
         logger.info("ThreadPoolExecutor shut down complete.")
-        with self._queue_lock: self._current_processing_record_id = None
+        with self._queue_lock: self._processing_record_ids.clear()
+        history_manager.flush()
 
 workflow_engine = WorkflowEngine()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+命令行批处理入口 - 不依赖 PyQt，在没有显示器的机器上执行已保存的工作流
+
+示例:
+    python -m src.headless my_workflow --input ./images --output ./out
+    python -m src.headless workflow.json --source DanbooruSource --param tags='["surtr_(arknights)"]' --output ./out
+
+退出码:
+    0   任务完成
+    1   任务失败
+    2   参数错误（工作流或来源不存在等）
+    130 被用户中断（Ctrl+C）
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from typing import Any, Dict, List, Optional
+
+# 以 python src/headless.py 方式运行时也能找到 src 包
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+# 注意：这里只能导入数据层，不能导入 src.ui（会引入 PyQt5）
+from src.data import config_manager, workflow_manager, workflow_engine
+from src.data.execution_history import ExecutionRecord
+from src.data.progress import ProgressSnapshot
+from src.tools.sources.source_registry import registry as source_registry
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+TERMINAL_STATUSES = {"completed", "failed", "cancelled"}
+
+
+def setup_logging(verbose: bool) -> None:
+    """日志输出到 stderr，stdout 留给 --json 结果"""
+    if verbose:
+        log_level = logging.DEBUG
+    else:
+        log_level_str = config_manager.get("general.log_level", "INFO")
+        log_level = max(getattr(logging, log_level_str, logging.INFO), logging.WARNING)
+    # 每个任务的日志器自带 INFO 级别并写入 logs 目录，控制台只显示达到 log_level 的消息
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setLevel(log_level)
+    logging.basicConfig(
+        level=log_level,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[handler],
+        force=True  # 导入 waifuc 等库时可能已经配置过根日志
+    )
+
+
+def parse_param(text: str) -> (str, Any):
+    """
+    解析 key=value 形式的来源参数，value 能按 JSON 解析时使用解析结果（数字、列表等），否则作为字符串
+
+    Args:
+        text: key=value 字符串
+
+    Returns:
+        (key, value)
+    """
+    if '=' not in text:
+        raise argparse.ArgumentTypeError(f"来源参数格式应为 key=value: {text}")
+    key, value = text.split('=', 1)
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='image_processor_headless',
+        description='不启动界面，直接执行已保存的工作流',
+    )
+    parser.add_argument('workflow', nargs='?',
+                        help='工作流 JSON 文件路径、工作流ID或工作流名称')
+    parser.add_argument('-o', '--output', help='输出目录')
+    parser.add_argument('-i', '--input', help='输入目录（等同于 --source LocalSource --param directory=...）')
+    parser.add_argument('-s', '--source', default=None, help='图像来源名称，默认为 LocalSource')
+    parser.add_argument('-p', '--param', action='append', type=parse_param, default=[], metavar='KEY=VALUE',
+                        help='来源参数，可重复；VALUE 按 JSON 解析，失败时作为字符串')
+    parser.add_argument('--source-params', default=None, metavar='JSON',
+                        help='以 JSON 对象给出全部来源参数，--param 会覆盖其中的同名项')
+
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--streaming', dest='streaming', action='store_true', default=None,
+                      help='流式执行（默认取配置项 processing.streaming）')
+    mode.add_argument('--staged', dest='streaming', action='store_false',
+                      help='分阶段执行，每个步骤的结果写入临时目录')
+    parser.add_argument('--incremental', action='store_true', default=None,
+                        help='增量运行，只处理输入目录中新增或变化的文件')
+    parser.add_argument('--prune', action='store_true', default=None,
+                        help='增量运行时删除来源已被删除的旧输出')
+
+    parser.add_argument('--scratch-dir', default=None,
+                        help='中间文件所在目录（默认取配置项 processing.scratch.path）')
+    parser.add_argument('--scratch-budget-mb', type=int, default=None,
+                        help='本任务中间文件的容量上限（MB），接近上限时按 processing.scratch.spill_policy 处理')
+
+    parser.add_argument('-q', '--quiet', action='store_true', help='不显示进度')
+    parser.add_argument('-v', '--verbose', action='store_true', help='输出调试日志')
+    parser.add_argument('--json', action='store_true', help='结束后把执行记录以 JSON 输出到 stdout')
+    parser.add_argument('--list-workflows', action='store_true', help='列出已保存的工作流后退出')
+    parser.add_argument('--list-sources', action='store_true', help='列出可用的图像来源后退出')
+    return parser
+
+
+class ConsoleProgress:
+    """
+    把进度快照输出到 stderr：终端中原地刷新一行，重定向到文件时只在阶段变化时输出一行
+    """
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.interactive = self.stream.isatty()
+        self._last_stage = None
+        self._line_width = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _format_seconds(seconds: float) -> str:
+        seconds = int(seconds)
+        return f"{seconds // 60}:{seconds % 60:02d}"
+
+    def format(self, snapshot: ProgressSnapshot) -> str:
+        text = f"[{snapshot.stage}] {snapshot.message}"
+        if snapshot.fraction is not None:
+            text = f"{snapshot.fraction * 100:5.1f}% " + text
+        if snapshot.done and not snapshot.finished:
+            text += f" | {snapshot.done}/{snapshot.total}" if snapshot.total else f" | {snapshot.done}"
+            if snapshot.items_per_second:
+                text += f" | {snapshot.items_per_second:.2f} it/s"
+            if snapshot.eta_seconds is not None:
+                text += f" | ETA {self._format_seconds(snapshot.eta_seconds)}"
+        return text
+
+    def __call__(self, snapshot: ProgressSnapshot) -> None:
+        with self._lock:
+            text = self.format(snapshot)
+            if self.interactive:
+                padding = max(0, self._line_width - len(text))
+                self.stream.write('\r' + text + ' ' * padding)
+                self._line_width = len(text)
+                if snapshot.finished:
+                    self.stream.write('\n')
+                    self._line_width = 0
+            else:
+                stage = (snapshot.stage, snapshot.message)
+                if stage != self._last_stage or snapshot.finished:
+                    self._last_stage = stage
+                    self.stream.write(text + '\n')
+            self.stream.flush()
+
+
+def resolve_source(args: argparse.Namespace) -> (str, Dict[str, Any]):
+    """根据命令行参数确定来源名称和参数"""
+    source_type = args.source or 'LocalSource'
+    source_params: Dict[str, Any] = {}
+    if args.source_params:
+        source_params.update(json.loads(args.source_params))
+    if args.input:
+        if args.source and args.source != 'LocalSource':
+            raise ValueError("--input 只能与 LocalSource 一起使用")
+        source_params['directory'] = os.path.abspath(args.input)
+    source_params.update(dict(args.param))
+
+    # 不存在时抛出 ValueError
+    source_registry.get_source_class(source_type)
+    if source_type == 'LocalSource' and not source_params.get('directory'):
+        raise ValueError("LocalSource 需要输入目录，请使用 --input 或 --param directory=...")
+    return source_type, source_params
+
+
+def wait_for_record(record: ExecutionRecord, poll_interval: float = 0.5) -> bool:
+    """
+    等待任务结束
+
+    Returns:
+        任务是否被 Ctrl+C 中断
+    """
+    finished = threading.Event()
+    record.subscribe_status(lambda status: finished.set() if status in TERMINAL_STATUSES else None)
+    interrupted = False
+    while record.status not in TERMINAL_STATUSES:
+        try:
+            finished.wait(poll_interval)
+        except KeyboardInterrupt:
+            if interrupted:
+                # 第二次 Ctrl+C 不再等待清理
+                raise
+            interrupted = True
+            sys.stderr.write("\n正在取消任务（再按一次 Ctrl+C 强制退出）...\n")
+            workflow_engine.cancel_task(record.id)
+    return interrupted
+
+
+def print_summary(record: ExecutionRecord, elapsed: float) -> None:
+    lines = [
+        f"状态: {record.status}",
+        f"工作流: {record.workflow_name}",
+        f"输出目录: {record.output_directory}",
+        f"图像: 总计 {record.total_images}, 成功 {record.success_images}, 失败 {record.failed_images}",
+        f"耗时: {elapsed:.1f} 秒",
+    ]
+    if record.scratch:
+        spilled = "（超出预算，已改为流式执行）" if record.scratch.get('spilled') else ""
+        lines.append(f"临时空间峰值: {record.scratch.get('high_water', 0) / (1024 * 1024):.1f} MB{spilled}")
+    if record.error_message:
+        lines.append(f"错误: {record.error_message}")
+    sys.stderr.write('\n'.join(lines) + '\n')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    命令行主入口
+
+    Args:
+        argv: 命令行参数，默认为 sys.argv[1:]
+
+    Returns:
+        退出码
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    setup_logging(args.verbose)
+
+    if args.list_workflows:
+        for workflow in sorted(workflow_manager.get_all_workflows(), key=lambda w: w.name):
+            print(f"{workflow.id}\t{workflow.name}\t{len(workflow.steps)} steps")
+        return EXIT_OK
+    if args.list_sources:
+        for category, sources in source_registry.get_all_sources().items():
+            for name in sources:
+                print(f"{category}\t{name}")
+        return EXIT_OK
+
+    if not args.workflow or not args.output:
+        parser.print_usage(sys.stderr)
+        sys.stderr.write("错误: 需要指定工作流和 --output\n")
+        return EXIT_USAGE
+
+    try:
+        workflow = workflow_manager.find_workflow(args.workflow)
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"错误: 无法加载工作流 {args.workflow}: {e}\n")
+        return EXIT_USAGE
+    if workflow is None:
+        sys.stderr.write(f"错误: 未找到工作流 {args.workflow}\n")
+        return EXIT_USAGE
+    if not workflow.steps:
+        sys.stderr.write(f"错误: 工作流 {workflow.name} 没有任何步骤\n")
+        return EXIT_USAGE
+
+    try:
+        source_type, source_params = resolve_source(args)
+    except ValueError as e:
+        sys.stderr.write(f"错误: {e}\n")
+        return EXIT_USAGE
+
+    output_directory = os.path.abspath(args.output)
+    start = time.monotonic()
+    record = workflow_engine.execute_workflow(
+        workflow,
+        source_type,
+        source_params,
+        output_directory,
+        None if args.quiet else ConsoleProgress(),
+        streaming=args.streaming,
+        incremental=args.incremental,
+        prune_outputs=args.prune,
+        scratch_dir=os.path.abspath(args.scratch_dir) if args.scratch_dir else None,
+        scratch_budget_mb=args.scratch_budget_mb,
+    )
+    try:
+        interrupted = wait_for_record(record)
+    except KeyboardInterrupt:
+        # 工作线程不是守护线程，正常退出会等待其结束
+        sys.stderr.write("已强制退出\n")
+        os._exit(EXIT_INTERRUPTED)
+    workflow_engine.shutdown()
+
+    if args.json:
+        print(json.dumps(record.to_dict(), ensure_ascii=False, indent=2))
+    elif not args.quiet:
+        print_summary(record, time.monotonic() - start)
+
+    if interrupted:
+        return EXIT_INTERRUPTED
+    return EXIT_OK if record.status == "completed" else EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
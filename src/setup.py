@@ -22,6 +22,7 @@ setup(
     entry_points={
         "console_scripts": [
             "image_processor=src.main:main",
+            "image_processor_headless=src.headless:main",
         ],
     },
     classifiers=[
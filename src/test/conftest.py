@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# the app runs on the waifuc bundled with the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'waifuc'))
+
+# config_manager and history_manager live under the home directory and are created on import
+os.environ['HOME'] = tempfile.mkdtemp(prefix='image_processor_test_')
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'unittest')
+
+
+@pytest.fixture()
+def image_dir(tmp_path):
+    from PIL import Image
+
+    directory = tmp_path / 'input'
+    directory.mkdir()
+    for i in range(6):
+        Image.new('RGB', (300 + i * 40, 200 + i * 30), (i * 40, 100, 50)).save(str(directory / f'img_{i}.png'))
+    return str(directory)
+
+
+@pytest.fixture()
+def empty_step_cache():
+    from src.data.step_cache import step_cache
+
+    step_cache.purge()
+    yield step_cache
+    step_cache.purge()
@@ -0,0 +1,153 @@
+import json
+import os
+import time
+
+import pytest
+
+from src.data.execution_history import ExecutionHistoryManager, ExecutionRecord
+
+
+def _record(i, status='completed', workflow_id='wf_a'):
+    record = ExecutionRecord(workflow_id, f'workflow {workflow_id}', 'LocalSource', {'directory': '/data'}, '/out', id=f'r{i:02d}')
+    record.start_time = f'2024-01-01T00:00:{i:02d}'
+    record.status = status
+    record.total_images = i
+    return record
+
+
+@pytest.fixture()
+def manager_factory(tmp_path):
+    managers = []
+
+    def _create(**kwargs):
+        kwargs.setdefault('db_path', str(tmp_path / 'history.db'))
+        kwargs.setdefault('history_dir', str(tmp_path / 'history'))
+        manager = ExecutionHistoryManager(**kwargs)
+        managers.append(manager)
+        return manager
+
+    yield _create
+    for manager in managers:
+        manager.close()
+
+
+@pytest.mark.unittest
+class TestExecutionHistoryManager:
+    def test_migrate_json(self, tmp_path, manager_factory):
+        history_dir = tmp_path / 'history'
+        history_dir.mkdir()
+        records = [_record(i, status) for i, status in enumerate(['completed', 'failed', 'cancelled'])]
+        for record in records:
+            (history_dir / f'{record.id}.json').write_text(json.dumps(record.to_dict()), encoding='utf-8')
+        (history_dir / 'broken.json').write_text('{', encoding='utf-8')
+
+        manager = manager_factory()
+        assert manager.count_records() == 3
+        loaded = manager.get_record('r01')
+        assert loaded.to_dict() == records[1].to_dict()
+        assert sorted(os.listdir(str(history_dir))) == ['broken.json', 'r00.json', 'r01.json', 'r02.json']
+        manager.close()
+
+        # imported once: files added later and records changed since are left alone
+        (history_dir / 'r09.json').write_text(json.dumps(_record(9).to_dict()), encoding='utf-8')
+        manager = manager_factory()
+        changed = manager.get_record('r00')
+        changed.fail('changed')
+        manager.save_record(changed)
+        manager.close()
+        manager = manager_factory()
+        assert manager.count_records() == 3
+        assert manager.get_record('r09') is None
+        assert manager.get_record('r00').error_message == 'changed'
+
+    def test_query(self, manager_factory):
+        manager = manager_factory(flush_interval=0)
+        statuses = ['completed', 'failed', 'cancelled']
+        for i in range(25):
+            manager.save_record(_record(i, statuses[i % 3], 'wf_a' if i < 20 else 'wf_b'))
+
+        assert manager.count_records() == 25
+        assert [r.id for r in manager.query_records(limit=10)] == [f'r{i:02d}' for i in range(24, 14, -1)]
+        assert [r.id for r in manager.query_records(offset=20, limit=10)] == [f'r{i:02d}' for i in range(4, -1, -1)]
+        assert manager.query_records(offset=30, limit=10) == []
+        assert len(manager.query_records()) == 25
+
+        assert manager.count_records(status='cancelled') == 8
+        assert all(r.status == 'cancelled' for r in manager.query_records(status='cancelled'))
+        assert manager.count_records(status=['completed', 'failed']) == 17
+        assert manager.count_records(workflow_id='wf_b') == 5
+        assert [r.id for r in manager.query_records(status='completed', workflow_id='wf_b', limit=2)] == ['r24', 'r21']
+
+        assert manager.delete_record('r24')
+        assert manager.count_records(workflow_id='wf_b') == 4
+
+    def test_query_pending(self, manager_factory):
+        manager = manager_factory(flush_interval=60)
+        record = manager.create_record('wf_a', 'workflow', 'LocalSource', {}, '/out')
+        assert manager.count_records(status='running') == 1
+        assert manager.query_records(status='running') == [record]
+
+        record.status = 'queued'
+        manager.save_record(record)
+        assert manager.count_records(status='running') == 0
+        assert manager.query_records(status='queued') == [record]
+
+
+@pytest.mark.unittest
+class TestExecutionHistoryWriter:
+    def test_coalesce(self, manager_factory, monkeypatch):
+        manager = manager_factory(flush_interval=0.3)
+        written = []
+        write = manager._write
+        monkeypatch.setattr(manager, '_write', lambda records: written.append(
+            [(r.id, r.processed_images) for r in records]) or write(records))
+
+        record = manager.create_record('wf_a', 'workflow', 'LocalSource', {}, '/out')
+        for i in range(1, 6):
+            record.processed_images = i
+            manager.save_record(record)
+        assert written == []
+        deadline = time.time() + 5
+        while not written and time.time() < deadline:
+            time.sleep(0.05)
+        assert written == [[(record.id, 5)]]
+
+    def test_flush(self, tmp_path, manager_factory):
+        manager = manager_factory(flush_interval=60)
+        record = manager.create_record('wf_a', 'workflow', 'LocalSource', {}, '/out')
+        record.processed_images = 3
+        manager.save_record(record)
+        other = manager_factory()
+        assert other.get_record(record.id) is None
+
+        assert manager.flush()
+        assert other.get_record(record.id).processed_images == 3
+
+        # finished records are written right away
+        record.complete(3, 3, 3, 0)
+        manager.save_record(record)
+        assert other.get_record(record.id).status == 'completed'
+
+    def test_crash(self, tmp_path, manager_factory):
+        manager = manager_factory(flush_interval=60)
+        record = manager.create_record('wf_a', 'workflow', 'LocalSource', {}, '/out')
+        assert manager.flush()
+        record.processed_images = 2
+        record.add_step_log('s1', 'ModeConvertAction', 'completed')
+        manager.save_record(record)
+        broken = manager.create_record('wf_a', 'workflow', 'LocalSource', {'directory': object()}, '/out')
+
+        # a failed batch writes nothing and keeps both records pending
+        assert not manager.flush()
+        other = manager_factory()
+        assert other.get_record(broken.id) is None
+        # the process dies here: what is on disk is the last complete write
+        stored = other.get_record(record.id)
+        assert stored.processed_images == 0
+        assert stored.step_logs == []
+        assert stored.to_dict() == ExecutionRecord.from_dict(stored.to_dict()).to_dict()
+
+        broken.source_params = {}
+        assert manager.flush()
+        assert other.get_record(record.id).processed_images == 2
+        assert other.get_record(broken.id) is not None
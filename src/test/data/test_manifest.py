@@ -0,0 +1,100 @@
+import os
+import time
+
+import pytest
+from PIL import Image
+from waifuc.model import ImageItem
+
+from src.data import Workflow, WorkflowStep, history_manager
+from src.data.manifest import RunManifest, SOURCE_FILE_META
+from src.data.workflow_engine import WorkflowEngine
+
+
+def _workflow(max_size: int = 400):
+    workflow = Workflow('test')
+    workflow.add_step(WorkflowStep('ModeConvertAction', {}))
+    workflow.add_step(WorkflowStep('AlignMaxSizeAction', {'max_size': max_size}))
+    return workflow
+
+
+def _produce(plan, files):
+    # what the engine does with the final items: track which output comes from which source file
+    items = [ImageItem(Image.new('RGB', (1, 1)), {SOURCE_FILE_META: rel, 'filename': rel}) for rel in files]
+    return list(plan.track(items))
+
+
+def _run(workflow, image_dir, output_dir, **kwargs):
+    source_args = {'directory': image_dir}
+    record = history_manager.create_record(workflow.id, workflow.name, 'LocalSource', source_args, output_dir)
+    WorkflowEngine()._execute_workflow_internal(workflow, 'LocalSource', source_args, output_dir, record,
+                                                incremental=True, **kwargs)
+    assert record.status == 'completed', record.error_message
+    return record
+
+
+@pytest.mark.unittest
+class TestManifest:
+    def test_plan(self, image_dir, tmp_path):
+        workflow = _workflow()
+        manifests_dir = str(tmp_path / 'manifests')
+        manifest = RunManifest(workflow, image_dir, str(tmp_path / 'output'), manifests_dir)
+        plan = manifest.plan()
+        assert len(plan.pending) == 6 and plan.unchanged == [] and plan.deleted == []
+        _produce(plan, plan.pending)
+        plan.commit()
+
+        # touched only: same content, still unchanged
+        touched = os.path.join(image_dir, 'img_0.png')
+        os.utime(touched, (time.time() + 10, time.time() + 10))
+        Image.new('RGB', (32, 32), (1, 2, 3)).save(os.path.join(image_dir, 'img_1.png'))
+        Image.new('RGB', (32, 32)).save(os.path.join(image_dir, 'new.png'))
+        os.remove(os.path.join(image_dir, 'img_2.png'))
+
+        plan = RunManifest(workflow, image_dir, str(tmp_path / 'output'), manifests_dir).plan()
+        assert plan.pending == ['img_1.png', 'new.png']
+        assert plan.unchanged == ['img_0.png', 'img_3.png', 'img_4.png', 'img_5.png']
+        assert plan.deleted == ['img_2.png']
+        assert plan.create_source().files == {'img_1.png', 'new.png'}
+
+        plan = RunManifest(_workflow(max_size=200), image_dir, str(tmp_path / 'output'), manifests_dir).plan()
+        assert len(plan.pending) == 6, 'a changed workflow invalidates the manifest'
+
+    @pytest.mark.parametrize('prune', [True, False])
+    def test_prune(self, image_dir, tmp_path, prune):
+        output_dir = tmp_path / 'output'
+        output_dir.mkdir()
+        workflow = _workflow()
+        manifests_dir = str(tmp_path / 'manifests')
+        plan = RunManifest(workflow, image_dir, str(output_dir), manifests_dir).plan()
+        _produce(plan, plan.pending)
+        plan.commit()
+        for rel in plan.pending:
+            (output_dir / rel).write_bytes(b'')
+            (output_dir / f'{os.path.splitext(rel)[0]}.txt').write_text('tags')
+
+        os.remove(os.path.join(image_dir, 'img_3.png'))
+        manifest = RunManifest(workflow, image_dir, str(output_dir), manifests_dir)
+        plan = manifest.plan()
+        assert plan.deleted == ['img_3.png']
+        removed = plan.commit(prune=prune)
+        assert removed == (['img_3.png'] if prune else [])
+        assert (output_dir / 'img_3.png').exists() != prune
+        assert (output_dir / 'img_3.txt').exists() != prune
+        assert (output_dir / 'img_4.png').exists()
+        assert ('img_3.png' in RunManifest(workflow, image_dir, str(output_dir), manifests_dir).files) != prune
+
+    def test_engine(self, image_dir, tmp_path):
+        workflow = _workflow()
+        output_dir = str(tmp_path / 'output')
+        record = _run(workflow, image_dir, output_dir)
+        assert record.total_images == 6
+        assert sorted(os.listdir(output_dir)) == [f'img_{i}.png' for i in range(6)]
+        mtimes = {name: os.path.getmtime(os.path.join(output_dir, name)) for name in os.listdir(output_dir)}
+
+        record = _run(workflow, image_dir, output_dir)
+        assert record.total_images == 0
+        assert {name: os.path.getmtime(os.path.join(output_dir, name)) for name in os.listdir(output_dir)} == mtimes
+
+        os.remove(os.path.join(image_dir, 'img_5.png'))
+        _run(workflow, image_dir, output_dir, prune_outputs=True)
+        assert sorted(os.listdir(output_dir)) == [f'img_{i}.png' for i in range(5)]
@@ -0,0 +1,33 @@
+import logging
+import threading
+
+import pytest
+
+from src.data.progress import ProgressChannel, TaskCancelledError
+
+
+@pytest.mark.unittest
+class TestProgressChannel:
+    def test_failing_subscriber(self, caplog):
+        channel = ProgressChannel('record', min_interval=0)
+        received = []
+
+        def _broken(snapshot):
+            raise ValueError('broken')
+
+        channel.subscribe(_broken)
+        channel.subscribe(received.append)
+        with caplog.at_level(logging.ERROR, logger='src.data.progress'):
+            channel.set_stage('处理中')
+        assert len(received) == 1
+        assert received[0].stage == '处理中'
+        assert [record.message for record in caplog.records] == ['progress callback failed']
+        assert caplog.records[0].exc_info[0] is ValueError
+
+    def test_check_cancelled(self):
+        cancel_event = threading.Event()
+        channel = ProgressChannel('record', cancel_event)
+        channel.check_cancelled()
+        cancel_event.set()
+        with pytest.raises(TaskCancelledError):
+            channel.check_cancelled()
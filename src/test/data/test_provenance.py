@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from src.data import Workflow, WorkflowStep, history_manager
+from src.data.provenance import ProvenanceWriter, ProvenanceLog, provenance_path, remove_provenance, \
+    SOURCE_STEP, EXPORT_STEP
+from src.data.workflow_engine import WorkflowEngine
+
+
+class _Item:
+    def __init__(self, filename):
+        self.meta = {'filename': filename}
+
+
+def _split(items):
+    # a.png -> a_0.png, a_1.png, like the person/head split actions
+    for item in items:
+        stem, ext = os.path.splitext(item.meta['filename'])
+        yield from (_Item(f'{stem}_{i}{ext}') for i in range(2))
+
+
+def _drop(names):
+    return lambda items: (item for item in items if item.meta['filename'] not in names)
+
+
+def _stage(writer, first, last, action, items):
+    tracer = writer.stage(first, last)
+    return list(tracer.outputs(action(tracer.inputs(items))))
+
+
+def _workflow():
+    workflow = Workflow('test')
+    workflow.add_step(WorkflowStep('ModeConvertAction', {}))
+    workflow.add_step(WorkflowStep('AlignMaxSizeAction', {'max_size': 400}))
+    workflow.add_step(WorkflowStep('MinSizeFilterAction', {'min_size': 250}))
+    return workflow
+
+
+@pytest.mark.unittest
+class TestProvenance:
+    def test_round_trip(self, tmp_path):
+        steps = [WorkflowStep('SplitAction', {}), WorkflowStep('FilterAction', {})]
+        path = str(tmp_path / 'run.prov')
+        writer = ProvenanceWriter(path, 'record', steps)
+        items = list(writer.stage(SOURCE_STEP).outputs(_Item(name) for name in ['a.png', 'b.png', 'c.png']))
+        items = _stage(writer, 0, 0, _split, items)
+        items = _stage(writer, 1, 1, _drop({'a_1.png', 'c_0.png', 'c_1.png'}), items)
+        list(writer.stage(EXPORT_STEP).inputs(items))
+        writer.close()
+
+        log = ProvenanceLog(path)
+        assert not log.truncated
+        assert log.meta['record_id'] == 'record'
+        assert log.steps == [{'id': steps[0].id, 'name': 'SplitAction'}, {'id': steps[1].id, 'name': 'FilterAction'}]
+        assert log.source_names() == ['a.png', 'b.png', 'c.png']
+        assert log.dropped(0) == []
+        assert log.dropped(1) == ['a_1.png', 'c_0.png', 'c_1.png']
+        assert [(s['step_index'], s['items_in'], s['items_out'], s['items_dropped']) for s in log.step_summary()] == \
+               [(0, 3, 6, 0), (1, 6, 3, 3)]
+        assert [(e['step_index'], e['input'], e['outcome'], e['outputs']) for e in log.trace('a.png')] == [
+            (0, 'a.png', 'passed', ['a_0.png', 'a_1.png']),
+            (1, 'a_0.png', 'passed', ['a_0.png']),
+            (1, 'a_1.png', 'dropped', []),
+            (EXPORT_STEP, 'a_0.png', 'exported', ['a_0.png']),
+        ]
+        assert log.explain('a.png') == 'a.png 已导出为 a_0.png'
+        assert log.explain('c.png') == 'c.png 在步骤 2 (FilterAction)被过滤掉（经过处理后的文件名为 c_0.png）'
+        assert log.explain('d.png').startswith('d.png 不在本次运行的来源图像中')
+
+        # a log cut short by a crash is still readable up to the last complete event
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:-7])
+        log = ProvenanceLog(path)
+        assert log.truncated
+        assert log.source_names() == ['a.png', 'b.png', 'c.png']
+
+    def test_disabled(self, tmp_path):
+        path = str(tmp_path / 'run.prov')
+        writer = ProvenanceWriter(path, 'record', [], enabled=False)
+        items = [_Item('a.png')]
+        assert writer.stage(SOURCE_STEP).outputs(items) is items
+        writer.close()
+        assert not os.path.exists(path)
+
+    @pytest.mark.parametrize('streaming', [True, False])
+    def test_engine(self, image_dir, tmp_path, empty_step_cache, streaming):
+        workflow = _workflow()
+        source_args = {'directory': image_dir}
+        output_dir = str(tmp_path / 'output')
+        record = history_manager.create_record(workflow.id, workflow.name, 'LocalSource', source_args, output_dir)
+        WorkflowEngine()._execute_workflow_internal(workflow, 'LocalSource', source_args, output_dir, record,
+                                                    streaming=streaming)
+        assert record.status == 'completed', record.error_message
+
+        log = ProvenanceLog.load(record.id)
+        assert log is not None and not log.truncated
+        assert sorted(log.source_names()) == [f'img_{i}.png' for i in range(6)]
+        assert sorted(log.dropped(2)) == ['img_0.png', 'img_1.png']
+        assert [(s['step_name'], s['items_in'], s['items_out']) for s in log.step_summary()] == [
+            ('ModeConvertAction', 6, 6), ('AlignMaxSizeAction', 6, 6), ('MinSizeFilterAction', 6, 4)]
+        assert log.explain('img_0.png') == 'img_0.png 在步骤 3 (MinSizeFilterAction)被过滤掉'
+        assert log.explain('img_5.png') == 'img_5.png 已导出为 img_5.png'
+
+        remove_provenance(record.id)
+        assert not os.path.exists(provenance_path(record.id))
+        assert ProvenanceLog.load(record.id) is None
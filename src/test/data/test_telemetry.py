@@ -0,0 +1,79 @@
+import csv
+import json
+import os
+
+import pytest
+
+from src.data import Workflow, WorkflowStep, history_manager
+from src.data.execution_history import ExecutionRecord
+from src.data.telemetry import METRIC_FIELDS, export_step_metrics
+from src.data.workflow_engine import WorkflowEngine
+
+
+def _workflow():
+    workflow = Workflow('test')
+    workflow.add_step(WorkflowStep('ModeConvertAction', {}))
+    workflow.add_step(WorkflowStep('AlignMaxSizeAction', {'max_size': 400}))
+    workflow.add_step(WorkflowStep('MinSizeFilterAction', {'min_size': 250}))
+    return workflow
+
+
+def _run(workflow, image_dir, output_dir, **kwargs):
+    source_args = {'directory': image_dir}
+    record = history_manager.create_record(workflow.id, workflow.name, 'LocalSource', source_args, output_dir)
+    WorkflowEngine()._execute_workflow_internal(workflow, 'LocalSource', source_args, output_dir, record, **kwargs)
+    assert record.status == 'completed', record.error_message
+    return record
+
+
+@pytest.mark.unittest
+class TestTelemetry:
+    @pytest.mark.parametrize('streaming', [True, False])
+    def test_step_metrics(self, image_dir, tmp_path, empty_step_cache, streaming):
+        workflow = _workflow()
+        record = _run(workflow, image_dir, str(tmp_path / 'output'), streaming=streaming)
+        metrics = record.step_metrics
+        assert [m['step_name'] for m in metrics] == \
+               ['Source', 'ModeConvertAction', 'AlignMaxSizeAction', 'MinSizeFilterAction', 'Export']
+        assert all(list(m) == METRIC_FIELDS for m in metrics)
+
+        source, *steps, export = metrics
+        assert [m['step_id'] for m in steps] == [step.id for step in workflow.steps]
+        assert [m['step_index'] for m in steps] == [0, 1, 2]
+        assert [(m['items_in'], m['items_out'], m['items_dropped']) for m in steps] == [(6, 6, 0), (6, 6, 0), (6, 4, 2)]
+        assert export['items_out'] == 4
+        for m in steps:
+            assert m['wall_time'] > 0
+            assert m['cpu_time'] >= 0
+            assert m['throughput'] > 0
+            assert not m['cached']
+            for field in ('peak_rss_delta', 'bytes_read', 'bytes_written'):
+                assert m[field] is None or m[field] >= 0
+        if streaming:
+            assert all(m['fused_with'] == [step.action_name for step in workflow.steps] for m in steps)
+        else:
+            assert all(m['fused_with'] is None for m in steps)
+
+        loaded = ExecutionRecord.from_dict(json.loads(json.dumps(record.to_dict())))
+        assert loaded.step_metrics == metrics
+
+    def test_cached_steps(self, image_dir, tmp_path, empty_step_cache):
+        _run(_workflow(), image_dir, str(tmp_path / 'first'), streaming=False)
+        record = _run(_workflow(), image_dir, str(tmp_path / 'second'), streaming=False)
+        assert [m['cached'] for m in record.step_metrics[1:-1]] == [True, True, True]
+
+    @pytest.mark.parametrize('ext', ['.csv', '.json'])
+    def test_export(self, image_dir, tmp_path, empty_step_cache, ext):
+        records = [_run(_workflow(), image_dir, str(tmp_path / f'output_{i}'), streaming=True) for i in range(2)]
+        path = str(tmp_path / f'metrics{ext}')
+        assert export_step_metrics(records, path) == 10
+        if ext == '.json':
+            with open(path, 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+        else:
+            with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+                rows = list(csv.DictReader(f))
+            assert list(rows[0]) == ['record_id', 'workflow_id', 'workflow_name', 'start_time', 'status', *METRIC_FIELDS]
+            assert rows[1]['fused_with'] == 'ModeConvertAction+AlignMaxSizeAction+MinSizeFilterAction'
+        assert [row['record_id'] for row in rows] == [records[0].id] * 5 + [records[1].id] * 5
+        assert str(rows[3]['items_dropped']) == '2'
@@ -0,0 +1,304 @@
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from waifuc.action import MinSizeFilterAction
+from waifuc.model import ImageItem
+from waifuc.source import LocalSource, OriginalFetchAction, WebDataSource
+
+from src.data import Workflow, WorkflowStep, history_manager
+from src.data.config_manager import config_manager
+from src.data.workflow_engine import WorkflowEngine, ResourceSlots, declare_task_resources, _web_source, \
+    RESOURCE_CPU, RESOURCE_NETWORK, RESOURCE_HEAVY_MODEL
+
+
+def _workflow(*options):
+    workflow = Workflow('test')
+    workflow.add_step(WorkflowStep('ModeConvertAction', {}))
+    workflow.add_step(WorkflowStep('AlignMaxSizeAction', {'max_size': 400}))
+    workflow.add_step(WorkflowStep('MinSizeFilterAction', {'min_size': 250}))
+    for step, step_options in zip(workflow.steps, options):
+        step.options.update(step_options)
+    return workflow
+
+
+def _run(workflow, image_dir, output_dir, **kwargs):
+    source_args = {'directory': image_dir}
+    record = history_manager.create_record(workflow.id, workflow.name, 'LocalSource', source_args, output_dir)
+    WorkflowEngine()._execute_workflow_internal(workflow, 'LocalSource', source_args, output_dir, record, **kwargs)
+    return record
+
+
+def _staged(cache):
+    return os.listdir(cache.staging_dir) if os.path.isdir(cache.staging_dir) else []
+
+
+class _EmptyWebSource(WebDataSource):
+    def __init__(self):
+        WebDataSource.__init__(self, 'test')
+
+    def _iter_data(self):
+        yield from []
+
+
+@pytest.mark.unittest
+class TestWorkflowEngineStepCache:
+    def test_streaming_writes_no_steps(self, image_dir, tmp_path, empty_step_cache):
+        record = _run(_workflow(), image_dir, str(tmp_path / 'output'), streaming=True)
+        assert record.status == 'completed', record.error_message
+        assert len(os.listdir(str(tmp_path / 'output'))) > 0
+        assert empty_step_cache.list_entries() == []
+        assert _staged(empty_step_cache) == []
+
+    def test_streaming_checkpoint(self, image_dir, tmp_path, empty_step_cache):
+        record = _run(_workflow({}, {'checkpoint': True}), image_dir, str(tmp_path / 'output'), streaming=True)
+        assert record.status == 'completed', record.error_message
+        entries = empty_step_cache.list_entries()
+        assert len(entries) == 1
+        assert _staged(empty_step_cache) == []
+
+    def test_staged_caches_steps(self, image_dir, tmp_path, empty_step_cache):
+        record = _run(_workflow(), image_dir, str(tmp_path / 'output'), streaming=False)
+        assert record.status == 'completed', record.error_message
+        assert len(empty_step_cache.list_entries()) == 3
+
+    def test_staging_in_scratch(self, image_dir, tmp_path, empty_step_cache):
+        scratch_dir = str(tmp_path / 'scratch')
+        record = _run(_workflow(), image_dir, str(tmp_path / 'output'), streaming=False, scratch_dir=scratch_dir)
+        assert record.status == 'completed', record.error_message
+        assert len(empty_step_cache.list_entries()) == 3
+        assert record.scratch['high_water'] > 0
+        assert os.listdir(scratch_dir) == []
+
+
+def _completed_logs(record):
+    return {log['step_name']: log['details'] for log in record.step_logs
+            if log['status'] == 'completed' and 'items_in' in (log['details'] or {})}
+
+
+@pytest.mark.unittest
+class TestWorkflowEngineFusion:
+    @pytest.mark.parametrize(['options', 'groups'], [
+        ((), [['ModeConvertAction', 'AlignMaxSizeAction', 'MinSizeFilterAction']]),
+        (({'fuse': False},), [['AlignMaxSizeAction', 'MinSizeFilterAction']]),
+        (({}, {'fuse': False}), []),
+        (({'checkpoint': True},), [['AlignMaxSizeAction', 'MinSizeFilterAction']]),
+        (({}, {'checkpoint': True}), [['ModeConvertAction', 'AlignMaxSizeAction']]),
+    ])
+    def test_groups(self, image_dir, tmp_path, empty_step_cache, options, groups):
+        record = _run(_workflow(*options), image_dir, str(tmp_path / 'output'), streaming=True)
+        assert record.status == 'completed', record.error_message
+        logs = _completed_logs(record)
+        fused_with = {name: group for group in groups for name in group}
+        for name, details in logs.items():
+            assert details.get('fused_with') == fused_with.get(name)
+
+        # per-step counts stay exact inside a fused stage
+        assert (logs['ModeConvertAction']['items_in'], logs['ModeConvertAction']['items_out']) == (6, 6)
+        assert (logs['AlignMaxSizeAction']['items_in'], logs['AlignMaxSizeAction']['items_out']) == (6, 6)
+        assert (logs['MinSizeFilterAction']['items_in'], logs['MinSizeFilterAction']['items_out']) == (6, 4)
+        assert len(os.listdir(str(tmp_path / 'output'))) == 4
+
+    def test_disabled(self, image_dir, tmp_path, empty_step_cache, monkeypatch):
+        get = config_manager.get
+        monkeypatch.setattr(config_manager, 'get', lambda key, default=None: False
+                            if key == 'processing.fusion' else get(key, default))
+        record = _run(_workflow(), image_dir, str(tmp_path / 'output'), streaming=True)
+        assert record.status == 'completed', record.error_message
+        assert all('fused_with' not in details for details in _completed_logs(record).values())
+
+
+@pytest.mark.unittest
+class TestWorkflowEngineCancel:
+    @pytest.mark.parametrize('streaming', [True, False])
+    def test_cancel_mid_step(self, image_dir, tmp_path, empty_step_cache, monkeypatch, streaming):
+        get = config_manager.get
+        monkeypatch.setattr(config_manager, 'get', lambda key, default=None: 0
+                            if key == 'processing.progress_interval' else get(key, default))
+        cancel_event = threading.Event()
+        snapshots = []
+
+        def _on_progress(snapshot):
+            snapshots.append(snapshot)
+            if snapshot.steps[0]['items_in'] >= 2:
+                cancel_event.set()
+
+        output_dir = str(tmp_path / 'output')
+        record = _run(_workflow(), image_dir, output_dir, streaming=streaming,
+                      progress_callback=_on_progress, cancel_event=cancel_event)
+        assert record.status == 'failed'
+        assert '取消' in record.error_message
+        # honored within the first step, one item after the request
+        assert max(snapshot.steps[0]['items_in'] for snapshot in snapshots) <= 3
+        assert not os.path.exists(output_dir) or len(os.listdir(output_dir)) < 4
+        assert snapshots[-1].finished
+
+
+@pytest.mark.unittest
+class TestWorkflowEngineWebSource:
+    def test_composed_sources(self, image_dir):
+        first, second = _EmptyWebSource(), _EmptyWebSource()
+        fetch = OriginalFetchAction()
+        web_sources = _web_source((first | LocalSource(image_dir)) + second[:3], [MinSizeFilterAction(100)], fetch)
+        assert web_sources == [first, second]
+        concurrency = int(config_manager.get("processing.download.concurrency", 1) or 1)
+        for source in (first, second):
+            assert source.download_concurrency == concurrency
+            assert len(source.post_filters) == 1
+            assert source.preview_size is not None
+        assert set(fetch.sources.values()) == {first, second}
+
+    def test_pushdown_filters(self, tmp_path, monkeypatch):
+        workflow = Workflow('test')
+        workflow.add_step(WorkflowStep('ClassFilterAction', {'classes': ['illustration']}))
+        workflow.add_step(WorkflowStep('MinSizeFilterAction', {'min_size': 800}))
+        workflow.add_step(WorkflowStep('ModeConvertAction', {}))
+        workflow.add_step(WorkflowStep('MinAreaFilterAction', {'min_size': 800}))
+        engine = WorkflowEngine()
+        created = []
+        create_step_action = engine._create_step_action
+        monkeypatch.setattr(engine, '_create_step_action',
+                            lambda step, *args, **kwargs: created.append(step.action_name) or
+                            create_step_action(step, *args, **kwargs))
+
+        filters = engine._pushdown_filters(workflow, str(tmp_path))
+        assert created == ['MinSizeFilterAction']
+        assert [type(f).__name__ for f in filters] == ['MinSizeFilterAction']
+        assert all(f.pushdownable for f in filters)
+
+
+@pytest.mark.unittest
+class TestWorkflowEngineParallel:
+    @pytest.fixture()
+    def parallel_enabled(self, monkeypatch):
+        get = config_manager.get
+        monkeypatch.setattr(config_manager, 'get', lambda key, default=None: {'enabled': True, 'workers': 2}
+                            if key == 'processing.parallel' else get(key, default))
+
+    @pytest.mark.parametrize(['action_name', 'parallel'], [
+        ('ModeConvertAction', True),
+        ('TaggingAction', True),
+        ('FileExtAction', False),
+        ('FileOrderAction', False),
+        ('FilterSimilarAction', False),
+    ])
+    def test_parallel_safe(self, parallel_enabled, action_name, parallel):
+        options = WorkflowEngine._get_parallel_options(WorkflowStep(action_name, {}))
+        assert (options is not None) == parallel
+
+    def test_file_ext_names(self, tmp_path, parallel_enabled):
+        workflow = Workflow('test')
+        workflow.add_step(WorkflowStep('FileExtAction', {'ext': '.jpg'}))
+        action = WorkflowEngine()._create_step_action(workflow.steps[0], str(tmp_path))
+        assert type(action).__name__ == 'FileExtAction'
+        items = [ImageItem(Image.new('RGB', (4, 4)), {}) for _ in range(4)]
+        names = [item.meta['filename'] for item in action.iter_from(items)]
+        assert names == [f'untitled_{i}.jpg' for i in range(1, 5)]
+
+
+class _SchedulerProbe:
+    """Replaces the task body, records how many tasks run at once and holds them until released."""
+
+    def __init__(self, duration: float = 0.1):
+        self.duration = duration
+        self.running = 0
+        self.max_running = 0
+        self.release = threading.Event()
+        self.started = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record, **kwargs):
+        with self._lock:
+            self.started.append(record.id)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.duration)
+            self.release.wait(5.0)
+        finally:
+            with self._lock:
+                self.running -= 1
+        record.complete(0, 0, 0, 0)
+
+
+def _wait_idle(engine: WorkflowEngine, timeout: float = 10.0):
+    deadline = time.time() + timeout
+    while (engine._running_tasks or engine._task_queue) and time.time() < deadline:
+        time.sleep(0.02)
+    assert not engine._running_tasks and not engine._task_queue
+
+
+@pytest.mark.unittest
+class TestWorkflowEngineScheduler:
+    def test_slots(self):
+        slots = ResourceSlots({RESOURCE_CPU: 2, RESOURCE_HEAVY_MODEL: 1})
+        assert slots.try_acquire([RESOURCE_CPU, RESOURCE_HEAVY_MODEL])
+        assert not slots.try_acquire([RESOURCE_HEAVY_MODEL])
+        assert not slots.try_acquire([RESOURCE_CPU, RESOURCE_HEAVY_MODEL])
+        assert slots.snapshot() == {RESOURCE_CPU: (1, 2), RESOURCE_HEAVY_MODEL: (1, 1)}, 'a failed acquire takes nothing'
+        assert slots.try_acquire([RESOURCE_CPU])
+        assert not slots.can_acquire([RESOURCE_CPU])
+        slots.release([RESOURCE_CPU, RESOURCE_HEAVY_MODEL])
+        assert slots.snapshot() == {RESOURCE_CPU: (1, 2), RESOURCE_HEAVY_MODEL: (0, 1)}
+
+    def test_declare_resources(self):
+        assert declare_task_resources(_workflow(), 'LocalSource') == {RESOURCE_CPU}
+        workflow = _workflow()
+        workflow.add_step(WorkflowStep('CCIPAction', {}))
+        assert declare_task_resources(workflow, 'DanbooruSource') == {RESOURCE_NETWORK, RESOURCE_CPU, RESOURCE_HEAVY_MODEL}
+
+    @pytest.mark.parametrize(['resources', 'expected'], [
+        ({RESOURCE_CPU}, 2),
+        ({RESOURCE_CPU, RESOURCE_HEAVY_MODEL}, 1),
+        ({RESOURCE_NETWORK}, 3),
+    ])
+    def test_concurrency(self, tmp_path, monkeypatch, resources, expected):
+        engine = WorkflowEngine(max_workers=3, resource_slots={RESOURCE_CPU: 2, RESOURCE_NETWORK: 4,
+                                                               RESOURCE_HEAVY_MODEL: 1})
+        probe = _SchedulerProbe()
+        probe.release.set()
+        monkeypatch.setattr(engine, '_execute_workflow_internal', probe)
+        records = [engine.execute_workflow(_workflow(), 'LocalSource', {'directory': str(tmp_path)},
+                                           str(tmp_path / f'output_{i}'), resources=resources)
+                   for i in range(5)]
+        _wait_idle(engine)
+        assert probe.max_running == expected
+        assert all(record.status == 'completed' for record in records)
+        assert engine.get_resource_usage()[RESOURCE_CPU][0] == 0
+
+    def test_blocked_head_reserves_resources(self, tmp_path, monkeypatch):
+        engine = WorkflowEngine(max_workers=3, resource_slots={RESOURCE_CPU: 2, RESOURCE_NETWORK: 2,
+                                                               RESOURCE_HEAVY_MODEL: 1})
+        probe = _SchedulerProbe(duration=0.0)
+        monkeypatch.setattr(engine, '_execute_workflow_internal', probe)
+        submit = lambda resources: engine.execute_workflow(  # noqa: E731
+            _workflow(), 'LocalSource', {'directory': str(tmp_path)}, str(tmp_path / 'output'), resources=resources)
+        heavy = submit({RESOURCE_HEAVY_MODEL})
+        blocked = submit({RESOURCE_HEAVY_MODEL, RESOURCE_CPU})
+        cpu = submit({RESOURCE_CPU})
+        network = submit({RESOURCE_NETWORK})
+        time.sleep(0.2)
+        assert probe.started == [heavy.id, network.id], 'the CPU task must not overtake the blocked one needing CPU'
+        probe.release.set()
+        _wait_idle(engine)
+        assert probe.started.index(blocked.id) < probe.started.index(cpu.id)
+
+    def test_cancel_queued(self, tmp_path, monkeypatch):
+        engine = WorkflowEngine(max_workers=1)
+        probe = _SchedulerProbe(duration=0.0)
+        monkeypatch.setattr(engine, '_execute_workflow_internal', probe)
+        running = engine.execute_workflow(_workflow(), 'LocalSource', {'directory': str(tmp_path)},
+                                          str(tmp_path / 'output'))
+        queued = engine.execute_workflow(_workflow(), 'LocalSource', {'directory': str(tmp_path)},
+                                         str(tmp_path / 'output'))
+        assert engine.cancel_task(queued.id)
+        assert queued.status == 'failed'
+        assert not engine.cancel_task('unknown')
+        assert engine.cancel_task(running.id)
+        assert engine._running_tasks[running.id][2].is_set()
+        probe.release.set()
+        _wait_idle(engine)
+        assert probe.max_running == 1
@@ -0,0 +1,105 @@
+import json
+import os
+
+import pytest
+
+from src import headless
+from src.data import Workflow, WorkflowStep, workflow_manager
+from src.data.workflow_engine import WorkflowEngine
+
+
+@pytest.fixture()
+def engine(monkeypatch):
+    # main() shuts the engine down when it is done
+    engine = WorkflowEngine()
+    monkeypatch.setattr(headless, 'workflow_engine', engine)
+    return engine
+
+
+@pytest.fixture()
+def workflow_file(tmp_path):
+    workflow = Workflow('headless test')
+    workflow.add_step(WorkflowStep('ModeConvertAction', {}))
+    workflow.add_step(WorkflowStep('MinSizeFilterAction', {'min_size': 250}))
+    path = str(tmp_path / 'workflow.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(workflow.to_dict(), f, ensure_ascii=False, indent=2)
+    return path
+
+
+def _run(capsys, *argv):
+    exit_code = headless.main(list(argv))
+    return exit_code, capsys.readouterr()
+
+
+@pytest.mark.unittest
+class TestHeadless:
+    @pytest.mark.parametrize('mode', ['--streaming', '--staged'])
+    def test_workflow_file(self, engine, workflow_file, image_dir, tmp_path, capsys, mode):
+        output_dir = str(tmp_path / 'output')
+        exit_code, captured = _run(capsys, workflow_file, '-i', image_dir, '-o', output_dir, mode, '-q', '--json')
+        assert exit_code == headless.EXIT_OK, captured.err
+        record = json.loads(captured.out)
+        assert record['status'] == 'completed'
+        assert record['workflow_name'] == 'headless test'
+        assert record['source_type'] == 'LocalSource'
+        assert record['output_directory'] == output_dir
+        # img_0 and img_1 are smaller than 250 on their short side
+        assert sorted(os.listdir(output_dir)) == [f'img_{i}.png' for i in range(2, 6)]
+
+    def test_saved_workflow(self, engine, image_dir, tmp_path, capsys):
+        workflow = Workflow('headless saved')
+        workflow.add_step(WorkflowStep('ModeConvertAction', {}))
+        assert workflow_manager.save_workflow(workflow)
+        try:
+            exit_code, captured = _run(capsys, 'headless saved', '--source', 'LocalSource',
+                                       '--param', f'directory={json.dumps(image_dir)}', '-o', str(tmp_path / 'output'))
+            assert exit_code == headless.EXIT_OK, captured.err
+            assert '状态: completed' in captured.err
+            assert len(os.listdir(str(tmp_path / 'output'))) == 6
+
+            exit_code, captured = _run(capsys, '--list-workflows')
+            assert exit_code == headless.EXIT_OK
+            assert f'{workflow.id}\theadless saved\t1 steps' in captured.out.splitlines()
+        finally:
+            workflow_manager.delete_workflow(workflow.id)
+
+    def test_incremental(self, engine, workflow_file, image_dir, tmp_path, capsys, monkeypatch):
+        output_dir = str(tmp_path / 'output')
+        args = (workflow_file, '-i', image_dir, '-o', output_dir, '--incremental', '-q', '--json')
+        exit_code, captured = _run(capsys, *args)
+        assert exit_code == headless.EXIT_OK, captured.err
+        assert json.loads(captured.out)['total_images'] == 6
+
+        monkeypatch.setattr(headless, 'workflow_engine', WorkflowEngine())
+        exit_code, captured = _run(capsys, *args)
+        assert exit_code == headless.EXIT_OK, captured.err
+        assert json.loads(captured.out)['total_images'] == 0
+
+    @pytest.mark.parametrize('argv', [
+        (),
+        ('missing_workflow', '-i', '.', '-o', 'out'),
+        ('{workflow}',),
+        ('{workflow}', '-o', 'out'),
+        ('{workflow}', '-s', 'NoSuchSource', '-o', 'out'),
+        ('{workflow}', '-s', 'DanbooruSource', '-i', '.', '-o', 'out'),
+    ])
+    def test_usage_errors(self, engine, workflow_file, capsys, argv):
+        exit_code, captured = _run(capsys, *(arg.format(workflow=workflow_file) for arg in argv))
+        assert exit_code == headless.EXIT_USAGE
+        assert captured.out == ''
+
+    def test_failed(self, engine, workflow_file, tmp_path, capsys):
+        exit_code, captured = _run(capsys, workflow_file, '-i', str(tmp_path / 'missing'),
+                                   '-o', str(tmp_path / 'output'), '-q', '--json')
+        assert exit_code == headless.EXIT_FAILED
+        assert json.loads(captured.out)['status'] == 'failed'
+
+    @pytest.mark.parametrize(['text', 'expected'], [
+        ('limit=10', ('limit', 10)),
+        ('tags=["a", "b"]', ('tags', ['a', 'b'])),
+        ('directory=/data/images', ('directory', '/data/images')),
+        ('query=a=b', ('query', 'a=b')),
+    ])
+    def test_parse_param(self, text, expected):
+        assert headless.parse_param(text) == expected
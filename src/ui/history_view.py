@@ -7,12 +7,44 @@ from typing import Optional, List, Dict, Any
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTreeWidget,
     QTreeWidgetItem, QMessageBox, QGroupBox, QMenu, QAction, QDialog,
-    QFormLayout, QTextEdit, QDialogButtonBox, QHeaderView
+    QFormLayout, QTextEdit, QDialogButtonBox, QHeaderView, QFileDialog, QComboBox
 )
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QIcon, QColor
 
 from src.data import ExecutionRecord, history_manager
+from src.data.telemetry import export_step_metrics
+
+
+def _format_bytes(value) -> str:
+    if value is None:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(value) < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def export_metrics_dialog(parent, records: List[ExecutionRecord], default_name: str) -> None:
+    """
+    选择文件并导出执行记录的步骤性能数据
+
+    Args:
+        parent: 父窗口
+        records: 要导出的执行记录
+        default_name: 默认文件名（不含扩展名）
+    """
+    path, _ = QFileDialog.getSaveFileName(
+        parent, parent.tr("导出性能数据"), f"{default_name}.csv",
+        parent.tr("CSV 文件 (*.csv);;JSON 文件 (*.json)")
+    )
+    if not path:
+        return
+    try:
+        count = export_step_metrics(records, path)
+        QMessageBox.information(parent, parent.tr("导出完成"), parent.tr(f"已导出 {count} 行性能数据到 {path}"))
+    except Exception as e:
+        QMessageBox.warning(parent, parent.tr("错误"), parent.tr(f"导出性能数据失败: {str(e)}"))
 
 
 class ExecutionDetailDialog(QDialog):
@@ -68,6 +100,14 @@ class ExecutionDetailDialog(QDialog):
         info_layout.addRow(self.tr("失败图像数:"), QLabel(str(record.failed_images)))
         
         info_layout.addRow(self.tr("输出目录:"), QLabel(record.output_directory or self.tr("未知")))
+        if record.scratch:
+            scratch_text = f"{record.scratch.get('high_water', 0) / (1024 * 1024):.1f} MB"
+            budget = record.scratch.get('budget') or record.scratch.get('global_budget')
+            if budget:
+                scratch_text += f" / {budget / (1024 * 1024):.0f} MB"
+            if record.scratch.get('spilled'):
+                scratch_text += self.tr("（超出预算，已改为流式执行）")
+            info_layout.addRow(self.tr("临时空间峰值:"), QLabel(scratch_text))
         
         layout.addWidget(info_group)
         
@@ -124,6 +164,50 @@ class ExecutionDetailDialog(QDialog):
             steps_layout.addWidget(steps_tree)
             layout.addWidget(steps_group)
         
+        # 步骤性能
+        if record.step_metrics:
+            metrics_group = QGroupBox(self.tr("步骤性能"))
+            metrics_layout = QVBoxLayout(metrics_group)
+            
+            metrics_tree = QTreeWidget()
+            metrics_tree.setHeaderLabels([
+                self.tr("步骤"), self.tr("耗时(秒)"), self.tr("CPU(秒)"), self.tr("输入"), self.tr("输出"),
+                self.tr("丢弃"), self.tr("张/秒"), self.tr("内存峰值增长"), self.tr("读取"), self.tr("写入")
+            ])
+            metrics_tree.header().setSectionResizeMode(QHeaderView.ResizeToContents)
+            
+            # 耗时最长的步骤标红，便于找到瓶颈
+            slowest = max(record.step_metrics, key=lambda m: m.get("wall_time") or 0)
+            for metrics in record.step_metrics:
+                name = metrics.get("step_name", self.tr("未知"))
+                if metrics.get("cached"):
+                    name += self.tr(" (缓存)")
+                elif metrics.get("fused_with"):
+                    name += self.tr(" (融合)")
+                throughput = metrics.get("throughput")
+                item = QTreeWidgetItem([
+                    name,
+                    f"{metrics.get('wall_time', 0):.3f}",
+                    f"{metrics.get('cpu_time', 0):.3f}",
+                    str(metrics.get("items_in", 0)),
+                    str(metrics.get("items_out", 0)),
+                    str(metrics.get("items_dropped", 0)),
+                    f"{throughput:.2f}" if throughput is not None else "-",
+                    _format_bytes(metrics.get("peak_rss_delta")),
+                    _format_bytes(metrics.get("bytes_read")),
+                    _format_bytes(metrics.get("bytes_written")),
+                ])
+                if metrics is slowest and (metrics.get("wall_time") or 0) > 0:
+                    item.setForeground(1, QColor(255, 0, 0))
+                metrics_tree.addTopLevelItem(item)
+            
+            metrics_layout.addWidget(metrics_tree)
+            
+            export_button = QPushButton(self.tr("导出性能数据"))
+            export_button.clicked.connect(lambda: export_metrics_dialog(self, [record], f"metrics_{record.id[:8]}"))
+            metrics_layout.addWidget(export_button, 0, Qt.AlignRight)
+            layout.addWidget(metrics_group)
+        
         # 添加按钮
         button_box = QDialogButtonBox(QDialogButtonBox.Ok)
         button_box.accepted.connect(self.accept)
@@ -135,9 +219,11 @@ class HistoryViewWidget(QWidget):
     历史记录视图部件，显示历史执行记录
     """
     record_selected = pyqtSignal(str)  # 记录ID
+    PAGE_SIZE = 100  # 每页显示的记录数
     
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.page = 0
         
         # 初始化UI
         self.init_ui()
@@ -160,8 +246,26 @@ class HistoryViewWidget(QWidget):
         self.clear_button.clicked.connect(self.clear_records)
         toolbar_layout.addWidget(self.clear_button)
         
+        # 按状态筛选
+        self.status_combo = QComboBox()
+        self.status_combo.addItem(self.tr("全部状态"), None)
+        for status in ("completed", "failed", "cancelled", "running", "queued"):
+            self.status_combo.addItem(status, status)
+        self.status_combo.currentIndexChanged.connect(self.on_filter_changed)
+        toolbar_layout.addWidget(self.status_combo)
+        
         toolbar_layout.addStretch()
         
+        # 分页
+        self.prev_button = QPushButton(self.tr("上一页"))
+        self.prev_button.clicked.connect(lambda: self.go_to_page(self.page - 1))
+        toolbar_layout.addWidget(self.prev_button)
+        self.page_label = QLabel()
+        toolbar_layout.addWidget(self.page_label)
+        self.next_button = QPushButton(self.tr("下一页"))
+        self.next_button.clicked.connect(lambda: self.go_to_page(self.page + 1))
+        toolbar_layout.addWidget(self.next_button)
+        
         # 添加到主布局
         layout.addLayout(toolbar_layout)
         
@@ -181,15 +285,39 @@ class HistoryViewWidget(QWidget):
         layout.addWidget(self.history_tree)
     
     def refresh_records(self):
-        """刷新历史记录"""
+        """刷新历史记录（只读取当前页）"""
         self.history_tree.clear()
         
-        # 获取所有记录
-        records = history_manager.get_all_records()
+        status = self.status_combo.currentData()
+        total = history_manager.count_records(status=status)
+        page_count = max(1, (total + self.PAGE_SIZE - 1) // self.PAGE_SIZE)
+        self.page = min(self.page, page_count - 1)
+        
+        # 获取当前页的记录
+        records = history_manager.query_records(status=status, offset=self.page * self.PAGE_SIZE,
+                                                limit=self.PAGE_SIZE)
         
         # 添加到树
         for record in records:
             self.add_record_to_tree(record)
+        
+        self.page_label.setText(self.tr(f"第 {self.page + 1}/{page_count} 页，共 {total} 条"))
+        self.prev_button.setEnabled(self.page > 0)
+        self.next_button.setEnabled(self.page < page_count - 1)
+    
+    def go_to_page(self, page: int):
+        """
+        跳转到指定页
+        
+        Args:
+            page: 页码（从 0 开始）
+        """
+        self.page = max(0, page)
+        self.refresh_records()
+    
+    def on_filter_changed(self, index: int):
+        """筛选条件变化时回到第一页"""
+        self.go_to_page(0)
     
     def add_record_to_tree(self, record: ExecutionRecord):
         """
@@ -260,6 +388,12 @@ class HistoryViewWidget(QWidget):
             open_action.triggered.connect(lambda: self.open_output_directory(record.output_directory))
             menu.addAction(open_action)
         
+        # 导出同一工作流所有运行的性能数据，便于比较
+        if record and record.workflow_id:
+            export_action = QAction(self.tr("导出该工作流的性能数据"), self)
+            export_action.triggered.connect(lambda: self.export_workflow_metrics(record))
+            menu.addAction(export_action)
+        
         menu.addSeparator()
         
         # 删除记录
@@ -305,6 +439,19 @@ class HistoryViewWidget(QWidget):
         dialog = ExecutionDetailDialog(record, self)
         dialog.exec_()
     
+    def export_workflow_metrics(self, record: ExecutionRecord):
+        """
+        导出与该记录同一工作流的所有执行记录的性能数据
+        
+        Args:
+            record: 执行记录
+        """
+        records = [r for r in history_manager.query_records(workflow_id=record.workflow_id) if r.step_metrics]
+        if not records:
+            QMessageBox.information(self, self.tr("提示"), self.tr("该工作流还没有性能数据。"))
+            return
+        export_metrics_dialog(self, list(reversed(records)), f"metrics_{record.workflow_name or record.workflow_id}")
+    
     def open_output_directory(self, directory: str):
         """
         打开输出目录
@@ -412,6 +559,9 @@ class HistoryViewWidget(QWidget):
         # 刷新按钮文本
         self.refresh_button.setText(self.tr("刷新"))
         self.clear_button.setText(self.tr("清理记录"))
+        self.status_combo.setItemText(0, self.tr("全部状态"))
+        self.prev_button.setText(self.tr("上一页"))
+        self.next_button.setText(self.tr("下一页"))
         # 刷新树表头
         self.history_tree.setHeaderLabels([
             self.tr("时间"), self.tr("工作流"), self.tr("状态"), self.tr("图像数")
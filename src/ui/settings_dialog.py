@@ -11,6 +11,7 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt, pyqtSignal
 
 from src.data.config_manager import config_manager
+from src.data.step_cache import step_cache
 
 
 class GeneralSettingsWidget(QWidget):
@@ -240,13 +241,143 @@ class ProcessingSettingsWidget(QWidget):
         
         layout.addWidget(sizes_group)
         
+        # 执行设置
+        execution_group = QGroupBox(self.tr("执行设置"))
+        execution_layout = QFormLayout(execution_group)
+        
+        # 流式执行
+        self.streaming_check = QCheckBox()
+        self.streaming_check.setChecked(config_manager.get("processing.streaming", True))
+        self.streaming_check.setToolTip(self.tr("所有步骤串联为一条流水线执行，中间结果不写入临时目录"))
+        
+        execution_layout.addRow(self.tr("流式执行:"), self.streaming_check)
+
+        # 步骤内并行
+        self.parallel_check = QCheckBox()
+        self.parallel_check.setChecked(config_manager.get("processing.parallel.enabled", False))
+        self.parallel_check.setToolTip(self.tr("把对齐、过滤、打标等逐图处理的步骤分发到多个工作线程/进程"))
+        execution_layout.addRow(self.tr("步骤内并行:"), self.parallel_check)
+
+        self.parallel_workers_spin = QSpinBox()
+        self.parallel_workers_spin.setRange(0, 256)
+        self.parallel_workers_spin.setSpecialValueText(self.tr("自动"))
+        self.parallel_workers_spin.setValue(config_manager.get("processing.parallel.workers", 0))
+        execution_layout.addRow(self.tr("并行工作数:"), self.parallel_workers_spin)
+
+        self.parallel_mode_combo = QComboBox()
+        self.parallel_mode_combo.addItem(self.tr("线程"), "thread")
+        self.parallel_mode_combo.addItem(self.tr("进程"), "process")
+        mode_index = self.parallel_mode_combo.findData(config_manager.get("processing.parallel.mode", "thread"))
+        self.parallel_mode_combo.setCurrentIndex(max(0, mode_index))
+        execution_layout.addRow(self.tr("并行方式:"), self.parallel_mode_combo)
+
+        self.parallel_ordered_check = QCheckBox()
+        self.parallel_ordered_check.setChecked(config_manager.get("processing.parallel.ordered", True))
+        execution_layout.addRow(self.tr("保持输出顺序:"), self.parallel_ordered_check)
+
+        # 增量运行
+        self.incremental_check = QCheckBox()
+        self.incremental_check.setChecked(config_manager.get("processing.incremental", False))
+        self.incremental_check.setToolTip(self.tr("对本地目录只处理上次运行后新增或变化的文件，之前的输出保留不变"))
+        execution_layout.addRow(self.tr("增量运行:"), self.incremental_check)
+
+        self.incremental_prune_check = QCheckBox()
+        self.incremental_prune_check.setChecked(config_manager.get("processing.incremental_prune", False))
+        self.incremental_prune_check.setToolTip(self.tr("增量运行时删除来源文件已被删除的输出"))
+        execution_layout.addRow(self.tr("清理失效输出:"), self.incremental_prune_check)
+
+        self.max_tasks_spin = QSpinBox()
+        self.max_tasks_spin.setRange(1, 16)
+        self.max_tasks_spin.setValue(config_manager.get("processing.max_concurrent_tasks", 2))
+        execution_layout.addRow(self.tr("最大并发任务数:"), self.max_tasks_spin)
+
+        self.network_slots_spin = QSpinBox()
+        self.network_slots_spin.setRange(1, 16)
+        self.network_slots_spin.setValue(config_manager.get("processing.resource_slots.network", 2))
+        execution_layout.addRow(self.tr("网络下载槽位:"), self.network_slots_spin)
+
+        self.cpu_slots_spin = QSpinBox()
+        self.cpu_slots_spin.setRange(1, 16)
+        self.cpu_slots_spin.setValue(config_manager.get("processing.resource_slots.cpu", 2))
+        execution_layout.addRow(self.tr("CPU 处理槽位:"), self.cpu_slots_spin)
+
+        self.heavy_model_slots_spin = QSpinBox()
+        self.heavy_model_slots_spin.setRange(1, 8)
+        self.heavy_model_slots_spin.setValue(config_manager.get("processing.resource_slots.heavy_model", 1))
+        self.heavy_model_slots_spin.setToolTip(self.tr("超分、抠图、CCIP 等重型模型同时运行的任务数"))
+        execution_layout.addRow(self.tr("重型模型槽位:"), self.heavy_model_slots_spin)
+        
+        layout.addWidget(execution_group)
+
+        # 步骤缓存
+        cache_group = QGroupBox(self.tr("步骤缓存"))
+        cache_layout = QFormLayout(cache_group)
+
+        self.cache_enabled_check = QCheckBox()
+        self.cache_enabled_check.setChecked(config_manager.get("processing.step_cache.enabled", True))
+        self.cache_enabled_check.setToolTip(self.tr("缓存每个步骤的输出，重跑修改过的工作流时跳过未变化的步骤"))
+        cache_layout.addRow(self.tr("启用缓存:"), self.cache_enabled_check)
+
+        self.cache_size_spin = QSpinBox()
+        self.cache_size_spin.setRange(256, 1024 * 1024)
+        self.cache_size_spin.setSingleStep(1024)
+        self.cache_size_spin.setSuffix(" MB")
+        self.cache_size_spin.setValue(config_manager.get("processing.step_cache.max_size_mb", 10240))
+        cache_layout.addRow(self.tr("缓存容量上限:"), self.cache_size_spin)
+
+        usage_layout = QHBoxLayout()
+        self.cache_usage_label = QLabel()
+        usage_layout.addWidget(self.cache_usage_label)
+        self.cache_purge_button = QPushButton(self.tr("清空缓存"))
+        self.cache_purge_button.clicked.connect(self.purge_step_cache)
+        usage_layout.addWidget(self.cache_purge_button)
+        cache_layout.addRow(self.tr("已用空间:"), usage_layout)
+        self.update_cache_usage()
+
+        layout.addWidget(cache_group)
+        
         # 添加空白占位
         layout.addStretch()
+
+    def update_cache_usage(self):
+        """刷新步骤缓存占用显示"""
+        entries = step_cache.list_entries()
+        self.cache_usage_label.setText(self.tr("{0:.1f} MB（{1} 个条目）").format(
+            step_cache.total_size() / (1024 * 1024), len(entries)))
+
+    def purge_step_cache(self):
+        """清空步骤缓存"""
+        reply = QMessageBox.question(
+            self, self.tr("确认"), self.tr("确定要清空步骤缓存吗？正在运行的任务使用的条目会被保留。"),
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        freed = step_cache.purge()
+        self.update_cache_usage()
+        QMessageBox.information(self, self.tr("完成"), self.tr("已释放 {0:.1f} MB").format(freed / (1024 * 1024)))
     
     def save_settings(self):
         """保存设置"""
         # 默认设置
         config_manager.set("processing.default_prefix", self.prefix_edit.text())
+
+        # 步骤缓存
+        config_manager.set("processing.step_cache.enabled", self.cache_enabled_check.isChecked())
+        config_manager.set("processing.step_cache.max_size_mb", self.cache_size_spin.value())
+        
+        # 执行设置
+        config_manager.set("processing.streaming", self.streaming_check.isChecked())
+        config_manager.set("processing.parallel.enabled", self.parallel_check.isChecked())
+        config_manager.set("processing.parallel.workers", self.parallel_workers_spin.value())
+        config_manager.set("processing.parallel.mode", self.parallel_mode_combo.currentData())
+        config_manager.set("processing.parallel.ordered", self.parallel_ordered_check.isChecked())
+        config_manager.set("processing.incremental", self.incremental_check.isChecked())
+        config_manager.set("processing.incremental_prune", self.incremental_prune_check.isChecked())
+        config_manager.set("processing.max_concurrent_tasks", self.max_tasks_spin.value())
+        config_manager.set("processing.resource_slots.network", self.network_slots_spin.value())
+        config_manager.set("processing.resource_slots.cpu", self.cpu_slots_spin.value())
+        config_manager.set("processing.resource_slots.heavy_model", self.heavy_model_slots_spin.value())
         
         # 默认尺寸
         config_manager.set("processing.default_sizes", {
@@ -5,10 +5,11 @@ from PyQt5.QtWidgets import (
     QTextEdit, QTreeWidget, QTreeWidgetItem, QMessageBox, QGroupBox,
     QSplitter, QFrame, QToolBar, QAction, QFileDialog
 )
-from PyQt5.QtCore import Qt, pyqtSignal, QTimer, pyqtSlot
+from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot
 from PyQt5.QtGui import QPixmap, QImage
 
 from src.data import Workflow, ExecutionRecord, workflow_engine, history_manager
+from src.data.progress import ProgressSnapshot
 
 
 class TaskExecutionWidget(QWidget):
@@ -19,7 +20,8 @@ class TaskExecutionWidget(QWidget):
     task_finished = pyqtSignal(bool, str)  # 成功状态, 消息
 
     # 新增信号，用于线程安全更新UI
-    progress_signal = pyqtSignal(str, float, str)  # status, progress, message
+    progress_signal = pyqtSignal(object)  # ProgressSnapshot
+    status_signal = pyqtSignal(str)  # status
     log_signal = pyqtSignal(str)  # message
     result_signal = pyqtSignal(dict)  # step_log
 
@@ -33,12 +35,15 @@ class TaskExecutionWidget(QWidget):
         self.output_directory = output_directory
 
         self.execution_record: Optional[ExecutionRecord] = None
+        self._last_stage: Optional[str] = None
+        self._finish_reported = False
 
         # 初始化UI
         self.init_ui()
 
         # 连接信号到槽
         self.progress_signal.connect(self.on_progress_update)
+        self.status_signal.connect(self.on_status_update)
         self.log_signal.connect(self.add_log)
         # self.result_signal.connect(self.update_result_tree) # 移除执行结果信号连接
 
@@ -141,11 +146,6 @@ class TaskExecutionWidget(QWidget):
         # 添加到主布局
         layout.addLayout(buttons_layout)
 
-        # 更新计时器
-        self.update_timer = QTimer(self)
-        self.update_timer.timeout.connect(self.update_progress)
-        self.update_timer.setInterval(1000)  # 1秒更新一次
-
     def retranslateUi(self):
         self.workflow_label.setText(self.tr("工作流: ") + self.workflow.name)
         self.source_label.setText(self.tr("源: ") + self.source_type)
@@ -180,6 +180,8 @@ class TaskExecutionWidget(QWidget):
         self.progress_bar.setValue(0)
         self.status_label.setText(self.tr("正在启动..."))
         self.log_text.clear()
+        self._last_stage = None
+        self._finish_reported = False
         # self.result_tree.clear() # 移除结果树清空
 
         # 更新按钮状态
@@ -201,12 +203,11 @@ class TaskExecutionWidget(QWidget):
             self.on_progress_callback
         )
 
-        # 注册状态变更回调
+        # 注册状态变更回调，进度和状态都由引擎推送，不再定时轮询
         if self.execution_record:
             self.execution_record.subscribe_status(self.on_status_changed)
-
-        # 启动更新计时器
-        self.update_timer.start()
+            # 订阅前任务可能已经开始甚至结束
+            self.on_status_update(self.execution_record.status)
 
         # 发送任务开始信号
         self.task_started.emit()
@@ -220,12 +221,10 @@ class TaskExecutionWidget(QWidget):
             main_window.update_stop_button_state()
 
     def on_status_changed(self, status):
-        from PyQt5.QtWidgets import QMainWindow
-        main_window = self.parent()
-        while main_window and not isinstance(main_window, QMainWindow):
-            main_window = main_window.parent()
-        if main_window and hasattr(main_window, 'update_stop_button_state'):
-            main_window.update_stop_button_state()
+        """
+        状态变更回调，子线程调用，发信号给主线程
+        """
+        self.status_signal.emit(status)
 
     def stop_task(self):
         if not self.can_stop():
@@ -246,7 +245,7 @@ class TaskExecutionWidget(QWidget):
                 self.status_label.setText(self.tr("正在取消..."))
                 self.start_button.setEnabled(True)
                 self.stop_button.setEnabled(False)
-                self.update_timer.stop()
+                self._finish_reported = True
                 self.task_finished.emit(False, self.tr("任务已取消"))
             else:
                 record = history_manager.get_record(self.execution_record.id)
@@ -260,36 +259,53 @@ class TaskExecutionWidget(QWidget):
             self.log_signal.emit(self.tr(f"停止任务时发生错误: {str(e)}"))
             QMessageBox.critical(self, self.tr("错误"), self.tr(f"停止任务时发生错误: {str(e)}"))
 
-    def on_progress_callback(self, status: str, progress: float, message: str):
+    def on_progress_callback(self, snapshot: ProgressSnapshot):
         """
         进度更新回调，子线程调用，发信号给主线程
 
         Args:
-            status: 当前状态
-            progress: 进度值 (0.0 - 1.0)
-            message: 状态消息
+            snapshot: 引擎发布的进度快照
         """
-        self.progress_signal.emit(status, progress, message)
+        self.progress_signal.emit(snapshot)
+
+    @staticmethod
+    def _format_seconds(seconds: float) -> str:
+        seconds = int(seconds)
+        if seconds >= 3600:
+            return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+        return f"{seconds // 60}:{seconds % 60:02d}"
 
-    @pyqtSlot(str, float, str)
-    def on_progress_update(self, status: str, progress: float, message: str):
+    @pyqtSlot(object)
+    def on_progress_update(self, snapshot: ProgressSnapshot):
         """
         进度更新槽函数，主线程更新UI
 
         Args:
-            status: 当前状态
-            progress: 进度值 (0.0 - 1.0)
-            message: 状态消息
+            snapshot: 引擎发布的进度快照
         """
         # 更新进度条
-        progress_value = int(progress * 100)
-        self.progress_bar.setValue(progress_value)
-
-        # 更新状态标签
-        self.status_label.setText(self.tr(f"{status}: {message}"))
-
-        # 添加日志
-        self.log_signal.emit(self.tr(f"[{status}] {message}"))
+        if snapshot.fraction is not None:
+            self.progress_bar.setValue(int(snapshot.fraction * 100))
+
+        # 更新状态标签：阶段、已处理图像数、速度和剩余时间
+        text = f"{snapshot.stage}: {snapshot.message}"
+        if snapshot.done and not snapshot.finished:
+            counted = f"{snapshot.done}/{snapshot.total}" if snapshot.total else str(snapshot.done)
+            text += self.tr(f" | 已处理 {counted}")
+            if snapshot.items_per_second:
+                text += self.tr(f" | {snapshot.items_per_second:.2f} 张/秒")
+            if snapshot.eta_seconds is not None:
+                text += self.tr(f" | 剩余约 {self._format_seconds(snapshot.eta_seconds)}")
+        self.status_label.setText(text)
+
+        # 只在阶段变化时写日志，避免逐图刷屏
+        stage_key = f"{snapshot.stage}: {snapshot.message}"
+        if stage_key != self._last_stage:
+            self._last_stage = stage_key
+            self.log_signal.emit(self.tr(f"[{snapshot.stage}] {snapshot.message}"))
+            if snapshot.finished:
+                for step in snapshot.steps:
+                    self.log_signal.emit(self.tr(f"  {step['name']}: 输入 {step['items_in']}, 输出 {step['items_out']}"))
 
     @pyqtSlot(str)
     def add_log(self, message: str):
@@ -363,7 +379,6 @@ class TaskExecutionWidget(QWidget):
             # 检查任务状态是否发生变化
             if record.status != "running" and self.is_running():
                 # 任务已完成或失败
-                self.update_timer.stop()
                 self.start_button.setEnabled(True)
                 # self.stop_button.setEnabled(False) # 移除停止按钮状态更新
                 
@@ -393,20 +408,30 @@ class TaskExecutionWidget(QWidget):
         except Exception as e:
             self.log_signal.emit(self.tr(f"检查任务状态时发生错误: {str(e)}"))
 
-    def update_progress(self):
-        """更新进度和结果显示"""
+    @pyqtSlot(str)
+    def on_status_update(self, status: str):
+        """状态变更槽函数，主线程更新按钮和结果显示"""
         if not self.execution_record:
             return
 
         # 直接使用自己的execution_record，不依赖history_manager
         record = self.execution_record
 
+        from PyQt5.QtWidgets import QMainWindow
+        main_window = self.parent()
+        while main_window and not isinstance(main_window, QMainWindow):
+            main_window = main_window.parent()
+        if main_window and hasattr(main_window, 'update_stop_button_state'):
+            main_window.update_stop_button_state()
+
         # 根据执行记录状态更新UI
         if record.status == "running":
             self.start_button.setEnabled(False)
             self.stop_button.setEnabled(True)
         elif record.status in ["completed", "failed", "cancelled"]:
-            self.update_timer.stop()
+            if self._finish_reported:
+                return
+            self._finish_reported = True
             self.start_button.setEnabled(True)
             self.stop_button.setEnabled(False)
             if record.status == "completed":
@@ -0,0 +1,120 @@
+import time
+from typing import List
+
+import pytest
+from PIL import Image
+
+from waifuc.action import ProcessAction, FilterAction, ActionStop, ModeConvertAction, FusedAction
+from waifuc.model import ImageItem
+
+
+class _BatchAddOneAction(ProcessAction):
+    def __init__(self):
+        self.batches = []
+
+    def process(self, item: ImageItem) -> ImageItem:
+        return ImageItem(item.image, {**item.meta, 'value': item.meta['value'] + 1})
+
+    def process_batch(self, items: List[ImageItem]) -> List[ImageItem]:
+        self.batches.append(len(items))
+        return [self.process(item) for item in items]
+
+
+class _BatchEvenFilterAction(FilterAction):
+    def __init__(self):
+        self.batches = []
+
+    def check(self, item: ImageItem) -> bool:
+        return item.meta['value'] % 2 == 0
+
+    def check_batch(self, items: List[ImageItem]) -> List[bool]:
+        self.batches.append(len(items))
+        return [self.check(item) for item in items]
+
+
+class _BatchStopAction(ProcessAction):
+    def process(self, item: ImageItem) -> ImageItem:
+        return item
+
+    def process_batch(self, items: List[ImageItem]) -> List[ImageItem]:
+        if any(item.meta['value'] >= 5 for item in items):
+            raise ActionStop
+        return items
+
+
+def _items(n: int = 10, interval: float = 0.0):
+    for i in range(n):
+        if interval:
+            time.sleep(interval)
+        yield ImageItem(Image.new('RGBA', (4, 4)), {'value': i})
+
+
+@pytest.mark.unittest
+class TestActionBatch:
+    def test_unbatched(self):
+        action = _BatchAddOneAction()
+        assert action.batchable
+        assert [item.meta['value'] for item in action.iter_from(_items())] == list(range(1, 11))
+        assert action.batches == []
+
+    def test_process_batch(self):
+        action = _BatchAddOneAction().batched(4)
+        assert [item.meta['value'] for item in action.iter_from(_items())] == list(range(1, 11))
+        assert action.batches == [4, 4, 2]
+
+    def test_check_batch(self):
+        action = _BatchEvenFilterAction().batched(3)
+        assert [item.meta['value'] for item in action.iter_from(_items())] == [0, 2, 4, 6, 8]
+        assert action.batches == [3, 3, 3, 1]
+
+    def test_max_latency(self):
+        action = _BatchAddOneAction().batched(100, max_latency=0.05)
+        assert len(list(action.iter_from(_items(6, interval=0.03)))) == 6
+        assert sum(action.batches) == 6
+        assert all(size <= 3 for size in action.batches)
+
+    def test_max_latency_stalled(self):
+        def _stalled():
+            yield from _items(2)
+            time.sleep(1.0)
+            yield from _items(1)
+
+        action = _BatchAddOneAction().batched(100, max_latency=0.05)
+        start = time.monotonic()
+        iter_ = action.iter_from(_stalled())
+        next(iter_)
+        assert time.monotonic() - start < 0.5, 'a partial batch must not wait for the stalled input'
+        assert len(list(iter_)) == 2
+        assert action.batches == [2, 1]
+
+    def test_max_latency_stop(self):
+        closed = []
+
+        def _endless():
+            try:
+                for i in range(10000):
+                    yield ImageItem(Image.new('RGBA', (4, 4)), {'value': i})
+            finally:
+                closed.append(True)
+
+        action = _BatchStopAction().batched(5, max_latency=1.0)
+        assert [item.meta['value'] for item in action.iter_from(_endless())] == [0, 1, 2, 3, 4]
+        deadline = time.monotonic() + 1.0
+        while not closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert closed
+
+    def test_action_stop(self):
+        action = _BatchStopAction().batched(5)
+        assert [item.meta['value'] for item in action.iter_from(_items())] == [0, 1, 2, 3, 4]
+
+    def test_not_batchable(self):
+        action = ModeConvertAction('RGB').batched(4)
+        assert not action.batchable
+        assert len(list(action.iter_from(_items()))) == 10
+
+    def test_fusable(self):
+        action = _BatchAddOneAction()
+        assert FusedAction.is_fusable(action)
+        assert len(list(FusedAction(action, _BatchEvenFilterAction()).iter_from(_items()))) == 5
+        assert action.batches == []
@@ -0,0 +1,117 @@
+import copy
+
+import pytest
+from PIL import Image
+
+from waifuc.action import ProcessAction, FusedAction
+from waifuc.export import BaseExporter
+from waifuc.model import ImageItem
+from waifuc.source import EmptySource
+from waifuc.source.base import BaseDataSource
+
+
+class _HeavyModel:
+    copies = 0
+
+    def __deepcopy__(self, memo):
+        _HeavyModel.copies += 1
+        return _HeavyModel()
+
+
+class _ModelAction(ProcessAction):
+    _shared_attrs = ('model', 'config')
+
+    def __init__(self):
+        self.model = _HeavyModel()
+        self.config = {'scale': 2}
+        self.seen = []
+
+    def process(self, item: ImageItem) -> ImageItem:
+        self.seen.append(item.meta['value'])
+        return item
+
+
+class _SubModelAction(_ModelAction):
+    _shared_attrs = ('extra',)
+
+    def __init__(self):
+        _ModelAction.__init__(self)
+        self.extra = _HeavyModel()
+
+
+class _ListSource(BaseDataSource):
+    def _iter(self):
+        for i in range(5):
+            yield ImageItem(Image.new('RGB', (1, 1)), {'value': i})
+
+
+class _ListExporter(BaseExporter):
+    _shared_attrs = ('target',)
+
+    def __init__(self, target: list):
+        BaseExporter.__init__(self)
+        self.target = target
+        self.count = 0
+
+    def pre_export(self):
+        pass
+
+    def export_item(self, item: ImageItem):
+        self.count += 1
+        self.target.append(item.meta['value'])
+
+    def post_export(self):
+        pass
+
+    def reset(self):
+        self.count = 0
+
+
+@pytest.fixture(autouse=True)
+def _reset_copies():
+    _HeavyModel.copies = 0
+
+
+@pytest.mark.unittest
+class TestActionClone:
+    def test_clone(self):
+        action = _ModelAction()
+        action.seen.append(-1)
+        cloned = action.clone()
+        assert cloned.model is action.model
+        assert cloned.config is action.config
+        assert cloned.seen == [-1] and cloned.seen is not action.seen
+        assert _HeavyModel.copies == 0
+
+    def test_inherited(self):
+        action = _SubModelAction()
+        cloned = copy.deepcopy(action)
+        assert cloned.model is action.model
+        assert cloned.extra is action.extra
+        assert _HeavyModel.copies == 0
+
+    def test_nested(self):
+        member = _ModelAction()
+        fused = FusedAction(member, _ModelAction(), probe=lambda: (0.0,))
+        cloned = fused.clone()
+        assert cloned.actions[0] is not member
+        assert cloned.actions[0].model is member.model
+        assert cloned.probe is fused.probe
+        assert cloned._lock is not fused._lock
+        assert _HeavyModel.copies == 0
+
+    def test_attach(self):
+        action = _ModelAction()
+        source = _ListSource().attach(action)
+        assert len(list(source)) == 5
+        assert len(list(source)) == 5
+        assert action.seen == []
+        assert _HeavyModel.copies == 0
+
+    def test_export(self):
+        target = []
+        exporter = _ListExporter(target)
+        _ListSource().export(exporter)
+        EmptySource().export(exporter)
+        assert target == [0, 1, 2, 3, 4]
+        assert exporter.count == 0
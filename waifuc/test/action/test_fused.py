@@ -0,0 +1,76 @@
+import copy
+
+import pytest
+from PIL import Image
+
+from waifuc.action import FusedAction, ProcessAction, FilterAction, ModeConvertAction, FirstNSelectAction
+from waifuc.model import ImageItem
+
+
+class _AddOneAction(ProcessAction):
+    def process(self, item: ImageItem) -> ImageItem:
+        return ImageItem(item.image, {**item.meta, 'value': item.meta['value'] + 1})
+
+
+class _EvenFilterAction(FilterAction):
+    def check(self, item: ImageItem) -> bool:
+        return item.meta['value'] % 2 == 0
+
+
+class _FailAction(ProcessAction):
+    def process(self, item: ImageItem) -> ImageItem:
+        raise ValueError('bad item')
+
+
+def _items(n: int = 10):
+    for i in range(n):
+        yield ImageItem(Image.new('RGBA', (4, 4)), {'value': i})
+
+
+@pytest.mark.unittest
+class TestActionFused:
+    def test_fused(self):
+        action = FusedAction(_AddOneAction(), _EvenFilterAction(), _AddOneAction(), ModeConvertAction('RGB'))
+        items = list(action.iter_from(_items()))
+        assert [item.meta['value'] for item in items] == [3, 5, 7, 9, 11]
+        assert all(item.image.mode == 'RGB' for item in items)
+        assert action.counts == [(10, 10), (10, 5), (5, 5), (5, 5)]
+
+        action.reset()
+        assert action.counts == [(0, 0)] * 4
+
+    def test_not_fusable(self):
+        assert not FusedAction.is_fusable(FirstNSelectAction(3))
+        with pytest.raises(TypeError):
+            FusedAction(_AddOneAction(), FirstNSelectAction(3))
+
+    def test_error(self):
+        action = FusedAction(_AddOneAction(), _FailAction())
+        with pytest.raises(ValueError):
+            list(action.iter_from(_items()))
+        assert action.failed_index == 1
+        assert action.counts == [(1, 1), (1, 0)]
+
+    def test_deepcopy(self):
+        action = FusedAction(_AddOneAction(), _EvenFilterAction())
+        list(action.iter_from(_items(4)))
+        copied = copy.deepcopy(action)
+        assert copied.counts == action.counts
+        assert len(list(copied.iter_from(_items(4)))) == 2
+
+    def test_probe(self):
+        clock = iter(range(1000))
+        action = FusedAction(_AddOneAction(), _EvenFilterAction(), _AddOneAction(), probe=lambda: (next(clock),))
+        assert len(list(action.iter_from(_items()))) == 5
+        # every member call advances the fake clock by exactly one tick
+        assert action.usage == [(10,), (10,), (5,)]
+
+        action.reset()
+        assert action.usage == [None, None, None]
+
+    def test_on_drop(self):
+        dropped = []
+        action = FusedAction(_AddOneAction(), _EvenFilterAction(), _AddOneAction(),
+                             on_drop=lambda index, item: dropped.append((index, item.meta['value'])))
+        assert len(list(action.iter_from(_items()))) == 5
+        assert dropped == [(1, 1), (1, 3), (1, 5), (1, 7), (1, 9)]
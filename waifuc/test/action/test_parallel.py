@@ -0,0 +1,86 @@
+import time
+
+import pytest
+from PIL import Image
+
+from waifuc.action import ParallelAction, ProcessAction, FilterAction, ActionStop, BaseAction, ModeConvertAction
+from waifuc.model import ImageItem
+
+
+class _SlowIndexAction(ProcessAction):
+    def process(self, item: ImageItem) -> ImageItem:
+        # later items finish first, so ordering is actually exercised
+        time.sleep(0.002 * (20 - item.meta['index']))
+        return ImageItem(item.image, {**item.meta, 'processed': True})
+
+
+class _EvenFilterAction(FilterAction):
+    def check(self, item: ImageItem) -> bool:
+        return item.meta['index'] % 2 == 0
+
+
+class _StopAtAction(BaseAction):
+    def __init__(self, stop_at: int):
+        self.stop_at = stop_at
+
+    def iter(self, item: ImageItem):
+        if item.meta['index'] >= self.stop_at:
+            raise ActionStop
+        yield item
+
+    def reset(self):
+        pass
+
+
+class _FailAtAction(ProcessAction):
+    def process(self, item: ImageItem) -> ImageItem:
+        if item.meta['index'] == 5:
+            raise ValueError('bad item')
+        return item
+
+
+def _items(n: int = 20):
+    for i in range(n):
+        yield ImageItem(Image.new('RGBA', (8, 8), (i, i, i, 255)), {'index': i, 'filename': f'{i}.png'})
+
+
+@pytest.mark.unittest
+class TestActionParallel:
+    def test_ordered(self):
+        items = list(ParallelAction(_SlowIndexAction(), workers=4).iter_from(_items()))
+        assert [item.meta['index'] for item in items] == list(range(20))
+        assert all(item.meta['processed'] for item in items)
+
+    def test_unordered(self):
+        items = list(ParallelAction(_SlowIndexAction(), workers=4, ordered=False).iter_from(_items()))
+        assert sorted(item.meta['index'] for item in items) == list(range(20))
+
+    def test_filter(self):
+        items = list(ParallelAction(_EvenFilterAction(), workers=3, window=2).iter_from(_items()))
+        assert [item.meta['index'] for item in items] == list(range(0, 20, 2))
+
+    def test_action_stop(self):
+        items = list(ParallelAction(_StopAtAction(7), workers=4).iter_from(_items()))
+        assert [item.meta['index'] for item in items] == list(range(7))
+
+    def test_error(self):
+        with pytest.raises(ValueError):
+            list(ParallelAction(_FailAtAction(), workers=4).iter_from(_items()))
+
+    def test_lazy_input(self):
+        consumed = []
+
+        def _source():
+            for item in _items():
+                consumed.append(item.meta['index'])
+                yield item
+
+        iter_ = ParallelAction(_EvenFilterAction(), workers=2, window=4).iter_from(_source())
+        next(iter_)
+        assert len(consumed) <= 5
+        iter_.close()
+
+    def test_process_mode(self):
+        items = list(ParallelAction(ModeConvertAction('RGB'), workers=2, mode='process').iter_from(_items(6)))
+        assert [item.meta['index'] for item in items] == list(range(6))
+        assert all(item.image.mode == 'RGB' for item in items)
@@ -1,6 +1,31 @@
+import threading
+import time
+
 import pytest
+from PIL import Image
+
+from waifuc.model import ImageItem
+from waifuc.source import LocalSource, EmptySource, ParallelDataSource
+from waifuc.source.base import BaseDataSource
+
 
-from waifuc.source import LocalSource, EmptySource
+class _SlowSource(BaseDataSource):
+    def __init__(self, name: str, count: int, interval: float = 0.0, fail_at: int = None):
+        self.name = name
+        self.count = count
+        self.interval = interval
+        self.fail_at = fail_at
+        self.closed = threading.Event()
+
+    def _iter(self):
+        try:
+            for i in range(self.count):
+                if i == self.fail_at:
+                    raise RuntimeError(f'{self.name} failed')
+                time.sleep(self.interval)
+                yield ImageItem(Image.new('RGB', (1, 1)), {'filename': f'{self.name}_{i}'})
+        finally:
+            self.closed.set()
 
 
 @pytest.fixture()
@@ -64,3 +89,39 @@ class TestSourceCompose:
             item.meta['filename'].startswith('danbooru_')
             for item in items[20:]
         ), 'The last 20 items should not be all danbooru'
+
+    def test_parallel_concurrent_seeded(self):
+        def _names(concurrent: bool):
+            sources = [_SlowSource(name, 10 + i) for i, name in enumerate('abc')]
+            return [item.meta['filename'] for item in ParallelDataSource(*sources, seed=7, concurrent=concurrent)]
+
+        assert _names(True) == _names(False)
+        assert len(_names(True)) == 33
+
+    def test_parallel_concurrent_speed(self):
+        sources = [_SlowSource(name, 5, interval=0.05) for name in 'abcd']
+        start = time.monotonic()
+        items = list(ParallelDataSource(*sources, concurrent=True, interleave='arrival'))
+        assert len(items) == 20
+        assert time.monotonic() - start < 0.75  # 1 second one site at a time
+
+    def test_parallel_concurrent_stop(self):
+        sources = [_SlowSource(name, 1000, interval=0.01) for name in 'ab']
+        items = list(ParallelDataSource(*sources, concurrent=True)[:5])
+        assert len(items) == 5
+        for source in sources:
+            assert source.closed.wait(2.0)
+
+    def test_parallel_concurrent_error(self):
+        sources = [_SlowSource('a', 10), _SlowSource('b', 10, fail_at=3)]
+        with pytest.raises(RuntimeError, match='b failed'):
+            list(ParallelDataSource(*sources, concurrent=True, interleave='arrival'))
+        assert sources[0].closed.wait(2.0)
+
+    def test_for_each_source(self):
+        a, b, c = _SlowSource('a', 1), _SlowSource('b', 1), _SlowSource('c', 1)
+        source = (ParallelDataSource(a, b, concurrent=True) + c)[:2]
+        visited = []
+        source.for_each_source(visited.append)
+        assert [s for s in visited if isinstance(s, _SlowSource)] == [a, b, c]
+        assert visited[0] is source
@@ -0,0 +1,68 @@
+import io
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+from waifuc.source import LocalSource, LocalTISource
+
+
+@pytest.fixture()
+def image_dir(tmp_path):
+    directory = tmp_path / 'images'
+    directory.mkdir()
+    for i in range(20):
+        Image.new('RGB', (8 + i, 8), (i * 10, 0, 0)).save(directory / f'image_{i:02d}.png')
+    (directory / 'image_05.txt').write_text('1girl, solo', encoding='utf-8')
+    (directory / 'not_an_image.bin').write_bytes(b'not an image')
+    with io.BytesIO() as buffer:
+        Image.frombytes('RGB', (64, 64), os.urandom(64 * 64 * 3)).save(buffer, format='PNG')
+        data = buffer.getvalue()
+    (directory / 'truncated.png').write_bytes(data[:len(data) // 2])
+    return str(directory)
+
+
+def _filenames(items):
+    return [item.meta['filename'] for item in items]
+
+
+@pytest.mark.unittest
+class TestSourceLocal:
+    def test_prefetch_order(self, image_dir):
+        with pytest.warns(UserWarning):
+            expected = _filenames(LocalSource(image_dir, recursive=False))
+        with pytest.warns(UserWarning):
+            items = list(LocalSource(image_dir, recursive=False, prefetch=4, prefetch_workers=3))
+        assert _filenames(items) == expected
+        assert len(items) == 20
+        assert all(item.image.size == (8 + int(item.meta['filename'][6:8]), 8) for item in items)
+
+    def test_prefetch_ti(self, image_dir):
+        with pytest.warns(UserWarning):
+            items = list(LocalTISource(image_dir, recursive=False, prefetch=4))
+        assert len(items) == 20
+        assert {item.meta['filename']: item.meta['tags'] for item in items}['image_05.png'] == \
+               {'1girl': 1.0, 'solo': 1.0}
+
+    def test_prefetch_error(self, image_dir):
+        class _FailingSource(LocalSource):
+            def _load_file(self, file, group_name):
+                if os.path.basename(file) == 'image_03.png':
+                    raise RuntimeError(f'failed on {threading.current_thread().name}')
+                return LocalSource._load_file(self, file, group_name)
+
+        source = _FailingSource(image_dir, recursive=False, prefetch=4)
+        source._iter_files = lambda: ((os.path.join(image_dir, f'image_{i:02d}.png'), 'g') for i in range(10))
+        items = []
+        with pytest.raises(RuntimeError, match='waifuc_prefetch'):
+            for item in source:
+                items.append(item)
+        assert _filenames(items) == ['image_00.png', 'image_01.png', 'image_02.png']
+
+    def test_prefetch_early_stop(self, image_dir):
+        source = LocalSource(image_dir, recursive=False, prefetch=4)
+        iterator = iter(source)
+        next(iterator)
+        iterator.close()
+        assert not any(thread.name.startswith('waifuc_prefetch') for thread in threading.enumerate())
@@ -0,0 +1,403 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+from PIL import Image
+
+from waifuc.action import MinSizeFilterAction, MinAreaFilterAction, NoMonochromeAction, FilterAction
+from waifuc.model import PostMeta
+from waifuc.source import ParallelDataSource, OriginalFetchAction
+from waifuc.source.web import WebDataSource
+from waifuc.utils import DownloadBuffer, DownloadCache, set_download_cache, set_rate_limit_dir
+
+
+class _ImageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), _ImageHandler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.paths = {}
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    server: _ImageServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.requests += 1
+            self.server.paths[url.path] = self.server.paths.get(url.path, 0) + 1
+            hits = self.server.paths[url.path]
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            time.sleep(float(query.get('delay', ['0.05'])[0]))
+            if url.path.startswith('/throttled/') and hits == 1:
+                self.send_response(429)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            elif url.path.startswith(('/image/', '/throttled/')):
+                size = (4 + int(url.path.split('/')[-1][:-4]), 4)
+            elif url.path.startswith('/preview/'):
+                size = (2, 2)
+            else:
+                self.send_error(404)
+                return
+
+            with io.BytesIO() as buffer:
+                Image.new('RGB', size).save(buffer, format='PNG')
+                data = buffer.getvalue()
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+
+def _image_md5(i: int) -> str:
+    with io.BytesIO() as buffer:
+        Image.new('RGB', (4 + i, 4)).save(buffer, format='PNG')
+        return hashlib.md5(buffer.getvalue()).hexdigest()
+
+
+@pytest.fixture()
+def download_cache(tmp_path):
+    cache = DownloadCache(str(tmp_path / 'download_cache'))
+    set_download_cache(cache)
+    try:
+        yield cache
+    finally:
+        set_download_cache(None)
+        cache.close()
+
+
+@pytest.fixture()
+def local_rate_limits():
+    set_rate_limit_dir(None)
+    try:
+        yield
+    finally:
+        set_rate_limit_dir()
+
+
+@pytest.fixture()
+def image_server():
+    server = _ImageServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class _ListWebSource(WebDataSource):
+    __download_rate_limit__ = 1000
+
+    def __init__(self, urls):
+        WebDataSource.__init__(self, 'test')
+        self.urls = urls
+
+    def _iter_data(self):
+        for i, url in enumerate(self.urls):
+            if isinstance(url, Image.Image):
+                yield i, url, {'id': i}
+            else:
+                yield i, url, {'id': i, 'filename': f'test_{i}.png'}
+
+
+class _MD5WebSource(_ListWebSource):
+    def __init__(self, urls, md5s):
+        _ListWebSource.__init__(self, urls)
+        self.md5s = md5s
+
+    def _content_md5(self, url, meta):
+        return self.md5s[meta['id']]
+
+
+class _PagedWebSource(_ListWebSource):
+    def __init__(self, urls, page_size: int = 2):
+        _ListWebSource.__init__(self, urls)
+        self.page_size = page_size
+        self.page_threads = []
+
+    def _iter_pages(self):
+        for i in range(0, len(self.urls), self.page_size):
+            self.page_threads.append(threading.current_thread().name)
+            yield [(j, self.urls[j], {'id': j}) for j in range(i, min(i + self.page_size, len(self.urls)))]
+
+    def _iter_data(self):
+        for page_items in self._prefetch_pages(self._iter_pages()):
+            yield from page_items
+
+
+class _PostWebSource(_ListWebSource):
+    def __init__(self, urls, sizes):
+        _ListWebSource.__init__(self, urls)
+        self.sizes = sizes
+
+    def _post_meta(self, data):
+        return PostMeta.create(width=data['width'], height=data['height'], file_ext=data['filename'])
+
+    def _iter_data(self):
+        for i, (url, (width, height)) in enumerate(zip(self.urls, self.sizes)):
+            if self._accept_post({'width': width, 'height': height, 'filename': f'test_{i}.png'}):
+                yield i, url, {'id': i}
+
+
+class _PreviewWebSource(_ListWebSource):
+    def _preview_url(self, url, meta):
+        if meta['id'] % 3 != 2:
+            return url.replace('/image/', '/preview/')
+        return None
+
+
+class _EvenPreviewFilter(FilterAction):
+    def __init__(self):
+        self.sizes = []
+
+    def check(self, item):
+        self.sizes.append(item.image.size)
+        return item.meta['id'] % 2 == 0
+
+
+def _ids(items):
+    return [item.meta['id'] for item in items]
+
+
+@pytest.mark.unittest
+class TestSourceWeb:
+    def test_concurrent_ordered(self, image_server):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(10)]
+        items = list(_ListWebSource(urls).concurrent_download(4))
+        assert _ids(items) == list(range(10))
+        assert [item.image.size for item in items] == [(4 + i, 4) for i in range(10)]
+        assert all(item.meta['url'] == urls[i] for i, item in enumerate(items))
+        assert 1 < image_server.max_in_flight <= 4
+
+    def test_sequential(self, image_server):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(4)]
+        assert _ids(_ListWebSource(urls)) == list(range(4))
+        assert image_server.max_in_flight == 1
+
+    def test_concurrent_unordered(self, image_server):
+        urls = [f'{image_server.url}/image/0.png?delay=0.5',
+                *(f'{image_server.url}/image/{i}.png' for i in range(1, 4))]
+        ids = _ids(_ListWebSource(urls).concurrent_download(4, ordered=False))
+        assert sorted(ids) == [0, 1, 2, 3]
+        assert ids[-1] == 0
+
+    def test_concurrent_errors_and_images(self, image_server):
+        urls = [f'{image_server.url}/image/0.png', f'{image_server.url}/missing/1.png',
+                Image.new('RGB', (2, 2)), f'{image_server.url}/image/3.png']
+        with pytest.warns(UserWarning, match='download error'):
+            items = list(_ListWebSource(urls).concurrent_download(3))
+        assert _ids(items) == [0, 2, 3]
+        assert items[1].meta['url'] is None
+
+    def test_concurrent_early_stop(self, image_server):
+        urls = [f'{image_server.url}/image/{i}.png?delay=0.2' for i in range(20)]
+        iterator = iter(_ListWebSource(urls).concurrent_download(4))
+        assert next(iterator).meta['id'] == 0
+        iterator.close()
+        assert not any(thread.name == 'waifuc_download' for thread in threading.enumerate())
+
+    def test_spill(self, image_server):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(4)]
+        source = _ListWebSource(urls)
+        source.download_spill_size = 16
+        assert [item.image.size for item in source] == [(4 + i, 4) for i in range(4)]
+        assert [item.image.size for item in source.concurrent_download(2)] == [(4 + i, 4) for i in range(4)]
+
+    def test_download_cache(self, image_server, download_cache):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(4)]
+        first = list(_ListWebSource(urls))
+        assert image_server.requests == 4
+        second = list(_ListWebSource(urls))
+        assert image_server.requests == 4
+        assert [item.image.size for item in second] == [item.image.size for item in first]
+        assert (download_cache.hits, download_cache.misses) == (4, 4)
+
+        list(_ListWebSource(urls).concurrent_download(3))
+        assert image_server.requests == 4
+        list(_ListWebSource([f'{url}?token=1' for url in urls]))
+        assert image_server.requests == 4
+
+    def test_download_cache_concurrent(self, image_server, download_cache):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(6)]
+        list(_ListWebSource(urls[:3]).concurrent_download(3))
+        assert _ids(_ListWebSource(urls).concurrent_download(3)) == list(range(6))
+        assert image_server.requests == 6
+
+    def test_download_cache_md5(self, image_server, download_cache):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(3)]
+        md5s = [_image_md5(i) for i in range(3)]
+        list(_MD5WebSource(urls, md5s))
+        # same files found through other urls are served by md5
+        mirrors = [url.replace('127.0.0.1', 'localhost') for url in urls]
+        items = list(_MD5WebSource(mirrors, md5s))
+        assert [item.image.size for item in items] == [(4 + i, 4) for i in range(3)]
+        assert image_server.requests == 3
+
+        with pytest.warns(UserWarning, match='md5'):
+            list(_MD5WebSource([f'{image_server.url}/image/9.png'], ['0' * 32]))
+        assert download_cache.get(DownloadCache.make_key('test', 0, '', '0' * 32)) is None
+
+    def test_download_cache_corrupted(self, image_server, download_cache):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(2)]
+        list(_ListWebSource(urls))
+        for root, _, files in os.walk(download_cache.objects_dir):
+            for file in files:
+                with open(os.path.join(root, file), 'r+b') as f:
+                    f.write(b'broken')
+        items = list(_ListWebSource(urls))
+        assert [item.image.size for item in items] == [(4, 4), (5, 4)]
+        assert image_server.requests == 4
+        assert download_cache.corrupted == 2
+
+    def test_download_cache_evict(self, download_cache):
+        download_cache.max_size = 250
+        download_cache.put('a', b'a' * 100)
+        download_cache.put('b', b'b' * 100)
+        path = download_cache.get('a', pin=True)
+        # the least recently used unpinned entry goes, never the one just stored
+        assert download_cache.put('c', b'c' * 100)
+        assert download_cache.get('b') is None
+        assert download_cache.put('d', b'd' * 100)
+        assert download_cache.get('c') is None
+        with open(path, 'rb') as f:
+            assert f.read() == b'a' * 100
+        download_cache.unpin('a')
+        assert download_cache.put('e', b'e' * 100)
+        assert download_cache.get('a') is None
+        assert download_cache.get('e') is not None
+
+        assert not download_cache.put('f', b'f' * 300)
+        assert download_cache.get('f') is None
+        assert download_cache.get('d') is not None
+
+    def test_download_cache_evict_window(self, image_server, download_cache):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(6)]
+        md5s = [_image_md5(i) for i in range(6)]
+        list(_MD5WebSource(urls[3:], md5s[3:]))
+        download_cache.max_size = sum(
+            os.path.getsize(os.path.join(root, file))
+            for root, _, files in os.walk(download_cache.objects_dir) for file in files
+        ) + 10
+        # the hits queued behind the downloads survive the files those downloads store
+        items = list(_MD5WebSource(urls, md5s).concurrent_download(6))
+        assert [item.image.size for item in items] == [(4 + i, 4) for i in range(6)]
+        assert image_server.requests == 6
+
+    def test_missing_file(self, tmp_path):
+        path = tmp_path / 'test_0.png'
+        Image.new('RGB', (4, 4)).save(str(path))
+        buffer = DownloadBuffer(filename=str(path))
+        path.unlink()
+        with pytest.warns(UserWarning, match='IO error'):
+            assert list(_ListWebSource([])._iter_buffer(0, 'url', {}, 'test_0.png', buffer)) == []
+
+    def test_prefetch_pages(self, image_server):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(5)]
+        source = _PagedWebSource(urls)
+        assert _ids(source) == list(range(5))
+        assert set(source.page_threads) == {threading.current_thread().name}
+
+        source = _PagedWebSource(urls).prefetch_pages(1)
+        assert _ids(source.concurrent_download(2)) == list(range(5))
+        assert set(source.page_threads) == {'waifuc_pages_test'}
+
+    def test_pushdown(self, image_server):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(5)]
+        sizes = [(1000, 800), (1000, 500), (None, None), (0, 300), (700, 700)]
+        source = _PostWebSource(urls, sizes).pushdown(NoMonochromeAction(), MinSizeFilterAction(600))
+        assert [type(f) for f in source.post_filters] == [MinSizeFilterAction]
+        assert _ids(source) == [0, 2, 3, 4]
+        assert source.posts_skipped == 1
+        assert image_server.requests == 4
+
+        source = _PostWebSource(urls, sizes).pushdown(MinAreaFilterAction(800))
+        assert _ids(source.concurrent_download(2)) == [0, 2, 3]
+        assert source.posts_skipped == 2
+
+    def test_post_meta(self):
+        post = PostMeta.create(width='1200', height=0, rating='s', tags=['a', '', 'b'], file_ext='abc.PNG')
+        assert post == PostMeta(width=1200, rating='s', tags=frozenset({'a', 'b'}), file_ext='png')
+        assert post.size is None
+        assert PostMeta.create(width=3, height=4, file_ext='webm').size == (3, 4)
+        assert PostMeta.create(file_ext='webm').file_ext == 'webm'
+        assert MinSizeFilterAction(800).check_post(post)
+        assert not MinSizeFilterAction(800).check_post(PostMeta(width=1200, height=799))
+
+    def test_preview_first(self, image_server):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(6)]
+        source = _PreviewWebSource(urls).preview_first(2)
+        filter_ = _EvenPreviewFilter()
+        items = list(source.fetch_originals().iter_from(filter_.iter_from(source)))
+        assert _ids(items) == [0, 2, 4]
+        assert filter_.sizes == [(2, 2), (2, 2), (6, 4), (2, 2), (2, 2), (9, 4)]
+        assert [item.image.size for item in items] == [(4, 4), (6, 4), (8, 4)]
+        assert [item.meta['url'] for item in items] == [urls[0], urls[2], urls[4]]
+        assert [item.meta.get('preview_url') for item in items] == \
+               [urls[0].replace('/image/', '/preview/'), None, urls[4].replace('/image/', '/preview/')]
+        assert not any('original' in item.meta for item in items)
+        assert image_server.requests == 6 + 2
+
+        source = _PreviewWebSource(urls).preview_first(2).concurrent_download(3)
+        items = list(source.attach(_EvenPreviewFilter(), source.fetch_originals()))
+        assert [item.image.size for item in items] == [(4, 4), (6, 4), (8, 4)]
+
+        source = _PreviewWebSource(urls).preview_first(None)
+        items = list(source.attach(_EvenPreviewFilter(), source.fetch_originals()))
+        assert [item.image.size for item in items] == [(4, 4), (6, 4), (8, 4)]
+        assert not any('preview_url' in item.meta for item in items)
+
+    def test_preview_several_sources(self, image_server):
+        urls = [f'{image_server.url}/image/{i}.png' for i in range(6)]
+        first, second = _PreviewWebSource(urls[:3]).preview_first(2), _PreviewWebSource(urls[3:]).preview_first(2)
+        fetch = OriginalFetchAction()
+        source = ParallelDataSource(first, second, seed=0)
+        source.for_each_source(lambda s: fetch.add_source(s) if isinstance(s, WebDataSource) else None)
+        items = list(source.attach(fetch))
+        assert sorted(item.meta['url'] for item in items) == sorted(urls)
+        assert not any('original' in item.meta for item in items)
+        assert sorted(item.image.size for item in items) == [(i + 4, 4) for i in range(6)]
+
+    def test_throttled(self, image_server, local_rate_limits):
+        urls = [f'{image_server.url}/throttled/{i}.png' for i in range(3)]
+        assert [item.image.size for item in _ListWebSource(urls)] == [(4, 4), (5, 4), (6, 4)]
+        limiter = _ListWebSource._rate_limiter()
+        assert limiter.rate < limiter.max_rate
+
+        urls = [f'{image_server.url}/throttled/{i}.png' for i in range(3, 6)]
+        items = list(_ListWebSource(urls).concurrent_download(3))
+        assert [item.image.size for item in items] == [(7, 4), (8, 4), (9, 4)]
+        assert image_server.requests == 12
+
+        source = _ListWebSource([f'{image_server.url}/throttled/9.png'])
+        source.download_throttle_retries = 0
+        with pytest.warns(UserWarning, match='429'):
+            assert list(source) == []
+
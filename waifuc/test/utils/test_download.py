@@ -4,7 +4,7 @@ from hashlib import sha256
 import pytest
 from hbutils.testing import disable_output
 
-from waifuc.utils import download_file
+from waifuc.utils import download_file, DownloadBuffer
 from ..testings import isolated_to_testfile
 
 
@@ -29,3 +29,47 @@ class TestUtilsDownload:
 
             assert os.path.getsize('nian_skin.png') == 3832280
             assert sha.hexdigest() == '3333af134d03375958b54d88193dcddfad3a0dd3135bbfd3a6c0988938049073'
+
+
+@pytest.mark.unittest
+class TestUtilsDownloadBuffer:
+    def test_in_memory(self):
+        with DownloadBuffer(spill_size=16) as buffer:
+            buffer.write(b'\x89PNG\r\n')
+            buffer.write(b'\x1a\n')
+            buffer.finish()
+            assert buffer.in_memory and buffer.filename is None
+            assert buffer.size == 8
+            assert buffer.head(4) == b'\x89PNG'
+            with buffer.open() as f:
+                assert f.read() == b'\x89PNG\r\n\x1a\n'
+
+    def test_spill(self):
+        with DownloadBuffer(spill_size=16) as buffer:
+            for _ in range(4):
+                buffer.write(b'0123456789')
+            buffer.finish()
+            assert not buffer.in_memory
+            filename = buffer.filename
+            assert os.path.getsize(filename) == buffer.size == 40
+            assert buffer.getvalue() == b'0123456789' * 4
+            assert buffer.head(3) == b'012'
+        assert not os.path.exists(filename)
+
+    def test_as_file(self):
+        buffer = DownloadBuffer()
+        buffer.write(b'content')
+        filename = buffer.as_file()
+        with open(filename, 'rb') as f:
+            assert f.read() == b'content'
+        buffer.close()
+        assert not os.path.exists(filename)
+
+    @isolated_to_testfile()
+    def test_wrap_file(self):
+        with open('wrapped.bin', 'wb') as f:
+            f.write(b'wrapped')
+        with DownloadBuffer(filename='wrapped.bin') as buffer:
+            assert buffer.size == 7
+            assert buffer.getvalue() == b'wrapped'
+        assert os.path.exists('wrapped.bin')
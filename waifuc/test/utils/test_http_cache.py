@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import httpx
+import pytest
+
+from waifuc.utils import srequest, HTTPCache, set_http_cache
+
+
+class _APIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), _APIHandler)
+        self.requests = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class _APIHandler(BaseHTTPRequestHandler):
+    server: _APIServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        page = parse_qs(url.query).get('page', ['1'])[0]
+        etag = f'"page-{page}"'
+        self.server.requests.append((url.path, page, self.headers.get('If-None-Match')))
+        if url.path == '/etag' and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        data = json.dumps([{'id': int(page), 'user': self.headers.get('Authorization')}] * 20).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if url.path == '/etag':
+            self.send_header('ETag', etag)
+        elif url.path == '/no-store':
+            self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture()
+def api_server():
+    server = _APIServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture()
+def http_cache(tmp_path):
+    cache = HTTPCache(str(tmp_path / 'http_cache'))
+    set_http_cache(cache)
+    try:
+        yield cache
+    finally:
+        set_http_cache(None)
+        cache.close()
+
+
+@pytest.mark.unittest
+class TestUtilsHTTPCache:
+    def test_hit(self, api_server, http_cache):
+        with httpx.Client() as session:
+            for _ in range(3):
+                resp = srequest(session, 'GET', f'{api_server.url}/posts', params={'page': '1'}, cache_ttl=60)
+                assert resp.json()[0]['id'] == 1
+            srequest(session, 'GET', f'{api_server.url}/posts', params={'page': '2'}, cache_ttl=60)
+        assert len(api_server.requests) == 2
+        assert (http_cache.hits, http_cache.misses) == (2, 2)
+
+    def test_not_cached(self, api_server, http_cache):
+        with httpx.Client() as session:
+            for _ in range(2):
+                srequest(session, 'GET', f'{api_server.url}/posts')
+                srequest(session, 'GET', f'{api_server.url}/no-store', cache_ttl=60)
+        assert len(api_server.requests) == 4
+
+    def test_auth_identity(self, api_server, http_cache):
+        with httpx.Client() as session:
+            srequest(session, 'GET', f'{api_server.url}/posts', cache_ttl=60)
+            resp = srequest(session, 'GET', f'{api_server.url}/posts', cache_ttl=60,
+                            headers={'Authorization': 'Bearer a'})
+            assert resp.json()[0]['user'] == 'Bearer a'
+            srequest(session, 'GET', f'{api_server.url}/posts', cache_ttl=60, auth=('user', 'key'))
+            srequest(session, 'GET', f'{api_server.url}/posts', cache_ttl=60, cache_identity='someone')
+            resp = srequest(session, 'GET', f'{api_server.url}/posts', cache_ttl=60,
+                            headers={'Authorization': 'Bearer a'})
+            assert resp.json()[0]['user'] == 'Bearer a'
+        assert len(api_server.requests) == 4
+
+    def test_revalidate(self, api_server, http_cache):
+        with httpx.Client() as session:
+            srequest(session, 'GET', f'{api_server.url}/etag', cache_ttl=0.05)
+            time.sleep(0.1)
+            resp = srequest(session, 'GET', f'{api_server.url}/etag', cache_ttl=0.05)
+            assert resp.status_code == 200
+            assert resp.json()[0]['id'] == 1
+        assert api_server.requests == [('/etag', '1', None), ('/etag', '1', '"page-1"')]
+        assert http_cache.revalidated == 1
+
+    def test_expired(self, api_server, http_cache):
+        with httpx.Client() as session:
+            srequest(session, 'GET', f'{api_server.url}/posts', cache_ttl=0.05)
+            time.sleep(0.1)
+            srequest(session, 'GET', f'{api_server.url}/posts', cache_ttl=0.05)
+        assert len(api_server.requests) == 2
+
+    def test_eviction(self, api_server, tmp_path):
+        cache = HTTPCache(str(tmp_path / 'small_cache'), max_size=1200)
+        set_http_cache(cache)
+        try:
+            with httpx.Client() as session:
+                for page in ['1', '2', '3', '1']:
+                    srequest(session, 'GET', f'{api_server.url}/posts', params={'page': page}, cache_ttl=60)
+            assert [page for _, page, _ in api_server.requests] == ['1', '2', '3', '1']
+        finally:
+            set_http_cache(None)
+            cache.close()
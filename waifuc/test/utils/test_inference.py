@@ -0,0 +1,82 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+from imgutils.metrics import ccip_extract_feature, ccip_batch_extract_features
+from imgutils.tagging import get_wd14_tags
+from imgutils.validate import anime_classify, anime_rating
+
+from waifuc.action import ClassFilterAction, RatingFilterAction
+from waifuc.model import ImageItem
+from waifuc.utils import inference
+
+
+def _items(n: int = 4):
+    return [ImageItem(Image.new('RGB', (16, 16), (i * 60, 0, 0)), {'value': i}) for i in range(n)]
+
+
+@pytest.fixture(scope='module')
+def ccip_images(ccip_simple):
+    files = sorted(glob.glob(os.path.join(ccip_simple, '*.jpg')))[:6]
+    return [Image.open(file).convert('RGB') for file in files]
+
+
+def _assert_scores(batched, single, threshold=None):
+    # a score right at the threshold may cross it by the rounding difference of a batched run
+    for name, score in single.items():
+        if threshold is None or abs(score - threshold) > 1e-3:
+            assert batched.get(name) == pytest.approx(score, abs=1e-3), name
+    for name in set(batched) - set(single):
+        assert threshold is not None and abs(batched[name] - threshold) <= 1e-3, name
+
+
+@pytest.mark.unittest
+class TestUtilsInference:
+    @pytest.mark.parametrize(['action_class', 'function', 'result'], [
+        (ClassFilterAction, 'anime_classify', 'illustration'),
+        (RatingFilterAction, 'anime_rating', 'safe'),
+    ])
+    def test_extra_kwargs(self, monkeypatch, action_class, function, result):
+        calls = []
+
+        def _single(image, model_name=None, **kwargs):
+            calls.append((model_name, kwargs))
+            return result, 0.9
+
+        monkeypatch.setattr(inference, function, _single)
+        action = action_class([result], model_name='model', threshold=0.5, extra=1)
+        assert action.check_batch(_items()) == [True] * 4
+        assert calls == [('model', {'extra': 1})] * 4
+
+    # The batched paths below use imgutils internals, these tests call them directly (not through the
+    # fallbacks) so an imgutils change cannot silently alter the decisions of the batched actions.
+
+    def test_classify_equivalence(self, ccip_images):
+        batched = inference._classify_batch(ccip_images, inference._CLASSIFY_REPO_ID, inference._CLASSIFY_MODEL_NAME)
+        for (cls, score), image in zip(batched, ccip_images):
+            single_cls, single_score = anime_classify(image)
+            assert cls == single_cls
+            assert score == pytest.approx(single_score, abs=1e-3)
+
+    def test_rating_equivalence(self, ccip_images):
+        batched = inference._classify_batch(ccip_images, inference._RATING_REPO_ID, inference._RATING_MODEL_NAME)
+        for (rating, score), image in zip(batched, ccip_images):
+            single_rating, single_score = anime_rating(image)
+            assert rating == single_rating
+            assert score == pytest.approx(single_score, abs=1e-3)
+
+    def test_wd14_equivalence(self, ccip_images):
+        assert inference._get_wd14_model is not None
+        batched = inference.get_wd14_tags_batch(ccip_images, 'SwinV2_v3')
+        for (rating, general, character), image in zip(batched, ccip_images):
+            single_rating, single_general, single_character = get_wd14_tags(image, model_name='SwinV2_v3')
+            _assert_scores(rating, single_rating)
+            _assert_scores(general, single_general, 0.35)
+            _assert_scores(character, single_character, 0.85)
+
+    def test_ccip_equivalence(self, ccip_images):
+        batched = ccip_batch_extract_features(ccip_images)
+        single = np.stack([ccip_extract_feature(image) for image in ccip_images])
+        np.testing.assert_allclose(batched, single, atol=1e-4)
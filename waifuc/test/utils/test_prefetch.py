@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from waifuc.utils import task_ctx, get_task_names
+from waifuc.utils.prefetch import prefetch_iter
+
+
+def _pages(n: int, log: list, interval: float = 0.0):
+    try:
+        for i in range(n):
+            if interval:
+                time.sleep(interval)
+            log.append(('fetched', i))
+            yield [i] * 3
+    finally:
+        log.append(('closed', threading.current_thread().name))
+
+
+@pytest.mark.unittest
+class TestUtilsPrefetch:
+    def test_order(self):
+        log = []
+        assert list(prefetch_iter(_pages(5, log), 2)) == [[i] * 3 for i in range(5)]
+        assert log[-1] == ('closed', 'waifuc_prefetch')
+
+    def test_ahead(self):
+        log = []
+        iterator = prefetch_iter(_pages(10, log), 2)
+        assert next(iterator) == [0, 0, 0]
+        time.sleep(0.2)
+        # the page being consumed, the ones in the queue and the one waiting to be queued
+        assert log == [('fetched', i) for i in range(4)]
+        iterator.close()
+
+    def test_overlap(self):
+        log = []
+        start = time.time()
+        for _ in prefetch_iter(_pages(5, log, interval=0.05), 1):
+            time.sleep(0.05)
+        assert time.time() - start < 0.45
+
+    def test_error(self):
+        def _failing():
+            yield 1
+            raise ValueError('page failed')
+
+        iterator = prefetch_iter(_failing())
+        assert next(iterator) == 1
+        with pytest.raises(ValueError, match='page failed'):
+            next(iterator)
+
+    def test_early_stop(self):
+        log = []
+        iterator = prefetch_iter(_pages(100, log), 1, name='pages')
+        next(iterator)
+        iterator.close()
+        time.sleep(0.3)
+        assert log[-1] == ('closed', 'pages')
+        assert not any(thread.name == 'pages' for thread in threading.enumerate())
+
+    def test_task_names(self):
+        def _names():
+            yield get_task_names()
+
+        with task_ctx('outer'):
+            assert list(prefetch_iter(_names())) == [('outer',)]
@@ -0,0 +1,185 @@
+import email.utils
+import multiprocessing
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import httpx
+import pytest
+
+from waifuc.utils import AdaptiveRateLimiter, get_rate_limiter, set_rate_limit_dir, retry_after, srequest
+
+
+@pytest.fixture()
+def rate_limit_dir(tmp_path):
+    set_rate_limit_dir(str(tmp_path))
+    try:
+        yield str(tmp_path)
+    finally:
+        set_rate_limit_dir()
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(time.time())
+        if len(self.server.requests) == 1:
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'ok')
+
+
+@pytest.fixture()
+def throttling_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _ThrottlingHandler)
+    server.daemon_threads = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _acquire_times(directory, count, queue):
+    limiter = AdaptiveRateLimiter('shared', 10, directory=directory, sync_interval=0.1)
+    for _ in range(count):
+        limiter.acquire()
+        queue.put(time.time())
+
+
+@pytest.mark.unittest
+class TestUtilsRateLimit:
+    def test_schedule(self):
+        limiter = AdaptiveRateLimiter('test', 20)
+        start = time.time()
+        for _ in range(6):
+            limiter.acquire()
+        assert 0.25 <= time.time() - start < 0.5
+
+    def test_unlimited(self):
+        limiter = AdaptiveRateLimiter('test')
+        assert limiter.rate is None
+        assert max(limiter.reserve() for _ in range(100)) == 0
+        limiter.throttle()
+        assert limiter.rate == 1.0
+
+    def test_aimd(self):
+        limiter = AdaptiveRateLimiter('test', 10)
+        limiter.throttle()
+        assert limiter.rate == 5
+        limiter.throttle()
+        assert limiter.rate == 5, 'the requests throttled together cut the rate once'
+        limiter.success()
+        assert limiter.rate == pytest.approx(5.02)
+        for _ in range(1000):
+            limiter.success()
+        assert limiter.rate == 10
+
+        limiter = AdaptiveRateLimiter('test', 10, min_rate=2, decrease=0.1)
+        limiter.throttle()
+        assert limiter.rate == 2
+
+    def test_retry_after(self):
+        limiter = AdaptiveRateLimiter('test', 100)
+        limiter.throttle(0.5)
+        assert limiter.reserve() == pytest.approx(0.5, abs=0.05)
+
+        def _response(value):
+            return httpx.Response(429, headers={'Retry-After': value} if value is not None else {})
+
+        assert retry_after(_response('3')) == 3
+        assert retry_after(_response(None)) is None
+        assert retry_after(_response('soon')) is None
+        assert retry_after(_response(email.utils.formatdate(time.time() + 60, usegmt=True))) == \
+               pytest.approx(60, abs=2)
+
+    def test_feedback(self):
+        limiter = AdaptiveRateLimiter('test', 10)
+        assert limiter.feedback(httpx.Response(503))
+        assert limiter.rate == 5
+        assert not limiter.feedback(httpx.Response(404))
+        assert limiter.rate == 5
+        assert not limiter.feedback(httpx.Response(200))
+        assert limiter.rate > 5
+
+    def test_shared(self, rate_limit_dir):
+        first = AdaptiveRateLimiter('shared', 10, directory=rate_limit_dir)
+        second = AdaptiveRateLimiter('shared', 10, directory=rate_limit_dir)
+        first.throttle(0.0)
+        assert second.rate == 5
+        assert first.rate == 5
+        # the rate is split between the two limiters
+        delays = [first.reserve(), first.reserve(), second.reserve(), second.reserve()]
+        assert delays[1] == pytest.approx(delays[0] + 0.2, abs=0.05)
+        assert delays[3] == pytest.approx(delays[2] + 0.4, abs=0.05)
+        assert get_rate_limiter('shared', 10) is get_rate_limiter('shared', 10)
+        assert get_rate_limiter('shared', 10).rate == 5
+
+    def test_shared_pause(self, rate_limit_dir):
+        first = AdaptiveRateLimiter('shared', 10, directory=rate_limit_dir, sync_interval=0.2)
+        second = AdaptiveRateLimiter('shared', 10, directory=rate_limit_dir, sync_interval=0.2)
+        second.reserve()
+        first.throttle(0.5)
+        # picked up on the next merge
+        assert second.reserve() < 0.3
+        time.sleep(0.2)
+        assert second.reserve() == pytest.approx(0.3, abs=0.05)
+
+    def test_sync_interval(self, rate_limit_dir):
+        limiter = AdaptiveRateLimiter('shared', 10, directory=rate_limit_dir, sync_interval=60)
+        limiter.throttle(0.0)
+        with open(limiter.filename) as f:
+            synced = f.read()
+        for _ in range(50):
+            limiter.reserve()
+            limiter.success()
+        assert limiter.rate > 5
+        with open(limiter.filename) as f:
+            assert f.read() == synced
+        limiter.throttle(0.0)
+        with open(limiter.filename) as f:
+            assert f.read() != synced
+
+    def test_unlimited_local(self, rate_limit_dir):
+        limiter = get_rate_limiter('unlimited')
+        assert limiter.filename is None
+        limiter.throttle(0.0)
+        for _ in range(10):
+            limiter.reserve()
+            limiter.success()
+        assert os.listdir(rate_limit_dir) == []
+
+    @pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='fork not available')
+    def test_processes(self, rate_limit_dir):
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [context.Process(target=_acquire_times, args=(rate_limit_dir, 10, queue)) for _ in range(2)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        times = sorted(queue.get() for _ in range(20))
+        # 20 requests at 10 per second together, not 10 per second each
+        assert times[-1] - times[0] >= 1.5
+
+    def test_srequest(self, throttling_server):
+        url = f'http://127.0.0.1:{throttling_server.server_address[1]}/'
+        limiter = AdaptiveRateLimiter('test')
+        with pytest.warns(UserWarning, match='429'):
+            resp = srequest(httpx.Client(), 'GET', url, rate_limiter=limiter)
+        assert resp.text == 'ok'
+        first, second = throttling_server.requests
+        assert second - first >= 0.95
+        assert limiter.rate is not None
@@ -10,8 +10,10 @@ from .filename import FileExtAction, FileOrderAction
 from .filter import NoMonochromeAction, OnlyMonochromeAction, ClassFilterAction, RatingFilterAction, FaceCountAction, \
     HeadCountAction, PersonRatioAction, MinSizeFilterAction, MinAreaFilterAction
 from .frame import FrameSplitAction
+from .fused import FusedAction
 from .head import HeadCoverAction, HeadCutOutAction
 from .lpips import FilterSimilarAction
+from .parallel import ParallelAction
 from .safety import SafetyAction
 from .split import PersonSplitAction, ThreeStageSplitAction
 from .tagging import TaggingAction, TagFilterAction, TagOverlapDropAction, TagDropAction, BlacklistedTagDropAction, \
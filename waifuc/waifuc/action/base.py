@@ -1,25 +1,121 @@
-from typing import Iterator, Iterable, Optional
+import queue
+import time
+from typing import Iterator, Iterable, List, Optional
 
 from tqdm.auto import tqdm
 
-from ..model import ImageItem
-from ..utils import get_task_names, NamedObject
+from ..model import ImageItem, PostMeta
+from ..utils import get_task_names, NamedObject, Cloneable
+from ..utils.prefetch import start_prefetch, PREFETCH_ITEM, PREFETCH_END
 
 
 class ActionStop(Exception):
     pass
 
 
-class BaseAction:
+def _close_upstream(iter_: Iterator[ImageItem]):
+    # stop the producers (e.g. threads of a concurrent source) instead of leaving them to the garbage collector
+    close = getattr(iter_, 'close', None)
+    if close is not None:
+        close()
+
+
+class BaseAction(Cloneable):
+    # Items handed to iter_batch at once by iter_from, batching is off when not greater than 1.
+    batch_size: int = 1
+    # Seconds a batch may wait for more items before it is flushed, None to always wait for a full batch.
+    max_latency: Optional[float] = None
+
     def iter(self, item: ImageItem) -> Iterator[ImageItem]:
         raise NotImplementedError  # pragma: no cover
 
+    def iter_batch(self, items: List[ImageItem]) -> Iterator[ImageItem]:
+        for item in items:
+            yield from self.iter(item)
+
+    @property
+    def batchable(self) -> bool:
+        """Whether this action has a real batch path, i.e. ``iter_batch`` is overridden."""
+        return type(self).iter_batch is not BaseAction.iter_batch
+
+    def batched(self, batch_size: int, max_latency: Optional[float] = None) -> 'BaseAction':
+        """
+        Let :meth:`iter_from` group the items into batches of ``batch_size``.
+
+        With ``max_latency``, a pending batch is flushed ``max_latency`` seconds after its first item
+        even when no further item arrives, so the input is then pulled on a background thread.
+        Otherwise batches are only flushed when full or when the input ends.
+        """
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        return self
+
+    def _iter_batches(self, iter_: Iterator[ImageItem]) -> Iterator[List[ImageItem]]:
+        # closes iter_ when closed early
+        if self.max_latency is not None:
+            yield from self._iter_timed_batches(iter_)
+            return
+
+        batch = []
+        try:
+            for item in iter_:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        except GeneratorExit:
+            _close_upstream(iter_)
+            raise
+        if batch:
+            yield batch
+
+    def _iter_timed_batches(self, iter_: Iterator[ImageItem]) -> Iterator[List[ImageItem]]:
+        queue_, stop = start_prefetch(iter_, self.batch_size, name='waifuc_batch')
+        try:
+            batch, deadline = [], None
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    kind, payload = queue_.get(timeout=timeout)
+                except queue.Empty:
+                    yield batch
+                    batch, deadline = [], None
+                    continue
+
+                if kind == PREFETCH_ITEM:
+                    batch.append(payload)
+                    if len(batch) == 1:
+                        deadline = time.monotonic() + self.max_latency
+                    if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                        yield batch
+                        batch, deadline = [], None
+                elif kind == PREFETCH_END:
+                    break
+                else:
+                    raise payload
+            if batch:
+                yield batch
+        finally:
+            # the worker closes iter_ once it notices
+            stop.set()
+
     def iter_from(self, iter_: Iterable[ImageItem]) -> Iterator[ImageItem]:
-        for item in iter_:
-            try:
-                yield from self.iter(item)
-            except ActionStop:
-                break
+        iter_ = iter(iter_)
+        if self.batch_size > 1 and self.batchable:
+            batches = self._iter_batches(iter_)
+            for batch in batches:
+                try:
+                    yield from self.iter_batch(batch)
+                except ActionStop:
+                    batches.close()
+                    break
+        else:
+            for item in iter_:
+                try:
+                    yield from self.iter(item)
+                except ActionStop:
+                    _close_upstream(iter_)
+                    break
 
     def reset(self):
         raise NotImplementedError  # pragma: no cover
@@ -29,9 +125,20 @@ class ProcessAction(BaseAction):
     def process(self, item: ImageItem) -> ImageItem:
         raise NotImplementedError  # pragma: no cover
 
+    def process_batch(self, items: List[ImageItem]) -> List[ImageItem]:
+        return [self.process(item) for item in items]
+
     def iter(self, item: ImageItem) -> Iterator[ImageItem]:
         yield self.process(item)
 
+    def iter_batch(self, items: List[ImageItem]) -> Iterator[ImageItem]:
+        yield from self.process_batch(items)
+
+    @property
+    def batchable(self) -> bool:
+        return type(self).process_batch is not ProcessAction.process_batch or \
+            type(self).iter_batch is not ProcessAction.iter_batch
+
     def reset(self):
         pass
 
@@ -43,10 +150,36 @@ class FilterAction(BaseAction):
     def check(self, item: ImageItem) -> bool:
         raise NotImplementedError  # pragma: no cover
 
+    def check_batch(self, items: List[ImageItem]) -> List[bool]:
+        return [self.check(item) for item in items]
+
+    def check_post(self, post: PostMeta) -> bool:
+        """
+        Check a post of a web source before its file is downloaded, see :meth:`WebDataSource.pushdown`.
+        Return ``False`` only when every item of the post would surely fail :meth:`check`, the items
+        of the posts passing it are still checked once downloaded.
+        """
+        return True
+
+    @property
+    def pushdownable(self) -> bool:
+        """Whether this action can decide on some posts from their metadata, i.e. ``check_post`` is overridden."""
+        return type(self).check_post is not FilterAction.check_post
+
     def iter(self, item: ImageItem) -> Iterator[ImageItem]:
         if self.check(item):
             yield item
 
+    def iter_batch(self, items: List[ImageItem]) -> Iterator[ImageItem]:
+        for item, passed in zip(items, self.check_batch(items)):
+            if passed:
+                yield item
+
+    @property
+    def batchable(self) -> bool:
+        return type(self).check_batch is not FilterAction.check_batch or \
+            type(self).iter_batch is not FilterAction.iter_batch
+
     def reset(self):
         pass
 
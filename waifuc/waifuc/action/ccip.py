@@ -5,7 +5,7 @@ from typing import Iterator, Optional, List, Tuple
 import numpy as np
 from hbutils.string import plural_word
 from hbutils.testing import disable_output
-from imgutils.metrics import ccip_extract_feature, ccip_default_threshold, ccip_clustering, ccip_batch_differences
+from imgutils.metrics import ccip_extract_feature, ccip_batch_extract_features, ccip_default_threshold, ccip_clustering, ccip_batch_differences
 
 from .base import BaseAction
 from ..model import ImageItem
@@ -19,6 +19,8 @@ class CCIPStatus(IntEnum):
 
 
 class CCIPAction(BaseAction):
+    _shared_attrs = ('init_source',)
+
     def __init__(self, init_source=None, *, min_val_count: int = 15, step: int = 5,
                  ratio_threshold: float = 0.6, min_clu_dump_ratio: float = 0.3, cmp_threshold: float = 0.5,
                  eps: Optional[float] = None, min_samples: Optional[int] = None,
@@ -37,6 +39,7 @@ class CCIPAction(BaseAction):
         self.items = []
         self.item_released = []
         self.feats = []
+        self._batch_feats = {}
         if self.init_source is not None:
             self.status = CCIPStatus.INIT_WITH_SOURCE
         else:
@@ -45,6 +48,8 @@ class CCIPAction(BaseAction):
     def _extract_feature(self, item: ImageItem):
         if 'ccip_feature' in item.meta:
             return item.meta['ccip_feature']
+        elif id(item) in self._batch_feats:
+            return self._batch_feats.pop(id(item))
         else:
             return ccip_extract_feature(item.image, model=self.model)
 
@@ -141,7 +146,20 @@ class CCIPAction(BaseAction):
         else:
             raise ValueError(f'Unknown status for {self.__class__.__name__} - {self.status!r}.')
 
+    def iter_batch(self, items: List[ImageItem]) -> Iterator[ImageItem]:
+        # extract the features of the whole batch at once, the clustering itself still goes item by item
+        todo = [item for item in items if 'ccip_feature' not in item.meta]
+        if todo:
+            feats = ccip_batch_extract_features([item.image for item in todo], model=self.model)
+            self._batch_feats = {id(item): feat for item, feat in zip(todo, feats)}
+        try:
+            for item in items:
+                yield from self.iter(item)
+        finally:
+            self._batch_feats = {}
+
     def reset(self):
+        self._batch_feats = {}
         self.items.clear()
         self.item_released.clear()
         self.feats.clear()
@@ -10,6 +10,8 @@ from waifuc.model import ImageItem
 from torch.cuda.amp import autocast
 
 class ESRGANAction(ProcessAction):
+    _shared_attrs = ('model',)
+
     def __init__(self, scale: float, model_path: str = None):
         """Initialize ESRGANAction with scaling factor and model path.
 
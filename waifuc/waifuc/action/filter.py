@@ -4,7 +4,8 @@ from imgutils.detect import detect_faces, detect_heads, detect_person
 from imgutils.validate import is_monochrome, anime_classify, anime_rating
 
 from .base import FilterAction
-from ..model import ImageItem
+from ..model import ImageItem, PostMeta
+from ..utils.inference import anime_classify_batch, anime_rating_batch, detect_faces_batch, detect_heads_batch
 
 
 class NoMonochromeAction(FilterAction):
@@ -26,10 +27,16 @@ class ClassFilterAction(FilterAction):
         self.threshold = threshold
         self.kwargs = kwargs
 
-    def check(self, item: ImageItem) -> bool:
-        cls, score = anime_classify(item.image, **self.kwargs)
+    def _check_result(self, cls: str, score: float) -> bool:
         return cls in self.classes and (self.threshold is None or score >= self.threshold)
 
+    def check(self, item: ImageItem) -> bool:
+        return self._check_result(*anime_classify(item.image, **self.kwargs))
+
+    def check_batch(self, items: List[ImageItem]) -> List[bool]:
+        results = anime_classify_batch([item.image for item in items], **self.kwargs)
+        return [self._check_result(cls, score) for cls, score in results]
+
 
 ImageRatingTyping = Literal['safe', 'r15', 'r18']
 
@@ -40,10 +47,16 @@ class RatingFilterAction(FilterAction):
         self.threshold = threshold
         self.kwargs = kwargs
 
-    def check(self, item: ImageItem) -> bool:
-        rating, score = anime_rating(item.image, **self.kwargs)
+    def _check_result(self, rating: str, score: float) -> bool:
         return rating in self.ratings and (self.threshold is None or score >= self.threshold)
 
+    def check(self, item: ImageItem) -> bool:
+        return self._check_result(*anime_rating(item.image, **self.kwargs))
+
+    def check_batch(self, items: List[ImageItem]) -> List[bool]:
+        results = anime_rating_batch([item.image for item in items], **self.kwargs)
+        return [self._check_result(rating, score) for rating, score in results]
+
 
 class FaceCountAction(FilterAction):
     def __init__(self, *args, min_count: Optional[int] = None, max_count: Optional[int] = None,
@@ -56,14 +69,21 @@ class FaceCountAction(FilterAction):
         self.conf_threshold = conf_threshold
         self.iou_threshold = iou_threshold
 
-    def check(self, item: ImageItem) -> bool:
-        detection = detect_faces(item.image, self.level, self.version,
-                                 conf_threshold=self.conf_threshold, iou_threshold=self.iou_threshold)
-        count = len(detection)
+    def _check_count(self, count: int) -> bool:
         return (self.min_count is None or count >= self.min_count) and \
             (self.max_count is None or count <= self.max_count) and \
             (not self.counts or count in self.counts)
 
+    def check(self, item: ImageItem) -> bool:
+        detection = detect_faces(item.image, self.level, self.version,
+                                 conf_threshold=self.conf_threshold, iou_threshold=self.iou_threshold)
+        return self._check_count(len(detection))
+
+    def check_batch(self, items: List[ImageItem]) -> List[bool]:
+        detections = detect_faces_batch([item.image for item in items], self.level, self.version,
+                                        conf_threshold=self.conf_threshold, iou_threshold=self.iou_threshold)
+        return [self._check_count(len(detection)) for detection in detections]
+
 
 class HeadCountAction(FilterAction):
     def __init__(self, *args, min_count: Optional[int] = None, max_count: Optional[int] = None,
@@ -75,16 +95,26 @@ class HeadCountAction(FilterAction):
         self.conf_threshold = conf_threshold
         self.iou_threshold = iou_threshold
 
+    def _check_count(self, count: int) -> bool:
+        return (self.min_count is None or count >= self.min_count) and \
+            (self.max_count is None or count <= self.max_count) and \
+            (not self.counts or count in self.counts)
+
     def check(self, item: ImageItem) -> bool:
         detection = detect_heads(
             item.image, self.level,
             conf_threshold=self.conf_threshold,
             iou_threshold=self.iou_threshold
         )
-        count = len(detection)
-        return (self.min_count is None or count >= self.min_count) and \
-            (self.max_count is None or count <= self.max_count) and \
-            (not self.counts or count in self.counts)
+        return self._check_count(len(detection))
+
+    def check_batch(self, items: List[ImageItem]) -> List[bool]:
+        detections = detect_heads_batch(
+            [item.image for item in items], self.level,
+            conf_threshold=self.conf_threshold,
+            iou_threshold=self.iou_threshold
+        )
+        return [self._check_count(len(detection)) for detection in detections]
 
 
 class PersonRatioAction(FilterAction):
@@ -112,6 +142,10 @@ class MinSizeFilterAction(FilterAction):
     def check(self, item: ImageItem) -> bool:
         return min(item.image.width, item.image.height) >= self.min_size
 
+    def check_post(self, post: PostMeta) -> bool:
+        # the downloaded file is the original or a smaller version of it
+        return post.size is None or min(post.size) >= self.min_size
+
 
 class MinAreaFilterAction(FilterAction):
     def __init__(self, min_size: int):
@@ -119,3 +153,6 @@ class MinAreaFilterAction(FilterAction):
 
     def check(self, item: ImageItem) -> bool:
         return (item.image.width * item.image.height) ** 0.5 >= self.min_size
+
+    def check_post(self, post: PostMeta) -> bool:
+        return post.size is None or (post.width * post.height) ** 0.5 >= self.min_size
@@ -0,0 +1,118 @@
+import threading
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from .base import BaseAction, ProcessAction, FilterAction
+from ..model import ImageItem
+
+
+class FusedAction(BaseAction):
+    """
+    Run a chain of per-item actions as one pass over the items.
+
+    Each item goes through every member's ``process``/``check`` directly, so there is
+    no generator layer, no extra iteration and no intermediate action copy per member.
+    The number of items entering and leaving every member is still counted, see :attr:`counts`.
+
+    :param actions: :class:`ProcessAction` or :class:`FilterAction` instances which do not
+        override ``iter``, see :meth:`is_fusable`.
+    :param probe: Optional callable returning a tuple of numbers (e.g. clocks or resource counters).
+        When given, it is called around every member call and the differences are summed per
+        member, see :attr:`usage`. It must be picklable when the action is used in process mode.
+    :param on_drop: Optional callable invoked as ``on_drop(index, item)`` when the member at ``index``
+        filters ``item`` out. It may be called from worker threads when the action runs in parallel.
+    """
+    _shared_attrs = ('probe', 'on_drop')
+
+    def __init__(self, *actions: BaseAction, probe: Optional[Callable[[], Tuple[float, ...]]] = None,
+                 on_drop: Optional[Callable[[int, ImageItem], None]] = None):
+        for action in actions:
+            if not self.is_fusable(action):
+                raise TypeError(f'Action {action!r} can not be fused.')
+        self.actions = list(actions)
+        self.probe = probe
+        self.on_drop = on_drop
+        self._in_counts = [0] * len(self.actions)
+        self._out_counts = [0] * len(self.actions)
+        self._usage: List[Optional[Tuple[float, ...]]] = [None] * len(self.actions)
+        self._lock = threading.Lock()
+        self.failed_index: Optional[int] = None
+
+    @classmethod
+    def is_fusable(cls, action: BaseAction) -> bool:
+        if isinstance(action, ProcessAction):
+            return type(action).iter is ProcessAction.iter
+        elif isinstance(action, FilterAction):
+            return type(action).iter is FilterAction.iter
+        else:
+            return False
+
+    def _call(self, action: BaseAction, item: ImageItem) -> Tuple[ImageItem, bool]:
+        if isinstance(action, FilterAction):
+            return item, action.check(item)
+        else:
+            return action.process(item), True
+
+    def iter(self, item: ImageItem) -> Iterator[ImageItem]:
+        reached, passed = 0, True
+        usage = [] if self.probe is not None else None
+        try:
+            for action in self.actions:
+                reached += 1
+                if usage is None:
+                    item, passed = self._call(action, item)
+                else:
+                    before = self.probe()
+                    try:
+                        item, passed = self._call(action, item)
+                    finally:
+                        usage.append(tuple(b - a for a, b in zip(before, self.probe())))
+                if not passed:
+                    break
+        except Exception:
+            self.failed_index = reached - 1
+            passed = False
+            raise
+        finally:
+            with self._lock:
+                for i in range(reached):
+                    self._in_counts[i] += 1
+                for i in range(reached if passed else reached - 1):
+                    self._out_counts[i] += 1
+                for i, delta in enumerate(usage or []):
+                    total = self._usage[i]
+                    self._usage[i] = delta if total is None else tuple(a + b for a, b in zip(total, delta))
+
+        if passed:
+            yield item
+        elif self.on_drop is not None:
+            self.on_drop(reached - 1, item)
+
+    @property
+    def counts(self) -> List[Tuple[int, int]]:
+        """(items in, items out) of every member."""
+        with self._lock:
+            return list(zip(self._in_counts, self._out_counts))
+
+    @property
+    def usage(self) -> List[Optional[Tuple[float, ...]]]:
+        """Summed ``probe`` differences of every member, ``None`` for members never reached or without probe."""
+        with self._lock:
+            return list(self._usage)
+
+    def reset(self):
+        for action in self.actions:
+            action.reset()
+        with self._lock:
+            self._in_counts = [0] * len(self.actions)
+            self._out_counts = [0] * len(self.actions)
+            self._usage = [None] * len(self.actions)
+        self.failed_index = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
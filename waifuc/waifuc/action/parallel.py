@@ -0,0 +1,111 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, Iterable, List, Literal, Optional, Tuple
+
+from .base import BaseAction, ActionStop, _close_upstream
+from ..model import ImageItem
+
+ParallelModeTyping = Literal['thread', 'process']
+
+_WORKER_ACTION: Optional[BaseAction] = None
+
+
+def _run_action(action: BaseAction, item: ImageItem) -> Tuple[List[ImageItem], bool]:
+    # mirror BaseAction.iter_from: items yielded before ActionStop are kept
+    outputs = []
+    try:
+        for output in action.iter(item):
+            outputs.append(output)
+    except ActionStop:
+        return outputs, True
+    return outputs, False
+
+
+def _init_process_worker(action: BaseAction):
+    global _WORKER_ACTION
+    _WORKER_ACTION = action
+
+
+def _run_in_process_worker(item: ImageItem) -> Tuple[List[ImageItem], bool]:
+    return _run_action(_WORKER_ACTION, item)
+
+
+class ParallelAction(BaseAction):
+    """
+    Run a per-item action on a pool of workers.
+
+    Only suitable for stateless actions whose ``iter`` depends on nothing but the given item
+    (e.g. most :class:`ProcessAction` and :class:`FilterAction` subclasses). At most ``window``
+    items are in flight, so the input is still consumed lazily.
+
+    :param action: The wrapped action.
+    :param workers: Number of workers, ``os.cpu_count()`` by default.
+    :param mode: ``thread`` shares the action between threads, ``process`` pickles it once into
+        every worker process (the action and the items must be picklable).
+    :param ordered: Keep the input order. When ``False``, results are yielded as soon as they are ready.
+    :param window: Maximum number of items in flight, ``2 * workers`` by default.
+    """
+
+    def __init__(self, action: BaseAction, workers: Optional[int] = None, mode: ParallelModeTyping = 'thread',
+                 ordered: bool = True, window: Optional[int] = None):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f'Unknown parallel mode - {mode!r}.')
+        self.action = action
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.mode = mode
+        self.ordered = ordered
+        self.window = max(1, window or self.workers * 2)
+
+    def _create_executor(self):
+        if self.mode == 'process':
+            return ProcessPoolExecutor(self.workers, initializer=_init_process_worker, initargs=(self.action,))
+        else:
+            return ThreadPoolExecutor(self.workers)
+
+    def _submit(self, executor, item: ImageItem):
+        if self.mode == 'process':
+            return executor.submit(_run_in_process_worker, item)
+        else:
+            return executor.submit(_run_action, self.action, item)
+
+    def iter(self, item: ImageItem) -> Iterator[ImageItem]:
+        yield from self.action.iter(item)
+
+    def iter_from(self, iter_: Iterable[ImageItem]) -> Iterator[ImageItem]:
+        iter_ = iter(iter_)
+        executor = self._create_executor()
+        pending = deque()
+        try:
+            def _fill():
+                while len(pending) < self.window:
+                    try:
+                        next_item = next(iter_)
+                    except StopIteration:
+                        return
+                    pending.append(self._submit(executor, next_item))
+
+            _fill()
+            while pending:
+                if self.ordered:
+                    done = [pending.popleft()]
+                else:
+                    done_set, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    done = [future for future in pending if future in done_set]
+                    for future in done:
+                        pending.remove(future)
+
+                for future in done:
+                    outputs, stopped = future.result()
+                    yield from outputs
+                    if stopped:
+                        _close_upstream(iter_)
+                        return
+                _fill()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def reset(self):
+        self.action.reset()
@@ -48,6 +48,7 @@ class DirectoryPipelineAction(TerminalAction):
         self.extract_mask = extract_mask
         
         self.output_directory = None 
+        self.scratch_directory = None  # 临时文件的父目录，由工作流引擎注入，None 时使用系统临时目录
         
         final_esrgan_config = esrgan_config
         if 'esrgan_model_path' in kwargs:
@@ -72,7 +73,7 @@ class DirectoryPipelineAction(TerminalAction):
         os.makedirs(self.output_directory, exist_ok=True)
 
 
-        self.temp_root = tempfile.mkdtemp()
+        self.temp_root = tempfile.mkdtemp(dir=self.scratch_directory)
         source_images_dir = os.path.join(self.temp_root, '00_source_input')
         split_output_dir = os.path.join(self.temp_root, '01_split_output')
         os.makedirs(source_images_dir, exist_ok=True)
@@ -7,6 +7,7 @@ from imgutils.tagging import get_deepdanbooru_tags, get_wd14_tags, get_mldanboor
 
 from .base import ProcessAction, BaseAction
 from ..model import ImageItem
+from ..utils.inference import get_wd14_tags_batch
 
 
 def _deepdanbooru_tagging(image: Image.Image, use_real_name: bool = False,
@@ -28,6 +29,18 @@ def _wd14_tagging(image: Image.Image, model_name: str,
     return {**features, **characters}
 
 
+def _wd14_batch_tagging(images: List[Image.Image], model_name: str,
+                        general_threshold: float = 0.35, character_threshold: float = 0.85, **kwargs):
+    _ = kwargs
+    results = get_wd14_tags_batch(
+        images,
+        model_name=model_name,
+        general_threshold=general_threshold,
+        character_threshold=character_threshold,
+    )
+    return [{**features, **characters} for _, features, characters in results]
+
+
 def _mldanbooru_tagging(image: Image.Image, use_real_name: bool = False, general_threshold: float = 0.7, **kwargs):
     _ = kwargs
     features = get_mldanbooru_tags(image, use_real_name, general_threshold)
@@ -47,6 +60,17 @@ _TAGGING_METHODS = {
     'mldanbooru': _mldanbooru_tagging,
 }
 
+_TAGGING_BATCH_METHODS = {
+    'wd14_vit': partial(_wd14_batch_tagging, model_name='ViT'),
+    'wd14_convnext': partial(_wd14_batch_tagging, model_name='ConvNext'),
+    'wd14_convnextv2': partial(_wd14_batch_tagging, model_name='ConvNextV2'),
+    'wd14_swinv2': partial(_wd14_batch_tagging, model_name='SwinV2'),
+    'wd14_moat': partial(_wd14_batch_tagging, model_name='MOAT'),
+    'wd14_v3_swinv2': partial(_wd14_batch_tagging, model_name='SwinV2_v3'),
+    'wd14_v3_convnext': partial(_wd14_batch_tagging, model_name='ConvNext_v3'),
+    'wd14_v3_vit': partial(_wd14_batch_tagging, model_name='ViT_v3'),
+}
+
 TaggingMethodTyping = Literal[
     'deepdanbooru', 'wd14_vit', 'wd14_convnext', 'wd14_convnextv2', 'wd14_swinv2', 'mldanbooru',
     'wd14_moat', 'wd14_v3_swinv2', 'wd14_v3_convnext', 'wd14_v3_vit',
@@ -56,6 +80,7 @@ TaggingMethodTyping = Literal[
 class TaggingAction(ProcessAction):
     def __init__(self, method: TaggingMethodTyping = 'wd14_v3_swinv2', force: bool = False, **kwargs):
         self.method = _TAGGING_METHODS[method]
+        self.batch_method = _TAGGING_BATCH_METHODS.get(method)
         self.force = force
         self.kwargs = kwargs
 
@@ -66,6 +91,22 @@ class TaggingAction(ProcessAction):
             tags = self.method(image=item.image, **self.kwargs)
             return ImageItem(item.image, {**item.meta, 'tags': tags})
 
+    @property
+    def batchable(self) -> bool:
+        return self.batch_method is not None
+
+    def process_batch(self, items: List[ImageItem]) -> List[ImageItem]:
+        if self.batch_method is None:
+            return [self.process(item) for item in items]
+
+        todo = [i for i, item in enumerate(items) if 'tags' not in item.meta or self.force]
+        items = list(items)
+        if todo:
+            all_tags = self.batch_method(images=[items[i].image for i in todo], **self.kwargs)
+            for i, tags in zip(todo, all_tags):
+                items[i] = ImageItem(items[i].image, {**items[i].meta, 'tags': tags})
+        return items
+
 
 class TagFilterAction(BaseAction):
     # noinspection PyShadowingBuiltins
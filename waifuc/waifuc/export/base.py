@@ -6,10 +6,10 @@ from hbutils.system import remove
 from tqdm.auto import tqdm
 
 from ..model import ImageItem
-from ..utils import get_task_names, NamedObject
+from ..utils import get_task_names, NamedObject, Cloneable
 
 
-class BaseExporter(NamedObject):
+class BaseExporter(NamedObject, Cloneable):
     def __init__(self, ignore_error_when_export: bool = False):
         self.ignore_error_when_export = ignore_error_when_export
 
@@ -1 +1,2 @@
 from .item import load_meta, dump_meta, ImageItem
+from .post import PostMeta
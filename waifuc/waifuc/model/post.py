@@ -0,0 +1,54 @@
+import os
+from dataclasses import dataclass
+from typing import Optional, FrozenSet, Iterable
+
+
+def _positive(value) -> Optional[int]:
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+@dataclass(frozen=True)
+class PostMeta:
+    """
+    What a site tells about a post before its file is downloaded, normalized across the sites,
+    ``None`` for what the site does not tell.
+
+    :param width: Width of the original file.
+    :param height: Height of the original file.
+    :param rating: Rating on the site, e.g. ``'s'`` or ``'explicit'``, as the site spells it.
+    :param tags: Tags on the site.
+    :param file_ext: Extension of the original file, lowercase without the dot, e.g. ``'png'``.
+    """
+    width: Optional[int] = None
+    height: Optional[int] = None
+    rating: Optional[str] = None
+    tags: Optional[FrozenSet[str]] = None
+    file_ext: Optional[str] = None
+
+    @classmethod
+    def create(cls, width=None, height=None, rating=None, tags: Optional[Iterable[str]] = None,
+               file_ext: Optional[str] = None) -> 'PostMeta':
+        """
+        Create from the raw values of the site, dropping the ones that are missing or invalid
+        (e.g. a width of ``0``). ``file_ext`` may also be a filename.
+        """
+        if file_ext:
+            file_ext = (os.path.splitext(file_ext)[1] or file_ext).lstrip('.').lower() or None
+        return cls(
+            width=_positive(width),
+            height=_positive(height),
+            rating=str(rating) if rating else None,
+            tags=frozenset(tag for tag in tags if tag) if tags is not None else None,
+            file_ext=file_ext or None,
+        )
+
+    @property
+    def size(self) -> Optional[tuple]:
+        """``(width, height)`` when both are known."""
+        if self.width is not None and self.height is not None:
+            return self.width, self.height
+        return None
@@ -34,6 +34,7 @@ class Period(str, Enum):
 class AnimePicturesSource(DynamicUAWebDataSource):
     __api_root__ = 'https://api.anime-pictures.net'
     __root__ = 'https://anime-pictures.net'
+    __api_cache_ttl__ = 3600
 
     def __init__(self, tags: List[str], tag_mode: Literal['or', 'and'] = 'and',
                  denied_tags: List[str] = None, denied_tag_mode: Literal['or', 'and'] = 'or',
@@ -100,7 +101,8 @@ class AnimePicturesSource(DynamicUAWebDataSource):
     def _iter_data(self) -> Iterator[Tuple[Union[str, int], str, dict]]:
         page = 0
         while True:
-            resp = srequest(self.session, 'GET', f'{self.__api_root__}/api/v3/posts', params=self._params(page))
+            resp = srequest(self.session, 'GET', f'{self.__api_root__}/api/v3/posts', params=self._params(page),
+                            cache_ttl=self.__api_cache_ttl__)
             resp.raise_for_status()
 
             posts = resp.json()['posts']
@@ -108,7 +110,8 @@ class AnimePicturesSource(DynamicUAWebDataSource):
                 break
 
             for post in posts:
-                resp_page = srequest(self.session, 'GET', f'{self.__root__}/posts/{post["id"]}?lang=en')
+                resp_page = srequest(self.session, 'GET', f'{self.__root__}/posts/{post["id"]}?lang=en',
+                                     cache_ttl=self.__api_cache_ttl__)
                 resp_page.raise_for_status()
 
                 url = self._get_url(post, resp_page)
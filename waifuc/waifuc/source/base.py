@@ -1,5 +1,4 @@
-import copy
-from typing import Iterator, Optional, Union
+from typing import Iterator, Optional, Union, Callable
 
 from tqdm.auto import tqdm
 
@@ -55,6 +54,13 @@ class BaseDataSource:
         else:
             raise TypeError(f'Data source\'s getitem only accept slices, but {item!r} found.')
 
+    def for_each_source(self, fn: Callable[['BaseDataSource'], None]):
+        """
+        Call ``fn`` on this source and on every source it reads from, e.g. to configure the web sources
+        inside a :class:`ParallelDataSource`. Sources built only when iterated are passed to ``fn`` then.
+        """
+        fn(self)
+
     def attach(self, *actions: BaseAction) -> 'AttachedDataSource':
         return AttachedDataSource(self, *actions)
 
@@ -63,7 +69,7 @@ class BaseDataSource:
             from ..export import SaveExporter
             exporter = SaveExporter(exporter, no_meta=True)
 
-        exporter = copy.deepcopy(exporter)
+        exporter = exporter.clone()
         exporter.reset()
         with task_ctx(name):
             return exporter.export_from(iter(self))
@@ -88,10 +94,14 @@ class AttachedDataSource(BaseDataSource):
         self.source = source
         self.actions = actions
 
+    def for_each_source(self, fn: Callable[[BaseDataSource], None]):
+        fn(self)
+        self.source.for_each_source(fn)
+
     def _iter(self) -> Iterator[ImageItem]:
         t = self.source
         for action in self.actions:
-            action = copy.deepcopy(action)
+            action = action.clone()
             action.reset()
             t = action.iter_from(t)
 
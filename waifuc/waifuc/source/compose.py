@@ -1,14 +1,22 @@
+import queue
 import random
-from typing import Iterator, Optional
+import threading
+from typing import Iterator, Optional, Literal, List, Callable
 
 from .base import BaseDataSource
 from ..model import ImageItem
+from ..utils import get_task_names, task_names_ctx
 
 
 class ComposedDataSource(BaseDataSource):
     def __init__(self, *sources: BaseDataSource):
         self.sources = sources
 
+    def for_each_source(self, fn: Callable[[BaseDataSource], None]):
+        fn(self)
+        for source in self.sources:
+            source.for_each_source(fn)
+
     def _iter(self) -> Iterator[ImageItem]:
         for source in self.sources:
             yield from iter(source)
@@ -17,12 +25,106 @@ class ComposedDataSource(BaseDataSource):
         yield from self._iter()
 
 
+InterleaveTyping = Literal['random', 'arrival']
+
+_ITEM, _END, _ERROR = 'item', 'end', 'error'
+
+
 class ParallelDataSource(BaseDataSource):
-    def __init__(self, *sources: BaseDataSource, seed: Optional[int] = None):
+    """
+    Interleave the items of several sources.
+
+    :param sources: The sources.
+    :param seed: Seed of the random choice of the source the next item is taken from.
+    :param concurrent: Iterate every source on a thread of its own, so the sources (e.g. sites with their
+        own rate limits) download at the same time instead of one at a time.
+    :param interleave: How the items are merged in concurrent mode. ``random`` takes them in the same seeded
+        random order as the sequential mode, waiting for the chosen source when it has nothing buffered.
+        ``arrival`` yields every item as soon as any source produces it.
+    :param buffer_size: Items buffered ahead of the consumer in concurrent mode, per source for ``random``
+        and in total for ``arrival``.
+    """
+
+    def __init__(self, *sources: BaseDataSource, seed: Optional[int] = None, concurrent: bool = False,
+                 interleave: InterleaveTyping = 'random', buffer_size: int = 16):
+        if interleave not in ('random', 'arrival'):
+            raise ValueError(f'Unknown interleave mode - {interleave!r}.')
         self.sources = sources
         self.random = random.Random(seed)
+        self.concurrent = concurrent
+        self.interleave = interleave
+        self.buffer_size = max(1, buffer_size)
+
+    def for_each_source(self, fn: Callable[[BaseDataSource], None]):
+        fn(self)
+        for source in self.sources:
+            source.for_each_source(fn)
+
+    @staticmethod
+    def _run_source(index: int, source: BaseDataSource, queue_: queue.Queue,
+                    stop: threading.Event, names) -> None:
+        def _put(kind, payload) -> bool:
+            # give up once the consumer is gone, instead of blocking on a full queue forever
+            while not stop.is_set():
+                try:
+                    queue_.put((index, kind, payload), timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        with task_names_ctx(names):
+            iter_ = iter(source)
+            try:
+                for item in iter_:
+                    if not _put(_ITEM, item):
+                        return
+            except Exception as err:
+                _put(_ERROR, err)
+                return
+            finally:
+                close = getattr(iter_, 'close', None)
+                if close is not None:
+                    close()
+            _put(_END, None)
+
+    def _iter_concurrent(self) -> Iterator[ImageItem]:
+        stop = threading.Event()
+        names = get_task_names()
+        if self.interleave == 'arrival':
+            queues: List[queue.Queue] = [queue.Queue(self.buffer_size)] * len(self.sources)
+        else:
+            queues = [queue.Queue(self.buffer_size) for _ in self.sources]
+        for i, source in enumerate(self.sources):
+            threading.Thread(
+                target=self._run_source, args=(i, source, queues[i], stop, names),
+                name=f'waifuc_source_{i}', daemon=True,
+            ).start()
+
+        try:
+            alive = list(range(len(self.sources)))
+            while alive:
+                if self.interleave == 'arrival':
+                    index, kind, payload = queues[0].get()
+                else:
+                    index = alive[self.random.choice(range(len(alive)))]
+                    _, kind, payload = queues[index].get()
+
+                if kind == _ITEM:
+                    yield payload
+                elif kind == _END:
+                    alive.remove(index)
+                else:
+                    raise payload
+        finally:
+            # the workers notice this before their next item and close their sources
+            stop.set()
 
     def _iter(self) -> Iterator[ImageItem]:
+        if self.concurrent and len(self.sources) > 1:
+            yield from self._iter_concurrent()
+            return
+
         iters = [iter(source) for source in self.sources]
         while len(iters) > 0:
             id_ = self.random.choice(range(len(iters)))
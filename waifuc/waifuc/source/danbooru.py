@@ -5,6 +5,7 @@ from typing import Optional, Iterator, List, Tuple, Union, Literal
 from hbutils.system import urlsplit
 
 from .web import NoURL, WebDataSource, DynamicUAWebDataSource
+from ..model import PostMeta
 from ..utils import srequest
 
 _DanbooruSiteTyping = Literal['konachan', 'yandere', 'danbooru', 'safebooru', 'lolibooru']
@@ -12,6 +13,8 @@ _DanbooruTagDomainTyping = Literal['general', 'character', 'copyright', 'artist'
 _E621DomainTyping = Literal['artist', 'character', 'copyright', 'general', 'invalid', 'lore', 'meta', 'species']
 
 class DanbooruLikeSource(DynamicUAWebDataSource):
+    __api_cache_ttl__ = 1800
+
     def __init__(self, tags: List[str], min_size: Optional[int] = 800, download_silent: bool = True,
                  username: Optional[str] = None, api_key: Optional[str] = None,
                  site_name: Optional[str] = 'danbooru', site_url: Optional[str] = 'https://danbooru.donmai.us/',
@@ -61,6 +64,25 @@ class DanbooruLikeSource(DynamicUAWebDataSource):
 
         raise NoURL
 
+    def _content_md5(self, url: str, meta: dict) -> Optional[str]:
+        data = meta[self.site_name]
+        # md5 is the one of the original file, the variants have their own
+        return data.get('md5') if url == data.get('file_url') else None
+
+    def _preview_url(self, url: str, meta: dict) -> Optional[str]:
+        variants = (meta[self.site_name].get('media_asset') or {}).get('variants') or []
+        return self._smallest_variant(
+            (item.get('url'), item.get('width'), item.get('height'))
+            for item in variants if item.get('type') != 'original'
+        )
+
+    def _post_meta(self, data: dict) -> Optional[PostMeta]:
+        tag_string = data.get('tag_string')
+        return PostMeta.create(
+            width=data.get('image_width'), height=data.get('image_height'), rating=data.get('rating'),
+            tags=tag_string.split() if tag_string is not None else None, file_ext=data.get('file_ext'),
+        )
+
     def _get_tags(self, data):
         if self.tag_domains is None:
             return re.split(r'\s+', data["tag_string"])
@@ -70,7 +92,7 @@ class DanbooruLikeSource(DynamicUAWebDataSource):
                 tags.extend(re.split(r'\s+', data[f'tag_string_{tag_domain}']))
             return tags
 
-    def _iter_data(self) -> Iterator[Tuple[Union[str, int], str, dict]]:
+    def _iter_pages(self) -> Iterator[List[dict]]:
         page = 1
         while True:
             resp = srequest(self.session, 'GET', f'{self.site_url}/posts.json', params={
@@ -78,13 +100,20 @@ class DanbooruLikeSource(DynamicUAWebDataSource):
                 "limit": "200",
                 "page": str(page),
                 "tags": ' '.join(self.tags),
-            }, auth=self.auth)
+            }, auth=self.auth, cache_ttl=self.__api_cache_ttl__)
             resp.raise_for_status()
             page_items = self._get_data_from_raw(resp.json())
             if not page_items:
                 break
 
+            yield page_items
+            page += 1
+
+    def _iter_data(self) -> Iterator[Tuple[Union[str, int], str, dict]]:
+        for page_items in self._prefetch_pages(self._iter_pages()):
             for data in page_items:
+                if not self._accept_post(data):
+                    continue
                 try:
                     url = self._select_url(data)
                 except NoURL:
@@ -100,8 +129,6 @@ class DanbooruLikeSource(DynamicUAWebDataSource):
                 }
                 yield data['id'], url, meta
 
-            page += 1
-
 class DanbooruSource(DanbooruLikeSource):
     def __init__(self, tags: List[str],
                  min_size: Optional[int] = 800, download_silent: bool = True,
@@ -162,6 +189,25 @@ class E621LikeSource(DanbooruLikeSource):
 
         return urls[0][0]
 
+    def _content_md5(self, url: str, meta: dict) -> Optional[str]:
+        file = meta[self.site_name].get('file') or {}
+        return file.get('md5') if url == file.get('url') else None
+
+    def _preview_url(self, url: str, meta: dict) -> Optional[str]:
+        data = meta[self.site_name]
+        variants = [data.get('preview') or {}]
+        if (data.get('sample') or {}).get('has'):
+            variants.append(data['sample'])
+        return self._smallest_variant((item.get('url'), item.get('width'), item.get('height')) for item in variants)
+
+    def _post_meta(self, data: dict) -> Optional[PostMeta]:
+        file, tags = data.get('file') or {}, data.get('tags')
+        return PostMeta.create(
+            width=file.get('width'), height=file.get('height'), rating=data.get('rating'),
+            tags=[tag for value in tags.values() for tag in value] if isinstance(tags, dict) else None,
+            file_ext=file.get('ext'),
+        )
+
     def _get_tags(self, data):
         tags = []
         if self.tag_domains is None:
@@ -10,6 +10,8 @@ SelectTyping = Literal['thumb', 'small', 'medium', 'large', 'full']
 
 
 class DerpibooruLikeSource(WebDataSource):
+    __api_cache_ttl__ = 3600
+
     def __init__(self, site_name: str, site_url: str,
                  tags: List[str], key: Optional[str] = None, select: SelectTyping = 'large',
                  download_silent: bool = True, group_name: Optional[str] = None):
@@ -44,7 +46,7 @@ class DerpibooruLikeSource(WebDataSource):
         page = 1
         while True:
             resp = srequest(self.session, 'GET', f'{self.site_url}/api/v1/json/search/images',
-                            params=self._params(page))
+                            params=self._params(page), cache_ttl=self.__api_cache_ttl__)
             resp.raise_for_status()
 
             posts = resp.json()['images']
@@ -13,6 +13,8 @@ def _extract_words(keyword):
 
 
 class DuitangSource(WebDataSource):
+    __api_cache_ttl__ = 3600
+
     def __init__(self, keyword: str, strict: bool = True, page_size: int = 100,
                  group_name: str = 'duitang', download_silent: bool = True):
         WebDataSource.__init__(self, group_name, get_requests_session(), download_silent)
@@ -38,7 +40,7 @@ class DuitangSource(WebDataSource):
                 'kw': self.keyword,
                 'start': str(offset),
                 'limit': str(self.page_size),
-            })
+            }, cache_ttl=self.__api_cache_ttl__)
             resp.raise_for_status()
 
             raw = resp.json()
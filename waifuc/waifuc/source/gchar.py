@@ -1,12 +1,11 @@
 import logging
-from functools import reduce
-from operator import __or__
-from typing import Iterator, Tuple, Optional, List, Mapping
+from typing import Iterator, Tuple, Optional, List, Mapping, Callable
 
 from hbutils.string import plural_word
 
 from .anime_pictures import AnimePicturesSource
 from .base import BaseDataSource
+from .compose import ParallelDataSource
 from .danbooru import ATFBooruSource, DanbooruSource, DanbooruLikeSource
 from .konachan import KonachanSource, KonachanNetSource, HypnoHubSource, LolibooruSource, XbooruSource, YandeSource, \
     Rule34Source, KonachanLikeSource
@@ -42,7 +41,7 @@ class GcharAutoSource(BaseDataSource):
                  max_preset_limit: Optional[int] = None, main_sources_count: int = 5,
                  blacklist_sites: Tuple[str, ...] = (), pixiv_refresh_token: Optional[str] = None,
                  min_size: Optional[int] = 1500, strict_for_preset: bool = True, strict_for_main: bool = True,
-                 extra_cfg: Optional[Mapping[str, dict]] = None):
+                 extra_cfg: Optional[Mapping[str, dict]] = None, concurrent: bool = True):
         from gchar.games import get_character
         from gchar.games.base import Character
 
@@ -70,6 +69,20 @@ class GcharAutoSource(BaseDataSource):
         self.main_sources_count = main_sources_count
 
         self.blacklist_sites = blacklist_sites
+        # crawl the sites at the same time, each one is still limited by its own request rate
+        self.concurrent = concurrent
+        # applied to the site sources once they are built, see for_each_source
+        self._source_fns: List[Callable[[BaseDataSource], None]] = []
+
+    def for_each_source(self, fn: Callable[[BaseDataSource], None]):
+        fn(self)
+        self._source_fns.append(fn)
+
+    def _merge_sources(self, sources: List[BaseDataSource]) -> BaseDataSource:
+        if len(sources) == 1:
+            return sources[0]
+        else:
+            return ParallelDataSource(*sources, concurrent=self.concurrent)
 
     def _select_keyword_for_site(self, site) -> Tuple[Optional[str], Optional[int]]:
         from gchar.resources.sites import list_site_tags
@@ -124,7 +137,7 @@ class GcharAutoSource(BaseDataSource):
         ]
         sources = [source for source in sources if source is not None]
         if sources:
-            retval = reduce(__or__, sources)
+            retval = self._merge_sources(sources)
             if self.max_preset_limit is not None:
                 retval = retval[:self.max_preset_limit]
             return retval
@@ -154,7 +167,7 @@ class GcharAutoSource(BaseDataSource):
         ]
         sources = [source for source in sources if source is not None]
         if sources:
-            return reduce(__or__, sources)
+            return self._merge_sources(sources)
         else:
             return None
 
@@ -173,4 +186,6 @@ class GcharAutoSource(BaseDataSource):
     def _iter(self) -> Iterator[ImageItem]:
         source = self._build_source()
         if source is not None:
+            for fn in self._source_fns:
+                source.for_each_source(fn)
             yield from source._iter()
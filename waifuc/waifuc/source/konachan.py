@@ -5,10 +5,13 @@ from typing import Iterator, Tuple, Union, List, Optional
 from hbutils.system import urlsplit
 
 from .web import WebDataSource, NoURL
+from ..model import PostMeta
 from ..utils import get_requests_session, srequest
 
 
 class KonachanLikeSource(WebDataSource):
+    __api_cache_ttl__ = 3600
+
     def __init__(self, site_name: str, site_url: str,
                  tags: List[str], start_page: int = 1, min_size: Optional[int] = 800,
                  group_name: Optional[str] = None, download_silent: bool = True):
@@ -49,17 +52,37 @@ class KonachanLikeSource(WebDataSource):
         else:
             raise NoURL
 
+    def _content_md5(self, url: str, meta: dict) -> Optional[str]:
+        data = meta[self.site_name]
+        # md5 is the one of the original file, the samples and jpeg versions have their own
+        return data.get('md5') if url == data.get('file_url') else None
+
+    def _preview_url(self, url: str, meta: dict) -> Optional[str]:
+        data = meta[self.site_name]
+        return self._smallest_variant(
+            (data[name], data.get(f'{name[:-4]}_width'), data.get(f'{name[:-4]}_height'))
+            for name in data.keys() if name.endswith('_url') and name != 'file_url'
+        )
+
+    def _post_meta(self, data: dict) -> Optional[PostMeta]:
+        tags, file_url = data.get('tags'), data.get('file_url')
+        return PostMeta.create(
+            width=data.get('width'), height=data.get('height'), rating=data.get('rating'),
+            tags=tags.split() if isinstance(tags, str) else None,
+            file_ext=urlsplit(file_url).filename if file_url else None,
+        )
+
     def _request(self, page):
         return srequest(self.session, 'GET', f'{self.site_url}/post.json', params={
             'tags': ' '.join(self.tags),
             'limit': '100',
             'page': str(page),
-        })
+        }, cache_ttl=self.__api_cache_ttl__)
 
     def _get_data_from_raw(self, raw):
         return raw
 
-    def _iter_data(self) -> Iterator[Tuple[Union[str, int], str, dict]]:
+    def _iter_pages(self) -> Iterator[List[dict]]:
         page = self.start_page
         while True:
             resp = self._request(page)
@@ -72,7 +95,14 @@ class KonachanLikeSource(WebDataSource):
             if not page_list:
                 break
 
+            yield page_list
+            page += 1
+
+    def _iter_data(self) -> Iterator[Tuple[Union[str, int], str, dict]]:
+        for page_list in self._prefetch_pages(self._iter_pages()):
             for data in page_list:
+                if not self._accept_post(data):
+                    continue
                 try:
                     url = self._select_url(data)
                 except NoURL:
@@ -88,8 +118,6 @@ class KonachanLikeSource(WebDataSource):
                 }
                 yield data["id"], url, meta
 
-            page += 1
-
 
 class YandeSource(KonachanLikeSource):
     def __init__(self, tags: List[str], min_size: Optional[int] = 800,
@@ -123,7 +151,7 @@ class LolibooruSource(KonachanLikeSource):
             'tags': ' '.join(self.tags),
             'limit': '100',
             'page': str(page),
-        })
+        }, cache_ttl=self.__api_cache_ttl__)
 
 
 class ThreeDBooruSource(KonachanLikeSource):
@@ -140,7 +168,7 @@ class ThreeDBooruSource(KonachanLikeSource):
             'tags': ' '.join(self.tags),
             'limit': '100',
             'page': str(page),
-        })
+        }, cache_ttl=self.__api_cache_ttl__)
 
 
 class Rule34LikeSource(KonachanLikeSource):
@@ -158,7 +186,7 @@ class Rule34LikeSource(KonachanLikeSource):
             'json': '1',
             'limit': '100',
             'pid': str(page),
-        })
+        }, cache_ttl=self.__api_cache_ttl__)
 
 
 class Rule34Source(Rule34LikeSource):
@@ -213,7 +241,7 @@ class XbooruLikeSource(Rule34LikeSource):
         Rule34LikeSource.__init__(self, site_name, site_url, tags, min_size, group_name, download_silent)
         self.img_site_url = img_site_url
 
-    def _select_url(self, data):
+    def _urls(self, data):
         name, _ = os.path.splitext(data['image'])
         urls = [(f'{self.img_site_url}/images/{data["directory"]}/{data["image"]}', data['width'], data['height'])]
         if data['sample']:
@@ -221,6 +249,13 @@ class XbooruLikeSource(Rule34LikeSource):
                 f'{self.img_site_url}/samples/{data["directory"]}/sample_{name}.jpg?{data["id"]}',
                 data['sample_width'], data['sample_height'],
             ))
+        return urls
+
+    def _preview_url(self, url: str, meta: dict) -> Optional[str]:
+        return self._smallest_variant(self._urls(meta[self.site_name])[1:])
+
+    def _select_url(self, data):
+        urls = self._urls(data)
 
         if self.min_size is not None:
             f_url, f_width, f_height = None, None, None
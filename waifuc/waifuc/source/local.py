@@ -3,6 +3,8 @@ import pathlib
 import random
 import re
 import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterator, Optional, List, Any
 
 from PIL import UnidentifiedImageError
@@ -14,10 +16,25 @@ from ..model import ImageItem
 
 
 class BaseDirectorySource(NamedDataSource):
-    def __init__(self, directory: str, recursive: bool = True, shuffle: bool = False):
+    """
+    Base class of the sources reading image files from a directory.
+
+    :param directory: The directory to read.
+    :param recursive: Read the sub-directories too.
+    :param shuffle: Read the files in random order.
+    :param prefetch: Number of files read and decoded ahead on a thread pool while the consumer
+        works on the current item, ``0`` to read every file only when it is requested. The items
+        keep the order of the files, and errors are raised when the failed item is requested.
+    :param prefetch_workers: Number of decoding threads, ``min(prefetch, os.cpu_count())`` by default.
+    """
+
+    def __init__(self, directory: str, recursive: bool = True, shuffle: bool = False,
+                 prefetch: int = 0, prefetch_workers: Optional[int] = None):
         self.directory = directory
         self.recursive = recursive
         self.shuffle = shuffle
+        self.prefetch = prefetch
+        self.prefetch_workers = prefetch_workers
 
     def _args(self) -> Optional[List[Any]]:
         return [self.directory]
@@ -39,61 +56,97 @@ class BaseDirectorySource(NamedDataSource):
             random.shuffle(lst)
         yield from tqdm(lst, desc=f'Loading from {self.directory!r}')
 
-    def _iter(self) -> Iterator[ImageItem]:
+    def _load_file(self, file: str, group_name: str) -> Optional[ImageItem]:
+        """Read and decode one file, ``None`` when it should be skipped. Runs on worker threads when prefetching."""
         raise NotImplementedError  # pragma: no cover
 
-
-class LocalSource(BaseDirectorySource):
-    def __init__(self, directory: str, recursive: bool = True, shuffle: bool = False):
-        BaseDirectorySource.__init__(self, directory, recursive, shuffle)
+    def _iter_prefetched(self) -> Iterator[ImageItem]:
+        files = iter(self._actual_iter_files())
+        workers = self.prefetch_workers or min(self.prefetch, os.cpu_count() or 1)
+        executor = ThreadPoolExecutor(max(1, workers), thread_name_prefix='waifuc_prefetch')
+        pending = deque()
+        try:
+            def _fill():
+                while len(pending) < self.prefetch:
+                    try:
+                        file, group_name = next(files)
+                    except StopIteration:
+                        return
+                    pending.append(executor.submit(self._load_file, file, group_name))
+
+            _fill()
+            while pending:
+                item = pending.popleft().result()
+                _fill()
+                if item is not None:
+                    yield item
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
 
     def _iter(self) -> Iterator[ImageItem]:
-        for file, group_name in self._actual_iter_files():
-            try:
-                origin_item = ImageItem.load_from_image(file)
-                origin_item.image.load()
-            except UnidentifiedImageError:
-                continue
-            except OSError:
-                warnings.warn(f'File {file} is truncated or corrupted, skipped.')
-                continue
-
-            target_filename = os.path.basename(file)
-            meta = origin_item.meta or {
-                'path': os.path.abspath(file),
-                'group_id': group_name,
-                'filename': target_filename,
-            }
-            yield ImageItem(origin_item.image, meta)
+        if self.prefetch > 0:
+            yield from self._iter_prefetched()
+        else:
+            for file, group_name in self._actual_iter_files():
+                item = self._load_file(file, group_name)
+                if item is not None:
+                    yield item
 
 
-class LocalTISource(BaseDirectorySource):
-    def __init__(self, directory: str, recursive: bool = True, shuffle: bool = False):
-        BaseDirectorySource.__init__(self, directory, recursive, shuffle)
+class LocalSource(BaseDirectorySource):
+    def __init__(self, directory: str, recursive: bool = True, shuffle: bool = False,
+                 prefetch: int = 0, prefetch_workers: Optional[int] = None):
+        BaseDirectorySource.__init__(self, directory, recursive, shuffle, prefetch, prefetch_workers)
+
+    def _load_file(self, file: str, group_name: str) -> Optional[ImageItem]:
+        try:
+            origin_item = ImageItem.load_from_image(file)
+            origin_item.image.load()
+        except UnidentifiedImageError:
+            return None
+        except OSError:
+            warnings.warn(f'File {file} is truncated or corrupted, skipped.')
+            return None
+
+        target_filename = os.path.basename(file)
+        meta = origin_item.meta or {
+            'path': os.path.abspath(file),
+            'group_id': group_name,
+            'filename': target_filename,
+        }
+        return ImageItem(origin_item.image, meta)
 
-    def _iter(self) -> Iterator[ImageItem]:
-        for file, group_name in self._actual_iter_files():
-            try:
-                image = load_image(file)
-            except UnidentifiedImageError:
-                continue
-            except OSError:
-                warnings.warn(f'File {file} is truncated or corrupted, skipped.')
-                continue
-
-            filename_body = os.path.splitext(os.path.basename(file))[0]
-            txt_file = os.path.join(self.directory, f'{filename_body}.txt')
-            if os.path.exists(txt_file):
-                full_text = pathlib.Path(txt_file).read_text(encoding='utf-8')
-                words = re.split(r'\s*,\s*', full_text)
-                tags = {word: 1.0 for word in words}
-            else:
-                tags = {}
-
-            meta = {
-                'path': os.path.abspath(file),
-                'group_id': group_name,
-                'filename': os.path.basename(file),
-                'tags': tags,
-            }
-            yield ImageItem(image, meta)
+
+class LocalTISource(BaseDirectorySource):
+    def __init__(self, directory: str, recursive: bool = True, shuffle: bool = False,
+                 prefetch: int = 0, prefetch_workers: Optional[int] = None):
+        BaseDirectorySource.__init__(self, directory, recursive, shuffle, prefetch, prefetch_workers)
+
+    def _load_file(self, file: str, group_name: str) -> Optional[ImageItem]:
+        try:
+            image = load_image(file)
+            image.load()
+        except UnidentifiedImageError:
+            return None
+        except OSError:
+            warnings.warn(f'File {file} is truncated or corrupted, skipped.')
+            return None
+
+        filename_body = os.path.splitext(os.path.basename(file))[0]
+        txt_file = os.path.join(self.directory, f'{filename_body}.txt')
+        if os.path.exists(txt_file):
+            full_text = pathlib.Path(txt_file).read_text(encoding='utf-8')
+            words = re.split(r'\s*,\s*', full_text)
+            tags = {word: 1.0 for word in words}
+        else:
+            tags = {}
+
+        meta = {
+            'path': os.path.abspath(file),
+            'group_id': group_name,
+            'filename': os.path.basename(file),
+            'tags': tags,
+        }
+        return ImageItem(image, meta)
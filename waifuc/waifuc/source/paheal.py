@@ -10,6 +10,8 @@ from ..utils import get_requests_session, srequest
 
 
 class PahealSource(WebDataSource):
+    __api_cache_ttl__ = 3600
+
     def __init__(self, tags: List[str], user_id: Optional[str] = None, api_key: Optional[str] = None,
                  min_size: Optional[int] = 800, download_silent: bool = True, group_name: str = 'paheal'):
         WebDataSource.__init__(self, group_name, get_requests_session(), download_silent)
@@ -63,7 +65,7 @@ class PahealSource(WebDataSource):
         page = 1
         while True:
             resp = srequest(self.session, 'GET', 'https://rule34.paheal.net/api/danbooru/find_posts/index.xml',
-                            params=self._params(page))
+                            params=self._params(page), cache_ttl=self.__api_cache_ttl__)
             resp.raise_for_status()
             posts = xmltodict.parse(resp.text)['posts']['tag']
 
@@ -77,7 +77,7 @@ class BasePixivSource(WebDataSource):
             filename = urlsplit(zip_url).filename
             frame_zip = os.path.join(td, filename)
             try:
-                self._rate_limiter().try_acquire(filename)
+                self._rate_limiter().acquire()
                 download_file(
                     zip_url, frame_zip, desc=filename,
                     session=self.session, silent=self.download_silent
@@ -6,6 +6,7 @@ from typing import Optional, Iterator, List, Tuple, Union
 from hbutils.system import urlsplit
 
 from .web import NoURL, WebDataSource
+from ..model import PostMeta
 from ..utils import get_requests_session, srequest
 
 
@@ -50,6 +51,8 @@ def _tags_by_kwargs(**kwargs):
 
 
 class SankakuSource(WebDataSource):
+    __api_cache_ttl__ = 1800
+
     def __init__(self, tags: List[str], order: Optional[PostOrder] = None,
                  rating: Optional[Rating] = None, file_type: Optional[FileType] = None,
                  date: Optional[Tuple[datetime.datetime, datetime.datetime]] = None,
@@ -95,6 +98,25 @@ class SankakuSource(WebDataSource):
         else:
             raise NoURL
 
+    def _content_md5(self, url: str, meta: dict) -> Optional[str]:
+        data = meta['sankaku']
+        return data.get('md5') if url == data.get('file_url') else None
+
+    def _preview_url(self, url: str, meta: dict) -> Optional[str]:
+        data = meta['sankaku']
+        return self._smallest_variant(
+            (data.get(url_name), data.get(width_name), data.get(height_name))
+            for url_name, width_name, height_name in self._FILE_URLS if url_name != 'file_url'
+        )
+
+    def _post_meta(self, data: dict) -> Optional[PostMeta]:
+        tags, file_url = data.get('tags'), data.get('file_url')
+        return PostMeta.create(
+            width=data.get('width'), height=data.get('height'), rating=data.get('rating'),
+            tags=[t_item['name'] for t_item in tags] if isinstance(tags, list) else None,
+            file_ext=urlsplit(file_url).filename if file_url else None,
+        )
+
     def _login(self):
         if self.access_token:
             self.auth_session.headers.update({
@@ -109,9 +131,7 @@ class SankakuSource(WebDataSource):
                 "Authorization": f"{login_data['token_type']} {login_data['access_token']}",
             })
 
-    def _iter_data(self) -> Iterator[Tuple[Union[str, int], str, dict]]:
-        self._login()
-
+    def _iter_pages(self) -> Iterator[List[dict]]:
         page = 1
         while True:
             resp = srequest(self.auth_session, 'GET', 'https://capi-v2.sankakucomplex.com/posts', params={
@@ -119,12 +139,21 @@ class SankakuSource(WebDataSource):
                 'page': str(page),
                 'limit': '100',
                 'tags': ' '.join(self.tags),
-            })
+            }, cache_ttl=self.__api_cache_ttl__)
             resp.raise_for_status()
             if not resp.json():
                 break
 
-            for data in resp.json():
+            yield resp.json()
+            page += 1
+
+    def _iter_data(self) -> Iterator[Tuple[Union[str, int], str, dict]]:
+        self._login()
+
+        for page_items in self._prefetch_pages(self._iter_pages()):
+            for data in page_items:
+                if not self._accept_post(data):
+                    continue
                 try:
                     url = self._select_url(data)
                 except NoURL:
@@ -139,5 +168,3 @@ class SankakuSource(WebDataSource):
                     'tags': {key: 1.0 for key in [t_item['name'] for t_item in data['tags']]}
                 }
                 yield data["id"], url, meta
-
-            page += 1
@@ -44,6 +44,8 @@ SelectTyping = Literal['original', 'thumbnail']
 
 
 class WallHavenSource(WebDataSource):
+    __api_cache_ttl__ = 3600
+
     def __init__(self, query: str, category: Category = Category.DEFAULT,
                  purity: Purity = Purity.DEFAULT, sorting: SortingTyping = 'relavance',
                  no_ai: bool = True, min_size: Tuple[int, int] = (1, 1),
@@ -84,7 +86,7 @@ class WallHavenSource(WebDataSource):
                 'ai_art_filter': "1" if self.no_ai else "0",
                 'atleast': f'{self.min_size[0]}x{self.min_size[1]}',
                 'page': str(page),
-            })
+            }, cache_ttl=self.__api_cache_ttl__)
             raw = resp.json()
             if not raw or not raw['data']:
                 break
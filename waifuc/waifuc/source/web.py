@@ -1,18 +1,27 @@
+import asyncio
 import logging
-import math
 import os
+import threading
 import warnings
-from typing import Iterator, Tuple, Union
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Iterator, Iterable, Tuple, Union, Optional, Deque, TypeVar, Dict
 
 import httpx
 from PIL import UnidentifiedImageError, Image
 from PIL.Image import DecompressionBombError
-from hbutils.system import urlsplit, TemporaryDirectory
-from pyrate_limiter import Rate, Duration, Limiter
+from hbutils.system import urlsplit
 
 from .base import NamedDataSource
-from ..model import ImageItem
-from ..utils import get_requests_session, download_file, get_random_ua, get_file_type
+from ..action import BaseAction, FilterAction
+from ..model import ImageItem, PostMeta
+from ..utils import get_requests_session, download_buffer, async_download_buffer, DownloadBuffer, get_random_ua, \
+    get_file_type, DownloadCache, get_download_cache, prefetch_iter, AdaptiveRateLimiter, get_rate_limiter
+from ..utils.download import DEFAULT_SPILL_SIZE
+from ..utils.session import DEFAULT_TIMEOUT
+
+T = TypeVar('T')
 
 
 class NoURL(Exception):
@@ -22,6 +31,24 @@ class NoURL(Exception):
 class WebDataSource(NamedDataSource):
     __download_rate_limit__: int = 1
     __download_rate_interval__: float = 1
+    # Downloads kept in flight at once by _iter, 1 downloads one URL at a time on the calling thread.
+    download_concurrency: int = 1
+    # Yield the downloaded items in the order of _iter_data, otherwise in the order they complete.
+    download_ordered: bool = True
+    # Attempts again a download the site throttles (429/503), after the wait imposed by the rate limiter.
+    download_throttle_retries: int = 3
+    # Downloads larger than this many bytes are moved from memory to a temporary file, e.g. videos.
+    download_spill_size: int = DEFAULT_SPILL_SIZE
+    # API pages fetched ahead on a background thread while the items of the current one are downloaded.
+    page_prefetch: int = 0
+    # Seconds the API responses (listing pages) of the source stay in the HTTP cache, None to never cache them.
+    __api_cache_ttl__: Optional[float] = None
+    # Filters checked against the metadata of the posts before downloading them, see pushdown.
+    post_filters: Tuple[FilterAction, ...] = ()
+    # Posts skipped by post_filters so far.
+    posts_skipped: int = 0
+    # Shorter side of the variants downloaded in place of the originals, None to download the originals, see preview_first.
+    preview_size: Optional[int] = None
 
     def __init__(self, group_name: str, session: httpx.Client = None, download_silent: bool = True):
         self.download_silent = download_silent
@@ -29,89 +56,429 @@ class WebDataSource(NamedDataSource):
         self.group_name = group_name
 
     @classmethod
-    def _rate_limiter(cls) -> Limiter:
-        if not hasattr(cls, '_rate_limit'):
-            if not os.environ.get('SHOW_RATE_LIMIT_LOG'):
-                logger = logging.getLogger("pyrate_limiter")
-                logger.disabled = True
+    def _rate_limiter(cls) -> AdaptiveRateLimiter:
+        # the rate of the class is the ceiling, shared by all the sources of the class on the host
+        return get_rate_limiter(f'{cls.__module__}.{cls.__qualname__}',
+                                cls.__download_rate_limit__ / cls.__download_rate_interval__)
+
+    def concurrent_download(self, concurrency: int, ordered: bool = True) -> 'WebDataSource':
+        """
+        Keep several downloads in flight on an :class:`httpx.AsyncClient`, while the items already
+        downloaded are decoded and processed downstream. The rate limit of the class still applies.
+
+        :param concurrency: Downloads in flight at once, 1 downloads one URL at a time.
+        :param ordered: Yield the items in the order of the listing, otherwise as soon as they are downloaded.
+        :return: The source itself.
+        """
+        self.download_concurrency = max(1, int(concurrency))
+        self.download_ordered = ordered
+        return self
+
+    def prefetch_pages(self, count: int) -> 'WebDataSource':
+        """
+        Fetch the next API pages of the listing on a background thread, so the downloads do not stall
+        on a listing request at every page boundary. Only the sources paging through ``_iter_pages`` use it.
+
+        :param count: Pages kept ready ahead of the current one, 0 fetches every page when it is reached.
+        :return: The source itself.
+        """
+        self.page_prefetch = max(0, int(count))
+        return self
+
+    def _prefetch_pages(self, pages: Iterator[T]) -> Iterator[T]:
+        if self.page_prefetch > 0:
+            return prefetch_iter(pages, self.page_prefetch, name=f'waifuc_pages_{self.group_name}')
+        else:
+            return pages
+
+    def pushdown(self, *filters: BaseAction) -> 'WebDataSource':
+        """
+        Check every post against the metadata predicates (:meth:`FilterAction.check_post`) of ``filters``
+        before downloading it, and skip the posts they would surely drop. The filters still have to run on
+        the downloaded items, the other actions are ignored. The skipped posts are counted in ``posts_skipped``.
+
+        :param filters: The filters at the head of the pipeline.
+        :return: The source itself.
+        """
+        self.post_filters = tuple(f for f in filters if isinstance(f, FilterAction) and f.pushdownable)
+        return self
+
+    def _post_meta(self, data: dict) -> Optional[PostMeta]:
+        """
+        Metadata of a post as returned by the API of the site, ``None`` when the source cannot tell.
+        """
+        return None
 
-            rate = Rate(cls.__download_rate_limit__, int(math.ceil(Duration.SECOND * cls.__download_rate_interval__)))
-            limiter = Limiter(rate, max_delay=1 << 32)
-            setattr(cls, '_rate_limit', limiter)
+    def _accept_post(self, data: dict) -> bool:
+        if self.post_filters:
+            post = self._post_meta(data)
+            if post is not None and not all(f.check_post(post) for f in self.post_filters):
+                self.posts_skipped += 1
+                return False
+        return True
 
-        return getattr(cls, '_rate_limit')
+    def preview_first(self, size: Optional[int] = 512) -> 'WebDataSource':
+        """
+        Download a smaller variant of the posts (e.g. the sample of a booru post) in place of the original,
+        so that filters can screen the posts before their originals are downloaded by the action of
+        :meth:`fetch_originals`. Posts without a variant of at least ``size`` pixels on the shorter side
+        are downloaded in full directly. Only the sources implementing ``_preview_url`` use it.
+
+        :param size: Shorter side the variants need at least, ``None`` to download the originals directly.
+        :return: The source itself.
+        """
+        self.preview_size = size
+        return self
+
+    def fetch_originals(self) -> 'OriginalFetchAction':
+        """
+        Action replacing the previews yielded in :meth:`preview_first` mode with their originals.
+        """
+        return OriginalFetchAction(self)
+
+    def _preview_url(self, url: str, meta: dict) -> Optional[str]:
+        """
+        URL of a variant of the post at ``url`` whose shorter side is at least ``preview_size``, ``None`` when there is none.
+        """
+        return None
+
+    def _smallest_variant(self, variants: Iterable[Tuple[Optional[str], Optional[int], Optional[int]]]) -> Optional[str]:
+        f_url, f_area = None, None
+        for url, width, height in variants:
+            if url and width and height and min(width, height) >= self.preview_size:
+                if f_url is None or width * height < f_area:
+                    f_url, f_area = url, width * height
+        return f_url
+
+    def _iter_posts(self) -> Iterator[Tuple[Union[str, int], Union[str, Image.Image], dict]]:
+        for id_, url, meta in self._iter_data():
+            if self.preview_size is not None and not isinstance(url, Image.Image):
+                preview_url = self._preview_url(url, meta)
+                if preview_url and preview_url != url:
+                    yield id_, preview_url, {**meta, 'original': {'id': id_, 'url': url, 'source': id(self)}}
+                    continue
+            yield id_, url, meta
+
+    def _async_client(self) -> httpx.AsyncClient:
+        session = self.session
+        if isinstance(session, httpx.Client):
+            return httpx.AsyncClient(
+                http2=True, headers=session.headers, cookies=session.cookies,
+                timeout=session.timeout, follow_redirects=session.follow_redirects,
+            )
+        else:
+            return httpx.AsyncClient(
+                http2=True, headers=dict(session.headers), cookies=session.cookies,
+                timeout=DEFAULT_TIMEOUT, follow_redirects=True,
+            )
 
     def _iter_data(self) -> Iterator[Tuple[Union[str, int], Union[str, Image.Image], dict]]:
         raise NotImplementedError  # pragma: no cover
 
-    def _iter(self) -> Iterator[ImageItem]:
-        for id_, url, meta in self._iter_data():
-            if isinstance(url, Image.Image):
-                meta = dict(meta)
-                if 'url' not in meta:
-                    meta = {**meta, 'url': None}
-                yield ImageItem(url, meta)
+    @staticmethod
+    def _image_item(image: Image.Image, meta: dict) -> ImageItem:
+        meta = dict(meta)
+        if 'url' not in meta:
+            meta = {**meta, 'url': None}
+        return ImageItem(image, meta)
+
+    def _filename(self, id_, url: str) -> str:
+        _, ext_name = os.path.splitext(urlsplit(url).filename)
+        return f'{self.group_name}_{id_}{ext_name}'
+
+    def _content_md5(self, url: str, meta: dict) -> Optional[str]:
+        """
+        md5 of the file at ``url`` when the site provides it, used to address and verify the download cache.
+        """
+        return None
+
+    def _cache_entry(self, cache: DownloadCache, id_, url: str, meta: dict) -> Tuple[str, Optional[str]]:
+        md5 = self._content_md5(url, meta)
+        return cache.make_key(self.group_name, id_, url, md5), md5
+
+    def _cache_store(self, cache: DownloadCache, key: str, md5: Optional[str], id_, buffer: DownloadBuffer):
+        if cache.max_size is not None and buffer.size > cache.max_size:
+            return
+        if not cache.put(key, buffer.getvalue() if buffer.in_memory else buffer.filename, md5):
+            warnings.warn(f'{self.group_name.capitalize()} resource {id_} does not match its md5, not cached.')
+
+    def _iter_buffer(self, id_, url: str, meta: dict, filename: str, buffer: DownloadBuffer) -> Iterator[ImageItem]:
+        try:
+            file_type = get_file_type(buffer.head())
+        except OSError as err:
+            warnings.warn(f'Skipped due to IO error: {err!r}')
+            return
+        if file_type == 'image':
+            try:
+                with buffer.open() as f:
+                    image = Image.open(f)
+                    image.load()
+            except UnidentifiedImageError:
+                warnings.warn(
+                    f'{self.group_name.capitalize()} resource {id_} unidentified as image, skipped.')
+                return
+            except (IOError, DecompressionBombError) as err:
+                warnings.warn(f'Skipped due to IO error: {err!r}')
+                return
+
+            meta = {**meta, 'url': url}
+            yield ImageItem(image, meta)
+
+        elif file_type == 'video':
+            from .video import _VIDEO_EXTRACT_AVAILABLE, VideoSource
+            if _VIDEO_EXTRACT_AVAILABLE:
+                logging.info(f'{self.group_name.capitalize()} resource {id_} '
+                             f'file {filename!r}\'s type is a {file_type} file, '
+                             f'extracting images from it.')
+                for item in VideoSource(buffer.as_file()):
+                    v_time = item.meta['time']
+                    v_index = item.meta['index']
+                    i_meta = {**meta, 'time': v_time, 'index': v_index, 'url': url}
+                    if 'filename' in i_meta:
+                        fn, fext = os.path.splitext(i_meta['filename'])
+                        i_meta['filename'] = f'{fn}_keyframe_{v_index}.png'
+                    yield ImageItem(item.image, i_meta)
 
             else:
-                with TemporaryDirectory(ignore_cleanup_errors=True) as td:
-                    _, ext_name = os.path.splitext(urlsplit(url).filename)
-                    filename = f'{self.group_name}_{id_}{ext_name}'
-                    td_file = os.path.join(td, filename)
+                warnings.warn(f'{self.group_name.capitalize()} resource {id_} '
+                              f'file {filename!r}\'s type is a {file_type} file, '
+                              f'but video file is not supported for pyav library is not yet installed, '
+                              f'skipped.')
 
-                    try:
-                        self._rate_limiter().try_acquire(filename)
-                        download_file(
-                            url, td_file, desc=filename,
-                            session=self.session, silent=self.download_silent
-                        )
-                    except httpx.HTTPError as err:
-                        warnings.warn(f'Skipped due to download error: {err!r}')
-                        continue
+        elif file_type:
+            warnings.warn(f'{self.group_name.capitalize()} resource {id_} '
+                          f'file {filename!r}\'s type is a {file_type} file, skipped.')
+
+        else:
+            warnings.warn(f'{self.group_name.capitalize()} resource {id_} '
+                          f'file {filename!r}\'s type is unknown, skipped.')
+
+    def _iter_url(self, id_, url: str, meta: dict) -> Iterator[ImageItem]:
+        filename = self._filename(id_, url)
+        cache = get_download_cache()
+        if cache is not None:
+            key, md5 = self._cache_entry(cache, id_, url, meta)
+            cached_file = cache.get(key, pin=True)
+            if cached_file is not None:
+                try:
+                    yield from self._iter_buffer(id_, url, meta, filename, DownloadBuffer(filename=cached_file))
+                finally:
+                    cache.unpin(key)
+                return
+
+        limiter = self._rate_limiter()
+        for attempt in range(self.download_throttle_retries + 1):
+            limiter.acquire()
+            try:
+                buffer = download_buffer(
+                    url, desc=filename, session=self.session,
+                    silent=self.download_silent, spill_size=self.download_spill_size,
+                )
+            except httpx.HTTPStatusError as err:
+                if limiter.feedback(err.response) and attempt < self.download_throttle_retries:
+                    continue
+                warnings.warn(f'Skipped due to download error: {err!r}')
+                return
+            except httpx.HTTPError as err:
+                warnings.warn(f'Skipped due to download error: {err!r}')
+                return
+            else:
+                limiter.success()
+                break
+
+        with buffer:
+            if cache is not None:
+                self._cache_store(cache, key, md5, id_, buffer)
+            yield from self._iter_buffer(id_, url, meta, filename, buffer)
+
+    def _iter_sequential(self) -> Iterator[ImageItem]:
+        for id_, url, meta in self._iter_posts():
+            if isinstance(url, Image.Image):
+                yield self._image_item(url, meta)
+            else:
+                yield from self._iter_url(id_, url, meta)
+
+    async def _download(self, client: httpx.AsyncClient, url: str, filename: str) -> DownloadBuffer:
+        limiter = self._rate_limiter()
+        for attempt in range(self.download_throttle_retries + 1):
+            # take the slot at once and wait for it on the loop, the other downloads keep going
+            await asyncio.sleep(max(0.0, limiter.reserve()))
+            try:
+                buffer = await async_download_buffer(client, url, desc=filename, silent=self.download_silent,
+                                                     spill_size=self.download_spill_size)
+            except httpx.HTTPStatusError as err:
+                if limiter.feedback(err.response) and attempt < self.download_throttle_retries:
+                    continue
+                raise
+            limiter.success()
+            return buffer
+
+    def _pop_download(self, window: Deque['_Download']) -> '_Download':
+        if not self.download_ordered:
+            futures = [download.future for download in window if download.future is not None]
+            if len(futures) == len(window):
+                wait(futures, return_when=FIRST_COMPLETED)
+            for i, download in enumerate(window):
+                if download.future is None or download.future.done():
+                    del window[i]
+                    return download
+
+        return window.popleft()
 
-                    file_type = get_file_type(td_file)
-                    if file_type == 'image':
+    def _iter_concurrent(self) -> Iterator[ImageItem]:
+        data = iter(self._iter_posts())
+        cache = get_download_cache()
+        window: Deque[_Download] = deque()
+        try:
+            with _DownloadLoop(self._async_client()) as loop:
+                while True:
+                    while len(window) < self.download_concurrency:
                         try:
-                            image = Image.open(td_file)
-                            image.load()
-                        except UnidentifiedImageError:
-                            warnings.warn(
-                                f'{self.group_name.capitalize()} resource {id_} unidentified as image, skipped.')
+                            id_, url, meta = next(data)
+                        except StopIteration:
+                            break
+
+                        if isinstance(url, Image.Image):
+                            window.append(_Download(id_, url, meta))
                             continue
-                        except (IOError, DecompressionBombError) as err:
-                            warnings.warn(f'Skipped due to IO error: {err!r}')
+
+                        filename = self._filename(id_, url)
+                        key, md5 = self._cache_entry(cache, id_, url, meta) if cache is not None else (None, None)
+                        # a hit stays pinned until it is consumed, downloads stored meanwhile must not evict it
+                        cached_file = cache.get(key, pin=True) if cache is not None else None
+                        if cached_file is not None:
+                            window.append(_Download(id_, url, meta, filename, DownloadBuffer(filename=cached_file),
+                                                    pinned_key=key))
+                        else:
+                            future = loop.submit(self._download(loop.client, url, filename))
+                            window.append(_Download(id_, url, meta, filename, None, future, key, md5))
+
+                    if not window:
+                        break
+
+                    download = self._pop_download(window)
+                    if download.future is None and download.buffer is None:
+                        yield self._image_item(download.url, download.meta)
+                        continue
+
+                    if download.future is not None:
+                        try:
+                            download.buffer = download.future.result()
+                        except httpx.HTTPError as err:
+                            warnings.warn(f'Skipped due to download error: {err!r}')
                             continue
+                        if download.cache_key is not None:
+                            self._cache_store(cache, download.cache_key, download.md5, download.id_, download.buffer)
 
-                        meta = {**meta, 'url': url}
-                        yield ImageItem(image, meta)
-
-                    elif file_type == 'video':
-                        from .video import _VIDEO_EXTRACT_AVAILABLE, VideoSource
-                        if _VIDEO_EXTRACT_AVAILABLE:
-                            logging.info(f'{self.group_name.capitalize()} resource {id_} '
-                                         f'file {filename!r}\'s type is a {file_type} file, '
-                                         f'extracting images from it.')
-                            for item in VideoSource(td_file):
-                                v_time = item.meta['time']
-                                v_index = item.meta['index']
-                                i_meta = {**meta, 'time': v_time, 'index': v_index, 'url': url}
-                                if 'filename' in i_meta:
-                                    fn, fext = os.path.splitext(i_meta['filename'])
-                                    i_meta['filename'] = f'{fn}_keyframe_{v_index}.png'
-                                yield ImageItem(item.image, i_meta)
+                    try:
+                        with download.buffer:
+                            yield from self._iter_buffer(download.id_, download.url, download.meta,
+                                                         download.filename, download.buffer)
+                    finally:
+                        if download.pinned_key is not None:
+                            cache.unpin(download.pinned_key)
+        finally:
+            for download in window:
+                if download.pinned_key is not None:
+                    cache.unpin(download.pinned_key)
+                if download.future is not None and not download.future.cancelled() and \
+                        download.future.done() and download.future.exception() is None:
+                    download.future.result().close()
+            close = getattr(data, 'close', None)
+            if close is not None:
+                close()
 
-                        else:
-                            warnings.warn(f'{self.group_name.capitalize()} resource {id_} '
-                                          f'file {filename!r}\'s type is a {file_type} file, '
-                                          f'but video file is not supported for pyav library is not yet installed, '
-                                          f'skipped.')
+    def _iter(self) -> Iterator[ImageItem]:
+        if self.download_concurrency > 1:
+            yield from self._iter_concurrent()
+        else:
+            yield from self._iter_sequential()
+
+
+class OriginalFetchAction(BaseAction):
+    """
+    Replace the previews yielded by :class:`WebDataSource` objects in :meth:`WebDataSource.preview_first` mode
+    with their originals, downloaded like their source does, the other items pass through. The originals
+    keep the meta of the previews, with the URL of the preview in ``preview_url``.
+
+    Only filters should run between the sources and this action, what the other actions do to
+    the previews is lost with them.
+
+    :param sources: The sources of the previews, more can be added with :meth:`add_source`.
+    """
+    _shared_attrs = ('sources',)
+
+    def __init__(self, *sources: WebDataSource):
+        self.sources: Dict[int, WebDataSource] = {}
+        for source in sources:
+            self.add_source(source)
+
+    def add_source(self, source: WebDataSource) -> 'OriginalFetchAction':
+        """
+        Also fetch the originals of the previews of ``source``, e.g. a site source built later by a composed source.
+        """
+        self.sources[id(source)] = source
+        return self
+
+    def iter(self, item: ImageItem) -> Iterator[ImageItem]:
+        original = item.meta.get('original')
+        if original is None:
+            yield item
+        else:
+            meta = {key: value for key, value in item.meta.items() if key != 'original'}
+            meta['preview_url'] = meta.pop('url', None)
+            source = self.sources[original['source']]
+            yield from source._iter_url(original['id'], original['url'], meta)
+
+    def reset(self):
+        pass
+
+
+@dataclass
+class _Download:
+    id_: Union[str, int]
+    url: Union[str, Image.Image]
+    meta: dict
+    filename: Optional[str] = None
+    buffer: Optional[DownloadBuffer] = None
+    future: Optional[Future] = None
+    cache_key: Optional[str] = None
+    md5: Optional[str] = None
+    pinned_key: Optional[str] = None
+
+
+class _DownloadLoop:
+    """
+    Event loop on a thread of its own, running the downloads of :meth:`WebDataSource._iter_concurrent`
+    while the calling thread consumes the results.
+    """
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='waifuc_download', daemon=True)
+
+    def submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _shutdown(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.client.aclose()
 
-                    elif file_type:
-                        warnings.warn(f'{self.group_name.capitalize()} resource {id_} '
-                                      f'file {filename!r}\'s type is a {file_type} file, skipped.')
+    def __enter__(self):
+        self.thread.start()
+        return self
 
-                    else:
-                        warnings.warn(f'{self.group_name.capitalize()} resource {id_} '
-                                      f'file {filename!r}\'s type is unknown, skipped.')
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.submit(self._shutdown()).result()
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
 
 
 class WebPlusDataSource(WebDataSource):
@@ -123,7 +490,7 @@ class WebPlusDataSource(WebDataSource):
 
     def _prune_session(self):
         while True:
-            self._rate_limiter().try_acquire('_prune_session_')
+            self._rate_limiter().acquire()
             self._refresh_session()
             if self._check_session():
                 return
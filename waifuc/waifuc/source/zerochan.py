@@ -8,6 +8,7 @@ from urllib.parse import quote_plus, urljoin
 from hbutils.system import urlsplit
 
 from .web import WebDataSource, DynamicUAWebDataSource
+from ..model import PostMeta
 from ..utils import get_requests_session, srequest
 
 
@@ -35,6 +36,7 @@ SelectTyping = Literal['medium', 'large', 'full']
 
 class ZerochanSource(DynamicUAWebDataSource):
     __SITE__ = 'https://www.zerochan.net'
+    __api_cache_ttl__ = 3600
 
     def __init__(self, word: Union[str, List[str]], sort: Sort = Sort.FAV, time: Time = Time.ALL,
                  dimension: Optional[Dimension] = None, color: Optional[str] = None, strict: bool = False,
@@ -116,7 +118,7 @@ class ZerochanSource(DynamicUAWebDataSource):
         id_ = data['id']
         resp = srequest(
             self.session, 'GET', f'https://www.zerochan.net/{id_}',
-            params={'json': '1'},
+            params={'json': '1'}, cache_ttl=self.__api_cache_ttl__, cache_identity=self.username,
         )
         json_data = resp.json()
         return [
@@ -126,6 +128,11 @@ class ZerochanSource(DynamicUAWebDataSource):
             ('small', json_data['small']),
         ]
 
+    def _post_meta(self, data: dict) -> Optional[PostMeta]:
+        tags = data.get('tags')
+        return PostMeta.create(width=data.get('width'), height=data.get('height'),
+                               tags=tags if isinstance(tags, list) else None)
+
     def _get_url(self, data):
         urls = self._get_urls(data)
         urls_dict = dict(urls)
@@ -157,8 +164,7 @@ class ZerochanSource(DynamicUAWebDataSource):
         resp = srequest(self.session, 'GET', f'{self.__SITE__}/?json', raise_for_status=False)
         return resp.status_code // 100 == 2
 
-    def _iter_data(self) -> Iterator[Tuple[Union[str, int], str, dict]]:
-        self._auth()
+    def _iter_pages(self) -> Iterator[List[dict]]:
         page = 1
         while True:
             quit_ = False
@@ -166,7 +172,8 @@ class ZerochanSource(DynamicUAWebDataSource):
             while True:
                 resp = srequest(self.session, 'GET', _base_url,
                                 params={**self._params, 'p': str(page), 'l': '200'},
-                                follow_redirects=False, raise_for_status=False)
+                                follow_redirects=False, raise_for_status=False,
+                                cache_ttl=self.__api_cache_ttl__, cache_identity=self.username)
                 if resp.status_code // 100 == 3:
                     _base_url = urljoin(_base_url, resp.headers['Location'])
                 elif resp.status_code in {403, 404}:
@@ -181,26 +188,33 @@ class ZerochanSource(DynamicUAWebDataSource):
 
             json_ = resp.json()
             if 'items' in json_:
-                items = json_['items']
-                for data in items:
-                    try:
-                        url = self._get_url(data)
-                    except json.JSONDecodeError as err:
-                        warnings.warn(f'API of {self.__SITE__} died again, skipped! Error: {err!r}')
-                        continue
-
-                    _, ext_name = os.path.splitext(urlsplit(url).filename)
-                    filename = f'{self.group_name}_{data["id"]}{ext_name}'
-                    meta = {
-                        'zerochan': {
-                            **data,
-                            'url': url,
-                        },
-                        'group_id': f'{self.group_name}_{data["id"]}',
-                        'filename': filename,
-                    }
-                    yield data["id"], url, meta
+                yield json_['items']
             else:
                 break
 
             page += 1
+
+    def _iter_data(self) -> Iterator[Tuple[Union[str, int], str, dict]]:
+        self._auth()
+        for items in self._prefetch_pages(self._iter_pages()):
+            for data in items:
+                # before _get_url, which costs a request per post
+                if not self._accept_post(data):
+                    continue
+                try:
+                    url = self._get_url(data)
+                except json.JSONDecodeError as err:
+                    warnings.warn(f'API of {self.__SITE__} died again, skipped! Error: {err!r}')
+                    continue
+
+                _, ext_name = os.path.splitext(urlsplit(url).filename)
+                filename = f'{self.group_name}_{data["id"]}{ext_name}'
+                meta = {
+                    'zerochan': {
+                        **data,
+                        'url': url,
+                    },
+                    'group_id': f'{self.group_name}_{data["id"]}',
+                    'filename': filename,
+                }
+                yield data["id"], url, meta
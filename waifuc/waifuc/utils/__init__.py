@@ -1,6 +1,11 @@
-from .context import task_ctx, get_task_names
-from .download import download_file
+from .clone import Cloneable
+from .context import task_ctx, task_names_ctx, get_task_names
+from .download import download_file, download_buffer, async_download_buffer, DownloadBuffer
+from .download_cache import DownloadCache, set_download_cache, get_download_cache
 from .filetype import get_file_type
+from .http_cache import HTTPCache, set_http_cache, get_http_cache
 from .named import NamedObject
+from .prefetch import prefetch_iter
+from .rate_limit import AdaptiveRateLimiter, get_rate_limiter, set_rate_limit_dir, retry_after
 from .session import get_requests_session, srequest, get_random_ua
 from .tqdm_ import tqdm
@@ -0,0 +1,37 @@
+import copy
+from typing import Tuple, Iterator
+
+
+class Cloneable:
+    """
+    Objects copied before every run (actions and exporters).
+
+    Subclasses list the attributes holding shared, read-only state (model handles, configuration,
+    data sources) in ``_shared_attrs``. :meth:`clone` (and :func:`copy.deepcopy`) keeps those by
+    reference and deep-copies only the rest, which is the per-run mutable state. The declarations
+    of all base classes are merged, and they also apply when the object is nested in another one,
+    e.g. a member of a :class:`waifuc.action.FusedAction`.
+    """
+    _shared_attrs: Tuple[str, ...] = ()
+
+    def _iter_shared_attrs(self) -> Iterator[str]:
+        for cls in type(self).__mro__:
+            yield from cls.__dict__.get('_shared_attrs', ())
+
+    def clone(self):
+        return copy.deepcopy(self)
+
+    def __deepcopy__(self, memo):
+        for name in self._iter_shared_attrs():
+            if name in self.__dict__:
+                value = self.__dict__[name]
+                memo.setdefault(id(value), value)
+
+        cls = type(self)
+        new = cls.__new__(cls)
+        memo[id(self)] = new
+        if hasattr(cls, '__setstate__'):
+            new.__setstate__(copy.deepcopy(self.__getstate__(), memo))
+        else:
+            new.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        return new
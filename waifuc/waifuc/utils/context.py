@@ -17,6 +17,13 @@ def task_ctx(name: Optional[str]):
         yield
 
 
+@contextmanager
+def task_names_ctx(names: Tuple[str, ...]):
+    """Enter the full task name chain, e.g. one captured with :func:`get_task_names` on another thread."""
+    with context().vars(**{WAIFUC_TASK_NAME: tuple(names)}):
+        yield
+
+
 def get_task_names() -> Tuple[str, ...]:
     ctx = context()
     names = tuple(ctx.get(WAIFUC_TASK_NAME, None) or ())
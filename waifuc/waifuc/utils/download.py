@@ -1,6 +1,8 @@
+import io
 import os
+import tempfile
 from contextlib import contextmanager
-from typing import Union
+from typing import Union, Optional, BinaryIO
 
 import httpx
 import requests
@@ -9,6 +11,9 @@ from tqdm.auto import tqdm
 from .session import get_requests_session
 from .tqdm_ import tqdm
 
+DEFAULT_CHUNK_SIZE = 1 << 16
+DEFAULT_SPILL_SIZE = 32 * 1024 ** 2
+
 
 @contextmanager
 def _get_stream(session: Union[httpx.Client, requests.Session], url, **kwargs):
@@ -20,13 +25,24 @@ def _get_stream(session: Union[httpx.Client, requests.Session], url, **kwargs):
         yield response
 
 
-def download_file(url, filename, expected_size: int = None, desc=None, session=None, silent: bool = False, **kwargs):
+def _expected_size(response: Union[httpx.Response, requests.Response], expected_size: Optional[int]):
+    expected_size = expected_size or response.headers.get('Content-Length', None)
+    return int(expected_size) if expected_size is not None else expected_size
+
+
+def _check_size(expected_size: Optional[int], actual_size: int):
+    if expected_size is not None and actual_size != expected_size:
+        raise httpx.HTTPError(f"Downloaded file is not of expected size, "
+                              f"{expected_size} expected but {actual_size} found.")
+
+
+def download_file(url, filename, expected_size: int = None, desc=None, session=None, silent: bool = False,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, **kwargs):
     session = session or get_requests_session()
     with _get_stream(session, url, **kwargs) as response:
         response: Union[httpx.Response, requests.Response]
         response.raise_for_status()
-        expected_size = expected_size or response.headers.get('Content-Length', None)
-        expected_size = int(expected_size) if expected_size is not None else expected_size
+        expected_size = _expected_size(response, expected_size)
 
         desc = desc or os.path.basename(filename)
         directory = os.path.dirname(filename)
@@ -37,18 +53,156 @@ def download_file(url, filename, expected_size: int = None, desc=None, session=N
             with tqdm(total=expected_size, unit='B', unit_scale=True,
                       unit_divisor=1024, desc=desc, silent=silent) as pbar:
                 if isinstance(response, httpx.Response):
-                    for chunk in response.iter_bytes(chunk_size=1024):
+                    for chunk in response.iter_bytes(chunk_size=chunk_size):
                         f.write(chunk)
                         pbar.update(len(chunk))
                 else:
-                    for chunk in response.iter_content(chunk_size=1024):
+                    for chunk in response.iter_content(chunk_size=chunk_size):
                         f.write(chunk)
                         pbar.update(len(chunk))
 
         actual_size = os.path.getsize(filename)
         if expected_size is not None and actual_size != expected_size:
             os.remove(filename)
-            raise httpx.HTTPError(f"Downloaded file is not of expected size, "
-                                  f"{expected_size} expected but {actual_size} found.")
+        _check_size(expected_size, actual_size)
 
         return filename
+
+
+class DownloadBuffer:
+    """
+    Content of a download, kept in memory and spilled to a temporary file once it grows over
+    ``spill_size`` bytes (e.g. videos). It can also wrap an existing file, which is never deleted.
+
+    :param spill_size: Size in bytes above which the content is moved to a temporary file.
+    :param filename: Existing file to wrap instead of collecting a download.
+    """
+
+    def __init__(self, spill_size: int = DEFAULT_SPILL_SIZE, filename: Optional[str] = None):
+        self.spill_size = spill_size
+        self.filename = filename
+        self.size = os.path.getsize(filename) if filename else 0
+        self._memory: Optional[io.BytesIO] = None if filename else io.BytesIO()
+        self._file: Optional[BinaryIO] = None
+        self._owned = filename is None
+
+    def _spill(self):
+        fd, self.filename = tempfile.mkstemp(prefix='waifuc_download_')
+        self._file = os.fdopen(fd, 'wb')
+        self._file.write(self._memory.getbuffer())
+        self._memory = None
+
+    def write(self, chunk: bytes):
+        if self._memory is not None and self.size + len(chunk) > self.spill_size:
+            self._spill()
+        (self._file or self._memory).write(chunk)
+        self.size += len(chunk)
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def in_memory(self) -> bool:
+        return self._memory is not None
+
+    def getvalue(self) -> bytes:
+        if self._memory is not None:
+            return self._memory.getvalue()
+        else:
+            with open(self.filename, 'rb') as f:
+                return f.read()
+
+    def head(self, size: int = 8192) -> bytes:
+        if self._memory is not None:
+            return self._memory.getbuffer()[:size].tobytes()
+        else:
+            with open(self.filename, 'rb') as f:
+                return f.read(size)
+
+    def open(self) -> BinaryIO:
+        if self._memory is not None:
+            return io.BytesIO(self._memory.getbuffer())
+        else:
+            return open(self.filename, 'rb')
+
+    def as_file(self) -> str:
+        """
+        Path of a file with the content, spilling the buffer when it is still in memory.
+        """
+        if self._memory is not None:
+            self._spill()
+            self.finish()
+        return self.filename
+
+    def close(self):
+        self.finish()
+        self._memory = None
+        if self._owned and self.filename and os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def download_buffer(url, expected_size: int = None, desc=None, session=None, silent: bool = False,
+                    spill_size: int = DEFAULT_SPILL_SIZE, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    **kwargs) -> DownloadBuffer:
+    """
+    Version of :func:`download_file` collecting the content into a :class:`DownloadBuffer` instead of a file.
+    """
+    session = session or get_requests_session()
+    buffer = DownloadBuffer(spill_size)
+    try:
+        with _get_stream(session, url, **kwargs) as response:
+            response: Union[httpx.Response, requests.Response]
+            response.raise_for_status()
+            expected_size = _expected_size(response, expected_size)
+            with tqdm(total=expected_size, unit='B', unit_scale=True,
+                      unit_divisor=1024, desc=desc, silent=silent) as pbar:
+                if isinstance(response, httpx.Response):
+                    chunks = response.iter_bytes(chunk_size=chunk_size)
+                else:
+                    chunks = response.iter_content(chunk_size=chunk_size)
+                for chunk in chunks:
+                    buffer.write(chunk)
+                    pbar.update(len(chunk))
+
+        buffer.finish()
+        _check_size(expected_size, buffer.size)
+    except BaseException:
+        buffer.close()
+        raise
+
+    return buffer
+
+
+async def async_download_buffer(client: httpx.AsyncClient, url, expected_size: int = None, desc=None,
+                                silent: bool = False, spill_size: int = DEFAULT_SPILL_SIZE,
+                                chunk_size: int = DEFAULT_CHUNK_SIZE, **kwargs) -> DownloadBuffer:
+    """
+    Coroutine version of :func:`download_buffer` on an :class:`httpx.AsyncClient`, so that several
+    downloads can be in flight on one event loop.
+    """
+    buffer = DownloadBuffer(spill_size)
+    try:
+        async with client.stream('GET', url, **kwargs) as response:
+            response.raise_for_status()
+            expected_size = _expected_size(response, expected_size)
+            with tqdm(total=expected_size, unit='B', unit_scale=True,
+                      unit_divisor=1024, desc=desc, silent=silent) as pbar:
+                async for chunk in response.aiter_bytes(chunk_size=chunk_size):
+                    buffer.write(chunk)
+                    pbar.update(len(chunk))
+
+        buffer.finish()
+        _check_size(expected_size, buffer.size)
+    except BaseException:
+        buffer.close()
+        raise
+
+    return buffer
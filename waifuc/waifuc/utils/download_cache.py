@@ -0,0 +1,197 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Union
+from urllib.parse import urlsplit
+
+
+def file_md5(filename: str) -> str:
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class DownloadCache:
+    """
+    On-disk cache of the files downloaded by :class:`waifuc.source.WebDataSource`, shared by all the
+    sources and runs of the process.
+
+    Files are addressed by their md5 when the site provides it for the chosen URL (e.g. the original
+    file on Danbooru), so the same image found through different sources is stored once, and by
+    (site, post id, URL without query) otherwise. Every hit is verified against the md5 recorded when
+    the file was stored, corrupted entries are dropped and downloaded again. The least recently used
+    files are evicted once the cache grows over ``max_size`` bytes, except the pinned ones (see :meth:`get`).
+    Files larger than ``max_size`` are not stored.
+
+    :param directory: Directory of the cache.
+    :param max_size: Size limit of the cached files in bytes, ``None`` means no limit.
+    """
+
+    def __init__(self, directory: str, max_size: Optional[int] = 10 * 1024 ** 3):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits, self.misses, self.corrupted = 0, 0, 0
+        self.objects_dir = os.path.join(directory, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pins: Dict[str, int] = {}
+        self._conn = sqlite3.connect(os.path.join(directory, 'index.db'), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    md5 TEXT NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_files_accessed ON files (accessed_at)')
+
+    @staticmethod
+    def make_key(site: str, id_, url: str, md5: Optional[str] = None) -> str:
+        if md5:
+            return f'md5-{md5.lower()}'
+        else:
+            split = urlsplit(url)
+            raw = '\0'.join((site, str(id_), f'{split.scheme}://{split.netloc}{split.path}'))
+            return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.objects_dir, key[-2:], key)
+
+    def get(self, key: str, pin: bool = False) -> Optional[str]:
+        """
+        Get the cached file of ``key``, ``None`` when it is not cached or fails the checksum.
+
+        :param pin: Keep the file from being evicted until :meth:`unpin` is called, for hits which
+            are read later on.
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT md5 FROM files WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self._pins[key] = self._pins.get(key, 0) + 1
+        if row is None:
+            self.misses += 1
+            return None
+
+        path = self._path(key)
+        try:
+            valid = file_md5(path) == row[0]
+        except OSError:
+            valid = False
+        if not valid:
+            self.unpin(key)
+            if os.path.exists(path):
+                self.corrupted += 1
+            self.misses += 1
+            self._remove(key)
+            return None
+
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE files SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        if not pin:
+            self.unpin(key)
+        self.hits += 1
+        return path
+
+    def unpin(self, key: str):
+        """
+        Release a file pinned by :meth:`get`.
+        """
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+
+    def put(self, key: str, content: Union[str, bytes], md5: Optional[str] = None) -> bool:
+        """
+        Store a copy of ``content``, the bytes or the name of the file. When ``md5`` is given,
+        content not matching it is not stored, neither is content larger than ``max_size``.
+
+        :return: Whether the content is stored.
+        """
+        size = len(content) if isinstance(content, bytes) else os.path.getsize(content)
+        if self.max_size is not None and size > self.max_size:
+            return False
+        digest = hashlib.md5(content).hexdigest() if isinstance(content, bytes) else file_md5(content)
+        if md5 and digest != md5.lower():
+            return False
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        if isinstance(content, bytes):
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+        else:
+            shutil.copyfile(content, tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files (key, size, md5, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, size, digest, time.time()),
+            )
+            self._evict(keep=key)
+        return True
+
+    def _remove(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM files WHERE key = ?', (key,))
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def _evict(self, keep: str):
+        # called with self._lock held
+        if self.max_size is None:
+            return
+        total, = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM files').fetchone()
+        if total <= self.max_size:
+            return
+
+        for key, size in self._conn.execute('SELECT key, size FROM files ORDER BY accessed_at').fetchall():
+            if key == keep or key in self._pins:
+                continue
+            self._conn.execute('DELETE FROM files WHERE key = ?', (key,))
+            if os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def clear(self):
+        with self._lock, self._conn:
+            for key, in self._conn.execute('SELECT key FROM files').fetchall():
+                if os.path.exists(self._path(key)):
+                    os.remove(self._path(key))
+            self._conn.execute('DELETE FROM files')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_download_cache: Optional[DownloadCache] = None
+
+
+def set_download_cache(cache: Optional[DownloadCache]):
+    """
+    Set the process-wide :class:`DownloadCache` used by :class:`waifuc.source.WebDataSource`,
+    ``None`` disables it.
+    """
+    global _download_cache
+    _download_cache = cache
+
+
+def get_download_cache() -> Optional[DownloadCache]:
+    return _download_cache
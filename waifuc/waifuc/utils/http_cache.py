@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+import httpx
+
+# headers describing the transfer rather than the content, the cached body is stored decoded
+_TRANSFER_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+class HTTPCache:
+    """
+    On-disk cache of API responses (e.g. the ``posts.json`` pages of booru sites), used by
+    :func:`waifuc.utils.srequest` when it is called with ``cache_ttl``.
+
+    Entries are keyed by method, final URL (with the query parameters), request body and a digest of
+    the auth identity, so different accounts never share pages. An entry is served as is within its TTL.
+    After that it is revalidated with ``If-None-Match``/``If-Modified-Since`` when the site sent an
+    ``ETag`` or ``Last-Modified``, and refetched otherwise. The least recently used entries are evicted
+    once the cache grows over ``max_size`` bytes.
+
+    :param directory: Directory of the cache database.
+    :param max_size: Size limit of the cached bodies in bytes, ``None`` means no limit.
+    """
+
+    def __init__(self, directory: str, max_size: Optional[int] = 256 * 1024 ** 2):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits, self.revalidated, self.misses = 0, 0, 0
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, 'http_cache.db'), timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    method TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    content BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)')
+
+    @staticmethod
+    def make_key(request: httpx.Request, identity: Optional[str] = None) -> str:
+        sha = hashlib.sha256()
+        for part in (request.method, str(request.url), identity or '', request.headers.get('Authorization', '')):
+            sha.update(part.encode('utf-8'))
+            sha.update(b'\0')
+        sha.update(request.content)
+        return sha.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[httpx.Response, bool]]:
+        """
+        Get the cached response of ``key``, together with whether it is still fresh.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT method, url, status, headers, content, expires_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            with self._conn:
+                self._conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+
+        method, url, status, headers, content, expires_at = row
+        response = httpx.Response(status, headers=json.loads(headers), content=content,
+                                  request=httpx.Request(method, url))
+        return response, time.time() < expires_at
+
+    def put(self, key: str, response: httpx.Response, ttl: float):
+        headers = [(name, value) for name, value in response.headers.multi_items()
+                   if name.lower() not in _TRANSFER_HEADERS]
+        content = response.content
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(key, method, url, status, headers, content, size, expires_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, response.request.method, str(response.request.url), response.status_code,
+                 json.dumps(headers), content, len(content), now + ttl, now),
+            )
+            self._evict()
+
+    def refresh(self, key: str, ttl: float):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE responses SET expires_at = ?, accessed_at = ? WHERE key = ?',
+                               (now + ttl, now, key))
+
+    def _evict(self):
+        if self.max_size is None:
+            return
+        total, = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()
+        if total <= self.max_size:
+            return
+
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall():
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM responses')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_http_cache: Optional[HTTPCache] = None
+
+
+def set_http_cache(cache: Optional[HTTPCache]):
+    """
+    Set the process-wide :class:`HTTPCache` used by :func:`waifuc.utils.srequest`, ``None`` disables it.
+    """
+    global _http_cache
+    _http_cache = cache
+
+
+def get_http_cache() -> Optional[HTTPCache]:
+    return _http_cache
+
+
+def is_cacheable(response: httpx.Response) -> bool:
+    cache_control = response.headers.get('Cache-Control', '').lower()
+    return response.status_code == 200 and 'no-store' not in cache_control
+
+
+def revalidation_headers(response: httpx.Response) -> dict:
+    headers = {}
+    if 'ETag' in response.headers:
+        headers['If-None-Match'] = response.headers['ETag']
+    if 'Last-Modified' in response.headers:
+        headers['If-Modified-Since'] = response.headers['Last-Modified']
+    return headers
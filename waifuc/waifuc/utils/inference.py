@@ -0,0 +1,179 @@
+"""
+Batched variants of the imgutils model calls used by the actions.
+
+Most imgutils entry points take one image and run the ONNX session with a batch of 1. These
+helpers preprocess a list of images, stack them and run the session once. They depend on imgutils
+internals, so every helper falls back to the public single-image function when those internals are
+missing (older imgutils) or the model was exported with a fixed batch dimension.
+"""
+from typing import List, Optional, Tuple, Dict
+
+import numpy as np
+from imgutils.data import load_image, rgb_encode, ImageTyping
+from imgutils.detect import detect_faces, detect_heads
+from imgutils.tagging import get_wd14_tags
+from imgutils.validate import anime_classify, anime_rating
+
+try:
+    from imgutils.generic.classify import _open_models_for_repo_id as _open_classify_models, _img_encode
+    from imgutils.validate.classify import _REPO_ID as _CLASSIFY_REPO_ID, \
+        _DEFAULT_MODEL_NAME as _CLASSIFY_MODEL_NAME
+    from imgutils.validate.rating import _REPO_ID as _RATING_REPO_ID, _DEFAULT_MODEL_NAME as _RATING_MODEL_NAME
+except ImportError:  # pragma: no cover
+    _open_classify_models = None
+    _CLASSIFY_REPO_ID, _CLASSIFY_MODEL_NAME = None, None
+    _RATING_REPO_ID, _RATING_MODEL_NAME = None, None
+
+try:
+    from imgutils.generic.yolo import _open_models_for_repo_id as _open_yolo_models, _image_preprocess, \
+        _yolo_postprocess, _rtdetr_postprocess
+    from imgutils.detect.face import _REPO_ID as _FACE_REPO_ID
+    from imgutils.detect.head import _REPO_ID as _HEAD_REPO_ID
+except ImportError:  # pragma: no cover
+    _open_yolo_models = None
+    _FACE_REPO_ID, _HEAD_REPO_ID = None, None
+
+try:
+    from imgutils.tagging.wd14 import _get_wd14_model, _prepare_image_for_tagging, _postprocess_embedding
+except ImportError:  # pragma: no cover
+    _get_wd14_model = None
+
+DetectionTyping = List[Tuple[Tuple[int, int, int, int], str, float]]
+
+
+def _fixed_batch(session) -> bool:
+    # dynamic dimensions are reported as names or None
+    return isinstance(session.get_inputs()[0].shape[0], int)
+
+
+def _classify_batch(images: List[ImageTyping], repo_id: str, model_name: str) -> List[Tuple[str, float]]:
+    model = _open_classify_models(repo_id)
+    session = model._open_model(model_name)
+    _, _, height, width = session.get_inputs()[0].shape
+    preprocess = model._open_preprocess(model_name)
+    inputs = []
+    for image in images:
+        image = load_image(image, force_background='white', mode='RGB')
+        if model._fn_preprocess:
+            image = model._fn_preprocess(image)
+        if preprocess:
+            inputs.append(preprocess(image))
+        elif isinstance(height, int) and isinstance(width, int):
+            inputs.append(_img_encode(image, size=(width, height)))
+        else:
+            inputs.append(_img_encode(image))
+
+    output, = session.run(['output'], {'input': np.stack(inputs)})
+    labels = model._open_label(model_name)['default']
+    max_ids = np.argmax(output, axis=-1)
+    return [(labels[max_id], scores[max_id].item()) for max_id, scores in zip(max_ids, output)]
+
+
+def anime_classify_batch(images: List[ImageTyping], model_name: Optional[str] = None,
+                         **kwargs) -> List[Tuple[str, float]]:
+    """
+    Batched :func:`imgutils.validate.anime_classify`, with the same arguments. Any argument other
+    than ``model_name`` is only known to ``anime_classify``, which is then called image by image.
+    """
+    model_name = model_name or _CLASSIFY_MODEL_NAME
+    if len(images) <= 1 or kwargs or _open_classify_models is None or \
+            _fixed_batch(_open_classify_models(_CLASSIFY_REPO_ID)._open_model(model_name)):
+        if model_name:
+            kwargs['model_name'] = model_name
+        return [anime_classify(image, **kwargs) for image in images]
+    return _classify_batch(images, _CLASSIFY_REPO_ID, model_name)
+
+
+def anime_rating_batch(images: List[ImageTyping], model_name: Optional[str] = None,
+                       **kwargs) -> List[Tuple[str, float]]:
+    """
+    Batched :func:`imgutils.validate.anime_rating`, with the same arguments. Any argument other
+    than ``model_name`` is only known to ``anime_rating``, which is then called image by image.
+    """
+    model_name = model_name or _RATING_MODEL_NAME
+    if len(images) <= 1 or kwargs or _open_classify_models is None or \
+            _fixed_batch(_open_classify_models(_RATING_REPO_ID)._open_model(model_name)):
+        if model_name:
+            kwargs['model_name'] = model_name
+        return [anime_rating(image, **kwargs) for image in images]
+    return _classify_batch(images, _RATING_REPO_ID, model_name)
+
+
+def _yolo_batch(images: List[ImageTyping], repo_id: str, model_name: str,
+                conf_threshold: Optional[float], iou_threshold: float) -> Optional[List[DetectionTyping]]:
+    if len(images) <= 1 or _open_yolo_models is None:
+        return None
+    model = _open_yolo_models(repo_id)
+    session, max_infer_size, labels, exec_lock = model._open_model(model_name)
+    if _fixed_batch(session):
+        return None
+
+    if conf_threshold is None:
+        conf_threshold = model._get_default_thresholds(model_name)
+        if conf_threshold is None:
+            conf_threshold = 0.25
+    model_type = model._get_model_type(model_name=model_name)
+    if model_type == 'yolo':
+        postprocess = _yolo_postprocess
+    elif model_type == 'rtdetr':
+        postprocess = _rtdetr_postprocess
+    else:
+        raise ValueError(f'Unknown object detection model type - {model_type!r}.')
+
+    inputs, sizes = [], []
+    for image in images:
+        # without allow_dynamic every image is resized to max_infer_size, so the inputs can be stacked
+        new_image, old_size, new_size = _image_preprocess(load_image(image, mode='RGB'), max_infer_size)
+        inputs.append(rgb_encode(new_image))
+        sizes.append((old_size, new_size))
+    with exec_lock:
+        output, = session.run(['output0'], {'images': np.stack(inputs)})
+    return [
+        postprocess(output=output_, conf_threshold=conf_threshold, iou_threshold=iou_threshold,
+                    old_size=old_size, new_size=new_size, labels=labels)
+        for output_, (old_size, new_size) in zip(output, sizes)
+    ]
+
+
+def detect_faces_batch(images: List[ImageTyping], level: str = 's', version: str = 'v1.4',
+                       conf_threshold: float = 0.25, iou_threshold: float = 0.7) -> List[DetectionTyping]:
+    """Batched :func:`imgutils.detect.detect_faces`."""
+    results = _yolo_batch(images, _FACE_REPO_ID, f'face_detect_{version}_{level}', conf_threshold, iou_threshold)
+    if results is None:
+        results = [detect_faces(image, level, version, conf_threshold=conf_threshold, iou_threshold=iou_threshold)
+                   for image in images]
+    return results
+
+
+def detect_heads_batch(images: List[ImageTyping], level: Optional[str] = None,
+                       model_name: Optional[str] = 'head_detect_v2.0_s',
+                       conf_threshold: float = 0.4, iou_threshold: float = 0.7) -> List[DetectionTyping]:
+    """Batched :func:`imgutils.detect.detect_heads`, with the same defaults."""
+    model_name_ = model_name or f'head_detect_v0_{level or "s"}'
+    results = _yolo_batch(images, _HEAD_REPO_ID, model_name_, conf_threshold, iou_threshold)
+    if results is None:
+        results = [detect_heads(image, level, model_name=model_name,
+                                conf_threshold=conf_threshold, iou_threshold=iou_threshold)
+                   for image in images]
+    return results
+
+
+def get_wd14_tags_batch(images: List[ImageTyping], model_name: str, general_threshold: float = 0.35,
+                        character_threshold: float = 0.85) \
+        -> List[Tuple[Dict[str, float], Dict[str, float], Dict[str, float]]]:
+    """Batched :func:`imgutils.tagging.get_wd14_tags`, returns ``(rating, general, character)`` of every image."""
+    if len(images) <= 1 or _get_wd14_model is None or _fixed_batch(_get_wd14_model(model_name)):
+        return [get_wd14_tags(image, model_name=model_name, general_threshold=general_threshold,
+                              character_threshold=character_threshold) for image in images]
+
+    session = _get_wd14_model(model_name)
+    _, target_size, _, _ = session.get_inputs()[0].shape
+    data = np.concatenate([_prepare_image_for_tagging(image, target_size) for image in images])
+    input_name = session.get_inputs()[0].name
+    label_name, emb_name = session.get_outputs()[0].name, session.get_outputs()[1].name
+    preds, embeddings = session.run([label_name, emb_name], {input_name: data})
+    return [
+        _postprocess_embedding(pred=pred, embedding=embedding, model_name=model_name,
+                               general_threshold=general_threshold, character_threshold=character_threshold)
+        for pred, embedding in zip(preds, embeddings)
+    ]
@@ -0,0 +1,76 @@
+import queue
+import threading
+from typing import Iterable, Iterator, TypeVar, Tuple
+
+from .context import get_task_names, task_names_ctx
+
+T = TypeVar('T')
+
+PREFETCH_ITEM, PREFETCH_END, PREFETCH_ERROR = 'item', 'end', 'error'
+
+
+def start_prefetch(iterable: Iterable[T], size: int = 1, name: str = 'waifuc_prefetch') \
+        -> Tuple[queue.Queue, threading.Event]:
+    """
+    Start iterating ``iterable`` on a background thread, see :func:`prefetch_iter`.
+
+    :return: The queue of ``(kind, payload)`` entries, ``kind`` being ``'item'``, ``'error'`` or ``'end'``,
+        and the event telling the worker to stop and close ``iterable``.
+    """
+    queue_ = queue.Queue(max(1, size))
+    stop = threading.Event()
+    names = get_task_names()
+
+    def _put(kind, payload) -> bool:
+        while not stop.is_set():
+            try:
+                queue_.put((kind, payload), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run():
+        with task_names_ctx(names):
+            iter_ = iter(iterable)
+            try:
+                for item in iter_:
+                    if not _put(PREFETCH_ITEM, item):
+                        return
+            except Exception as err:
+                _put(PREFETCH_ERROR, err)
+                return
+            finally:
+                close = getattr(iter_, 'close', None)
+                if close is not None:
+                    close()
+            _put(PREFETCH_END, None)
+
+    threading.Thread(target=_run, name=name, daemon=True).start()
+    return queue_, stop
+
+
+def prefetch_iter(iterable: Iterable[T], size: int = 1, name: str = 'waifuc_prefetch') -> Iterator[T]:
+    """
+    Iterate ``iterable`` on a background thread, keeping up to ``size`` items ready ahead of the consumer,
+    e.g. the next API pages of a source while the images of the current one are downloaded.
+
+    Errors are raised in the consumer when it reaches them. When the consumer stops early, the worker
+    notices before its next item and closes ``iterable``.
+
+    :param iterable: The iterable to prefetch.
+    :param size: Items kept ready ahead of the consumer, at least 1.
+    :param name: Name of the background thread.
+    """
+    queue_, stop = start_prefetch(iterable, size, name)
+    try:
+        while True:
+            kind, payload = queue_.get()
+            if kind == PREFETCH_ITEM:
+                yield payload
+            elif kind == PREFETCH_END:
+                break
+            else:
+                raise payload
+    finally:
+        stop.set()
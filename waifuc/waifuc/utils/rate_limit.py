@@ -0,0 +1,242 @@
+import email.utils
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional, Dict, Tuple
+
+import httpx
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+    import msvcrt
+
+THROTTLE_STATUS = (429, 503)
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """
+    Seconds to wait according to the ``Retry-After`` header of ``response``, in seconds or as an HTTP date.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def is_throttled(response: httpx.Response) -> bool:
+    return response.status_code in THROTTLE_STATUS
+
+
+class AdaptiveRateLimiter:
+    """
+    Rate limiter adapting to the site (AIMD): the rate grows by about ``increase`` requests per second
+    every second while the requests succeed, and is multiplied by ``decrease`` when the site answers
+    429 or 503, which also pauses all the requests for its ``Retry-After``.
+
+    The state is kept in this object. With a ``directory`` and a ``max_rate``, the limiters of the host
+    using the same ``name``, in this process or others, also share it through a locked file: a throttling
+    is written at once, the rest is merged every ``sync_interval`` seconds, and the rate is split evenly
+    among the limiters seen in the file. Limiters without ``max_rate`` never touch the file. Use
+    :func:`get_rate_limiter` to share the instance within the process.
+
+    :param name: Name of the limiter, e.g. the site.
+    :param max_rate: Ceiling of the rate in requests per second, also the initial rate. ``None`` leaves
+        the requests unlimited until the site throttles them.
+    :param min_rate: Floor of the rate in requests per second.
+    :param increase: Additive increase, in requests per second per second.
+    :param decrease: Multiplicative decrease on throttling.
+    :param throttled_rate: Rate set on the first throttling when there is no ``max_rate``.
+    :param directory: Directory of the shared state, ``None`` keeps it in this object.
+    :param sync_interval: Seconds between two merges with the shared state.
+    """
+
+    def __init__(self, name: str, max_rate: Optional[float] = None, min_rate: float = 0.05,
+                 increase: float = 0.1, decrease: float = 0.5, throttled_rate: float = 1.0,
+                 directory: Optional[str] = None, sync_interval: float = 1.0):
+        self.name = name
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate) if max_rate else min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.throttled_rate = throttled_rate
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._state = {'rate': self.max_rate, 'next_at': 0.0, 'blocked_until': 0.0, 'cut_until': 0.0}
+        self._shares = 1
+        self._synced_at = None
+        self._user = f'{os.getpid()}-{id(self)}'
+        if directory is not None and max_rate:
+            os.makedirs(directory, exist_ok=True)
+            self.filename = os.path.join(directory, f'{re.sub(r"[^0-9A-Za-z_.-]", "_", name)}.json')
+        else:
+            self.filename = None
+
+    @contextmanager
+    def _locked_file(self):
+        with open(self.filename, 'a+') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:  # pragma: no cover
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield f
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:  # pragma: no cover
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _sync(self, force: bool = False, update: Optional[Callable[[dict], None]] = None):
+        # called with self._lock held; ``update`` changes the state between the merge and the write
+        now = time.time()
+        if self.filename is None or (not force and self._synced_at is not None
+                                     and now - self._synced_at < self.sync_interval):
+            if update is not None:
+                update(self._state)
+            return
+
+        state = self._state
+        with self._locked_file() as f:
+            f.seek(0)
+            try:
+                shared = json.loads(f.read())
+            except ValueError:
+                shared = {}
+            if shared.get('cut_until', 0.0) > state['cut_until']:
+                # another limiter cut the rate since the last merge
+                state['rate'] = shared['rate']
+            elif shared.get('rate') is not None:
+                state['rate'] = max(state['rate'], shared['rate'])
+            state['blocked_until'] = max(state['blocked_until'], shared.get('blocked_until', 0.0))
+            state['cut_until'] = max(state['cut_until'], shared.get('cut_until', 0.0))
+            users = {user: seen for user, seen in shared.get('users', {}).items()
+                     if seen >= now - 3 * self.sync_interval}
+            users[self._user] = now
+            self._shares = len(users)
+            if update is not None:
+                update(state)
+
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps({
+                'rate': state['rate'],
+                'blocked_until': state['blocked_until'],
+                'cut_until': state['cut_until'],
+                'users': users,
+            }))
+            f.flush()
+        self._synced_at = now
+
+    @property
+    def rate(self) -> Optional[float]:
+        """Current rate in requests per second, ``None`` when unlimited."""
+        with self._lock:
+            self._sync()
+            return self._state['rate']
+
+    def reserve(self) -> float:
+        """
+        Take the next slot of the schedule without waiting for it.
+
+        :return: Seconds until the slot.
+        """
+        with self._lock:
+            self._sync()
+            state = self._state
+            now = time.time()
+            start = max(now, state['next_at'], state['blocked_until'])
+            state['next_at'] = start + (self._shares / state['rate'] if state['rate'] else 0.0)
+        return start - now
+
+    def acquire(self):
+        """Wait for the next slot of the schedule."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def success(self):
+        """Report a request the site accepted."""
+        def _increase(state):
+            rate = state['rate']
+            if rate is not None:
+                rate += self.increase / rate
+                state['rate'] = min(rate, self.max_rate) if self.max_rate else rate
+
+        with self._lock:
+            self._sync(update=_increase)
+
+    def throttle(self, wait: Optional[float] = None):
+        """
+        Report a request the site throttled.
+
+        :param wait: Seconds the site asked to wait (``Retry-After``), one interval of the reduced rate by default.
+        """
+        def _cut(state):
+            now = time.time()
+            # the requests in flight when the site started throttling cut the rate only once,
+            # including those of the other limiters sharing the state
+            if now >= state['cut_until']:
+                rate = state['rate']
+                rate = rate * self.decrease if rate is not None else self.throttled_rate
+                state['rate'] = max(self.min_rate, rate)
+                state['cut_until'] = now + 1.0 / state['rate']
+            pause = wait if wait is not None else 1.0 / state['rate']
+            state['blocked_until'] = max(state['blocked_until'], now + pause)
+
+        with self._lock:
+            self._sync(force=True, update=_cut)
+
+    def feedback(self, response: httpx.Response) -> bool:
+        """
+        Report the outcome of a request from its response.
+
+        :return: Whether the site throttled it.
+        """
+        if is_throttled(response):
+            self.throttle(retry_after(response))
+            return True
+        elif response.status_code < 400:
+            self.success()
+        return False
+
+
+_DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'waifuc_rate_limits')
+_rate_limit_dir: Optional[str] = _DEFAULT_DIRECTORY
+_rate_limiters: Dict[Tuple[Optional[str], str], AdaptiveRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def set_rate_limit_dir(directory: Optional[str] = _DEFAULT_DIRECTORY):
+    """
+    Set the directory where the limiters of :func:`get_rate_limiter` share their state with the other
+    processes of the host, ``None`` keeps it within the process. Limiters created before keep theirs.
+    """
+    global _rate_limit_dir
+    _rate_limit_dir = directory
+
+
+def get_rate_limiter(name: str, max_rate: Optional[float] = None) -> AdaptiveRateLimiter:
+    """
+    The :class:`AdaptiveRateLimiter` of ``name``, shared by the whole process.
+    """
+    with _rate_limiters_lock:
+        key = (_rate_limit_dir, name)
+        if key not in _rate_limiters:
+            _rate_limiters[key] = AdaptiveRateLimiter(name, max_rate, directory=_rate_limit_dir)
+        return _rate_limiters[key]
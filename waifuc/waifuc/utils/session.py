@@ -9,6 +9,9 @@ from random_user_agent.params import SoftwareName, OperatingSystem
 from random_user_agent.user_agent import UserAgent
 from requests.adapters import HTTPAdapter, Retry
 
+from .http_cache import HTTPCache, get_http_cache, is_cacheable, revalidation_headers
+from .rate_limit import AdaptiveRateLimiter, get_rate_limiter, is_throttled, retry_after
+
 DEFAULT_TIMEOUT = 10  # seconds
 
 
@@ -88,22 +91,33 @@ def _should_retry(response: httpx.Response) -> bool:
         response.status_code in RETRY_STATUS_FORCELIST
 
 
-def srequest(session: httpx.Client, method, url, *, max_retries: int = 5,
-             backoff_factor: float = 1.0, raise_for_status: bool = True, **kwargs) -> httpx.Response:
+def _request_with_retries(session: httpx.Client, method, url, *, max_retries: int = 5,
+                          backoff_factor: float = 1.0, raise_for_status: bool = True,
+                          rate_limiter: Optional[AdaptiveRateLimiter] = None, **kwargs) -> httpx.Response:
     resp = None
     for i in range(max_retries):
         sleep_time = backoff_factor * (2 ** i)
+        if rate_limiter is not None:
+            rate_limiter.acquire()
         try:
             resp = session.request(method, url, **kwargs)
+            if rate_limiter is not None:
+                rate_limiter.feedback(resp)
             if raise_for_status:
                 resp.raise_for_status()
         except (httpx.TooManyRedirects,):
             raise
         except (httpx.HTTPStatusError, requests.exceptions.HTTPError) as err:
             if _should_retry(err.response):
-                warnings.warn(f'Requests {err.response.status_code} ({i + 1}/{max_retries}), '
-                              f'sleep for {sleep_time!r}s ...')
-                time.sleep(sleep_time)
+                if rate_limiter is not None and is_throttled(err.response):
+                    # the limiter holds back the next attempt, and the other requests to the site
+                    warnings.warn(f'Requests {err.response.status_code} ({i + 1}/{max_retries}), '
+                                  f'slowing down to {rate_limiter.rate!r} requests/s ...')
+                else:
+                    sleep_time = max(sleep_time, retry_after(err.response) or 0.0)
+                    warnings.warn(f'Requests {err.response.status_code} ({i + 1}/{max_retries}), '
+                                  f'sleep for {sleep_time!r}s ...')
+                    time.sleep(sleep_time)
             else:
                 raise
         except (httpx.HTTPError, requests.exceptions.RequestException) as err:
@@ -120,6 +134,78 @@ def srequest(session: httpx.Client, method, url, *, max_retries: int = 5,
     return resp
 
 
+_BUILD_REQUEST_KWARGS = ('content', 'data', 'files', 'json', 'params', 'headers', 'cookies')
+
+
+def _cached_request(cache: HTTPCache, session: httpx.Client, method, url, cache_ttl: float,
+                    cache_identity: Optional[str], **kwargs) -> httpx.Response:
+    request = session.build_request(method, url, **{
+        name: value for name, value in kwargs.items() if name in _BUILD_REQUEST_KWARGS
+    })
+    auth = kwargs.get('auth')
+    identity = f'{cache_identity or ""}|{auth!r}' if auth is not None else cache_identity
+    key = HTTPCache.make_key(request, identity)
+
+    cached = cache.get(key)
+    if cached is not None:
+        response, fresh = cached
+        if fresh:
+            cache.hits += 1
+            return response
+
+        validators = revalidation_headers(response)
+        if validators:
+            resp = _request_with_retries(session, method, url, **{
+                **kwargs, 'headers': {**dict(kwargs.get('headers') or {}), **validators}, 'raise_for_status': False,
+            })
+            if resp.status_code == 304:
+                cache.revalidated += 1
+                cache.refresh(key, cache_ttl)
+                return response
+            elif resp.is_success:
+                cache.misses += 1
+                if is_cacheable(resp):
+                    cache.put(key, resp, cache_ttl)
+                return resp
+
+    resp = _request_with_retries(session, method, url, **kwargs)
+    cache.misses += 1
+    if is_cacheable(resp):
+        cache.put(key, resp, cache_ttl)
+    return resp
+
+
+def srequest(session: httpx.Client, method, url, *, max_retries: int = 5,
+             backoff_factor: float = 1.0, raise_for_status: bool = True,
+             cache_ttl: Optional[float] = None, cache_identity: Optional[str] = None,
+             rate_limiter: Optional[AdaptiveRateLimiter] = None, **kwargs) -> httpx.Response:
+    """
+    Send a request, retrying on connection errors and retryable status codes.
+
+    The requests go through ``rate_limiter``, by default the :func:`get_rate_limiter` of the host, which
+    is unlimited until the site answers 429 or 503 and then adapts to it, honoring ``Retry-After``.
+
+    With ``cache_ttl`` set and an :class:`HTTPCache` installed by :func:`set_http_cache`, successful
+    ``GET`` responses are cached for ``cache_ttl`` seconds. ``cache_identity`` names the account the
+    response belongs to when the session authenticates by cookies, ``auth`` and ``Authorization`` are
+    taken into account anyway.
+    """
+    if rate_limiter is None:
+        rate_limiter = get_rate_limiter(httpx.URL(url).host)
+    kwargs['rate_limiter'] = rate_limiter
+    cache = get_http_cache() if cache_ttl else None
+    if cache is not None and method.upper() == 'GET' and isinstance(session, httpx.Client):
+        return _cached_request(
+            cache, session, method, url, cache_ttl, cache_identity,
+            max_retries=max_retries, backoff_factor=backoff_factor, raise_for_status=raise_for_status, **kwargs,
+        )
+    else:
+        return _request_with_retries(
+            session, method, url,
+            max_retries=max_retries, backoff_factor=backoff_factor, raise_for_status=raise_for_status, **kwargs,
+        )
+
+
 @lru_cache()
 def _ua_pool():
     software_names = [SoftwareName.CHROME.value, SoftwareName.FIREFOX.value, SoftwareName.EDGE.value]